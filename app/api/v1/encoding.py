@@ -0,0 +1,166 @@
+"""
+Response encoding with `Accept`-based content negotiation.
+
+The classification endpoints return their payloads through `encode_response`,
+which serializes them once into the representation the client asked for:
+
+- `application/json` (default, also for `*/*` or no Accept header), encoded
+  with python-rapidjson when it is installed and compact stdlib json if not;
+- `application/msgpack` (or `application/x-msgpack`), when msgpack is
+  installed; floats are packed as float32, which loses nothing since the
+  confidences come from float32 model outputs;
+- either of the above with `; layout=columnar`: batch payloads (those with a
+  "results" list) are sent column by column, one array per field, instead of
+  one object per result.
+
+Endpoints hand back a finished Response, so FastAPI skips its response-model
+validation and `jsonable_encoder`, which rebuild every nested dict of a batch
+before encoding it. Unsupported Accept values fall back to JSON rather than
+failing with 406.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack is then not offered
+    msgpack = None
+
+try:
+    import rapidjson
+except ImportError:  # optional: stdlib json is used instead
+    rapidjson = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MEDIA_TYPES = {
+    JSON: "json",
+    "application/*": "json",
+    "*/*": "json",
+    MSGPACK: "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+COLUMNAR = "columnar"
+
+
+def _default(value: Any) -> Any:
+    """Numpy scalars/arrays that slipped into a payload."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps_json(payload: Any) -> bytes:
+    if rapidjson is not None:
+        return rapidjson.dumps(payload, ensure_ascii=False, default=_default).encode(
+            "utf-8"
+        )
+    return json.dumps(
+        payload,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    return msgpack.packb(payload, use_single_float=True, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps_json` (the app's default response class)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def negotiate(accept: Optional[str]) -> Tuple[str, bool]:
+    """
+    Pick the response format for an Accept header.
+
+    Returns:
+        ("json" | "msgpack", as_columns): the supported media range with the
+        highest q-value (earliest listed on ties); ("json", False) if none is.
+    """
+    best: Optional[Tuple[float, int, str, bool]] = None
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        fmt = MEDIA_TYPES.get(media_type.lower())
+        if fmt is None or (fmt == "msgpack" and msgpack is None):
+            continue
+        q, as_columns = 1.0, False
+        for param in params:
+            key, _, value = param.partition("=")
+            key, value = key.strip().lower(), value.strip().strip('"').lower()
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+            elif key == "layout":
+                as_columns = value == COLUMNAR
+        if q <= 0:
+            continue
+        if best is None or (q, -position) > (best[0], -best[1]):
+            best = (q, position, fmt, as_columns)
+    if best is None:
+        return "json", False
+    return best[2], best[3]
+
+
+def columnar(rows: List[dict]) -> Dict[str, list]:
+    """
+    One list per field for `rows`, in first-seen field order. Nested dicts
+    (each result's "result") are flattened into their parent row; fields a
+    row lacks (e.g. "error" on successes) are None.
+    """
+    columns: Dict[str, list] = {}
+
+    def put(key: str, value: Any, index: int) -> None:
+        column = columns.get(key)
+        if column is None:
+            column = columns[key] = [None] * index
+        column.append(value)
+
+    for index, row in enumerate(rows):
+        for key, value in row.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    put(sub_key, sub_value, index)
+            else:
+                put(key, value, index)
+        for column in columns.values():
+            if len(column) <= index:
+                column.append(None)
+    return columns
+
+
+def encode_response(
+    request: Request, payload: dict, status_code: int = 200
+) -> Response:
+    """Serialize `payload` in the format the request's Accept header asks for."""
+    fmt, as_columns = negotiate(request.headers.get("accept"))
+    media_type = JSON if fmt == "json" else MSGPACK
+    if as_columns and isinstance(payload.get("results"), list):
+        results = payload["results"]
+        payload = {
+            **{k: v for k, v in payload.items() if k != "results"},
+            "count": len(results),
+            "columns": columnar(results),
+        }
+        media_type += f"; layout={COLUMNAR}"
+    body = dumps_json(payload) if fmt == "json" else dumps_msgpack(payload)
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+    )
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import secrets
+from typing import Literal, Optional
+
+import structlog
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.diagnostics.loop_monitor import loop_monitor
+from app.diagnostics.memory import (
+    MEMORY_TRACEMALLOC_MAX_FRAMES,
+    SnapshotNotFound,
+    TracingNotStarted,
+    allocation_tracker,
+    directory_bytes,
+    model_memory,
+    process_memory,
+    tf_allocator_stats,
+)
+from app.diagnostics.profiler import (
+    PROFILER_MAX_HZ,
+    PROFILER_MAX_SECONDS,
+    ProfilerBusyError,
+    SamplingProfiler,
+)
+from app.pipeline.jobs import JOBS_SPOOL_DIR
+
+logger = structlog.get_logger()
+
+# Admin endpoints are disabled unless a token is configured.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Dependency guarding every admin endpoint. Returns 404 when no ADMIN_TOKEN
+    is configured (so the surface is invisible by default) and 403 when the
+    `X-Admin-Token` header does not match.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        logger.warning("Rejected admin request")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token."
+        )
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=PROFILER_MAX_SECONDS),
+    hz: int = Query(100, gt=0, le=PROFILER_MAX_HZ),
+    format: Literal["collapsed", "speedscope"] = "collapsed",
+    tf_trace: bool = False,
+):
+    """
+    Sample every thread of this worker for `seconds` and return the stacks.
+
+    Args:
+        seconds (float): Sampling window, capped by PROFILER_MAX_SECONDS.
+        hz (int): Sampling frequency, capped by PROFILER_MAX_HZ.
+        format (str): "collapsed" (flamegraph.pl input) or "speedscope" (JSON).
+        tf_trace (bool): Also capture a TensorFlow profiler trace; its log
+            directory is returned in the `X-TF-Profile-Logdir` header.
+
+    Returns:
+        The profile as a downloadable text or JSON file.
+
+    Raises:
+        HTTPException: 409 if a profiling session is already running.
+    """
+    profiler = SamplingProfiler(hz=hz, tf_trace=tf_trace)
+    try:
+        profiler.start()
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    try:
+        # The event loop keeps serving traffic while the sampler thread runs.
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+
+    headers = {"X-Profile-Samples": str(profiler.samples)}
+    if profiler.tf_logdir:
+        headers["X-TF-Profile-Logdir"] = profiler.tf_logdir
+
+    if format == "speedscope":
+        headers["Content-Disposition"] = (
+            'attachment; filename="profile.speedscope.json"'
+        )
+        return JSONResponse(profiler.to_speedscope(), headers=headers)
+    headers["Content-Disposition"] = 'attachment; filename="profile.collapsed.txt"'
+    return PlainTextResponse(profiler.to_collapsed(), headers=headers)
+
+
+@router.get("/loop")
+async def event_loop_blocking():
+    """
+    Recent event-loop blocking episodes of this worker, newest first.
+
+    Returns:
+        dict: monitor settings and episodes, each with the lag, the task that
+        held the loop and its stack at the time.
+    """
+    return {
+        "running": loop_monitor.running,
+        "interval_seconds": loop_monitor.interval,
+        "threshold_seconds": loop_monitor.threshold,
+        "episodes": loop_monitor.recent(),
+    }
+
+
+KeyType = Literal["lineno", "filename", "traceback"]
+
+
+def _memory_report() -> dict:
+    return {
+        "process": process_memory(),
+        "models": model_memory(),
+        "tf_allocator": tf_allocator_stats(),
+        "spooled_upload_bytes": directory_bytes(JOBS_SPOOL_DIR),
+        "snapshots": allocation_tracker.snapshots(),
+    }
+
+
+@router.get("/memory")
+async def memory():
+    """
+    Memory accounting of this worker.
+
+    Returns:
+        dict: process RSS/VMS and tracemalloc totals, weights of each model
+        resident in the registry, TensorFlow allocator stats (where TF reports
+        them), bytes of spooled job uploads and the kept tracemalloc snapshots.
+    """
+    return await asyncio.to_thread(_memory_report)
+
+
+@router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: int = Query(1, gt=0, le=MEMORY_TRACEMALLOC_MAX_FRAMES),
+):
+    """
+    Start tracing Python allocations, keeping `frames` frames per allocation.
+    Restarting with another depth drops what was traced so far.
+    """
+    allocation_tracker.start(frames)
+    return {"tracing": True, "frames": frames}
+
+
+@router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc():
+    """Stop tracing and drop the kept snapshots."""
+    allocation_tracker.stop()
+    return {"tracing": False}
+
+
+@router.post("/memory/snapshots")
+async def take_snapshot(
+    key_type: KeyType = "lineno", limit: int = Query(20, gt=0, le=200)
+):
+    """
+    Take and keep a tracemalloc snapshot (the oldest kept one is dropped past
+    MEMORY_MAX_SNAPSHOTS).
+
+    Returns:
+        dict: the snapshot `id`, its `top` allocation sites and its traced
+        bytes `by_source` (app, pil, numpy, tensorflow, keras, http, other).
+
+    Raises:
+        HTTPException: 409 if tracemalloc is not tracing.
+    """
+    try:
+        snapshot_id = await asyncio.to_thread(allocation_tracker.snapshot)
+        top = await asyncio.to_thread(
+            allocation_tracker.top, snapshot_id, key_type, limit
+        )
+        by_source = await asyncio.to_thread(allocation_tracker.by_source, snapshot_id)
+    except (TracingNotStarted, SnapshotNotFound) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.args[0])
+    return {"id": snapshot_id, "top": top, "by_source": by_source}
+
+
+@router.get("/memory/snapshots/{snapshot_id}/diff")
+async def diff_snapshot(
+    snapshot_id: int,
+    against: Optional[int] = Query(
+        None, description="later snapshot id (default: the current heap)"
+    ),
+    key_type: KeyType = "lineno",
+    limit: int = Query(20, gt=0, le=200),
+):
+    """
+    Allocation sites that grew (or shrank) most since snapshot `snapshot_id`.
+    Under steady load, sites that keep growing between snapshots are leaks.
+
+    Raises:
+        HTTPException: 404 for an unknown snapshot, 409 if tracemalloc is
+        not tracing.
+    """
+    try:
+        stats = await asyncio.to_thread(
+            allocation_tracker.diff, snapshot_id, against, key_type, limit
+        )
+    except (TracingNotStarted, SnapshotNotFound) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.args[0])
+    return {"base": snapshot_id, "against": against, "stats": stats}
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+import structlog
+from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import Response
+
+from app.api.v1.encoding import encode_response
+from app.api.v1.routes.img_class import ALLOWED_CONTENT_TYPES
+from app.metrics import UPLOAD_READ_DURATION, VECTOR_SEARCH_DURATION
+from app.models.multimodel import ModelManager
+from app.models.scheduler import SchedulerError
+from app.models.vector_index import (
+    VECTOR_INDEX_NPROBE,
+    VectorIndex,
+    VectorIndexError,
+    get_vector_index,
+)
+
+router = APIRouter()
+logger = structlog.get_logger()
+
+MAX_EMBED_FILES = int(os.getenv("MAX_EMBED_FILES", "64"))
+MAX_NEIGHBOURS = 100
+
+# Index versions already warned about, so a stale index is logged once
+_stale_warned: set = set()
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {file.content_type}",
+        )
+    with UPLOAD_READ_DURATION.labels(backend="tensorflow").time():
+        image_data = await file.read()
+    if not image_data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Uploaded file {file.filename} is empty.",
+        )
+    return image_data
+
+
+def _open_index() -> VectorIndex:
+    try:
+        index = get_vector_index()
+    except VectorIndexError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    current = ModelManager.model_version(index.model)
+    if (
+        index.version
+        and index.version != current
+        and index.version not in _stale_warned
+    ):
+        _stale_warned.add(index.version)
+        logger.warning(
+            "Vector index was built with another model version; rebuild it",
+            model=index.model,
+            index_version=index.version,
+            model_version=current,
+        )
+    return index
+
+
+@router.post("/embeddings")
+async def embeddings(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    model: Optional[str] = Query(
+        None, description="Backbone to embed with; picked by CPU load if omitted"
+    ),
+) -> Response:
+    """
+    Endpoint to compute image embeddings: the pooled penultimate-layer
+    features of a ModelManager backbone, L2-normalized. All files go through
+    the backbone in one batch, and embeddings already in the prediction cache
+    are not computed again.
+
+    Args:
+        files (List[UploadFile]): Up to MAX_EMBED_FILES images (JPEG or PNG).
+        model (str): Optional backbone name.
+
+    Returns:
+        Response: JSON or MessagePack (by the Accept header; MessagePack
+        sends the vectors as float32) of:
+            {
+                "results": [
+                    {"filename": str, "model_used": str, "embedding": [float, ...]}
+                    | {"filename": str, "error": str},
+                    ...
+                ]
+            }
+        in the order of `files`.
+
+    Raises:
+        HTTPException: 400 for an unknown model, empty files or too many
+        files, 415 for unsupported file types, 429/503/504 when the request
+        is dropped before inference, 500 on unexpected errors.
+    """
+    if model is not None and model not in ModelManager.MODEL_INFO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown model: {model}"
+        )
+    if len(files) > MAX_EMBED_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_EMBED_FILES} files per request.",
+        )
+    images = [await _read_upload(file) for file in files]
+
+    try:
+        results = await ModelManager.embed_batch(images, model_name=model)
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during embeddings", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred while computing embeddings.",
+        )
+    return encode_response(
+        request,
+        {
+            "results": [
+                {"filename": file.filename, **result}
+                for file, result in zip(files, results)
+            ]
+        },
+    )
+
+
+@router.post("/similar")
+async def similar(
+    request: Request,
+    file: UploadFile = File(...),
+    k: int = Query(10, ge=1, le=MAX_NEIGHBOURS),
+    nprobe: int = Query(
+        VECTOR_INDEX_NPROBE,
+        ge=0,
+        description="IVF lists to scan; 0 searches the whole index exactly",
+    ),
+) -> Response:
+    """
+    Endpoint to find the archive images most similar to an uploaded one, in
+    the index at VECTOR_INDEX_DIR (built with app.pipeline.embed_index), and
+    to classify it by its labelled neighbours (kNN, weighted by similarity).
+    The query is embedded with the backbone the index was built with.
+
+    Args:
+        file (UploadFile): The query image (JPEG or PNG).
+        k (int): Neighbours to return.
+        nprobe (int): IVF lists to scan (more is slower and more exact).
+
+    Returns:
+        Response: JSON or MessagePack (by the Accept header) of:
+            {
+                "model_used": str,
+                "neighbours": [{"key": str, "label": str, "score": float}, ...],
+                "knn": [{"label": str, "score": float, "votes": int}, ...]
+            }
+        neighbours by cosine similarity, best first.
+
+    Raises:
+        HTTPException: 400 if the image cannot be decoded, 415 for
+        unsupported file types, 503 if no index is configured, 429/503/504
+        when the request is dropped before inference, 500 on unexpected
+        errors.
+    """
+    index = _open_index()
+    image_data = await _read_upload(file)
+    try:
+        (result,) = await ModelManager.embed_batch([image_data], model_name=index.model)
+        if "error" in result:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=result["error"]
+            )
+        mode = "ivf" if index.nlist and 0 < nprobe < index.nlist else "exact"
+        started = time.perf_counter()
+        neighbours = await asyncio.to_thread(
+            index.neighbours, result["embedding"], k, nprobe
+        )
+        VECTOR_SEARCH_DURATION.labels(mode=mode).observe(time.perf_counter() - started)
+    except HTTPException:
+        raise
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during similarity search", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during similarity search.",
+        )
+    return encode_response(
+        request,
+        {
+            "model_used": index.model,
+            "neighbours": neighbours,
+            "knn": VectorIndex.vote(neighbours),
+        },
+    )
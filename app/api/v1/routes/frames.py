@@ -0,0 +1,167 @@
+from typing import List, Literal
+
+import structlog
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import Response
+from starlette.datastructures import UploadFile
+
+from app.api.v1.encoding import encode_response
+from app.api.v1.routes.img_class import ALLOWED_CONTENT_TYPES, triton_multi_model
+from app.metrics import INFERENCE_DURATION, UPLOAD_READ_DURATION
+from app.models.multimodel import ModelManager
+from app.models.scheduler import SchedulerError
+from app.pipeline.frames import (
+    FRAME_DEDUP_MAX_DISTANCE,
+    FRAME_MAX_BYTES,
+    FRAME_SEQUENCE_MAX_BYTES,
+    FRAME_SEQUENCE_MAX_FRAMES,
+    FrameSequenceError,
+    JpegStreamSplitter,
+    classify_frames,
+)
+
+router = APIRouter()
+logger = structlog.get_logger()
+
+# Body types read as one MJPEG stream (raw concatenated JPEGs or
+# multipart/x-mixed-replace parts)
+STREAM_CONTENT_TYPES = {
+    "video/x-motion-jpeg",
+    "video/mjpeg",
+    "multipart/x-mixed-replace",
+    "image/jpeg",
+    "application/octet-stream",
+}
+
+
+def _too_many_frames() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {FRAME_SEQUENCE_MAX_FRAMES} frames per request.",
+    )
+
+
+async def _read_multipart(request: Request) -> List[bytes]:
+    form = await request.form(max_files=FRAME_SEQUENCE_MAX_FRAMES + 1)
+    files = [f for f in form.getlist("files") if isinstance(f, UploadFile)]
+    if len(files) > FRAME_SEQUENCE_MAX_FRAMES:
+        raise _too_many_frames()
+    for file in files:
+        if file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported file type: {file.content_type}",
+            )
+        if file.size is not None and file.size > FRAME_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Frame {file.filename} exceeds {FRAME_MAX_BYTES} bytes",
+            )
+    return [await file.read() for file in files]
+
+
+async def _read_stream(request: Request) -> List[bytes]:
+    splitter = JpegStreamSplitter(FRAME_MAX_BYTES, FRAME_SEQUENCE_MAX_BYTES)
+    frames = []
+    try:
+        async for chunk in request.stream():
+            frames.extend(splitter.feed(chunk))
+            if len(frames) > FRAME_SEQUENCE_MAX_FRAMES:
+                raise _too_many_frames()
+    except FrameSequenceError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return frames
+
+
+@router.post("/predict_frames")
+async def predict_frames(
+    request: Request,
+    backend: Literal["smart", "triton"] = Query("smart"),
+    max_distance: int = Query(
+        FRAME_DEDUP_MAX_DISTANCE,
+        ge=0,
+        le=64,
+        description="dHash bits a frame may differ by and still reuse the last "
+        "prediction; 0 reuses it only for identical hashes",
+    ),
+) -> Response:
+    """
+    Endpoint to classify a frame sequence (ROV video) without running every
+    near-identical frame through the model: frames whose perceptual hash
+    barely changed since the last classified frame reuse its prediction, the
+    rest are classified in batches (see app.pipeline.frames).
+
+    The body is either multipart/form-data with the frames as `files` parts
+    (JPEG or PNG, in order), or one MJPEG stream (`video/x-motion-jpeg`,
+    `multipart/x-mixed-replace` or concatenated JPEGs), split into frames as
+    it arrives.
+
+    Returns:
+        Response: JSON or MessagePack (by the Accept header) of
+            {
+                "model_used": str,
+                "frame_count": int,
+                "inferred": int,
+                "inferred_share": float,
+                "frames": [{"frame": int, "source": int, "predictions": [...]}
+                           | {"frame": int, "source": int, "error": str}, ...]
+            }
+        where "source" is the frame whose prediction was used.
+
+    Raises:
+        HTTPException: 400 if there are no frames, 413 for more than
+        FRAME_SEQUENCE_MAX_FRAMES frames, a frame over FRAME_MAX_BYTES or a
+        body over FRAME_SEQUENCE_MAX_BYTES, 415 for unsupported types,
+        429/503/504 when the request is dropped before inference, 500 on
+        unexpected errors.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > FRAME_SEQUENCE_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Request exceeds {FRAME_SEQUENCE_MAX_BYTES} bytes",
+        )
+    model_label = "triton_multi" if backend == "triton" else "multi"
+    with UPLOAD_READ_DURATION.labels(
+        backend="triton" if backend == "triton" else "tensorflow"
+    ).time():
+        if content_type == "multipart/form-data":
+            frames = await _read_multipart(request)
+        elif content_type in STREAM_CONTENT_TYPES:
+            frames = await _read_stream(request)
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported content type: {content_type or 'none'}",
+            )
+    if not frames:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="No frames in the request."
+        )
+
+    manager = triton_multi_model if backend == "triton" else ModelManager
+    try:
+        with INFERENCE_DURATION.labels(model_name=model_label).time():
+            # One backbone for the whole sequence
+            model_name = await manager.select_model()
+            result = await classify_frames(
+                frames, manager.classify_batch, model_name, max_distance
+            )
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during predict_frames", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during prediction.",
+        )
+
+    logger.info(
+        "Frame sequence classified",
+        frames=result["frame_count"],
+        inferred=result["inferred"],
+        model_used=result["model_used"],
+    )
+    return encode_response(request, result)
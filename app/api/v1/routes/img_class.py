@@ -1,17 +1,35 @@
 import os
-from typing import List
+from functools import partial
+from typing import List, Literal
 
 import structlog
-from fastapi import APIRouter, File, HTTPException, UploadFile, status
+from fastapi import (
+    APIRouter,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+
+from app.api.v1.encoding import encode_response
 
 # Prometheus metrics
 from app.metrics import (
     INFERENCE_DURATION,
     INFERENCE_REQUESTS,
+    INFERENCE_STAGE_DURATION,
+    UPLOAD_READ_DURATION,
 )
 from app.models import resnet
 from app.models.multimodel import ModelManager
+from app.models.scheduler import SchedulerError
+from app.models.tiling import TILE_MAX_COUNT, TILE_OVERLAP
 from app.models.tritonservice import TritonMultiModel
+from app.pipeline.fetcher import FetchError, fetch_and_classify_many, image_fetcher
 
 router = APIRouter()
 logger = structlog.get_logger()
@@ -23,6 +41,18 @@ TRITON_SERVER_PORT = os.getenv("TRITON_SERVER_PORT", "8000")
 TRITON_SERVER_URL = f"{TRITON_SERVER_NAME}:{TRITON_SERVER_PORT}"
 triton_multi_model = TritonMultiModel(TRITON_SERVER_URL)
 
+MAX_URLS_PER_REQUEST = int(os.getenv("MAX_URLS_PER_REQUEST", "64"))
+
+
+class UrlPredictRequest(BaseModel):
+    url: str
+    backend: Literal["smart", "triton"] = "smart"
+
+
+class UrlBatchPredictRequest(BaseModel):
+    urls: List[str] = Field(..., min_length=1, max_length=MAX_URLS_PER_REQUEST)
+    backend: Literal["smart", "triton"] = "smart"
+
 
 def return_the_highest_confidence(predictions: List) -> dict | None:
     """
@@ -40,7 +70,7 @@ def return_the_highest_confidence(predictions: List) -> dict | None:
 
 
 @router.post("/predict")
-async def predict(file: UploadFile = File(...)) -> dict:
+async def predict(request: Request, file: UploadFile = File(...)) -> Response:
     """
     Endpoint to classify an uploaded image and return the most confident prediction.
 
@@ -51,7 +81,8 @@ async def predict(file: UploadFile = File(...)) -> dict:
         file (UploadFile): The uploaded image file.
 
     Returns:
-        dict: A dictionary containing the most confident prediction:
+        Response: JSON or MessagePack (by the Accept header, see
+        app.api.v1.encoding) of the most confident prediction:
             {
                 "result": {
                     "class_id": str,
@@ -73,7 +104,8 @@ async def predict(file: UploadFile = File(...)) -> dict:
                 detail=f"Unsupported file type: {file.content_type}. Allowed types: {', '.join(ALLOWED_CONTENT_TYPES)}",
             )
 
-        image_data = await file.read()
+        with UPLOAD_READ_DURATION.labels(backend="tensorflow").time():
+            image_data = await file.read()
 
         if not image_data:
             logger.warning("Uploaded file is empty")
@@ -82,19 +114,29 @@ async def predict(file: UploadFile = File(...)) -> dict:
                 detail="Uploaded file is empty.",
             )
 
-        # Time and count inference
+        # Time and count inference; the registry lookup and the forward pass
+        # block, so they run on the inference executor like ModelManager's
         with INFERENCE_DURATION.labels(model_name=model_name).time():
-            pred = resnet.classify_image(image_data)["predictions"]
+            pred = (
+                await ModelManager._run_in_executor(
+                    partial(resnet.classify_image, image_data), lane=model_name
+                )
+            )["predictions"]
         INFERENCE_REQUESTS.labels(model_name=model_name, status="success").inc()
 
         result = return_the_highest_confidence(predictions=pred)
         logger.info("Image classified successfully", result=result)
-        return {"result": result}
+        return encode_response(request, {"result": result})
 
     except HTTPException as http_exc:
         INFERENCE_REQUESTS.labels(model_name=model_name, status="failure").inc()
         logger.error("HTTPException occurred", detail=http_exc.detail)
         raise http_exc
+    except SchedulerError as e:
+        # Dropped before inference, or ModelBudgetError (503)
+        INFERENCE_REQUESTS.labels(model_name=model_name, status="failure").inc()
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         INFERENCE_REQUESTS.labels(model_name=model_name, status="failure").inc()
         logger.exception("Unexpected error during prediction: error", error=str(e))
@@ -105,7 +147,7 @@ async def predict(file: UploadFile = File(...)) -> dict:
 
 
 @router.post("/smart_predict")
-async def smart_predict(file: UploadFile = File(...)) -> dict:
+async def smart_predict(request: Request, file: UploadFile = File(...)) -> Response:
     """
     Endpoint to classify an uploaded image using the ModelManager's classify_image method.
     This endpoint accepts an image file (JPEG or PNG), processes it using the ModelManager,
@@ -113,7 +155,8 @@ async def smart_predict(file: UploadFile = File(...)) -> dict:
     Args:
         file (UploadFile): The uploaded image file.
     Returns:
-        dict: A dictionary containing the most confident prediction:
+        Response: JSON or MessagePack (by the Accept header) of the most
+        confident prediction:
             {
                 "result": {
                     "class_id": str,
@@ -135,7 +178,8 @@ async def smart_predict(file: UploadFile = File(...)) -> dict:
         )
 
     # 2) Read bytes
-    image_data = await file.read()
+    with UPLOAD_READ_DURATION.labels(backend="tensorflow").time():
+        image_data = await file.read()
     if not image_data:
         logger.warning("Uploaded file is empty")
         raise HTTPException(
@@ -152,12 +196,15 @@ async def smart_predict(file: UploadFile = File(...)) -> dict:
         best["model_used"] = out["model_used"]
 
         logger.info("Image classified successfully (smart_predict)", result=best)
-        return {"result": best}
+        return encode_response(request, {"result": best})
 
     except HTTPException as http_exc:
         INFERENCE_REQUESTS.labels(model_name="multi", status="failure").inc()
         logger.error("HTTPException in smart_predict", detail=http_exc.detail)
         raise
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         INFERENCE_REQUESTS.labels(model_name="multi", status="failure").inc()
         logger.exception("Unexpected error during smart_predict", error=str(e))
@@ -168,7 +215,7 @@ async def smart_predict(file: UploadFile = File(...)) -> dict:
 
 
 @router.post("/triton_predict")
-async def triton_predict(file: UploadFile = File(...)) -> dict:
+async def triton_predict(request: Request, file: UploadFile = File(...)) -> Response:
     """
     Endpoint to classify an uploaded image using the Triton service.
     This endpoint accepts an image file (JPEG or PNG), processes it using the Triton service,
@@ -176,7 +223,8 @@ async def triton_predict(file: UploadFile = File(...)) -> dict:
     Args:
         file (UploadFile): The uploaded image file.
     Returns:
-        dict: A dictionary containing the most confident prediction:
+        Response: JSON or MessagePack (by the Accept header) of the most
+        confident prediction:
             {
                 "result": {
                     "class_id": str,
@@ -190,7 +238,8 @@ async def triton_predict(file: UploadFile = File(...)) -> dict:
     """
     try:
         model_label = "triton_multi"  # Specify the model class for metrics
-        image_data = await file.read()
+        with UPLOAD_READ_DURATION.labels(backend="triton").time():
+            image_data = await file.read()
 
         with INFERENCE_DURATION.labels(model_name=model_label).time():
             result = await triton_multi_model.classify_image(image_data)
@@ -204,7 +253,10 @@ async def triton_predict(file: UploadFile = File(...)) -> dict:
         # Optionally attach which backbone was used:
         best["model_used"] = result["model_used"]
 
-        return {"result": best}
+        return encode_response(request, {"result": best})
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         INFERENCE_REQUESTS.labels(model_name=model_label, status="failure").inc()
         logger.exception("Unexpected error during Triton prediction", error=str(e))
@@ -212,3 +264,195 @@ async def triton_predict(file: UploadFile = File(...)) -> dict:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred during Triton prediction.",
         )
+
+
+async def classify_with_backend(image_data: bytes, backend: str) -> dict:
+    """
+    Classify `image_data` with the CPU-aware ModelManager ("smart") or the
+    Triton service ("triton") and return the most confident prediction with
+    the backbone that produced it.
+    """
+    model_label = "triton_multi" if backend == "triton" else "multi"
+    try:
+        with INFERENCE_DURATION.labels(model_name=model_label).time():
+            if backend == "triton":
+                out = await triton_multi_model.classify_image(image_data)
+            else:
+                out = await ModelManager.classify_image(image_data)
+    except SchedulerError:
+        raise
+    except Exception:
+        INFERENCE_REQUESTS.labels(model_name=model_label, status="failure").inc()
+        raise
+    INFERENCE_REQUESTS.labels(model_name=out["model_used"], status="success").inc()
+
+    best = return_the_highest_confidence(out["predictions"])
+    best["model_used"] = out["model_used"]
+    return {"result": best}
+
+
+async def _fetch(url: str, backend: str) -> bytes:
+    with INFERENCE_STAGE_DURATION.labels(
+        backend="triton" if backend == "triton" else "tensorflow",
+        model_name="url",
+        stage="fetch",
+    ).time():
+        return await image_fetcher.fetch(url)
+
+
+@router.post("/predict_url")
+async def predict_url(request: UrlPredictRequest, http_request: Request) -> Response:
+    """
+    Endpoint to classify an image fetched from a URL, so callers don't have to
+    download and re-upload images that already live in an object store.
+
+    Args:
+        request (UrlPredictRequest): {"url": str, "backend": "smart" | "triton"}
+
+    Returns:
+        Response: {"result": {"class_id", "class_name", "confidence",
+        "model_used"}} as JSON or MessagePack (by the Accept header).
+
+    Raises:
+        HTTPException: 400/403 for invalid or disallowed URLs, 413 if the image
+        is too large, 502/504 if the download fails or times out, 500 on
+        unexpected errors.
+    """
+    try:
+        image_data = await _fetch(request.url, request.backend)
+    except FetchError as e:
+        logger.warning("Image fetch failed", url=request.url, error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    try:
+        result = await classify_with_backend(image_data, request.backend)
+        logger.info("Image classified successfully (predict_url)", result=result)
+        return encode_response(http_request, result)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during predict_url", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during prediction.",
+        )
+
+
+@router.post("/predict_urls")
+async def predict_urls(
+    request: UrlBatchPredictRequest, http_request: Request
+) -> Response:
+    """
+    Endpoint to classify several images by URL in one call. Downloads share a
+    pooled HTTP client and overlap with decoding and inference of the images
+    already fetched.
+
+    Args:
+        request (UrlBatchPredictRequest): {"urls": [str, ...], "backend": ...}
+
+    Returns:
+        Response: {"results": [{"url": str, "result": {...}} | {"url": str,
+        "error": str, "status_code": int}, ...]} in the order of `urls`, as
+        JSON or MessagePack (by the Accept header). With `layout=columnar`
+        in the Accept media type the results come as {"count": int,
+        "columns": {"url": [...], "class_id": [...], ..., "error": [...]}},
+        one array per field.
+    """
+    results = await fetch_and_classify_many(
+        request.urls,
+        partial(_fetch, backend=request.backend),
+        partial(classify_with_backend, backend=request.backend),
+    )
+    logger.info(
+        "Images classified (predict_urls)",
+        count=len(results),
+        failed=sum(1 for r in results if "error" in r),
+    )
+    return encode_response(http_request, {"results": results})
+
+
+@router.post("/predict_tiled")
+async def predict_tiled(
+    request: Request,
+    file: UploadFile = File(...),
+    backend: Literal["smart", "triton"] = Query("smart"),
+    overlap: float = Query(TILE_OVERLAP, ge=0, lt=0.9),
+    max_tiles: int = Query(TILE_MAX_COUNT, ge=1, le=TILE_MAX_COUNT),
+) -> Response:
+    """
+    Endpoint to classify a high-resolution image (survey stills, camera-trap
+    frames) tile by tile instead of squashing it to the model's input size.
+    The image is decoded once, cut into overlapping tiles and every tile runs
+    in one batch (see app.models.tiling).
+
+    Args:
+        file (UploadFile): The uploaded image file.
+        backend: "smart" (ModelManager) or "triton".
+        overlap: Share of a tile overlapping its neighbour.
+        max_tiles: Most tiles, including the whole-frame tile; larger images
+            are scaled down until their grid fits.
+
+    Returns:
+        Response: JSON or MessagePack (by the Accept header) of
+            {
+                "model_used": str,
+                "image_size": [width, height],
+                "scale": float,
+                "predictions": [{"class_id", "class_name", "confidence",
+                                 "tiles"}, ...],
+                "tiles": [{"box": [left, top, right, bottom],
+                           "predictions": [...]}, ...]
+            }
+
+    Raises:
+        HTTPException: 415 for unsupported file types, 400 if the file is
+        empty or can't be decoded, 500 on unexpected errors.
+    """
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
+        logger.warning("Unsupported file type", content_type=file.content_type)
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {file.content_type}",
+        )
+
+    model_label = "triton_multi" if backend == "triton" else "multi"
+    with UPLOAD_READ_DURATION.labels(
+        backend="triton" if backend == "triton" else "tensorflow"
+    ).time():
+        image_data = await file.read()
+    if not image_data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Uploaded file is empty."
+        )
+
+    classify = (
+        triton_multi_model.classify_tiled
+        if backend == "triton"
+        else ModelManager.classify_tiled
+    )
+    try:
+        with INFERENCE_DURATION.labels(model_name=model_label).time():
+            result = await classify(image_data, overlap=overlap, max_tiles=max_tiles)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SchedulerError as e:
+        logger.warning("Request dropped before inference", error=str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        INFERENCE_REQUESTS.labels(model_name=model_label, status="failure").inc()
+        logger.exception("Unexpected error during predict_tiled", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during prediction.",
+        )
+    INFERENCE_REQUESTS.labels(model_name=result["model_used"], status="success").inc()
+
+    logger.info(
+        "Image classified tile by tile",
+        model_used=result["model_used"],
+        tiles=len(result["tiles"]),
+    )
+    return encode_response(request, result)
@@ -0,0 +1,172 @@
+import os
+import shutil
+from typing import List, Literal, Optional
+
+import structlog
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+
+from app.api.v1.routes.img_class import ALLOWED_CONTENT_TYPES, triton_multi_model
+from app.models.multimodel import ModelManager
+from app.pipeline.fetcher import image_fetcher
+from app.pipeline.jobs import JOBS_MAX_ITEMS, JobError, JobManager
+
+router = APIRouter()
+logger = structlog.get_logger()
+
+job_manager = JobManager(
+    backends={
+        "smart": ModelManager.classify_batch,
+        "triton": triton_multi_model.classify_batch,
+    },
+    fetcher=image_fetcher,
+)
+
+# Bytes copied at a time when spooling uploads to disk
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+class JobItem(BaseModel):
+    url: Optional[str] = None
+    path: Optional[str] = None
+    shard: Optional[str] = None
+
+    @model_validator(mode="after")
+    def exactly_one_source(self):
+        if sum(v is not None for v in (self.url, self.path, self.shard)) != 1:
+            raise ValueError("Each item needs exactly one of 'url', 'path' or 'shard'.")
+        return self
+
+
+class JobRequest(BaseModel):
+    items: List[JobItem] = Field(..., min_length=1, max_length=JOBS_MAX_ITEMS)
+    backend: Literal["smart", "triton"] = "smart"
+
+
+def _submit(items: List[dict], backend: str, job_id: Optional[str] = None) -> dict:
+    try:
+        job = job_manager.submit(items, backend, job_id)
+    except JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return job.summary()
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(request: JobRequest) -> dict:
+    """
+    Endpoint to submit a bulk classification job from a manifest of image URLs,
+    server-local image paths and/or tar shards (both relative to
+    JOBS_LOCAL_ROOT; see app.pipeline.shards). The job runs in the background;
+    poll `/jobs/{job_id}` or stream `/jobs/{job_id}/results`.
+
+    Args:
+        request (JobRequest): {"items": [{"url": str} | {"path": str} |
+        {"shard": str}, ...], "backend": "smart" | "triton"}
+
+    Returns:
+        dict: The job summary, including `job_id` and `status` ("queued").
+
+    Raises:
+        HTTPException: 400/403 for invalid items, 429 if too many jobs are
+        queued, 503 if the job manager is not running.
+    """
+    items = [item.model_dump(exclude_none=True) for item in request.items]
+    return _submit(items, request.backend)
+
+
+@router.post("/jobs/upload", status_code=status.HTTP_202_ACCEPTED)
+async def create_upload_job(
+    files: List[UploadFile] = File(...),
+    backend: Literal["smart", "triton"] = Form("smart"),
+) -> dict:
+    """
+    Endpoint to submit a bulk classification job from uploaded images. Files
+    are spooled to disk as they arrive, so large jobs are not held in memory.
+
+    Args:
+        files (List[UploadFile]): The images (JPEG or PNG).
+        backend (str): "smart" or "triton".
+
+    Returns:
+        dict: The job summary, including `job_id` and `status` ("queued").
+
+    Raises:
+        HTTPException: 400 for unsupported file types, 429 if too many jobs are
+        queued, 503 if the job manager is not running.
+    """
+    if len(files) > JOBS_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A job can contain at most {JOBS_MAX_ITEMS} items.",
+        )
+    for file in files:
+        if file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported file type: {file.filename}",
+            )
+
+    job_id = job_manager.new_job_id()
+    os.makedirs(os.path.join(job_manager.spool_dir, job_id), exist_ok=True)
+    items = []
+    try:
+        for index, file in enumerate(files):
+            path = job_manager.spool_path(job_id, index)
+            with open(path, "wb") as out:
+                while chunk := await file.read(SPOOL_CHUNK_BYTES):
+                    out.write(chunk)
+            items.append({"upload": path, "filename": file.filename})
+        return _submit(items, backend, job_id)
+    except BaseException:
+        shutil.rmtree(os.path.join(job_manager.spool_dir, job_id), ignore_errors=True)
+        raise
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> dict:
+    """
+    Endpoint to check the progress of a bulk job.
+
+    Returns:
+        dict: {"job_id", "status", "backend", "total", "processed", "failed",
+        "created_at", "finished_at", "error"}
+    """
+    try:
+        return job_manager.get(job_id).summary()
+    except JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@router.get("/jobs/{job_id}/results")
+async def stream_job_results(job_id: str, start: int = 0) -> StreamingResponse:
+    """
+    Endpoint to stream a job's results as newline-delimited JSON while it runs.
+
+    Each line is {"type": "result", "index", "source", ...prediction or
+    "error"}, {"type": "progress", "processed", "total"} after every batch, or
+    a final {"type": "summary", ...}. Pass `start` to resume a stream from a
+    given result position.
+    """
+    try:
+        job = job_manager.get(job_id)
+    except JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return StreamingResponse(
+        job_manager.stream(job, start=max(0, start)),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str) -> dict:
+    """
+    Endpoint to cancel a queued or running job. Results produced so far stay
+    available until the job expires.
+    """
+    try:
+        job = await job_manager.cancel(job_id)
+    except JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    logger.info("Job cancel requested", job_id=job_id)
+    return job.summary()
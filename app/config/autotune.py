@@ -0,0 +1,448 @@
+"""
+Thread-configuration autotuner for the inference stack.
+
+A search runs a short synthetic benchmark for every backbone in CPU_TO_MODEL
+across TensorFlow intra/inter-op thread counts, executor pool sizes and
+batch sizes, within the CPU budget of one API worker (the cgroup quota
+divided by the number of workers). TensorFlow fixes its thread pools when it
+starts, so every (intra, inter) pair is measured in a fresh subprocess.
+Exported ONNX models, when present, are measured with onnxruntime to
+recommend Triton's `session_thread_pool_size`.
+
+The winning settings are saved as a JSON profile keyed by a fingerprint of
+the CPU budget, and applied as environment variables before the workers
+start, so later startups load the profile instead of searching again:
+
+    AUTOTUNE_MODE=off     never tune (default)
+    AUTOTUNE_MODE=load    apply a matching saved profile if there is one
+    AUTOTUNE_MODE=auto    like load, but search and save when none matches
+    AUTOTUNE_MODE=search  always search and overwrite the profile
+
+    python -m app.config.autotune search   # tune now and print the result
+    python -m app.config.autotune show     # print the saved profile
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+from app.config.server import available_cpus, cgroup_cpu_limit, resolve_workers
+
+logger = structlog.get_logger()
+
+AUTOTUNE_MODE = os.getenv("AUTOTUNE_MODE", "off").lower()
+AUTOTUNE_PROFILE_PATH = os.getenv("AUTOTUNE_PROFILE_PATH", "autotune_profile.json")
+# Seconds measured per grid cell
+AUTOTUNE_SECONDS = float(os.getenv("AUTOTUNE_SECONDS", "1.0"))
+# Batch-1 p95 a configuration must meet for interactive requests
+AUTOTUNE_LATENCY_SLO_MS = float(os.getenv("AUTOTUNE_LATENCY_SLO_MS", "500"))
+AUTOTUNE_BATCH_SIZES = [
+    int(b) for b in os.getenv("AUTOTUNE_BATCH_SIZES", "1,4,8,16").split(",")
+]
+
+PROFILE_VERSION = 1
+
+
+# -----------------------------------------------------------
+# Search space
+# -----------------------------------------------------------
+def fingerprint(workers: int) -> dict:
+    """What a profile depends on; a saved profile is only used if this matches."""
+    return {
+        "version": PROFILE_VERSION,
+        "cpus": available_cpus(),
+        "cpu_limit": cgroup_cpu_limit(),
+        "workers": workers,
+        "cpu_to_model": os.getenv("CPU_TO_MODEL", ""),
+    }
+
+
+def cpu_budget(workers: int) -> int:
+    """Cores one API worker should plan for."""
+    return max(1, available_cpus() // max(1, workers))
+
+
+def thread_candidates(budget: int) -> List[Tuple[int, int]]:
+    """(intra_op, inter_op) pairs worth measuring for a `budget`-core worker."""
+    intra = sorted({n for n in (1, 2, budget // 2, budget) if 1 <= n <= budget})
+    inter = sorted({n for n in (1, 2) if n <= max(1, budget)})
+    return [(a, b) for a in intra for b in inter]
+
+
+def executor_candidates(budget: int, intra: int) -> List[int]:
+    """Executor pool sizes to try when each inference uses `intra` threads."""
+    return sorted({n for n in (1, 2, budget // intra, budget) if n >= 1})
+
+
+# -----------------------------------------------------------
+# Measurement (runs inside the subprocess)
+# -----------------------------------------------------------
+def measure_cell(predict, batch: np.ndarray, executors: int, seconds: float) -> dict:
+    """
+    Run `predict(batch)` from `executors` threads for `seconds`. Shared with
+    app.models.triton_tuning, which measures Triton instance counts with it.
+    """
+    latencies: List[float] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            predict(batch)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=executors) as pool:
+        for future in [pool.submit(loop) for _ in range(executors)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies) or [float("inf")]
+    return {
+        "executors": executors,
+        "batch": len(batch),
+        "images_per_second": len(latencies) * len(batch) / elapsed,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+def measure_tensorflow(
+    intra: int,
+    inter: int,
+    executors: Sequence[int],
+    batches: Sequence[int],
+    seconds: float,
+    models: Optional[Sequence[str]] = None,
+) -> List[dict]:
+    """
+    Benchmark the backbones in this process, whose TensorFlow thread pools
+    must already be configured as (intra, inter). Batch 1 is measured at every
+    executor size (the interactive path); larger batches with one executor
+    (the bulk path).
+    """
+    from app.models.multimodel import ModelManager
+
+    names = models or sorted({name for _, name in ModelManager.CPU_TO_MODEL})
+    rng = np.random.default_rng(0)
+    results = []
+    for name in names:
+        model = ModelManager.get_model(name)
+        height, width = ModelManager.MODEL_INFO[name]["input_size"]
+
+        def predict(batch, model=model):
+            model.predict(batch, batch_size=len(batch), verbose=0)
+
+        cells = [(e, 1) for e in executors] + [(1, b) for b in batches if b > 1]
+        for e, b in cells:
+            batch = rng.random((b, height, width, 3), dtype=np.float32)
+            predict(batch)  # warm-up (graph tracing)
+            cell = measure_cell(predict, batch, e, seconds)
+            results.append({"model": name, "intra": intra, "inter": inter, **cell})
+    return results
+
+
+def _run_measure_subprocess(
+    intra: int, inter: int, executors: Sequence[int], seconds: float
+) -> List[dict]:
+    env = dict(
+        os.environ,
+        TF_NUM_INTRAOP_THREADS=str(intra),
+        TF_NUM_INTEROP_THREADS=str(inter),
+        OMP_NUM_THREADS=str(intra),
+    )
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        command = [
+            sys.executable,
+            "-m",
+            "app.config.autotune",
+            "measure",
+            "--intra",
+            str(intra),
+            "--inter",
+            str(inter),
+            "--executors",
+            ",".join(map(str, executors)),
+            "--seconds",
+            str(seconds),
+            "--output",
+            out.name,
+        ]
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(out.name) as f:
+            return json.load(f)
+
+
+def measure_onnx(budget: int, seconds: float, batch_size: int = 8) -> Dict[str, dict]:
+    """
+    Images/sec of each exported ONNX backbone per onnxruntime intra-op thread
+    count, for recommending Triton's thread settings. Empty if onnxruntime or
+    the exported models are not available.
+    """
+    try:
+        import onnxruntime as ort
+
+        from app.pipeline.backends import ONNX_MODEL_REPO
+    except ImportError:
+        return {}
+    if not os.path.isdir(ONNX_MODEL_REPO):
+        return {}
+
+    rng = np.random.default_rng(0)
+    results: Dict[str, dict] = {}
+    for name in sorted(os.listdir(ONNX_MODEL_REPO)):
+        path = os.path.join(ONNX_MODEL_REPO, name, "1", "model.onnx")
+        if not os.path.exists(path):
+            continue
+        results[name] = {}
+        for threads in sorted({n for n in (1, 2, budget // 2, budget) if n >= 1}):
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = threads
+            session = ort.InferenceSession(
+                path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            spec = session.get_inputs()[0]
+            height, width = spec.shape[1], spec.shape[2]
+            if spec.type == "tensor(uint8)":
+                batch = rng.integers(0, 256, (batch_size, height, width, 3), np.uint8)
+            else:
+                batch = rng.random((batch_size, height, width, 3), dtype=np.float32)
+
+            def predict(batch, session=session, input_name=spec.name):
+                session.run(None, {input_name: batch})
+
+            predict(batch)
+            cell = measure_cell(predict, batch, 1, seconds)
+            results[name][threads] = cell["images_per_second"]
+    return results
+
+
+# -----------------------------------------------------------
+# Selection
+# -----------------------------------------------------------
+def select_best(measurements: List[dict], slo_ms: float) -> dict:
+    """
+    Pick the TensorFlow configuration from `measurements`.
+
+    Interactive settings (intra, inter, executors) maximize batch-1
+    throughput, averaged over backbones after normalizing each by its best
+    result, among configurations whose batch-1 p95 meets `slo_ms` for every
+    backbone (or, if none does, the one with the lowest worst-case p95). The
+    bulk batch size is then the best batch measured with those threads.
+    """
+
+    def normalized(cells: List[dict]) -> Dict[str, float]:
+        best: Dict[str, float] = {}
+        for cell in cells:
+            best[cell["model"]] = max(
+                best.get(cell["model"], 0.0), cell["images_per_second"]
+            )
+        return {m: v or 1.0 for m, v in best.items()}
+
+    interactive = [m for m in measurements if m["batch"] == 1]
+    best_by_model = normalized(interactive)
+    configs: Dict[Tuple[int, int, int], List[dict]] = {}
+    for cell in interactive:
+        configs.setdefault(
+            (cell["intra"], cell["inter"], cell["executors"]), []
+        ).append(cell)
+
+    def score(cells: List[dict]) -> float:
+        return sum(
+            c["images_per_second"] / best_by_model[c["model"]] for c in cells
+        ) / len(cells)
+
+    def worst_p95(cells: List[dict]) -> float:
+        return max(c["p95_ms"] for c in cells)
+
+    within_slo = {k: v for k, v in configs.items() if worst_p95(v) <= slo_ms}
+    if within_slo:
+        intra, inter, executors = max(within_slo, key=lambda k: score(within_slo[k]))
+    else:
+        intra, inter, executors = min(configs, key=lambda k: worst_p95(configs[k]))
+
+    bulk = [
+        m
+        for m in measurements
+        if m["intra"] == intra and m["inter"] == inter and m["executors"] == 1
+    ]
+    bulk_best = normalized(bulk)
+    by_batch: Dict[int, List[float]] = {}
+    for cell in bulk:
+        by_batch.setdefault(cell["batch"], []).append(
+            cell["images_per_second"] / bulk_best[cell["model"]]
+        )
+    by_batch = by_batch or {1: [0.0]}
+    batch_size = max(by_batch, key=lambda b: sum(by_batch[b]) / len(by_batch[b]))
+
+    return {
+        "THREADPOOL_SIZE": executors,
+        "TF_NUM_INTRAOP_THREADS": intra,
+        "TF_NUM_INTEROP_THREADS": inter,
+        "OMP_NUM_THREADS": intra,
+        "JOBS_BATCH_SIZE": batch_size,
+    }
+
+
+def recommend_triton(onnx: Dict[str, dict]) -> Optional[dict]:
+    """Thread count that is fastest for most exported backbones."""
+    if not onnx:
+        return None
+    votes: Dict[int, int] = {}
+    for per_threads in onnx.values():
+        best = max(per_threads, key=per_threads.get)
+        votes[best] = votes.get(best, 0) + 1
+    threads = max(votes, key=lambda t: (votes[t], -t))
+    return {"session_thread_pool_size": threads, "OMP_NUM_THREADS": threads}
+
+
+# -----------------------------------------------------------
+# Profiles
+# -----------------------------------------------------------
+def search(
+    workers: int,
+    seconds: float = AUTOTUNE_SECONDS,
+    slo_ms: float = AUTOTUNE_LATENCY_SLO_MS,
+) -> dict:
+    """Run the full search and return a profile (not yet saved)."""
+    budget = cpu_budget(workers)
+    logger.info("Autotune search started", cpu_budget=budget, workers=workers)
+    started = time.perf_counter()
+    measurements: List[dict] = []
+    for intra, inter in thread_candidates(budget):
+        measurements.extend(
+            _run_measure_subprocess(
+                intra, inter, executor_candidates(budget, intra), seconds
+            )
+        )
+    onnx = measure_onnx(budget, seconds)
+    profile = {
+        "fingerprint": fingerprint(workers),
+        "settings": select_best(measurements, slo_ms),
+        "triton": recommend_triton(onnx),
+        "measurements": measurements,
+        "onnx_measurements": onnx,
+        "created_at": time.time(),
+        "search_seconds": round(time.perf_counter() - started, 1),
+    }
+    logger.info("Autotune search finished", **profile["settings"])
+    return profile
+
+
+def save_profile(profile: dict, path: str = AUTOTUNE_PROFILE_PATH) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_profile(path: str, expected: dict) -> Optional[dict]:
+    """The saved profile at `path` if it exists and matches `expected`."""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if profile.get("fingerprint") != expected:
+        logger.warning(
+            "Ignoring autotune profile for a different CPU budget",
+            path=path,
+            saved=profile.get("fingerprint"),
+            current=expected,
+        )
+        return None
+    return profile
+
+
+def apply_profile(profile: dict) -> None:
+    """Export the profile settings so the workers started next pick them up."""
+    for name, value in profile["settings"].items():
+        os.environ[name] = str(value)
+    logger.info("Applied autotune profile", **profile["settings"])
+
+
+def prepare(
+    mode: str = AUTOTUNE_MODE,
+    path: str = AUTOTUNE_PROFILE_PATH,
+    workers: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    Load, or search for, the profile for this machine according to `mode` and
+    apply it. Call before the API workers are started.
+    """
+    if mode == "off":
+        return None
+    workers = workers or resolve_workers()
+    expected = fingerprint(workers)
+    profile = None if mode == "search" else load_profile(path, expected)
+    if profile is None:
+        if mode == "load":
+            logger.warning("No matching autotune profile, using defaults", path=path)
+            return None
+        profile = search(workers)
+        save_profile(profile, path)
+    apply_profile(profile)
+    return profile
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inference thread autotuner.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("search", help="Search now and save the profile")
+    run.add_argument("--workers", type=int, default=0)
+    run.add_argument("--seconds", type=float, default=AUTOTUNE_SECONDS)
+    run.add_argument("--slo-ms", type=float, default=AUTOTUNE_LATENCY_SLO_MS)
+    run.add_argument("--profile", default=AUTOTUNE_PROFILE_PATH)
+
+    show = commands.add_parser("show", help="Print the saved profile settings")
+    show.add_argument("--profile", default=AUTOTUNE_PROFILE_PATH)
+
+    measure = commands.add_parser("measure", help=argparse.SUPPRESS)
+    measure.add_argument("--intra", type=int, required=True)
+    measure.add_argument("--inter", type=int, required=True)
+    measure.add_argument("--executors", required=True)
+    measure.add_argument("--seconds", type=float, default=AUTOTUNE_SECONDS)
+    measure.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "measure":
+        results = measure_tensorflow(
+            args.intra,
+            args.inter,
+            [int(e) for e in args.executors.split(",")],
+            AUTOTUNE_BATCH_SIZES,
+            args.seconds,
+        )
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    if args.command == "search":
+        profile = search(
+            resolve_workers(args.workers or None), args.seconds, args.slo_ms
+        )
+        save_profile(profile, args.profile)
+    else:
+        with open(args.profile) as f:
+            profile = json.load(f)
+    print(json.dumps({"settings": profile["settings"], "triton": profile["triton"]}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
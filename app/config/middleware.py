@@ -1,18 +1,210 @@
+import asyncio
+import os
+import time
 import uuid
+from typing import Optional
 
 import structlog
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
 
+from app.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS
+from app.models.scheduler import (
+    RequestContext,
+    parse_deadline,
+    reset_request_context,
+    set_request_context,
+)
+
+logger = structlog.get_logger()
+
+# Fraction of new (root) traces to sample; child requests follow the caller's decision.
+OTEL_TRACES_SAMPLER_RATIO = float(os.getenv("OTEL_TRACES_SAMPLER_RATIO", "1.0"))
+# Paths that are still counted in Prometheus but never traced.
+TELEMETRY_UNTRACED_PATHS = frozenset(
+    p.strip()
+    for p in os.getenv(
+        "TELEMETRY_UNTRACED_PATHS", "/metrics,/healthz,/readiness"
+    ).split(",")
+    if p.strip()
+)
+
+
+def build_sampler(ratio: float = OTEL_TRACES_SAMPLER_RATIO) -> ParentBased:
+    """
+    Head sampler: a root request is traced with probability `ratio`
+    (decided from its trace id), and requests arriving with a `traceparent`
+    header inherit the caller's decision.
+    """
+    return ParentBased(root=TraceIdRatioBased(max(0.0, min(1.0, ratio))))
+
+
+class TelemetryMiddleware:
+    """
+    Pure-ASGI middleware that does all per-request telemetry in one pass:
+      - binds request context (request_id, path, method, client_host) to structlog,
+      - opens a single OpenTelemetry SERVER span (W3C `traceparent` is honoured),
+      - records HTTP_REQUEST_DURATION and HTTP_REQUESTS in Prometheus.
+
+    It replaces FastAPIInstrumentor + OpenTelemetryMiddleware + the
+    `@app.middleware("http")` metrics hook, which instrumented every request
+    twice and went through Starlette's BaseHTTPMiddleware machinery.
+    """
+
+    def __init__(self, app, tracer_provider=None, untraced_paths=None):
+        self.app = app
+        self.tracer = trace.get_tracer(__name__, tracer_provider=tracer_provider)
+        self.untraced_paths = (
+            TELEMETRY_UNTRACED_PATHS if untraced_paths is None else untraced_paths
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        method = scope["method"]
+        carrier = {}
+        for key, value in scope["headers"]:
+            if key in (b"traceparent", b"tracestate", b"x-request-id"):
+                carrier[key.decode("latin-1")] = value.decode("latin-1")
+        request_id = carrier.get("x-request-id") or uuid.uuid4().hex
+        client = scope.get("client")
 
-class RequestContextMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         structlog.contextvars.clear_contextvars()
         structlog.contextvars.bind_contextvars(
-            request_id=str(uuid.uuid4()),
-            path=request.url.path,
-            method=request.method,
-            client_host=request.client.host,
+            request_id=request_id,
+            path=path,
+            method=method,
+            client_host=client[0] if client else None,
         )
-        response = await call_next(request)
-        return response
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        start = time.perf_counter()
+        if path in self.untraced_paths:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                self._record(scope, method, status_code, start)
+            return
+
+        token = otel_context.attach(propagate.extract(carrier))
+        try:
+            with self.tracer.start_as_current_span(
+                f"{method} {path}",
+                kind=SpanKind.SERVER,
+                record_exception=True,
+                set_status_on_exception=True,
+            ) as span:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    endpoint = self._record(scope, method, status_code, start)
+                    if span.is_recording():
+                        span.update_name(f"{method} {endpoint}")
+                        span.set_attribute("http.method", method)
+                        span.set_attribute("http.route", endpoint)
+                        span.set_attribute("http.target", path)
+                        span.set_attribute("http.status_code", status_code)
+                        span.set_attribute("request.id", request_id)
+                        if status_code >= 500:
+                            span.set_status(Status(StatusCode.ERROR))
+        finally:
+            otel_context.detach(token)
+
+    @staticmethod
+    def _record(scope, method: str, status_code: int, start: float) -> str:
+        # Prefer the route template (set by the router once matched) to keep
+        # label cardinality bounded; fall back to the raw path for mounts.
+        route = scope.get("route")
+        endpoint = getattr(route, "path", None) or scope["path"]
+        HTTP_REQUEST_DURATION.labels(endpoint=endpoint).observe(
+            time.perf_counter() - start
+        )
+        HTTP_REQUESTS.labels(
+            method=method, endpoint=endpoint, http_status=status_code
+        ).inc()
+        return endpoint
+
+
+class DeadlineMiddleware:
+    """
+    Pure-ASGI middleware that gives every HTTP request a RequestContext:
+      - the deadline comes from `X-Request-Timeout` (seconds) or
+        `X-Request-Deadline` (Unix time), else SCHEDULER_DEFAULT_TIMEOUT_SECONDS,
+      - once the request body has been read, a watcher waits for
+        `http.disconnect` and cancels the context if the client goes away
+        before the response is complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        try:
+            deadline = parse_deadline(
+                _header(headers, b"x-request-timeout"),
+                _header(headers, b"x-request-deadline"),
+            )
+        except ValueError:
+            logger.warning("Ignoring invalid deadline header")
+            deadline = parse_deadline(None, None)
+        ctx = RequestContext(deadline)
+
+        body_done = asyncio.Event()
+        response_done = False
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body"):
+                body_done.set()
+            elif message["type"] == "http.disconnect":
+                ctx.cancel()
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_done
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                response_done = True
+            await send(message)
+
+        async def watch_disconnect():
+            await body_done.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_done:
+                        ctx.cancel()
+                    return
+
+        token = set_request_context(ctx)
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            watcher.cancel()
+            reset_request_context(token)
+
+
+def _header(headers: dict, name: bytes) -> Optional[str]:
+    value = headers.get(name)
+    return value.decode("latin-1") if value is not None else None
@@ -0,0 +1,172 @@
+import math
+import os
+import shutil
+import sys
+from typing import Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# "development": single process with optional auto-reload (the previous default).
+# "production": several uvicorn workers sharing the port, no reload.
+API_SERVER_MODE = os.getenv("API_SERVER_MODE", "development").lower()
+API_SERVICE_HOST = str(os.getenv("API_SERVICE_HOST", "0.0.0.0"))
+API_SERVICE_PORT = int(os.getenv("API_SERVICE_PORT", "29000"))
+API_AUTO_RELOAD = bool(os.getenv("API_AUTO_RELOAD", "true").lower() == "true")
+# 0 means "one worker per available core".
+API_WORKERS = int(os.getenv("API_WORKERS", "0"))
+# Seconds uvicorn waits for open requests, and the app waits for queued
+# inferences, before a worker exits.
+API_GRACEFUL_SHUTDOWN_SECONDS = float(os.getenv("API_GRACEFUL_SHUTDOWN_SECONDS", "30"))
+PROMETHEUS_MULTIPROC_DIR = os.getenv(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc"
+)
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read_first_line(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(root: str = CGROUP_ROOT) -> Optional[float]:
+    """
+    CPU quota of this container in cores (e.g. 1.5 for `--cpus=1.5` or a k8s
+    `limits.cpu: 1500m`), from cgroup v2 `cpu.max` or cgroup v1
+    `cpu.cfs_quota_us`. None when no quota is set.
+    """
+    line = _read_first_line(os.path.join(root, "cpu.max"))
+    if line:
+        quota, _, period = line.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota = _read_first_line(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+    period = _read_first_line(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    """
+    Number of cores this process may use: the cores it may run on
+    (taskset/cpusets), capped by the cgroup CPU quota rounded up.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return cpus
+
+
+def resolve_workers(requested: Optional[int] = None) -> int:
+    """Worker count: `requested` (or API_WORKERS) if positive, else one per core."""
+    requested = API_WORKERS if requested is None else requested
+    return requested if requested > 0 else available_cpus()
+
+
+def _prepare_multiprocess_metrics(directory: str) -> None:
+    """
+    Point prometheus_client at a fresh shared directory *before* workers start,
+    so every worker writes its samples there and `/metrics` can aggregate them.
+    Stale files from a previous run would be summed in, so the directory is
+    wiped first.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+
+
+def _split_threads_between_workers(workers: int) -> None:
+    """
+    Give each worker an equal share of the cores for TF/OpenMP thread pools
+    unless explicitly configured, so N workers don't each spawn one thread
+    per core.
+    """
+    per_worker = str(max(1, available_cpus() // workers))
+    for var in ("TF_NUM_INTRAOP_THREADS", "OMP_NUM_THREADS"):
+        os.environ.setdefault(var, per_worker)
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1" if workers > 1 else "2")
+
+
+def uvicorn_options(mode: str = API_SERVER_MODE) -> dict:
+    """Keyword arguments for `uvicorn.run` for the given server mode."""
+    options = {
+        "host": API_SERVICE_HOST,
+        "port": API_SERVICE_PORT,
+        "timeout_graceful_shutdown": API_GRACEFUL_SHUTDOWN_SECONDS,
+    }
+    if mode == "production":
+        options.update(
+            workers=resolve_workers(),
+            reload=False,
+            # uvloop / httptools when installed, asyncio / h11 otherwise
+            loop="auto",
+            http="auto",
+            access_log=False,
+        )
+    else:
+        options.update(
+            reload=API_AUTO_RELOAD,  # keep it False in production
+            reload_dirs=["app"],
+        )
+    return options
+
+
+# Modules that read the autotuned settings (THREADPOOL_SIZE, TF thread
+# counts, ...) from the environment at import time
+AUTOTUNED_MODULES = ("app.models.multimodel",)
+
+
+def _spawns_app_processes(options: dict) -> bool:
+    """
+    Whether `uvicorn.run(**options)` imports the app in fresh processes
+    (reloader or several workers); with one worker and no reload it serves
+    from the calling process.
+    """
+    return bool(options.get("reload")) or options.get("workers", 1) > 1
+
+
+def run_server(mode: str = API_SERVER_MODE) -> None:
+    """
+    Start uvicorn for `app.main:app`. In production mode this runs one
+    worker per core (or API_WORKERS) with Prometheus multiprocess mode
+    enabled, so `/metrics` on any worker reports totals for the whole pod.
+    """
+    import uvicorn
+
+    from app.config import autotune
+
+    options = uvicorn_options(mode)
+    # A saved (or freshly searched) thread profile, applied through env vars
+    # that the workers read at import time; AUTOTUNE_MODE=off skips this.
+    # Served from this process after those modules were imported (python
+    # app/main.py without reload or workers), the env vars would be read by
+    # nobody, so the profile is not applied at all.
+    imported = [m for m in AUTOTUNED_MODULES if m in sys.modules]
+    if _spawns_app_processes(options) or not imported:
+        autotune.prepare(workers=options.get("workers", 1))
+    elif autotune.AUTOTUNE_MODE != "off":
+        logger.warning(
+            "Autotune profile ignored: the app runs in this process, which "
+            "already read its thread settings; enable API_AUTO_RELOAD or run "
+            "several API_WORKERS, or export the profile's settings instead",
+            autotune_mode=autotune.AUTOTUNE_MODE,
+            imported=imported,
+        )
+    if mode == "production":
+        _prepare_multiprocess_metrics(PROMETHEUS_MULTIPROC_DIR)
+        _split_threads_between_workers(options["workers"])
+
+    logger.info("Starting API server", mode=mode, **options)
+    uvicorn.run("app.main:app", **options)
@@ -0,0 +1,277 @@
+"""
+Critical-path analysis of spans exported by FileSpanExporter.
+
+Reads NDJSON span files (TRACE_EXPORT_DIR, optionally gzipped), rebuilds
+each trace's span tree and walks its critical path: starting from the end of
+the root span, the child that finished last is on the path, then the child
+that finished last before that one started, and so on, recursively; time not
+covered by a child on the path is the span's own. Every trace's duration is
+split this way over its stages (span names; "(request)" is the root span's
+own time: reading the upload, encoding the response, ...).
+
+Traces are grouped by endpoint (the root's http.method and http.route) and
+`model.name`, and for each group and stage it reports:
+
+- the stage's latency distribution (p50/p90/p99 of its spans per trace),
+- critical-path share: the stage's share of all time on critical paths,
+- p99 excess share: how much of the gap between the slowest traces (at or
+  above the group's p99) and the others the stage accounts for,
+- the correlation of the stage's critical-path time with trace duration.
+
+A stage with a large critical-path share is where average latency goes; a
+large p99 excess share or correlation marks the stage that makes slow
+requests slow.
+
+Usage (from the repo root):
+    python -m app.diagnostics.critical_path logs/spans
+    python -m app.diagnostics.critical_path logs/spans --by endpoint --sort tail --json
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+ROOT_STAGE = "(request)"
+GROUP_KEYS = ("endpoint", "model")
+
+
+# -----------------------------------------------------------
+# Loading
+# -----------------------------------------------------------
+def span_files(paths: Iterable[str]) -> List[str]:
+    """`paths`, with directories expanded to the span files in them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                glob.glob(os.path.join(path, "*.ndjson"))
+                + glob.glob(os.path.join(path, "*.ndjson.gz"))
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def read_spans(files: Iterable[str]) -> Iterator[dict]:
+    """Span records from NDJSON files; malformed lines are skipped."""
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(span, dict) and span.get("end_ns") is not None:
+                    yield span
+
+
+def group_traces(spans: Iterable[dict]) -> Dict[str, List[dict]]:
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+    return traces
+
+
+# -----------------------------------------------------------
+# One trace
+# -----------------------------------------------------------
+def _tree(spans: List[dict]) -> Optional[dict]:
+    """Link children to parents. Returns the root (the longest parentless span)."""
+    by_id = {s["span_id"]: dict(s, children=[]) for s in spans}
+    roots = []
+    for span in by_id.values():
+        parent = by_id.get(span.get("parent_id"))
+        if parent is None:
+            roots.append(span)
+        else:
+            parent["children"].append(span)
+    if not roots:
+        return None
+    return max(roots, key=lambda s: s["end_ns"] - s["start_ns"])
+
+
+def critical_path(root: dict) -> Dict[str, int]:
+    """Nanoseconds on the critical path of `root`'s tree, by stage."""
+    stages: Dict[str, int] = defaultdict(int)
+
+    def walk(span: dict, start: int, end: int, stage: str) -> None:
+        cursor = end
+        for child in sorted(span["children"], key=lambda c: c["end_ns"], reverse=True):
+            child_end = min(child["end_ns"], cursor)
+            child_start = max(child["start_ns"], start)
+            if child_end <= child_start:
+                continue
+            stages[stage] += cursor - child_end
+            walk(child, child_start, child_end, child["name"])
+            cursor = child_start
+            if cursor <= start:
+                break
+        stages[stage] += max(0, cursor - start)
+
+    walk(root, root["start_ns"], root["end_ns"], ROOT_STAGE)
+    return {stage: ns for stage, ns in stages.items() if ns > 0}
+
+
+def summarize_trace(spans: List[dict]) -> Optional[dict]:
+    """
+    Returns:
+        {"trace_id", "endpoint", "model", "duration_ns", "stages":
+        {name: summed span ns}, "critical": {name: critical-path ns}}, or
+        None if the trace has no usable root.
+    """
+    root = _tree(spans)
+    if root is None or root["end_ns"] <= root["start_ns"]:
+        return None
+    attributes = root.get("attributes") or {}
+    if "http.route" in attributes:
+        endpoint = f"{attributes.get('http.method', '')} {attributes['http.route']}"
+    else:
+        endpoint = root["name"]
+    model = None
+    stages: Dict[str, int] = defaultdict(int)
+    for span in sorted(spans, key=lambda s: s["start_ns"]):
+        if model is None:
+            model = (span.get("attributes") or {}).get("model.name")
+        if span["span_id"] != root["span_id"]:
+            stages[span["name"]] += span["end_ns"] - span["start_ns"]
+    return {
+        "trace_id": root["trace_id"],
+        "endpoint": endpoint.strip(),
+        "model": model or "-",
+        "duration_ns": root["end_ns"] - root["start_ns"],
+        "stages": dict(stages),
+        "critical": critical_path(root),
+    }
+
+
+# -----------------------------------------------------------
+# Many traces
+# -----------------------------------------------------------
+def _ms(values) -> Dict[str, float]:
+    p50, p90, p99 = np.percentile(
+        np.asarray(values, dtype=np.float64) / 1e6, [50, 90, 99]
+    )
+    return {"p50_ms": round(p50, 3), "p90_ms": round(p90, 3), "p99_ms": round(p99, 3)}
+
+
+def analyze_group(traces: List[dict], tail_quantile: float = 99.0) -> dict:
+    """Per-stage statistics of one group of trace summaries."""
+    durations = np.array([t["duration_ns"] for t in traces], dtype=np.float64)
+    tail = durations >= np.percentile(durations, tail_quantile)
+    excess = durations[tail].mean() - (
+        durations[~tail].mean() if (~tail).any() else durations[tail].mean()
+    )
+    total = durations.sum()
+
+    names = sorted({name for t in traces for name in (*t["stages"], *t["critical"])})
+    stages = []
+    for name in names:
+        on_path = np.array(
+            [t["critical"].get(name, 0) for t in traces], dtype=np.float64
+        )
+        spans = [t["stages"][name] for t in traces if name in t["stages"]]
+        if (~tail).any() and excess > 0:
+            tail_share = (on_path[tail].mean() - on_path[~tail].mean()) / excess
+        else:
+            tail_share = 0.0
+        if len(traces) > 1 and on_path.std() > 0 and durations.std() > 0:
+            correlation = float(np.corrcoef(on_path, durations)[0, 1])
+        else:
+            correlation = 0.0
+        stage = {
+            "stage": name,
+            "count": len(spans) if name != ROOT_STAGE else len(traces),
+            "critical_share": round(float(on_path.sum() / total), 4),
+            "tail_share": round(float(tail_share), 4),
+            "correlation": round(correlation, 3),
+        }
+        stage.update(_ms(spans if spans else on_path))
+        stages.append(stage)
+    return {"traces": len(traces), **_ms(durations), "stages": stages}
+
+
+def analyze(
+    summaries: Iterable[dict],
+    by: Sequence[str] = GROUP_KEYS,
+    tail_quantile: float = 99.0,
+    min_traces: int = 1,
+    sort: str = "critical",
+) -> List[dict]:
+    """Group trace summaries by `by` and analyze each group, largest first."""
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for summary in summaries:
+        groups[tuple(summary[key] for key in by)].append(summary)
+    key = "tail_share" if sort == "tail" else "critical_share"
+    report = []
+    for values, traces in groups.items():
+        if len(traces) < min_traces:
+            continue
+        group = analyze_group(traces, tail_quantile)
+        group["stages"].sort(key=lambda s: s[key], reverse=True)
+        report.append({**dict(zip(by, values)), **group})
+    report.sort(key=lambda g: g["traces"], reverse=True)
+    return report
+
+
+def format_report(report: List[dict], by: Sequence[str], top: int) -> str:
+    lines = []
+    for group in report:
+        title = "  ".join(f"{key}={group[key]}" for key in by)
+        lines.append(
+            f"{title}  traces={group['traces']}  p50={group['p50_ms']:.1f}ms  "
+            f"p90={group['p90_ms']:.1f}ms  p99={group['p99_ms']:.1f}ms"
+        )
+        lines.append(
+            f"  {'stage':<28} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} "
+            f"{'critical':>9} {'p99 excess':>11} {'corr':>6}"
+        )
+        for stage in group["stages"][:top]:
+            lines.append(
+                f"  {stage['stage']:<28} {stage['count']:>7} "
+                f"{stage['p50_ms']:>9.2f} {stage['p99_ms']:>9.2f} "
+                f"{stage['critical_share']:>9.1%} {stage['tail_share']:>11.1%} "
+                f"{stage['correlation']:>6.2f}"
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Critical-path analysis of exported spans."
+    )
+    parser.add_argument("paths", nargs="+", help="span files or directories")
+    parser.add_argument(
+        "--by",
+        default=",".join(GROUP_KEYS),
+        help="comma separated grouping: endpoint, model",
+    )
+    parser.add_argument("--tail-quantile", type=float, default=99.0)
+    parser.add_argument("--min-traces", type=int, default=20)
+    parser.add_argument("--sort", choices=["critical", "tail"], default="critical")
+    parser.add_argument("--top", type=int, default=15, help="stages per group")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    by = [key for key in args.by.split(",") if key in GROUP_KEYS] or list(GROUP_KEYS)
+    traces = group_traces(read_spans(span_files(args.paths)))
+    summaries = [s for s in map(summarize_trace, traces.values()) if s is not None]
+    report = analyze(summaries, by, args.tail_quantile, args.min_traces, args.sort)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{len(summaries)} traces\n")
+        print(format_report(report, by, args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
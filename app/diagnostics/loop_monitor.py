@@ -0,0 +1,160 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional
+
+import structlog
+
+from app.metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+
+logger = structlog.get_logger()
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+# How often the loop is asked to wake up; the lateness of each wake-up is the lag
+LOOP_MONITOR_INTERVAL_SECONDS = float(
+    os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", "0.25")
+)
+# A single step holding the loop this long gets its stack captured and logged
+LOOP_BLOCK_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.1"))
+LOOP_MONITOR_MAX_DEPTH = int(os.getenv("LOOP_MONITOR_MAX_DEPTH", "64"))
+# Blocking episodes kept for GET /api/v1/admin/loop
+LOOP_MONITOR_HISTORY = int(os.getenv("LOOP_MONITOR_HISTORY", "50"))
+
+
+class EventLoopMonitor:
+    """
+    Measures event-loop scheduling lag and catches steps that block the loop.
+
+    - A ticker coroutine sleeps `interval` seconds at a time; how late each
+      wake-up comes is observed in the `event_loop_lag_seconds` histogram.
+      Any synchronous work on the loop (model calls, PIL decodes, blocking
+      sockets) delays it.
+    - A watchdog thread checks that the ticker keeps running. When it has not
+      run for `interval + threshold` seconds, the watchdog snapshots the loop
+      thread's stack (`sys._current_frames()`) while it is still blocked.
+      When the loop recovers, the episode is logged with the lag, the
+      task that was running and that stack, counted in
+      `event_loop_blocked_total`, and kept for the admin endpoint.
+
+    Both cost a few wake-ups per second; nothing is traced in between.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL_SECONDS,
+        threshold: float = LOOP_BLOCK_THRESHOLD_SECONDS,
+        history: int = LOOP_MONITOR_HISTORY,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.episodes: Deque[dict] = deque(maxlen=history)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._ticker: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._beat = 0.0
+        self._pending: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._ticker is not None and not self._ticker.done()
+
+    def start(self) -> None:
+        """Start monitoring the running event loop."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._ticker = self._loop.create_task(self._tick())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(
+            "Event loop monitor started",
+            interval=self.interval,
+            threshold=self.threshold,
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._ticker is not None:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+            self._ticker = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    # -----------------------------------------------------------
+    # Lag measurement (on the loop)
+    # -----------------------------------------------------------
+    async def _tick(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG.observe(lag)
+            with self._lock:
+                self._beat = now
+                episode, self._pending = self._pending, None
+            if episode is not None:
+                self._report(episode, lag)
+
+    # -----------------------------------------------------------
+    # Blocking detection (watchdog thread)
+    # -----------------------------------------------------------
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            with self._lock:
+                stalled = time.perf_counter() - self._beat - self.interval
+                if stalled < self.threshold or self._pending is not None:
+                    continue
+                self._pending = self._capture()
+
+    def _capture(self) -> dict:
+        """Stack of the loop thread and the task it is running, taken off-loop."""
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = []
+        if frame is not None:
+            stack = [
+                f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+                for f in traceback.extract_stack(frame, limit=LOOP_MONITOR_MAX_DEPTH)
+            ]
+        task = None
+        try:
+            current = asyncio.current_task(self._loop)
+            if current is not None:
+                task = current.get_name()
+                coro = current.get_coro()
+                task += f" ({getattr(coro, '__qualname__', coro)})"
+        except RuntimeError:
+            pass
+        return {"captured_at": time.time(), "task": task, "stack": stack}
+
+    def _report(self, episode: dict, lag: float) -> None:
+        episode["lag_seconds"] = round(lag, 3)
+        self.episodes.append(episode)
+        EVENT_LOOP_BLOCKED.inc()
+        logger.warning(
+            "Event loop blocked",
+            lag_seconds=episode["lag_seconds"],
+            task=episode["task"],
+            stack=episode["stack"][-10:],
+        )
+
+    def recent(self) -> List[dict]:
+        """Blocking episodes seen by this worker, newest first."""
+        return list(reversed(self.episodes))
+
+
+loop_monitor = EventLoopMonitor()
@@ -0,0 +1,351 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+import structlog
+
+from app.metrics import (
+    MEMORY_RSS_BYTES,
+    MEMORY_TF_ALLOCATOR_BYTES,
+    MEMORY_TRACED_BYTES,
+    MEMORY_TRACED_GROWTH,
+)
+
+logger = structlog.get_logger()
+
+MEMORY_MONITOR_ENABLED = os.getenv("MEMORY_MONITOR_ENABLED", "true").lower() == "true"
+MEMORY_SAMPLE_INTERVAL_SECONDS = float(
+    os.getenv("MEMORY_SAMPLE_INTERVAL_SECONDS", "15")
+)
+# Start tracemalloc with the worker (otherwise only on demand from the admin API)
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+# Frames kept per allocation; 1 is cheapest and enough for per-line hot spots
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "1"))
+MEMORY_TRACEMALLOC_MAX_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_MAX_FRAMES", "25"))
+# Snapshots hold every live trace, so only a few are kept (oldest dropped)
+MEMORY_MAX_SNAPSHOTS = int(os.getenv("MEMORY_MAX_SNAPSHOTS", "3"))
+
+# Traced memory is attributed to this service's code (the `app` package) or
+# to the first library whose path fragment matches
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+SOURCES = (
+    ("pil", f"{os.sep}PIL{os.sep}"),
+    ("numpy", f"{os.sep}numpy{os.sep}"),
+    ("tensorflow", f"{os.sep}tensorflow{os.sep}"),
+    ("keras", f"{os.sep}keras{os.sep}"),
+    ("http", f"{os.sep}starlette{os.sep}"),
+    ("http", f"{os.sep}fastapi{os.sep}"),
+    ("http", f"{os.sep}anyio{os.sep}"),
+    ("http", f"{os.sep}httpx{os.sep}"),
+)
+# Allocations made by tracemalloc itself or the import machinery
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class SnapshotNotFound(KeyError):
+    """No kept snapshot has this id (never taken, or dropped as too old)."""
+
+    status_code = 404
+
+
+class TracingNotStarted(RuntimeError):
+    """A snapshot needs tracemalloc to be tracing."""
+
+    status_code = 409
+
+
+def source_of(filename: str) -> str:
+    if filename.startswith(APP_DIR):
+        return "app"
+    for source, fragment in SOURCES:
+        if fragment in filename:
+            return source
+    return "other"
+
+
+# -----------------------------------------------------------
+# Point-in-time reports
+# -----------------------------------------------------------
+def process_memory() -> dict:
+    """RSS/VMS of this worker, Python heap blocks and tracemalloc totals."""
+    info = psutil.Process().memory_info()
+    report = {
+        "pid": os.getpid(),
+        "rss_bytes": info.rss,
+        "vms_bytes": info.vms,
+        "python_allocated_blocks": sys.getallocatedblocks(),
+        "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["tracemalloc"].update(
+            frames=tracemalloc.get_traceback_limit(),
+            traced_bytes=current,
+            peak_bytes=peak,
+            overhead_bytes=tracemalloc.get_tracemalloc_memory(),
+        )
+    return report
+
+
+def model_memory() -> dict:
+    """Weights held by each model resident in the ModelManager registry."""
+    from app.models.multimodel import model_registry
+
+    resident = model_registry.resident()
+    return {
+        "budget_bytes": model_registry.budget_bytes,
+        "used_bytes": sum(resident.values()),
+        "pinned": sorted(model_registry.pinned),
+        # least recently used first
+        "models": [{"name": n, "bytes": b} for n, b in resident.items()],
+    }
+
+
+def tf_allocator_stats() -> Dict[str, dict]:
+    """
+    Current and peak bytes of TensorFlow's allocator per device, where TF
+    reports them (GPUs; the CPU allocator has no stats). Empty if TensorFlow
+    is not loaded.
+    """
+    tf = sys.modules.get("tensorflow")
+    if tf is None:
+        return {}
+    stats = {}
+    for device in tf.config.list_logical_devices():
+        try:
+            info = tf.config.experimental.get_memory_info(device.name)
+        except (ValueError, RuntimeError):
+            continue
+        stats[device.name] = {
+            "current_bytes": info["current"],
+            "peak_bytes": info["peak"],
+        }
+    return stats
+
+
+def directory_bytes(path: str) -> int:
+    """Bytes of the files under `path` (0 if it does not exist)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# -----------------------------------------------------------
+# tracemalloc snapshots
+# -----------------------------------------------------------
+def _stat_dict(stat) -> dict:
+    frame = stat.traceback[0]
+    return {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "source": source_of(frame.filename),
+        "size_bytes": stat.size,
+        "count": stat.count,
+        "traceback": [f"{f.filename}:{f.lineno}" for f in stat.traceback],
+    }
+
+
+def _diff_dict(stat) -> dict:
+    report = _stat_dict(stat)
+    report.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+    return report
+
+
+class AllocationTracker:
+    """
+    On-demand tracemalloc sessions for finding allocation hot spots and leaks.
+
+    tracemalloc is off unless started (here or with MEMORY_TRACEMALLOC), so it
+    costs nothing by default. Snapshots are kept by id, at most
+    MEMORY_MAX_SNAPSHOTS at a time; diffing two of them (or one against the
+    current heap) shows what grew in between, by line or by traceback.
+    """
+
+    def __init__(self, max_snapshots: int = MEMORY_MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[int, Tuple[float, tracemalloc.Snapshot]]" = (
+            OrderedDict()
+        )
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = MEMORY_TRACEMALLOC_FRAMES) -> None:
+        frames = max(1, min(frames, MEMORY_TRACEMALLOC_MAX_FRAMES))
+        if tracemalloc.is_tracing():
+            if tracemalloc.get_traceback_limit() == frames:
+                return
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+        logger.info("tracemalloc started", frames=frames)
+
+    def stop(self) -> None:
+        """Stop tracing and drop the kept snapshots."""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+        logger.info("tracemalloc stopped")
+
+    def _take(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise TracingNotStarted("tracemalloc is not tracing; start it first.")
+        return tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+    def snapshot(self) -> int:
+        """Take and keep a snapshot. Returns its id."""
+        snap = self._take()
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (time.time(), snap)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def snapshots(self) -> List[dict]:
+        with self._lock:
+            return [
+                {
+                    "id": snapshot_id,
+                    "taken_at": taken_at,
+                    "traced_bytes": sum(t.size for t in snap.traces),
+                }
+                for snapshot_id, (taken_at, snap) in self._snapshots.items()
+            ]
+
+    def _get(self, snapshot_id: int) -> tracemalloc.Snapshot:
+        with self._lock:
+            if snapshot_id not in self._snapshots:
+                raise SnapshotNotFound(f"Snapshot {snapshot_id} not found.")
+            return self._snapshots[snapshot_id][1]
+
+    def top(
+        self,
+        snapshot_id: Optional[int] = None,
+        key_type: str = "lineno",
+        limit: int = 20,
+    ) -> List[dict]:
+        """Largest allocation sites in a kept snapshot (or the current heap)."""
+        snap = self._take() if snapshot_id is None else self._get(snapshot_id)
+        return [_stat_dict(s) for s in snap.statistics(key_type)[:limit]]
+
+    def diff(
+        self,
+        base_id: int,
+        other_id: Optional[int] = None,
+        key_type: str = "lineno",
+        limit: int = 20,
+    ) -> List[dict]:
+        """
+        Allocation sites that changed most between snapshot `base_id` and
+        `other_id` (default: the current heap), largest growth first.
+        """
+        base = self._get(base_id)
+        other = self._take() if other_id is None else self._get(other_id)
+        stats = other.compare_to(base, key_type)
+        return [_diff_dict(s) for s in stats[:limit]]
+
+    def by_source(self, snapshot_id: Optional[int] = None) -> Dict[str, int]:
+        """
+        Traced bytes per source (app, pil, numpy, ...) in a kept snapshot (or
+        the current heap). Groups every trace, so it is only run on demand
+        from the admin API, never by the sampler.
+        """
+        snap = self._take() if snapshot_id is None else self._get(snapshot_id)
+        totals: Dict[str, int] = {}
+        for stat in snap.statistics("filename"):
+            source = source_of(stat.traceback[0].filename)
+            totals[source] = totals.get(source, 0) + stat.size
+        return totals
+
+
+# -----------------------------------------------------------
+# Background sampler
+# -----------------------------------------------------------
+class MemorySampler:
+    """
+    Updates the memory gauges every `interval` seconds from a daemon thread:
+    worker RSS, TensorFlow allocator stats and, while tracemalloc is tracing,
+    total traced bytes and their growth rate (bytes/s). Only the running
+    total is read (tracemalloc.get_traced_memory); snapshots, which hold the
+    GIL while they copy and group every trace, are left to the admin API.
+    """
+
+    def __init__(
+        self,
+        tracker: AllocationTracker,
+        interval: float = MEMORY_SAMPLE_INTERVAL_SECONDS,
+    ):
+        self.tracker = tracker
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last: Optional[Tuple[float, int]] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="memory-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning("Memory sample failed", error=str(e))
+            if self._stop.wait(self.interval):
+                return
+
+    def sample(self) -> None:
+        MEMORY_RSS_BYTES.set(psutil.Process().memory_info().rss)
+        for device, stats in tf_allocator_stats().items():
+            MEMORY_TF_ALLOCATOR_BYTES.labels(device=device, stat="current").set(
+                stats["current_bytes"]
+            )
+            MEMORY_TF_ALLOCATOR_BYTES.labels(device=device, stat="peak").set(
+                stats["peak_bytes"]
+            )
+
+        if not self.tracker.tracing:
+            self._last = None
+            return
+        now = time.monotonic()
+        traced, _ = tracemalloc.get_traced_memory()
+        MEMORY_TRACED_BYTES.labels(source="total").set(traced)
+        if self._last is not None:
+            then, previous = self._last
+            MEMORY_TRACED_GROWTH.labels(source="total").set(
+                (traced - previous) / (now - then)
+            )
+        self._last = (now, traced)
+
+
+allocation_tracker = AllocationTracker()
+memory_sampler = MemorySampler(allocation_tracker)
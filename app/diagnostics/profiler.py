@@ -0,0 +1,208 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Hard limits so a profiling session can never hurt a loaded pod.
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MAX_HZ = int(os.getenv("PROFILER_MAX_HZ", "250"))
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", "20000"))
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "128"))
+# Fraction of one core the sampler may spend walking stacks before backing off.
+PROFILER_MAX_OVERHEAD = float(os.getenv("PROFILER_MAX_OVERHEAD", "0.05"))
+PROFILER_TF_LOGDIR = os.getenv("PROFILER_TF_LOGDIR", "logs/tf_profile")
+
+TRUNCATED_STACK = ("[truncated]",)
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profiling session is already running in this process."""
+
+
+class SamplingProfiler:
+    """
+    A wall-clock sampling profiler for a live worker.
+
+    A daemon thread periodically snapshots every thread's Python stack with
+    `sys._current_frames()` (event loop, `threadpool_executor` workers, anyio
+    worker threads) and counts identical stacks. Nothing runs between
+    sessions, so the idle cost is zero.
+
+    Samples are bounded three ways: session length (PROFILER_MAX_SECONDS),
+    sampling rate (PROFILER_MAX_HZ, and the sampler backs off if walking the
+    stacks costs more than PROFILER_MAX_OVERHEAD of a core), and memory
+    (at most PROFILER_MAX_STACKS distinct stacks are kept).
+
+    When `tf_trace=True` and TensorFlow is loaded, a TensorFlow profiler trace
+    is captured for the same window so TF op time can be inspected in
+    TensorBoard; Python stacks only show time spent *inside* TF calls.
+    """
+
+    _session_lock = threading.Lock()
+
+    def __init__(self, hz: int = 100, tf_trace: bool = False):
+        self.hz = max(1, min(int(hz), PROFILER_MAX_HZ))
+        self.tf_trace = tf_trace
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self.tf_logdir: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -----------------------------------------------------------
+    # Session control
+    # -----------------------------------------------------------
+    def start(self) -> None:
+        if not SamplingProfiler._session_lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profiling session is already running.")
+        self.started_at = time.perf_counter()
+        if self.tf_trace:
+            self._start_tf_trace()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        logger.info("Profiler started", hz=self.hz, tf_trace=self.tf_trace)
+
+    def stop(self) -> None:
+        try:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join()
+            if self.tf_trace:
+                self._stop_tf_trace()
+            self.duration = time.perf_counter() - (self.started_at or 0.0)
+        finally:
+            SamplingProfiler._session_lock.release()
+        logger.info(
+            "Profiler stopped",
+            samples=self.samples,
+            unique_stacks=len(self.stacks),
+            dropped=self.dropped,
+            duration=self.duration,
+        )
+
+    @classmethod
+    def is_running(cls) -> bool:
+        return cls._session_lock.locked()
+
+    # -----------------------------------------------------------
+    # Sampling loop
+    # -----------------------------------------------------------
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        interval = 1.0 / self.hz
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            self._sample(own_id)
+            cost = time.perf_counter() - t0
+            # Back off when stack walking gets expensive (many threads/deep stacks).
+            self._stop.wait(max(interval - cost, cost / PROFILER_MAX_OVERHEAD - cost))
+
+    def _sample(self, own_id: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = [names.get(thread_id, f"thread-{thread_id}")]
+            depth = 0
+            frames = []
+            while frame is not None and depth < PROFILER_MAX_DEPTH:
+                code = frame.f_code
+                frames.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+                depth += 1
+            stack.extend(reversed(frames))
+            key = tuple(stack)
+            if key not in self.stacks and len(self.stacks) >= PROFILER_MAX_STACKS:
+                self.dropped += 1
+                key = TRUNCATED_STACK
+            self.stacks[key] += 1
+            self.samples += 1
+
+    # -----------------------------------------------------------
+    # TensorFlow op tracing (optional)
+    # -----------------------------------------------------------
+    def _start_tf_trace(self) -> None:
+        tf = sys.modules.get("tensorflow")
+        if tf is None:
+            logger.warning("tf_trace requested but TensorFlow is not loaded")
+            self.tf_trace = False
+            return
+        self.tf_logdir = os.path.join(PROFILER_TF_LOGDIR, str(int(time.time())))
+        try:
+            tf.profiler.experimental.start(self.tf_logdir)
+        except Exception as e:
+            logger.warning("Could not start TensorFlow profiler", error=str(e))
+            self.tf_trace = False
+            self.tf_logdir = None
+
+    def _stop_tf_trace(self) -> None:
+        try:
+            sys.modules["tensorflow"].profiler.experimental.stop()
+        except Exception as e:
+            logger.warning("Could not stop TensorFlow profiler", error=str(e))
+
+    # -----------------------------------------------------------
+    # Export formats
+    # -----------------------------------------------------------
+    def to_collapsed(self) -> str:
+        """
+        Brendan Gregg's collapsed-stack format, one `frame;frame;frame count`
+        line per unique stack. Feed it to flamegraph.pl or speedscope.
+        """
+        lines = [
+            ";".join(frame.replace(";", ":") for frame in stack) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "marine-classifier") -> dict:
+        """
+        Export as a speedscope "sampled" profile
+        (https://www.speedscope.app/file-format-schema.json). Each sample
+        weight is one sampling interval, so the total roughly equals wall time
+        per thread.
+        """
+        frame_index: dict = {}
+        frames = []
+        samples = []
+        weights = []
+        interval = 1.0 / self.hz
+        for stack, count in self.stacks.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame})
+                indices.append(frame_index[frame])
+            samples.append(indices)
+            weights.append(count * interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": name,
+            "exporter": "app.diagnostics.profiler",
+        }
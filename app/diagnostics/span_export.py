@@ -0,0 +1,116 @@
+import glob
+import json
+import os
+import threading
+import time
+from typing import Optional, Sequence
+
+import structlog
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+logger = structlog.get_logger()
+
+# Write sampled spans as NDJSON under this directory (empty = off); read them
+# back with `python -m app.diagnostics.critical_path <dir>`
+TRACE_EXPORT_DIR = os.getenv("TRACE_EXPORT_DIR", "")
+# A worker's file is rotated past this size...
+TRACE_EXPORT_MAX_MB = float(os.getenv("TRACE_EXPORT_MAX_MB", "64"))
+# ...and the oldest files in the directory are deleted beyond this many
+TRACE_EXPORT_MAX_FILES = int(os.getenv("TRACE_EXPORT_MAX_FILES", "20"))
+
+FILE_PREFIX = "spans-"
+FILE_SUFFIX = ".ndjson"
+
+
+def span_record(span: ReadableSpan) -> dict:
+    """One exported span as a flat JSON-able dict (ids in hex, times in ns)."""
+    context = span.get_span_context()
+    return {
+        "trace_id": format(context.trace_id, "032x"),
+        "span_id": format(context.span_id, "016x"),
+        "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "name": span.name,
+        "kind": span.kind.name,
+        "start_ns": span.start_time,
+        "end_ns": span.end_time,
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {}),
+    }
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends finished spans, one JSON object per line, to
+    `<directory>/spans-<pid>-<started>.ndjson`. Each worker writes its own
+    file, so several workers can share the directory without locking.
+    Files are rotated at `max_bytes` and only the newest `max_files` in the
+    directory are kept. Use behind a BatchSpanProcessor.
+    """
+
+    def __init__(
+        self,
+        directory: str = TRACE_EXPORT_DIR,
+        max_bytes: int = int(TRACE_EXPORT_MAX_MB * 2**20),
+        max_files: int = TRACE_EXPORT_MAX_FILES,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._file = None
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self) -> None:
+        name = f"{FILE_PREFIX}{os.getpid()}-{time.time_ns()}{FILE_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._prune()
+
+    def _prune(self) -> None:
+        files = []
+        for path in glob.glob(
+            os.path.join(self.directory, f"{FILE_PREFIX}*{FILE_SUFFIX}")
+        ):
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:  # pruned by another worker
+                pass
+        files.sort()
+        for _, path in files[: max(0, len(files) - self.max_files)]:
+            if path != self._path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(
+            json.dumps(span_record(span), default=str) + "\n" for span in spans
+        )
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._open()
+                self._file.write(lines)
+                self._file.flush()
+                if self._file.tell() >= self.max_bytes:
+                    self._file.close()
+                    self._open()
+        except OSError as e:
+            logger.warning("Span export to file failed", error=str(e))
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        return True
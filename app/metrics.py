@@ -1,5 +1,15 @@
 # app/metrics.py
-from prometheus_client import Counter, Gauge, Histogram
+import os
+import time
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+)
 
 # ─── HTTP ───────────────────────────────────────────────────────────────────────
 
@@ -24,6 +34,46 @@ MODEL_LOAD_TIME = Gauge(
     "model_load_duration_seconds",
     "Time taken to load each model on startup",
     ["model_name"],
+    multiprocess_mode="max",
+)
+
+# Model memory budget of the registry (bytes, 0 = unlimited).
+MODEL_MEMORY_BUDGET = Gauge(
+    "model_memory_budget_bytes",
+    "Memory budget for resident models",
+    multiprocess_mode="max",
+)
+
+# Weight bytes of each resident model (0 once unloaded).
+MODEL_RESIDENT_BYTES = Gauge(
+    "model_resident_bytes",
+    "Memory held by each resident model",
+    ["model_name"],
+    multiprocess_mode="livesum",
+)
+
+# Registry events per model: "load", "evict" (LRU, under memory pressure) and
+# "unload" (explicit or on shutdown).
+MODEL_REGISTRY_EVENTS = Counter(
+    "model_registry_events_total",
+    "Model loads and unloads",
+    ["model_name", "event"],
+)
+
+# Triton models loaded by the API in explicit model-control mode (1 = loaded).
+TRITON_MODEL_LOADED = Gauge(
+    "triton_model_loaded",
+    "Whether a Triton model is loaded and warm",
+    ["model_name"],
+    multiprocess_mode="max",
+)
+
+# Triton model-control events: "load", "prewarm", "unload", and "fallback"
+# (request served by another model while this one was loading).
+TRITON_MODEL_EVENTS = Counter(
+    "triton_model_events_total",
+    "Triton model loads, unloads and fallbacks",
+    ["model_name", "event"],
 )
 
 # ─── INFERENCE ─────────────────────────────────────────────────────────────────
@@ -42,7 +92,228 @@ INFERENCE_DURATION = Histogram(
     ["model_name"],
 )
 
+# ─── INFERENCE STAGES ──────────────────────────────────────────────────────────
+
+# Bucket boundaries (seconds) sized for millisecond-scale CPU inference: fine
+# resolution from 0.5ms to 100ms, coarser up to 5s for queueing under load.
+STAGE_DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.02,
+    0.03,
+    0.05,
+    0.075,
+    0.1,
+    0.15,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# Per-stage latency of a single classification, by backend, model and stage.
+# Stages: decode, preprocess, queue_wait, inference, postprocess.
+INFERENCE_STAGE_DURATION = Histogram(
+    "inference_stage_duration_seconds",
+    "Histogram of per-stage inference latency",
+    ["backend", "model_name", "stage"],
+    buckets=STAGE_DURATION_BUCKETS,
+)
+
+# Reading the request body, by backend only: it happens before a model is
+# selected, so there is no model name to label it with.
+UPLOAD_READ_DURATION = Histogram(
+    "upload_read_duration_seconds",
+    "Histogram of request upload read latency",
+    ["backend"],
+    buckets=STAGE_DURATION_BUCKETS,
+)
+
+# ─── SCHEDULING ────────────────────────────────────────────────────────────────
+
+# Work dropped before it reached a backend, by scheduler and reason
+# ("expired": deadline passed, "cancelled": client disconnected).
+SCHEDULER_DROPPED = Counter(
+    "scheduler_dropped_requests_total",
+    "Requests dropped before inference",
+    ["scheduler", "reason"],
+)
+
+# Work waiting for a free inference slot, by scheduler and lane (backbone).
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "scheduler_queue_depth",
+    "Requests waiting for an inference slot",
+    ["scheduler", "lane"],
+    multiprocess_mode="livesum",
+)
+
+# Time spent waiting for a slot, by scheduler and lane (seconds).
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "scheduler_wait_seconds",
+    "Time spent waiting for an inference slot",
+    ["scheduler", "lane"],
+    buckets=STAGE_DURATION_BUCKETS,
+)
+
+# Slots in use and slot cap per lane; in_use / limit is the lane's utilization.
+SCHEDULER_LANE_INFLIGHT = Gauge(
+    "scheduler_lane_inflight",
+    "Inference slots held by a lane",
+    ["scheduler", "lane"],
+    multiprocess_mode="livesum",
+)
+SCHEDULER_LANE_LIMIT = Gauge(
+    "scheduler_lane_limit",
+    "Maximum inference slots a lane may hold",
+    ["scheduler", "lane"],
+    multiprocess_mode="livesum",
+)
+
+# Slot-seconds used per lane; rate() gives the average number of busy slots.
+SCHEDULER_LANE_BUSY_SECONDS = Counter(
+    "scheduler_lane_busy_seconds_total",
+    "Slot time used by a lane",
+    ["scheduler", "lane"],
+)
+
+# ─── EVENT LOOP ────────────────────────────────────────────────────────────────
+
+# How late the event loop runs a scheduled wake-up (seconds); anything run
+# synchronously on the loop shows up here.
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Event loop scheduling lag",
+    buckets=STAGE_DURATION_BUCKETS,
+)
+
+# Times a single step held the loop longer than LOOP_BLOCK_THRESHOLD_SECONDS.
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Event loop blocking episodes over the threshold",
+)
+
+# ─── MEMORY ────────────────────────────────────────────────────────────────────
+
+# Resident memory of the API workers, summed over live workers (compare with
+# the pod's resources.limits.memory).
+MEMORY_RSS_BYTES = Gauge(
+    "memory_rss_bytes",
+    "Resident memory of the API workers",
+    multiprocess_mode="livesum",
+)
+
+# TensorFlow allocator bytes by device and stat ("current", "peak"), where TF
+# reports them.
+MEMORY_TF_ALLOCATOR_BYTES = Gauge(
+    "memory_tf_allocator_bytes",
+    "TensorFlow allocator memory",
+    ["device", "stat"],
+    multiprocess_mode="livesum",
+)
+
+# While tracemalloc is tracing: Python/numpy bytes allocated and still alive
+# (source="total"; the split by app, pil, numpy, ... comes from admin
+# snapshots), and how fast that grows (bytes/s, negative when it shrinks).
+MEMORY_TRACED_BYTES = Gauge(
+    "memory_traced_bytes",
+    "Live traced allocations by source",
+    ["source"],
+    multiprocess_mode="livesum",
+)
+MEMORY_TRACED_GROWTH = Gauge(
+    "memory_traced_growth_bytes_per_second",
+    "Growth rate of live traced allocations by source",
+    ["source"],
+    multiprocess_mode="livesum",
+)
+
+# ─── PREDICTION CACHE ──────────────────────────────────────────────────────────
+
+# Lookups per tier ("memory": this worker, "shared": the node's store) and
+# result ("hit", "miss"); a shared hit is then kept in memory too.
+PREDICTION_CACHE_REQUESTS = Counter(
+    "prediction_cache_requests_total",
+    "Prediction cache lookups",
+    ["tier", "result"],
+)
+# Entries dropped by size-based eviction or because their model version changed.
+PREDICTION_CACHE_EVICTIONS = Counter(
+    "prediction_cache_evictions_total",
+    "Prediction cache entries evicted",
+    ["tier", "reason"],
+)
+# Bytes held per tier: the largest worker's memory tier, and the shared store
+# (one file for every worker on the node).
+PREDICTION_CACHE_BYTES = Gauge(
+    "prediction_cache_bytes",
+    "Bytes held by the prediction cache",
+    ["tier"],
+    multiprocess_mode="max",
+)
+
+# ─── VECTOR INDEX ──────────────────────────────────────────────────────────────
+
+# Time to search the nearest-neighbour index for one /similar query, by mode
+# ("exact": every row, "ivf": the nprobe closest lists).
+VECTOR_SEARCH_DURATION = Histogram(
+    "vector_search_duration_seconds",
+    "Nearest-neighbour index search latency",
+    ["mode"],
+    buckets=STAGE_DURATION_BUCKETS,
+)
+
+# ─── FRAME SEQUENCES ───────────────────────────────────────────────────────────
+
+# Frames of /predict_frames sequences by outcome: "inferred" (ran through the
+# model) or "reused" (within FRAME_DEDUP_MAX_DISTANCE of the last inferred one).
+FRAME_SEQUENCE_FRAMES = Counter(
+    "frame_sequence_frames_total",
+    "Frames of classified frame sequences by dedup outcome",
+    ["outcome"],
+)
+
 TOTAL_MODEL_LOAD_TIME = Gauge(
     "marine_classifier_model_load_seconds",
     "Time to load all models at startup",
+    multiprocess_mode="max",
 )
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Registry to expose on `/metrics`. With several workers
+    (PROMETHEUS_MULTIPROC_DIR set), each worker writes its samples to that
+    directory and this registry aggregates all of them, so any worker
+    reports totals for the whole process group.
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_worker_exited() -> None:
+    """Drop this worker's live-gauge samples from the multiprocess directory."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def time_executor_call(fn, *args, queue_wait, run_time, submitted_at: float, **kwargs):
+    """
+    Run `fn` on an executor thread, recording how long the call waited for a
+    free worker (`queue_wait`) and how long it ran (`run_time`). Both are
+    histogram children, e.g. INFERENCE_STAGE_DURATION.labels(...).
+    `submitted_at` is the time.perf_counter() value taken when the call was
+    handed to the executor.
+    """
+    started_at = time.perf_counter()
+    queue_wait.observe(started_at - submitted_at)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        run_time.observe(time.perf_counter() - started_at)
@@ -1,10 +1,12 @@
 import asyncio
 import concurrent.futures
+import gc
 import io
 import json
 import os
-import threading
+import time
 from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import psutil
@@ -29,6 +31,19 @@ from tensorflow.keras.applications import (
     xception,
 )
 
+from app.metrics import INFERENCE_STAGE_DURATION, time_executor_call
+from app.models.prediction_cache import prediction_cache
+from app.models.registry import ModelRegistry
+from app.models.scheduler import DeadlineScheduler, parse_lane_settings
+from app.models.tiling import (
+    TILE_MAX_COUNT,
+    TILE_OVERLAP,
+    Tiles,
+    decode_tiles,
+    tiled_result,
+)
+from app.models.vector_index import l2_normalize
+
 tracer = trace.get_tracer(__name__)
 
 
@@ -39,6 +54,47 @@ getattr(logger, LOG_LEVEL, logger.info)("Logger initialized", log_level=LOG_LEVE
 
 THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "4"))
 threadpool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=THREADPOOL_SIZE)
+# Memory budget for resident models (0 = unlimited). Least recently used
+# models are unloaded to stay within it and loaded again on demand.
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Comma separated models that are never evicted; defaults to the model the CPU
+# selector falls back to under the heaviest load
+MODEL_PINNED = os.getenv("MODEL_PINNED")
+# The backbone of the legacy /predict endpoint (app.models.resnet), always
+# pinned on top of MODEL_PINNED so that endpoint never waits on a reload
+RESNET_PREDICT_MODEL = "ResNet50"
+
+# Per-backbone lanes over the pool: "Model=N,..." caps and fair-share weights.
+# By default no backbone may hold every thread, so a burst on a slow model
+# always leaves room for the cheap ones.
+MODEL_LANE_DEFAULT_LIMIT = int(
+    os.getenv("MODEL_LANE_DEFAULT_LIMIT", str(max(1, THREADPOOL_SIZE - 1)))
+)
+MODEL_LANE_LIMITS = parse_lane_settings(os.getenv("MODEL_LANE_LIMITS", ""), int)
+MODEL_LANE_WEIGHTS = parse_lane_settings(os.getenv("MODEL_LANE_WEIGHTS", ""), float)
+# Orders work for the pool by lane share, then request deadline; one slot per
+# thread so the executor's own FIFO queue stays empty
+inference_scheduler = DeadlineScheduler(
+    "tensorflow",
+    slots=THREADPOOL_SIZE,
+    lane_limits=MODEL_LANE_LIMITS,
+    lane_weights=MODEL_LANE_WEIGHTS,
+    default_limit=MODEL_LANE_DEFAULT_LIMIT,
+)
+
+# Version of each backbone's weights for the prediction cache ("Model=v,..."),
+# bumped when a model is retrained or its weights change; others use the
+# TensorFlow version, since keras.applications weights ship with it
+MODEL_VERSIONS = parse_lane_settings(os.getenv("MODEL_VERSIONS", ""), str)
+DEFAULT_MODEL_VERSION = f"keras-{tf.__version__}"
+
+# Set by the autotune profile or by the server per worker; 0 keeps TF's default
+TF_NUM_INTRAOP_THREADS = int(os.getenv("TF_NUM_INTRAOP_THREADS", "0"))
+TF_NUM_INTEROP_THREADS = int(os.getenv("TF_NUM_INTEROP_THREADS", "0"))
+if TF_NUM_INTRAOP_THREADS:
+    tf.config.threading.set_intra_op_parallelism_threads(TF_NUM_INTRAOP_THREADS)
+if TF_NUM_INTEROP_THREADS:
+    tf.config.threading.set_inter_op_parallelism_threads(TF_NUM_INTEROP_THREADS)
 
 if os.getenv("TF_FORCE_GPU_ALLOW_GROWTH", "false").lower() == "true":
     gpus = tf.config.experimental.list_physical_devices("GPU")
@@ -95,6 +151,8 @@ class ModelManager:
     #    - the preprocess_input function
     #    - the decode_predictions function
     #    - the expected input size (height, width)
+    #    - the layer whose output is the image embedding (the pooled features
+    #      the classification head sees)
     # -----------------------------------------------------------
     MODEL_INFO = {
         "Xception": {
@@ -102,69 +160,77 @@ class ModelManager:
             "preprocess": xception.preprocess_input,
             "decode": xception.decode_predictions,
             "input_size": (299, 299),
+            "embedding_layer": "avg_pool",
         },
         "ResNet152V2": {
             "constructor": ResNet152V2,
             "preprocess": resnet_v2.preprocess_input,
             "decode": resnet_v2.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "avg_pool",
         },
         "ResNet101V2": {
             "constructor": ResNet101V2,
             "preprocess": resnet_v2.preprocess_input,
             "decode": resnet_v2.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "avg_pool",
         },
         "ResNet50V2": {
             "constructor": ResNet50V2,
             "preprocess": resnet_v2.preprocess_input,
             "decode": resnet_v2.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "avg_pool",
         },
         "ResNet152": {
             "constructor": ResNet152,
             "preprocess": resnet50.preprocess_input,
             "decode": resnet50.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "avg_pool",
         },
         "ResNet101": {
             "constructor": ResNet101,
             "preprocess": resnet50.preprocess_input,
             "decode": resnet50.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "avg_pool",
         },
         "ResNet50": {
             "constructor": ResNet50,
             "preprocess": resnet50.preprocess_input,
             "decode": resnet50.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "avg_pool",
         },
         "VGG19": {
             "constructor": VGG19,
             "preprocess": vgg19.preprocess_input,
             "decode": vgg19.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "fc2",
         },
         "VGG16": {
             "constructor": VGG16,
             "preprocess": vgg16.preprocess_input,
             "decode": vgg16.decode_predictions,
             "input_size": (224, 224),
+            "embedding_layer": "fc2",
         },
     }
 
-    # -----------------------------------------------------------
-    # 3) Internal registry for loaded models; guarded by a threading.Lock
-    # -----------------------------------------------------------
-    _models: dict = {}
-    _lock = threading.Lock()
+    # Executor futures that have been submitted but not finished yet
+    _inflight: set = set()
+    # model_name -> (backbone, backbone cut at its embedding layer)
+    _feature_models: Dict[str, Tuple[tf.keras.Model, tf.keras.Model]] = {}
 
     @classmethod
     def _load_model(cls, model_name: str) -> tf.keras.Model:
         """
         Instantiate and return a Keras model for `model_name`, using
-        weights="imagenet". Called inside a lock to ensure each backbone
-        is only loaded once.
+        weights="imagenet". Called by model_registry, which makes sure each
+        backbone is only loaded once.
         """
         info = cls.MODEL_INFO.get(model_name)
         if info is None:
@@ -176,32 +242,59 @@ class ModelManager:
 
     @staticmethod
     def is_ready():
-        # Check if all models are loaded and ready
-        return all(model is not None for model in ModelManager._models.values())
+        # Ready once the pinned models (the overload fallback) are resident
+        return all(model_registry.is_resident(name) for name in model_registry.pinned)
 
     @classmethod
     def get_model(cls, model_name: str) -> tf.keras.Model:
         """
-        Thread-safe lazy‐loading. If `model_name` is not yet in _models,
-        acquire the lock, load it, store it, then return. Otherwise return
-        the already-loaded model.
+        Return `model_name` from the shared model_registry, loading it on
+        first use (and unloading least recently used models if the memory
+        budget requires it).
+        """
+        return model_registry.get(model_name)
+
+    @classmethod
+    def feature_model(
+        cls, model_name: str, model: Optional[tf.keras.Model] = None
+    ) -> tf.keras.Model:
+        """
+        `model_name` cut at its MODEL_INFO "embedding_layer". It shares the
+        layers (and weights) of the registry's backbone, so it costs no extra
+        memory, and is rebuilt if the registry has reloaded the backbone.
+
+        Args:
+            model: The backbone, when the caller already has it (e.g. from
+                _get_model_async); otherwise it is taken from get_model(),
+                which may load it on the calling thread.
         """
-        if model_name not in cls._models:
-            with cls._lock:
-                if model_name not in cls._models:
-                    cls._models[model_name] = cls._load_model(model_name)
-        return cls._models[model_name]
+        if model is None:
+            model = cls.get_model(model_name)
+        cached = cls._feature_models.get(model_name)
+        if cached is None or cached[0] is not model:
+            layer = model.get_layer(cls.MODEL_INFO[model_name]["embedding_layer"])
+            cached = (model, tf.keras.Model(model.input, layer.output))
+            cls._feature_models[model_name] = cached
+        return cached[1]
+
+    @classmethod
+    async def _get_model_async(cls, model_name: str) -> tf.keras.Model:
+        """get_model() that loads cold models off the event loop."""
+        if model_registry.is_resident(model_name):
+            return cls.get_model(model_name)
+        return await asyncio.to_thread(cls.get_model, model_name)
 
     @classmethod
     def load_all_models(cls) -> None:
         """
-        Force-load every model named in CPU_TO_MODEL into memory. Call this
-        once at program startup (e.g. in FastAPI’s startup event) so that
-        classify_image(...) never has to wait on a first-time load.
+        Pre-load the pinned models and then every model named in CPU_TO_MODEL,
+        as far as the memory budget allows. Call this once at program startup
+        (e.g. in FastAPI’s startup event) so that classify_image(...) rarely
+        has to wait on a first-time load.
         """
-        model_names = {model_name for _, model_name in cls.CPU_TO_MODEL}
-        for name in model_names:
-            cls.get_model(name)
+        model_registry.preload(
+            [*model_registry.pinned, *(name for _, name in cls.CPU_TO_MODEL)]
+        )
 
     @classmethod
     def clear(cls) -> None:
@@ -209,10 +302,60 @@ class ModelManager:
         Clear all loaded models from RAM and reset the Keras session.
         Call this when the program is terminating.
         """
-        with cls._lock:
-            cls._models.clear()
+        model_registry.clear()
         tf.keras.backend.clear_session()
 
+    @classmethod
+    async def _run_in_executor(cls, fn, lane: str = "default"):
+        """
+        Submit `fn` to the shared thread pool and await it. Calls wait for a
+        free thread in inference_scheduler within `lane`'s cap (the backbone
+        name), fairly shared between lanes and earliest deadline first within
+        one, and raise DeadlineExceeded / RequestCancelled instead of running
+        when their request expires or disconnects first. The underlying
+        concurrent future is tracked until the thread finishes (even if the
+        awaiting request is cancelled), so drain() can wait for it.
+        """
+        granted = await inference_scheduler.acquire(lane)
+        try:
+            future = threadpool_executor.submit(fn)
+        except BaseException:
+            inference_scheduler.release(lane, granted)
+            raise
+        # The slot stays taken until the thread is done, not the awaiting task
+        loop = asyncio.get_running_loop()
+        release = partial(inference_scheduler.release, lane, granted)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+        cls._inflight.add(future)
+        future.add_done_callback(cls._inflight.discard)
+        return await asyncio.wrap_future(future)
+
+    @classmethod
+    async def drain(cls, timeout: float) -> None:
+        """
+        Wait up to `timeout` seconds for in-flight inferences to finish, then
+        shut the thread pool down, cancelling anything still queued. Call this
+        on shutdown before clear().
+        """
+        pending = set(cls._inflight)
+        if pending:
+            logger.info("Draining in-flight inferences", count=len(pending))
+            loop = asyncio.get_running_loop()
+            _, not_done = await loop.run_in_executor(
+                None, partial(concurrent.futures.wait, pending, timeout=timeout)
+            )
+            if not_done:
+                logger.warning(
+                    "Inferences still running after drain timeout",
+                    count=len(not_done),
+                    timeout=timeout,
+                )
+        threadpool_executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def model_version(model_name: str) -> str:
+        return MODEL_VERSIONS.get(model_name, DEFAULT_MODEL_VERSION)
+
     @classmethod
     def _choose_model_by_cpu(cls) -> str:
         """
@@ -228,6 +371,15 @@ class ModelManager:
 
         return cls.CPU_TO_MODEL[-1][1]
 
+    @classmethod
+    async def select_model(cls, model_name: Optional[str] = None) -> str:
+        """
+        `model_name`, or the backbone for the current CPU load; for callers
+        that split one logical request over several classify_batch calls and
+        need them all to use the same model.
+        """
+        return model_name or cls._choose_model_by_cpu()
+
     @classmethod
     async def classify_image(cls, image_data: bytes) -> dict:
         """
@@ -254,36 +406,64 @@ class ModelManager:
                 # Also attach to parent span for higher-level context
                 span.set_attribute("model.name", chosen_model_name)
 
+            # Already classified by this model version (here or by another worker)
+            cache_key, cached = await prediction_cache.get(
+                image_data,
+                "tensorflow",
+                chosen_model_name,
+                cls.model_version(chosen_model_name),
+            )
+            span.set_attribute("prediction_cache.hit", cached is not None)
+            if cached is not None:
+                return cached
+
             # 2) Retrieve the model
             with tracer.start_as_current_span("model_retrieval"):
-                model = cls.get_model(chosen_model_name)
+                model = await cls._get_model_async(chosen_model_name)
                 info = cls.MODEL_INFO[chosen_model_name]
                 preprocess_fn = info["preprocess"]
                 decode_fn = info["decode"]
                 input_h, input_w = info["input_size"]
 
+            stage = partial(
+                INFERENCE_STAGE_DURATION.labels,
+                backend="tensorflow",
+                model_name=chosen_model_name,
+            )
+
             # 3) Preprocessing
             with tracer.start_as_current_span("preprocessing"):
-                try:
-                    img = Image.open(io.BytesIO(image_data)).convert("RGB")
-                except Exception as e:
-                    raise ValueError(f"Could not decode image bytes: {e}")
+                with stage(stage="decode").time():
+                    try:
+                        img = Image.open(io.BytesIO(image_data)).convert("RGB")
+                    except Exception as e:
+                        raise ValueError(f"Could not decode image bytes: {e}")
 
-                img = img.resize((input_w, input_h))
-                x = np.asarray(img, dtype=np.float32)
-                x = np.expand_dims(x, axis=0)
-                x = preprocess_fn(x)
+                with stage(stage="preprocess").time():
+                    img = img.resize((input_w, input_h))
+                    x = np.asarray(img, dtype=np.float32)
+                    x = np.expand_dims(x, axis=0)
+                    x = preprocess_fn(x)
 
             # 4) Inference (inside threadpool!)
             with tracer.start_as_current_span("inference_call"):
-                loop = asyncio.get_running_loop()
-                preds = await loop.run_in_executor(
-                    threadpool_executor,  # Use the custom executor
-                    partial(model.predict, x),  # Pass the model's predict function
+                preds = await cls._run_in_executor(
+                    partial(
+                        time_executor_call,
+                        model.predict,  # Pass the model's predict function
+                        x,
+                        queue_wait=stage(stage="queue_wait"),
+                        run_time=stage(stage="inference"),
+                        submitted_at=time.perf_counter(),
+                    ),
+                    lane=chosen_model_name,
                 )
 
             # 5) Postprocessing
-            with tracer.start_as_current_span("postprocessing"):
+            with (
+                tracer.start_as_current_span("postprocessing"),
+                stage(stage="postprocess").time(),
+            ):
                 decoded = decode_fn(preds, top=5)[0]
                 results = []
                 for class_id, class_name, score in decoded:
@@ -301,7 +481,296 @@ class ModelManager:
                         "top_prediction.confidence", results[0]["confidence"]
                     )
 
-            return {
+            result = {
                 "model_used": chosen_model_name,
                 "predictions": results,
             }
+            await prediction_cache.put(cache_key, result)
+            return result
+
+    @staticmethod
+    def _prepare_batch(
+        images: List[bytes], info: dict, stage
+    ) -> Tuple[Optional[np.ndarray], Dict[int, str]]:
+        """
+        Decode and preprocess `images` into one (N, H, W, 3) float32 batch.
+        Images that fail to decode are left out and reported in the returned
+        {input_index: error} dict. Runs on an executor thread.
+        """
+        input_h, input_w = info["input_size"]
+        arrays = []
+        errors = {}
+        for i, image_data in enumerate(images):
+            try:
+                with stage(stage="decode").time():
+                    img = Image.open(io.BytesIO(image_data)).convert("RGB")
+            except Exception as e:
+                errors[i] = f"Could not decode image bytes: {e}"
+                continue
+            with stage(stage="preprocess").time():
+                arrays.append(
+                    np.asarray(img.resize((input_w, input_h)), dtype=np.float32)
+                )
+        if not arrays:
+            return None, errors
+        with stage(stage="preprocess").time():
+            batch = info["preprocess"](np.stack(arrays))
+        return batch, errors
+
+    @classmethod
+    async def classify_batch(
+        cls, images: List[bytes], model_name: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Classify several images with a single forward pass.
+
+        The backbone is picked once for the whole batch (by CPU load unless
+        `model_name` is given). Decoding and preprocessing run on the thread
+        pool, like inference, so large batches never block the event loop.
+
+        Images already in the prediction cache for that model version are
+        not run again.
+
+        Returns:
+            list: one entry per input, in order. Either
+                {"model_used": str, "predictions": [top-5 ...]} or
+                {"error": str} for images that could not be decoded.
+        """
+        chosen_model_name = model_name or cls._choose_model_by_cpu()
+        return await prediction_cache.classify_batch(
+            images,
+            "tensorflow",
+            chosen_model_name,
+            cls.model_version(chosen_model_name),
+            partial(cls._classify_batch, model_name=chosen_model_name),
+        )
+
+    @classmethod
+    async def _classify_batch(cls, images: List[bytes], model_name: str) -> List[dict]:
+        with tracer.start_as_current_span("modelmanager_classify_batch") as span:
+            chosen_model_name = model_name
+            span.set_attribute("model.name", chosen_model_name)
+            span.set_attribute("batch.size", len(images))
+            model = await cls._get_model_async(chosen_model_name)
+            info = cls.MODEL_INFO[chosen_model_name]
+            stage = partial(
+                INFERENCE_STAGE_DURATION.labels,
+                backend="tensorflow",
+                model_name=chosen_model_name,
+            )
+
+            with tracer.start_as_current_span("preprocessing"):
+                batch, errors = await cls._run_in_executor(
+                    partial(cls._prepare_batch, images, info, stage),
+                    lane=chosen_model_name,
+                )
+
+            predictions = []
+            if batch is not None:
+                predictions = await cls._predict_top5(
+                    model, batch, info, chosen_model_name, stage
+                )
+
+            results = []
+            rows = iter(predictions)
+            for i in range(len(images)):
+                if i in errors:
+                    results.append({"error": errors[i]})
+                    continue
+                results.append(
+                    {"model_used": chosen_model_name, "predictions": next(rows)}
+                )
+            return results
+
+    @classmethod
+    async def _predict_top5(
+        cls, model, batch: np.ndarray, info: dict, model_name: str, stage
+    ) -> List[List[dict]]:
+        """
+        Run a preprocessed batch through `model` on the thread pool and
+        decode the top-5 predictions of every row.
+        """
+        with tracer.start_as_current_span("inference_call"):
+            preds = await cls._run_in_executor(
+                partial(
+                    time_executor_call,
+                    model.predict,
+                    batch,
+                    batch_size=len(batch),
+                    verbose=0,
+                    queue_wait=stage(stage="queue_wait"),
+                    run_time=stage(stage="inference"),
+                    submitted_at=time.perf_counter(),
+                ),
+                lane=model_name,
+            )
+        with (
+            tracer.start_as_current_span("postprocessing"),
+            stage(stage="postprocess").time(),
+        ):
+            return [
+                [
+                    {
+                        "class_id": class_id,
+                        "class_name": class_name,
+                        "confidence": float(score),
+                    }
+                    for class_id, class_name, score in row
+                ]
+                for row in info["decode"](preds, top=5)
+            ]
+
+    @staticmethod
+    def _prepare_tiles(
+        image_data: bytes, info: dict, overlap: float, max_tiles: int, stage
+    ) -> Tuple[Tiles, np.ndarray]:
+        """Decode and tile one image, and preprocess the tiles. Runs on an executor thread."""
+        tiles = decode_tiles(
+            image_data, info["input_size"], overlap, max_tiles, stage=stage
+        )
+        with stage(stage="preprocess").time():
+            batch = info["preprocess"](tiles.arrays.astype(np.float32))
+        return tiles, batch
+
+    @classmethod
+    async def classify_tiled(
+        cls,
+        image_data: bytes,
+        overlap: float = TILE_OVERLAP,
+        max_tiles: int = TILE_MAX_COUNT,
+        model_name: Optional[str] = None,
+    ) -> dict:
+        """
+        Classify a high-resolution image tile by tile (see app.models.tiling):
+        it is decoded once, cut into overlapping tiles of the backbone's
+        input size (at most `max_tiles`, scaling the image down if needed)
+        and every tile runs in one forward pass.
+
+        Returns:
+            dict: {"model_used", "image_size", "scale", "predictions":
+            [aggregated top-5 with "tiles" counts], "tiles": [{"box",
+            "predictions"}, ...]}.
+
+        Raises:
+            ValueError: the image could not be decoded.
+        """
+        chosen_model_name = model_name or cls._choose_model_by_cpu()
+        with tracer.start_as_current_span("modelmanager_classify_tiled") as span:
+            span.set_attribute("model.name", chosen_model_name)
+            model = await cls._get_model_async(chosen_model_name)
+            info = cls.MODEL_INFO[chosen_model_name]
+            stage = partial(
+                INFERENCE_STAGE_DURATION.labels,
+                backend="tensorflow",
+                model_name=chosen_model_name,
+            )
+
+            with tracer.start_as_current_span("preprocessing"):
+                tiles, batch = await cls._run_in_executor(
+                    partial(
+                        cls._prepare_tiles, image_data, info, overlap, max_tiles, stage
+                    ),
+                    lane=chosen_model_name,
+                )
+            span.set_attribute("tiles.count", len(batch))
+
+            predictions = await cls._predict_top5(
+                model, batch, info, chosen_model_name, stage
+            )
+            return tiled_result(chosen_model_name, tiles, predictions)
+
+    @classmethod
+    async def embed_batch(
+        cls, images: List[bytes], model_name: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Embed several images with a single forward pass: the pooled features
+        of each backbone's "embedding_layer", L2-normalized, so the dot
+        product of two embeddings is their cosine similarity.
+
+        Like classify_batch(), the backbone is picked by CPU load unless
+        `model_name` is given, and embeddings already in the prediction
+        cache for that model version are not computed again.
+
+        Returns:
+            list: one entry per input, in order. Either
+                {"model_used": str, "embedding": [float, ...]} or
+                {"error": str} for images that could not be decoded.
+        """
+        chosen_model_name = model_name or cls._choose_model_by_cpu()
+        return await prediction_cache.classify_batch(
+            images,
+            "tensorflow-embedding",
+            chosen_model_name,
+            cls.model_version(chosen_model_name),
+            partial(cls._embed_batch, model_name=chosen_model_name),
+        )
+
+    @classmethod
+    async def _embed_batch(cls, images: List[bytes], model_name: str) -> List[dict]:
+        with tracer.start_as_current_span("modelmanager_embed_batch") as span:
+            span.set_attribute("model.name", model_name)
+            span.set_attribute("batch.size", len(images))
+            model = await cls._get_model_async(model_name)
+            features = cls.feature_model(model_name, model)
+            info = cls.MODEL_INFO[model_name]
+            stage = partial(
+                INFERENCE_STAGE_DURATION.labels,
+                backend="tensorflow",
+                model_name=model_name,
+            )
+
+            with tracer.start_as_current_span("preprocessing"):
+                batch, errors = await cls._run_in_executor(
+                    partial(cls._prepare_batch, images, info, stage),
+                    lane=model_name,
+                )
+
+            embeddings = iter(())
+            if batch is not None:
+                with tracer.start_as_current_span("inference_call"):
+                    vectors = await cls._run_in_executor(
+                        partial(
+                            time_executor_call,
+                            features.predict,
+                            batch,
+                            batch_size=len(batch),
+                            verbose=0,
+                            queue_wait=stage(stage="queue_wait"),
+                            run_time=stage(stage="inference"),
+                            submitted_at=time.perf_counter(),
+                        ),
+                        lane=model_name,
+                    )
+                embeddings = iter(l2_normalize(vectors).tolist())
+
+            return [
+                (
+                    {"error": errors[i]}
+                    if i in errors
+                    else {"model_used": model_name, "embedding": next(embeddings)}
+                )
+                for i in range(len(images))
+            ]
+
+
+def _release_unloaded_models() -> None:
+    # Feature models hold their backbone's layers; drop those of unloaded ones
+    for name in list(ModelManager._feature_models):
+        if not model_registry.is_resident(name):
+            del ModelManager._feature_models[name]
+    gc.collect()
+
+
+# Shared by every endpoint (and resnet.py), so each backbone is loaded once
+model_registry = ModelRegistry(
+    loader=ModelManager._load_model,
+    budget_bytes=int(MODEL_MEMORY_BUDGET_MB * 2**20),
+    pinned=(
+        [name.strip() for name in MODEL_PINNED.split(",") if name.strip()]
+        if MODEL_PINNED is not None
+        else [ModelManager.CPU_TO_MODEL[-1][1]]
+    )
+    + [RESNET_PREDICT_MODEL],
+    on_unload=_release_unloaded_models,
+)
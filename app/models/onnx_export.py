@@ -0,0 +1,216 @@
+"""
+Export Keras backbones to ONNX for Triton, with each backbone's own
+`preprocess_input` compiled into the graph.
+
+The exported models take UINT8 NHWC images (the decoded, resized pixels) and
+do the float conversion, channel order and scaling/mean subtraction
+themselves, so clients ship 1 byte per pixel instead of 4 and no numpy math
+runs in the API process.
+
+Usage (from the repo root):
+    python -m app.models.onnx_export export --model ResNet50V2 --repo services/triton/models
+    python -m app.models.onnx_export prepend services/triton/models/ResNet50/1/model.onnx --model ResNet50
+"""
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+# Preprocessing of each backbone, as done by its keras `preprocess_input`:
+#   "tf":    x / 127.5 - 1                 (ResNet*V2, Xception)
+#   "caffe": RGB -> BGR, minus ImageNet mean (ResNet*, VGG*)
+PREPROCESS_MODES = {
+    "Xception": "tf",
+    "ResNet152V2": "tf",
+    "ResNet101V2": "tf",
+    "ResNet50V2": "tf",
+    "ResNet152": "caffe",
+    "ResNet101": "caffe",
+    "ResNet50": "caffe",
+    "VGG19": "caffe",
+    "VGG16": "caffe",
+}
+INPUT_SIZES = {name: (224, 224) for name in PREPROCESS_MODES}
+INPUT_SIZES["Xception"] = (299, 299)
+
+CAFFE_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+ONNX_OPSET = 13
+
+
+def preprocessing_nodes(mode: str, source: str, target: str, prefix: str = "pre"):
+    """
+    Nodes and initializers computing `target` (float32 NHWC) from `source`
+    (uint8 NHWC) with the given preprocessing mode.
+    """
+    cast = f"{prefix}/cast"
+    nodes = [helper.make_node("Cast", [source], [cast], to=TensorProto.FLOAT)]
+    if mode == "tf":
+        scale = numpy_helper.from_array(
+            np.array(1 / 127.5, dtype=np.float32), f"{prefix}/scale"
+        )
+        one = numpy_helper.from_array(np.array(1.0, dtype=np.float32), f"{prefix}/one")
+        nodes += [
+            helper.make_node("Mul", [cast, scale.name], [f"{prefix}/scaled"]),
+            helper.make_node("Sub", [f"{prefix}/scaled", one.name], [target]),
+        ]
+        return nodes, [scale, one]
+    if mode == "caffe":
+        order = numpy_helper.from_array(
+            np.array([2, 1, 0], dtype=np.int64), f"{prefix}/bgr"
+        )
+        mean = numpy_helper.from_array(CAFFE_MEAN_BGR, f"{prefix}/mean")
+        nodes += [
+            helper.make_node("Gather", [cast, order.name], [f"{prefix}/bgr_x"], axis=3),
+            helper.make_node("Sub", [f"{prefix}/bgr_x", mean.name], [target]),
+        ]
+        return nodes, [order, mean]
+    raise ValueError(f"Unknown preprocessing mode '{mode}'")
+
+
+def is_uint8_model(model: onnx.ModelProto) -> bool:
+    return model.graph.input[0].type.tensor_type.elem_type == TensorProto.UINT8
+
+
+def prepend_preprocessing(model: onnx.ModelProto, mode: str) -> onnx.ModelProto:
+    """
+    Turn a float32-input model into one that takes uint8 NHWC images.
+
+    The graph input keeps its name and shape (so Triton configs and clients
+    only change the data type); its former consumers now read the output of
+    the preprocessing nodes.
+    """
+    if is_uint8_model(model):
+        raise ValueError("Model already takes uint8 input")
+    graph = model.graph
+    graph_input = graph.input[0]
+    name = graph_input.name
+    preprocessed = f"{name}/preprocessed"
+    for node in graph.node:
+        for i, value in enumerate(node.input):
+            if value == name:
+                node.input[i] = preprocessed
+    for output in graph.output:
+        if output.name == name:
+            raise ValueError("Model input is also an output")
+
+    nodes, initializers = preprocessing_nodes(mode, name, preprocessed)
+    existing = list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes + existing)
+    graph.initializer.extend(initializers)
+    graph_input.type.tensor_type.elem_type = TensorProto.UINT8
+    onnx.checker.check_model(model)
+    return model
+
+
+DEFAULT_DYNAMIC_BATCHING = """dynamic_batching {
+  preferred_batch_size: [4, 8]
+  max_queue_delay_microseconds: 100
+}
+"""
+
+
+def model_config(
+    model_name: str,
+    height: int,
+    width: int,
+    max_batch_size: int = 8,
+    tuning: str = DEFAULT_DYNAMIC_BATCHING,
+) -> str:
+    """
+    Triton config.pbtxt for an exported backbone (uint8 input). `tuning` is
+    appended verbatim (dynamic_batching, instance_group, parameters, ...).
+    """
+    return f"""name: "{model_name}"
+platform: "onnxruntime_onnx"
+max_batch_size: {max_batch_size}
+input [
+  {{
+    name: "input"
+    data_type: TYPE_UINT8
+    dims: [{height}, {width}, 3]
+  }}
+]
+output [
+  {{
+    name: "predictions"
+    data_type: TYPE_FP32
+    dims: [1000]
+  }}
+]
+{tuning}"""
+
+
+def export_keras(model_name: str, repo: str, version: str = "1") -> str:
+    """
+    Export `model_name` (ImageNet weights) to `<repo>/<model>/<version>/model.onnx`
+    with preprocessing compiled in, plus a default config.pbtxt. Returns the
+    ONNX path.
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    from app.models.multimodel import ModelManager
+
+    height, width = INPUT_SIZES[model_name]
+    model = ModelManager.MODEL_INFO[model_name]["constructor"](weights="imagenet")
+    model.trainable = False
+    spec = (tf.TensorSpec((None, height, width, 3), tf.float32, name="input"),)
+    proto, _ = tf2onnx.convert.from_keras(model, input_signature=spec, opset=ONNX_OPSET)
+    output = proto.graph.output[0]
+    if output.name != "predictions":
+        for node in proto.graph.node:
+            for i, value in enumerate(node.output):
+                if value == output.name:
+                    node.output[i] = "predictions"
+        output.name = "predictions"
+    proto = prepend_preprocessing(proto, PREPROCESS_MODES[model_name])
+
+    version_dir = os.path.join(repo, model_name, version)
+    os.makedirs(version_dir, exist_ok=True)
+    path = os.path.join(version_dir, "model.onnx")
+    onnx.save(proto, path)
+    with open(os.path.join(repo, model_name, "config.pbtxt"), "w") as f:
+        f.write(model_config(model_name, height, width))
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Export backbones to uint8-input ONNX models for Triton."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export a Keras backbone")
+    export.add_argument("--model", required=True, choices=sorted(PREPROCESS_MODES))
+    export.add_argument("--repo", default="services/triton/models")
+    export.add_argument("--version", default="1")
+    prepend = commands.add_parser(
+        "prepend", help="add preprocessing to an existing float32 ONNX export"
+    )
+    prepend.add_argument("path")
+    prepend.add_argument("--model", required=True, choices=sorted(PREPROCESS_MODES))
+    prepend.add_argument("--output", default="", help="defaults to overwriting PATH")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(export_keras(args.model, args.repo, args.version))
+        return 0
+
+    model = onnx.load(args.path)
+    if is_uint8_model(model):
+        print(f"{args.path} already takes uint8 input", file=sys.stderr)
+        return 0
+    onnx.save(
+        prepend_preprocessing(model, PREPROCESS_MODES[args.model]),
+        args.output or args.path,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
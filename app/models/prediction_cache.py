@@ -0,0 +1,566 @@
+"""
+Two-tier cache of predictions, keyed by image content and model version.
+
+- "memory": an LRU dict in each worker (PREDICTION_CACHE_MEMORY_MB).
+- "shared": one store for every worker on the node that survives restarts and
+  rollouts. By default an SQLite database in WAL mode on a local volume
+  (PREDICTION_CACHE_PATH), read through mmap, with its total size kept by
+  triggers so eviction never has to scan it.
+
+Keys are the BLAKE2b hash of the image bytes plus backend, model name and
+model version, so a new model version never serves an old prediction. The
+first time a worker sees a model under a version, entries of that model
+stored under any other version are dropped from both tiers. Both tiers evict
+least recently used entries to stay within their byte budget.
+
+Tiers implement `CacheBackend` and are looked up by name in CACHE_BACKENDS
+(PREDICTION_CACHE_BACKEND picks the shared one), so a networked store can be
+added later without touching the callers. Cache failures are logged and
+treated as misses; they never fail a request.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import structlog
+
+from app.metrics import (
+    PREDICTION_CACHE_BYTES,
+    PREDICTION_CACHE_EVICTIONS,
+    PREDICTION_CACHE_REQUESTS,
+)
+
+logger = structlog.get_logger()
+
+PREDICTION_CACHE_ENABLED = (
+    os.getenv("PREDICTION_CACHE_ENABLED", "false").lower() == "true"
+)
+# Per-worker tier (0 disables it)
+PREDICTION_CACHE_MEMORY_MB = float(os.getenv("PREDICTION_CACHE_MEMORY_MB", "64"))
+# Shared tier: a CACHE_BACKENDS name, or "none"
+PREDICTION_CACHE_BACKEND = os.getenv("PREDICTION_CACHE_BACKEND", "sqlite").lower()
+# Put this on a node-local volume (hostPath / emptyDir on local disk) that all
+# workers of the node mount, so the cache outlives pods
+PREDICTION_CACHE_PATH = os.getenv(
+    "PREDICTION_CACHE_PATH", "/var/cache/marine-classifier/predictions.sqlite3"
+)
+PREDICTION_CACHE_MAX_MB = float(os.getenv("PREDICTION_CACHE_MAX_MB", "1024"))
+PREDICTION_CACHE_MMAP_MB = int(os.getenv("PREDICTION_CACHE_MMAP_MB", "256"))
+# Model versions are looked up again after this long (Triton can swap them live)
+PREDICTION_CACHE_VERSION_TTL_SECONDS = float(
+    os.getenv("PREDICTION_CACHE_VERSION_TTL_SECONDS", "60")
+)
+
+# Eviction frees down to this share of the budget, so it doesn't run per insert
+EVICT_TO_FRACTION = 0.9
+EVICT_BATCH = 256
+# A hit refreshes an entry's access time at most this often (saves writes)
+TOUCH_INTERVAL_SECONDS = 60.0
+
+
+class CacheKey(NamedTuple):
+    key: str
+    model: str
+    version: str
+
+
+# -----------------------------------------------------------
+# Tiers
+# -----------------------------------------------------------
+class CacheBackend(ABC):
+    """
+    A cache tier. Values are opaque bytes tagged with the model and version
+    they were computed with. Methods may block; the shared tier is only
+    called off the event loop.
+    """
+
+    name = ""
+
+    @classmethod
+    @abstractmethod
+    def from_settings(cls) -> "CacheBackend":
+        """The tier configured by the PREDICTION_CACHE_* environment."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """The value stored under `key`, or None."""
+
+    @abstractmethod
+    def put(self, key: str, value: bytes, model: str, version: str) -> int:
+        """Store `value`. Returns how many entries were evicted to make room."""
+
+    @abstractmethod
+    def set_model_version(self, model: str, version: str) -> int:
+        """Drop entries of `model` stored under other versions. Returns how many."""
+
+    @abstractmethod
+    def size_bytes(self) -> int:
+        """Bytes of the stored values."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Drop every entry."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU dict bounded by the bytes of its values, private to one process."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, str, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "MemoryCacheBackend":
+        return cls(int(PREDICTION_CACHE_MEMORY_MB * 2**20))
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: bytes, model: str, version: str) -> int:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (value, model, version)
+            self._bytes += len(value)
+            evicted = 0
+            while self._bytes > self.max_bytes and self._entries:
+                _, (old, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+                evicted += 1
+            return evicted
+
+    def set_model_version(self, model: str, version: str) -> int:
+        with self._lock:
+            stale = [
+                key
+                for key, (_, m, v) in self._entries.items()
+                if m == model and v != version
+            ]
+            for key in stale:
+                self._bytes -= len(self._entries.pop(key)[0])
+            return len(stale)
+
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    Embedded store shared by processes through one SQLite file.
+
+    WAL mode lets workers read while one writes; each thread has its own
+    connection. `totals` holds the bytes of all values, kept by triggers, and
+    an insert that takes it over `max_bytes` deletes the least recently
+    accessed entries down to EVICT_TO_FRACTION of it.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        version TEXT NOT NULL,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        accessed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+    CREATE INDEX IF NOT EXISTS entries_model ON entries (model, version);
+    CREATE TABLE IF NOT EXISTS totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO totals VALUES (0, 0);
+    CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+        UPDATE totals SET bytes = bytes + NEW.size WHERE id = 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+        UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+        UPDATE totals SET bytes = bytes - OLD.size WHERE id = 0;
+    END;
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        mmap_bytes: int = PREDICTION_CACHE_MMAP_MB * 2**20,
+        timeout: float = 5.0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mmap_bytes = mmap_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @classmethod
+    def from_settings(cls) -> "SqliteCacheBackend":
+        return cls(PREDICTION_CACHE_PATH, int(PREDICTION_CACHE_MAX_MB * 2**20))
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; multi-statement writes use explicit transactions
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+        with self._lock:
+            if not self._ready:
+                conn.executescript(self.SCHEMA)
+                self._ready = True
+            self._connections.append(conn)
+        self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, accessed FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > TOUCH_INTERVAL_SECONDS:
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, value: bytes, model: str, version: str) -> int:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO entries (key, model, version, value, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value, size = excluded.size, "
+                "accessed = excluded.accessed",
+                (key, model, version, value, len(value), time.time()),
+            )
+            if self._total(conn) <= self.max_bytes:
+                return 0
+            return self._evict(conn, int(self.max_bytes * EVICT_TO_FRACTION))
+
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, target: int) -> int:
+        evicted = 0
+        excess = self._total(conn) - target
+        while excess > 0:
+            oldest = conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT ?",
+                (EVICT_BATCH,),
+            ).fetchall()
+            if not oldest:
+                break
+            keys = []
+            for key, size in oldest:
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+            evicted += len(keys)
+        return evicted
+
+    def set_model_version(self, model: str, version: str) -> int:
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM entries WHERE model = ? AND version != ?",
+                (model, version),
+            ).rowcount
+
+    def size_bytes(self) -> int:
+        return self._total(self._connection())
+
+    def clear(self) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM entries")
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+CACHE_BACKENDS = {
+    "memory": MemoryCacheBackend,
+    "sqlite": SqliteCacheBackend,
+}
+
+
+# -----------------------------------------------------------
+# Cache front
+# -----------------------------------------------------------
+class PredictionCache:
+    """
+    Looks predictions up in the memory tier, then the shared tier (filling
+    the memory tier on a hit), and stores new ones in both. The shared tier
+    runs on a worker thread so the event loop never waits on disk.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = PREDICTION_CACHE_ENABLED,
+        local: Optional[CacheBackend] = None,
+        shared: Optional[CacheBackend] = None,
+    ):
+        self.enabled = enabled
+        self.local = local
+        self.shared = shared
+        # model -> version both tiers were last reconciled with
+        self._versions: Dict[str, str] = {}
+
+    @classmethod
+    def from_settings(cls) -> "PredictionCache":
+        if not PREDICTION_CACHE_ENABLED:
+            return cls(enabled=False)
+        local = (
+            MemoryCacheBackend.from_settings() if PREDICTION_CACHE_MEMORY_MB else None
+        )
+        shared = None
+        if PREDICTION_CACHE_BACKEND != "none":
+            shared = CACHE_BACKENDS[PREDICTION_CACHE_BACKEND].from_settings()
+        return cls(enabled=True, local=local, shared=shared)
+
+    @staticmethod
+    def image_hash(image_data: bytes) -> str:
+        return hashlib.blake2b(image_data, digest_size=20).hexdigest()
+
+    def key(
+        self, image_data: bytes, backend: str, model_name: str, version: str
+    ) -> CacheKey:
+        model = f"{backend}/{model_name}"
+        return CacheKey(
+            f"{model}@{version}:{self.image_hash(image_data)}", model, version
+        )
+
+    # -----------------------------------------------------------
+    # Version changes
+    # -----------------------------------------------------------
+    async def _reconcile(self, model: str, version: str) -> None:
+        if self._versions.get(model) == version:
+            return
+        self._versions[model] = version
+        if self.local is not None:
+            dropped = self.local.set_model_version(model, version)
+            PREDICTION_CACHE_EVICTIONS.labels(tier="memory", reason="version").inc(
+                dropped
+            )
+        if self.shared is not None:
+            try:
+                dropped = await asyncio.to_thread(
+                    self.shared.set_model_version, model, version
+                )
+            except Exception as e:
+                logger.warning("Prediction cache invalidation failed", error=str(e))
+                return
+            PREDICTION_CACHE_EVICTIONS.labels(tier="shared", reason="version").inc(
+                dropped
+            )
+            if dropped:
+                logger.info(
+                    "Prediction cache entries of an old model version dropped",
+                    model=model,
+                    version=version,
+                    dropped=dropped,
+                )
+
+    # -----------------------------------------------------------
+    # Lookups and inserts
+    # -----------------------------------------------------------
+    def _shared_get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found = {}
+        for key in keys:
+            value = self.shared.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    async def get_many(
+        self,
+        images: List[bytes],
+        backend: str,
+        model_name: str,
+        version: Optional[str],
+    ) -> Tuple[List[Optional[CacheKey]], Dict[int, dict]]:
+        """
+        Keys for `images` and the cached results among them.
+
+        Returns:
+            (keys, {input_index: result}). Keys are None when the cache is
+            off or the model version is unknown (nothing is cached then).
+        """
+        if not self.enabled or version is None:
+            return [None] * len(images), {}
+        keys = [self.key(data, backend, model_name, version) for data in images]
+        await self._reconcile(keys[0].model, version)
+
+        hits: Dict[int, dict] = {}
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.local.get(key.key) if self.local is not None else None
+            if value is None:
+                missing.append(i)
+            else:
+                hits[i] = json.loads(value)
+        if self.local is not None:
+            PREDICTION_CACHE_REQUESTS.labels(tier="memory", result="hit").inc(len(hits))
+            PREDICTION_CACHE_REQUESTS.labels(tier="memory", result="miss").inc(
+                len(missing)
+            )
+
+        if missing and self.shared is not None:
+            try:
+                found = await asyncio.to_thread(
+                    self._shared_get_many, [keys[i].key for i in missing]
+                )
+            except Exception as e:
+                logger.warning("Prediction cache lookup failed", error=str(e))
+                found = {}
+            for i in missing:
+                value = found.get(keys[i].key)
+                if value is None:
+                    continue
+                hits[i] = json.loads(value)
+                if self.local is not None:
+                    self._put_local(keys[i], value)
+            PREDICTION_CACHE_REQUESTS.labels(tier="shared", result="hit").inc(
+                len(found)
+            )
+            PREDICTION_CACHE_REQUESTS.labels(tier="shared", result="miss").inc(
+                len(missing) - len(found)
+            )
+        return keys, hits
+
+    async def get(
+        self,
+        image_data: bytes,
+        backend: str,
+        model_name: str,
+        version: Optional[str],
+    ) -> Tuple[Optional[CacheKey], Optional[dict]]:
+        """(key, cached result or None) for one image."""
+        keys, hits = await self.get_many([image_data], backend, model_name, version)
+        return keys[0], hits.get(0)
+
+    def _put_local(self, key: CacheKey, value: bytes) -> None:
+        evicted = self.local.put(key.key, value, key.model, key.version)
+        PREDICTION_CACHE_EVICTIONS.labels(tier="memory", reason="size").inc(evicted)
+        PREDICTION_CACHE_BYTES.labels(tier="memory").set(self.local.size_bytes())
+
+    def _shared_put_many(self, entries: List[Tuple[CacheKey, bytes]]) -> None:
+        evicted = 0
+        for key, value in entries:
+            evicted += self.shared.put(key.key, value, key.model, key.version)
+        PREDICTION_CACHE_EVICTIONS.labels(tier="shared", reason="size").inc(evicted)
+        PREDICTION_CACHE_BYTES.labels(tier="shared").set(self.shared.size_bytes())
+
+    async def put_many(self, entries: List[Tuple[Optional[CacheKey], dict]]) -> None:
+        """Store (key, result) pairs; results with an "error" are skipped."""
+        encoded = [
+            (key, json.dumps(result, separators=(",", ":")).encode("utf-8"))
+            for key, result in entries
+            if key is not None and "error" not in result
+        ]
+        if not encoded:
+            return
+        if self.local is not None:
+            for key, value in encoded:
+                self._put_local(key, value)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self._shared_put_many, encoded)
+            except Exception as e:
+                logger.warning("Prediction cache insert failed", error=str(e))
+
+    async def put(self, key: Optional[CacheKey], result: dict) -> None:
+        await self.put_many([(key, result)])
+
+    async def classify_batch(
+        self,
+        images: List[bytes],
+        backend: str,
+        model_name: str,
+        version: Optional[str],
+        classify: Callable[[List[bytes]], Awaitable[List[dict]]],
+    ) -> List[dict]:
+        """
+        `classify(images)` for the images not in the cache, merged in order
+        with the cached results; the new results are cached.
+        """
+        keys, hits = await self.get_many(images, backend, model_name, version)
+        if len(hits) == len(images):
+            return [hits[i] for i in range(len(images))]
+        missing = [i for i in range(len(images)) if i not in hits]
+        computed = await classify([images[i] for i in missing])
+        results = dict(hits)
+        results.update(zip(missing, computed))
+        await self.put_many([(keys[i], results[i]) for i in missing])
+        return [results[i] for i in range(len(images))]
+
+    def clear(self) -> None:
+        for tier in (self.local, self.shared):
+            if tier is not None:
+                tier.clear()
+
+    def close(self) -> None:
+        if self.shared is not None:
+            self.shared.close()
+
+
+prediction_cache = PredictionCache.from_settings()
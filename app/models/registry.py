@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+import structlog
+
+from app.metrics import (
+    MODEL_LOAD_TIME,
+    MODEL_MEMORY_BUDGET,
+    MODEL_REGISTRY_EVENTS,
+    MODEL_RESIDENT_BYTES,
+)
+from app.models.scheduler import SchedulerError
+
+logger = structlog.get_logger()
+
+
+class ModelBudgetError(SchedulerError):
+    """A model does not fit in the memory budget, so the work cannot run."""
+
+    status_code = 503
+
+
+def weights_footprint(model) -> int:
+    """Bytes held by a Keras model's weights."""
+    total = 0
+    for weight in model.weights:
+        total += int(np.prod(weight.shape)) * weight.dtype.size
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models with a memory budget.
+
+    Every endpoint gets its models from here, so each backbone is loaded at
+    most once per process; concurrent requests for a model that is still
+    loading wait for that one load instead of starting their own. Models are
+    loaded on first use and, when `budget_bytes` is set, the least recently
+    used unpinned models are unloaded to make room. A model's footprint is
+    measured after its first load and remembered, so later reloads can make
+    room before loading rather than after.
+
+    A model evicted while an inference still holds it stays alive until that
+    inference returns; the budget bounds what the registry keeps resident.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], object],
+        budget_bytes: int = 0,
+        pinned: Iterable[str] = (),
+        footprint: Callable[[object], int] = weights_footprint,
+        on_unload: Optional[Callable[[], None]] = None,
+    ):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self.pinned = set(pinned)
+        self.footprint = footprint
+        self.on_unload = on_unload
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        MODEL_MEMORY_BUDGET.set(budget_bytes)
+
+    @property
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes[name] for name in self._models)
+
+    def resident(self) -> Dict[str, int]:
+        """{model_name: bytes} of the loaded models, least recently used first."""
+        with self._lock:
+            return {name: self._sizes[name] for name in self._models}
+
+    def is_resident(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str, evict: bool = True):
+        """
+        Return the model `name`, loading it if needed.
+
+        Args:
+            name: model name understood by the loader.
+            evict: whether other models may be unloaded to make room.
+
+        Raises:
+            ModelBudgetError: if the model does not fit the budget.
+        """
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                return model
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:  # loaded by another caller meanwhile
+                    self._models.move_to_end(name)
+                    return model
+                # Make room up front when the size is known from a past load
+                evicted = 0
+                if name in self._sizes:
+                    evicted = self._make_room(name, self._sizes[name], evict)
+            if evicted and self.on_unload:
+                self.on_unload()
+
+            start = time.perf_counter()
+            model = self.loader(name)
+            duration = time.perf_counter() - start
+            size = self.footprint(model)
+
+            with self._lock:
+                self._sizes[name] = size
+                self._loading.pop(name, None)
+                evicted = self._make_room(name, size, evict)
+                self._models[name] = model
+            if evicted and self.on_unload:
+                self.on_unload()
+            MODEL_LOAD_TIME.labels(model_name=name).set(duration)
+            MODEL_RESIDENT_BYTES.labels(model_name=name).set(size)
+            MODEL_REGISTRY_EVENTS.labels(model_name=name, event="load").inc()
+            logger.info(
+                "Model loaded",
+                model_name=name,
+                size_mb=round(size / 2**20, 1),
+                seconds=round(duration, 2),
+                used_mb=round(self.used_bytes / 2**20, 1),
+            )
+            return model
+
+    def _make_room(self, name: str, size: int, evict: bool) -> int:
+        """
+        Evict LRU unpinned models until `size` more bytes fit. Holds _lock.
+        Returns how many models were evicted.
+        """
+        evicted = 0
+        if not self.budget_bytes:
+            return evicted
+        used = sum(self._sizes[n] for n in self._models)
+        victims = [n for n in self._models if n not in self.pinned] if evict else []
+        while victims and used + size > self.budget_bytes:
+            victim = victims.pop(0)
+            used -= self._sizes[victim]
+            self._unload(victim, reason="evict")
+            evicted += 1
+        if used + size > self.budget_bytes:
+            raise ModelBudgetError(
+                f"Model '{name}' ({size / 2**20:.0f} MB) does not fit the "
+                f"{self.budget_bytes / 2**20:.0f} MB model memory budget"
+            )
+        return evicted
+
+    def _unload(self, name: str, reason: str) -> None:
+        del self._models[name]
+        MODEL_RESIDENT_BYTES.labels(model_name=name).set(0)
+        MODEL_REGISTRY_EVENTS.labels(model_name=name, event=reason).inc()
+        logger.info("Model unloaded", model_name=name, reason=reason)
+
+    def preload(self, names: Iterable[str]) -> None:
+        """
+        Load `names` in order, pinned models first. Preloading never evicts:
+        once a model only fits by unloading another one, it and the rest are
+        left to load on demand.
+        """
+        names = sorted(dict.fromkeys(names), key=lambda n: n not in self.pinned)
+        for i, name in enumerate(names):
+            try:
+                self.get(name, evict=name in self.pinned)
+            except ModelBudgetError:
+                if name in self.pinned:
+                    raise
+                logger.info(
+                    "Model memory budget full, remaining models load on demand",
+                    skipped=names[i:],
+                )
+                return
+
+    def unload(self, name: str) -> bool:
+        """Unload `name` if it is resident. Returns whether it was."""
+        with self._lock:
+            if name not in self._models:
+                return False
+            self._unload(name, reason="unload")
+        if self.on_unload:
+            self.on_unload()
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in list(self._models):
+                self._unload(name, reason="unload")
+        if self.on_unload:
+            self.on_unload()
@@ -1,5 +1,6 @@
 import io
 import os
+from functools import partial
 
 import numpy as np
 import structlog
@@ -8,6 +9,9 @@ from opentelemetry import trace
 from PIL import Image
 from tensorflow.keras.applications.resnet50 import decode_predictions, preprocess_input
 
+from app.metrics import INFERENCE_STAGE_DURATION
+from app.models.multimodel import RESNET_PREDICT_MODEL, model_registry
+
 tracer = trace.get_tracer(__name__)
 
 
@@ -23,8 +27,9 @@ if os.getenv("TF_FORCE_GPU_ALLOW_GROWTH", "false").lower() == "true":
         tf.config.experimental.set_memory_growth(gpu, True)
 
 
-# Load the ResNet50 model with ImageNet weights
-model = tf.keras.applications.ResNet50(weights="imagenet")
+# ResNet50 with ImageNet weights, shared with ModelManager through the
+# registry, where it is pinned
+MODEL_NAME = RESNET_PREDICT_MODEL
 
 # Define target image size for ResNet50
 TARGET_SIZE = (224, 224)
@@ -32,8 +37,8 @@ TARGET_SIZE = (224, 224)
 
 def classify_image(image_data: bytes) -> dict:
     """
-    Classify an image using the ResNet50 model. Tensorflow will be used for asynchronous inference.
-    So this function must reamin synchronous. as not to interfere with the async inferece of tensorflow model.
+    Classify an image using the ResNet50 model. Blocking (model lookup and
+    forward pass): the /predict route runs it on the inference executor.
 
     Args:
         image_data (bytes): The image data in bytes.
@@ -47,20 +52,34 @@ def classify_image(image_data: bytes) -> dict:
             "classify_image called with image data of length", length=len(image_data)
         )
 
+        stage = partial(
+            INFERENCE_STAGE_DURATION.labels, backend="tensorflow", model_name="ResNet50"
+        )
+
         # Preprocessing
         with tracer.start_as_current_span("preprocessing"):
-            image = Image.open(io.BytesIO(image_data)).convert("RGB")
-            image = image.resize(TARGET_SIZE)
-            image_array = np.array(image)
-            image_batch = np.expand_dims(image_array, axis=0)
-            preprocessed_image = preprocess_input(image_batch)
+            with stage(stage="decode").time():
+                image = Image.open(io.BytesIO(image_data)).convert("RGB")
+            with stage(stage="preprocess").time():
+                image = image.resize(TARGET_SIZE)
+                image_array = np.array(image)
+                image_batch = np.expand_dims(image_array, axis=0)
+                preprocessed_image = preprocess_input(image_batch)
+
+        model = model_registry.get(MODEL_NAME)
 
         # Inference
-        with tracer.start_as_current_span("inference"):
+        with (
+            tracer.start_as_current_span("inference"),
+            stage(stage="inference").time(),
+        ):
             predictions = tf.constant(predictions := model(preprocessed_image))
 
         # Postprocessing / Decoding
-        with tracer.start_as_current_span("postprocessing"):
+        with (
+            tracer.start_as_current_span("postprocessing"),
+            stage(stage="postprocess").time(),
+        ):
             decoded = decode_predictions(predictions.numpy(), top=5)[0]
             results = [
                 {
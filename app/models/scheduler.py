@@ -0,0 +1,355 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from app.metrics import (
+    SCHEDULER_DROPPED,
+    SCHEDULER_LANE_BUSY_SECONDS,
+    SCHEDULER_LANE_INFLIGHT,
+    SCHEDULER_LANE_LIMIT,
+    SCHEDULER_QUEUE_DEPTH,
+    SCHEDULER_WAIT_SECONDS,
+)
+
+# Timeout applied to requests without a deadline header (0 = no deadline)
+SCHEDULER_DEFAULT_TIMEOUT_SECONDS = float(
+    os.getenv("SCHEDULER_DEFAULT_TIMEOUT_SECONDS", "0")
+)
+# Upper bound on client-supplied timeouts
+SCHEDULER_MAX_TIMEOUT_SECONDS = float(os.getenv("SCHEDULER_MAX_TIMEOUT_SECONDS", "300"))
+# Work without a deadline is ordered as if it were due this long after it was
+# queued, so a steady stream of deadline requests cannot starve it
+SCHEDULER_UNDATED_SLACK_SECONDS = float(
+    os.getenv("SCHEDULER_UNDATED_SLACK_SECONDS", "10")
+)
+# Assumed slot time of a lane before any work has finished in it, and the
+# weight of each new observation in the lane's moving average
+LANE_INITIAL_COST_SECONDS = 0.05
+LANE_COST_SMOOTHING = 0.2
+
+
+class SchedulerError(Exception):
+    """Work was dropped before it ran. `status_code` is the HTTP status to return."""
+
+    status_code = 503
+
+
+class DeadlineExceeded(SchedulerError):
+    status_code = 504
+
+
+class RequestCancelled(SchedulerError):
+    # nginx's "client closed request"; the client is gone and never sees it
+    status_code = 499
+
+
+class RequestContext:
+    """
+    Deadline and cancellation signal of one HTTP request.
+
+    `deadline` is a time.monotonic() value (None = no deadline). `cancelled`
+    is set when the client disconnects; handlers can check it or wait on it,
+    and the schedulers fail any of the request's queued work with
+    RequestCancelled.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.cancelled = asyncio.Event()
+        self._waiters = set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None without a deadline)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        for waiter in list(self._waiters):
+            if not waiter.done():
+                waiter.set_exception(RequestCancelled("Client disconnected"))
+
+
+_request_context: contextvars.ContextVar[Optional[RequestContext]] = (
+    contextvars.ContextVar("request_context", default=None)
+)
+
+
+def current_request() -> Optional[RequestContext]:
+    """Context of the request being handled (None outside a request)."""
+    return _request_context.get()
+
+
+def set_request_context(ctx: Optional[RequestContext]) -> contextvars.Token:
+    return _request_context.set(ctx)
+
+
+def reset_request_context(token: contextvars.Token) -> None:
+    _request_context.reset(token)
+
+
+def parse_deadline(
+    timeout: Optional[str],
+    deadline: Optional[str],
+    default: float = SCHEDULER_DEFAULT_TIMEOUT_SECONDS,
+    maximum: float = SCHEDULER_MAX_TIMEOUT_SECONDS,
+) -> Optional[float]:
+    """
+    Turn request headers into a time.monotonic() deadline.
+
+    Args:
+        timeout: `X-Request-Timeout`, seconds from now.
+        deadline: `X-Request-Deadline`, absolute Unix time in seconds.
+        default: timeout used when neither header is given (0 = none).
+        maximum: cap on the resulting timeout.
+
+    Returns:
+        The earliest of the given deadlines, or None.
+
+    Raises:
+        ValueError: if a header is not a number.
+    """
+    now = time.monotonic()
+    candidates = []
+    if timeout is not None:
+        candidates.append(now + float(timeout))
+    if deadline is not None:
+        candidates.append(now + float(deadline) - time.time())
+    if not candidates and default > 0:
+        candidates.append(now + default)
+    if not candidates or any(math.isnan(c) for c in candidates):
+        return None
+    return min(min(candidates), now + maximum)
+
+
+def check_request(scheduler: str = "admission") -> None:
+    """
+    Raise DeadlineExceeded / RequestCancelled if the current request has
+    already expired or its client has gone, counting it as dropped.
+    """
+    ctx = current_request()
+    if ctx is None:
+        return
+    if ctx.cancelled.is_set():
+        SCHEDULER_DROPPED.labels(scheduler=scheduler, reason="cancelled").inc()
+        raise RequestCancelled("Client disconnected")
+    if ctx.expired():
+        SCHEDULER_DROPPED.labels(scheduler=scheduler, reason="expired").inc()
+        raise DeadlineExceeded("Request deadline exceeded before inference")
+
+
+def parse_lane_settings(text: str, cast=int) -> Dict[str, float]:
+    """Parse "ModelA=2,ModelB=1" into {"ModelA": 2, "ModelB": 1}."""
+    settings = {}
+    for item in text.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            settings[name.strip()] = cast(value.strip())
+    return settings
+
+
+class _Lane:
+    """Waiters and accounting of one lane (e.g. one backbone)."""
+
+    def __init__(self, scheduler: str, name: str, limit: int, weight: float):
+        self.name = name
+        self.limit = limit
+        self.weight = weight
+        self.busy = 0
+        self.heap = []
+        # Virtual time at which this lane's last dispatched work "finishes"
+        self.finish = 0.0
+        # Moving average of how long one slot is held, in seconds
+        self.cost = LANE_INITIAL_COST_SECONDS
+        self.depth = SCHEDULER_QUEUE_DEPTH.labels(scheduler=scheduler, lane=name)
+        self.inflight = SCHEDULER_LANE_INFLIGHT.labels(scheduler=scheduler, lane=name)
+        self.busy_seconds = SCHEDULER_LANE_BUSY_SECONDS.labels(
+            scheduler=scheduler, lane=name
+        )
+        self.wait = SCHEDULER_WAIT_SECONDS.labels(scheduler=scheduler, lane=name)
+        self.expired = SCHEDULER_DROPPED.labels(scheduler=scheduler, reason="expired")
+        SCHEDULER_LANE_LIMIT.labels(scheduler=scheduler, lane=name).set(limit)
+
+    def head(self) -> Optional[Tuple]:
+        """Earliest-deadline live waiter, dropping dead entries on the way."""
+        while self.heap:
+            entry = self.heap[0]
+            _, _, ctx, waiter = entry
+            if waiter.done():  # cancelled, expired or disconnected while queued
+                heapq.heappop(self.heap)
+            elif ctx is not None and ctx.expired():
+                heapq.heappop(self.heap)
+                waiter.set_exception(DeadlineExceeded("Request deadline exceeded"))
+                self.expired.inc()
+            else:
+                return entry
+        return None
+
+
+class DeadlineScheduler:
+    """
+    Earliest-deadline-first gate with `slots` concurrent holders, split into
+    lanes with weighted fair queueing between them.
+
+    Callers wrap backend work in `async with scheduler.slot(lane):`. Each lane
+    (one per backbone for ModelManager) holds at most its limit of the slots,
+    so a slow model cannot occupy the whole pool. While slots are busy:
+      - within a lane, waiters are ordered by their request's deadline; work
+        outside a request (bulk jobs) has no deadline and is ordered
+        SCHEDULER_UNDATED_SLACK_SECONDS after it was queued,
+      - across lanes, a freed slot goes to the lane with the smallest virtual
+        start time (start-time fair queueing). Every dispatch advances the
+        lane's virtual time by its average slot time divided by its weight,
+        so lanes share the pool's time, not its call count, by weight.
+    A waiter whose deadline passes, or whose client disconnects, is failed
+    while still queued (DeadlineExceeded / RequestCancelled) and never reaches
+    the model.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slots: int,
+        lane_limits: Optional[Dict[str, int]] = None,
+        lane_weights: Optional[Dict[str, float]] = None,
+        default_limit: Optional[int] = None,
+        undated_slack: float = SCHEDULER_UNDATED_SLACK_SECONDS,
+    ):
+        self.name = name
+        self.slots = max(1, slots)
+        self.lane_limits = lane_limits or {}
+        self.lane_weights = lane_weights or {}
+        self.default_limit = default_limit or self.slots
+        self.undated_slack = undated_slack
+        self.lanes: Dict[str, _Lane] = {}
+        self._busy = 0
+        self._vtime = 0.0
+        self._seq = itertools.count()
+
+    def _lane(self, name: str) -> _Lane:
+        lane = self.lanes.get(name)
+        if lane is None:
+            limit = self.lane_limits.get(name, self.default_limit)
+            lane = _Lane(
+                self.name,
+                name,
+                limit=max(1, min(self.slots, limit)),
+                weight=max(1e-6, self.lane_weights.get(name, 1.0)),
+            )
+            self.lanes[name] = lane
+        return lane
+
+    def _drop(self, waiter: asyncio.Future, exc: SchedulerError, reason: str):
+        if not waiter.done():
+            waiter.set_exception(exc)
+            SCHEDULER_DROPPED.labels(scheduler=self.name, reason=reason).inc()
+
+    def _dispatch(self, lane: _Lane, start_tag: float) -> float:
+        self._vtime = start_tag
+        lane.finish = start_tag + lane.cost / lane.weight
+        lane.busy += 1
+        lane.inflight.inc()
+        self._busy += 1
+        return time.monotonic()
+
+    def _hand_over(self) -> None:
+        """Give free slots to waiting lanes, smallest virtual start first."""
+        while self._busy < self.slots:
+            best = None
+            for lane in self.lanes.values():
+                if lane.busy >= lane.limit:
+                    continue
+                entry = lane.head()
+                if entry is None:
+                    continue
+                candidate = (max(self._vtime, lane.finish), entry[0], entry[1], lane)
+                if best is None or candidate[:3] < best[:3]:
+                    best = candidate
+            if best is None:
+                return
+            start_tag, _, _, lane = best
+            _, _, _, waiter = heapq.heappop(lane.heap)
+            waiter.set_result(self._dispatch(lane, start_tag))
+
+    async def acquire(self, lane: str = "default") -> float:
+        """
+        Wait for a slot in `lane`. Returns the time.monotonic() at which the
+        slot was granted; pass it to the matching release().
+        """
+        ctx = current_request()
+        check_request(self.name)
+        queue = self._lane(lane)
+        if self._busy < self.slots and queue.busy < queue.limit and not queue.heap:
+            queue.wait.observe(0.0)
+            return self._dispatch(queue, max(self._vtime, queue.finish))
+
+        loop = asyncio.get_running_loop()
+        queued_at = time.monotonic()
+        waiter = loop.create_future()
+        if ctx is not None and ctx.deadline is not None:
+            key = ctx.deadline
+            timer = loop.call_at(
+                loop.time() + max(0.0, ctx.remaining()),
+                self._drop,
+                waiter,
+                DeadlineExceeded("Request deadline exceeded while queued"),
+                "expired",
+            )
+        else:
+            key = queued_at + self.undated_slack
+            timer = None
+        heapq.heappush(queue.heap, (key, next(self._seq), ctx, waiter))
+        queue.depth.inc()
+        waiter.add_done_callback(lambda _: queue.depth.dec())
+        if ctx is not None:
+            ctx._waiters.add(waiter)
+        # Slots may be free with only dead entries left in the heaps
+        self._hand_over()
+        try:
+            granted = await waiter
+        except RequestCancelled:
+            SCHEDULER_DROPPED.labels(scheduler=self.name, reason="cancelled").inc()
+            raise
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # The slot was handed over just as the task was cancelled
+                self.release(lane, waiter.result())
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if ctx is not None:
+                ctx._waiters.discard(waiter)
+        queue.wait.observe(granted - queued_at)
+        return granted
+
+    def release(self, lane: str = "default", granted: Optional[float] = None) -> None:
+        """Return a slot of `lane` taken at `granted` (as returned by acquire())."""
+        queue = self.lanes[lane]
+        if granted is not None:
+            held = time.monotonic() - granted
+            queue.busy_seconds.inc(held)
+            queue.cost += LANE_COST_SMOOTHING * (held - queue.cost)
+        queue.busy -= 1
+        queue.inflight.dec()
+        self._busy -= 1
+        self._hand_over()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "default"):
+        """Hold one slot of `lane` for the duration of the block."""
+        granted = await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane, granted)
@@ -0,0 +1,187 @@
+"""
+Tiled inference for high-resolution survey stills.
+
+Squashing a 20+ megapixel frame to 224x224 loses small animals. Instead the
+frame is decoded once and cut into overlapping tiles of the model's input
+size, which run through the backbone as one batch: per-tile predictions say
+where something was seen, and the aggregate (each class's best confidence
+over the tiles) says what is in the frame.
+
+The number of tiles is capped (TILE_MAX_COUNT): a frame whose grid would
+need more is scaled down until it fits, and JPEGs are then decoded directly
+at the reduced scale (PIL draft mode), which is most of the decode cost
+saved. Optionally the whole frame, resized, is added as one more tile, so
+animals larger than a tile are still seen whole.
+"""
+
+import io
+import os
+from contextlib import nullcontext
+from typing import Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Share of a tile that overlaps its neighbour, so an animal on a tile border
+# is whole in at least one tile
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.25"))
+# Most tiles per frame (including the whole-frame tile); larger frames are
+# scaled down to fit
+TILE_MAX_COUNT = int(os.getenv("TILE_MAX_COUNT", "64"))
+
+
+class Tiles(NamedTuple):
+    arrays: np.ndarray  # (N, H, W, 3) uint8, at the model's input size
+    boxes: List[Tuple[int, int, int, int]]  # (left, top, right, bottom), frame pixels
+    image_size: Tuple[int, int]  # (width, height) of the frame
+    scale: float  # tiles were cut from the frame resized by this factor
+
+
+def tile_positions(length: int, tile: int, overlap: float) -> List[int]:
+    """Tile offsets along one axis: evenly strided, the last one flush with the end."""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] != length - tile:
+        positions.append(length - tile)
+    return positions
+
+
+def tile_count(width: int, height: int, size: Tuple[int, int], overlap: float) -> int:
+    tile_h, tile_w = size
+    return len(tile_positions(width, tile_w, overlap)) * len(
+        tile_positions(height, tile_h, overlap)
+    )
+
+
+def fit_scale(
+    width: int,
+    height: int,
+    size: Tuple[int, int],
+    overlap: float,
+    max_tiles: int,
+) -> float:
+    """
+    Largest scale, at most 1, at which the frame's tile grid has at most
+    `max_tiles` tiles. A frame is never scaled below one tile, and frames
+    smaller than a tile are scaled up to one.
+    """
+    tile_h, tile_w = size
+    smallest = max(tile_w / width, tile_h / height)
+    scale = max(1.0, smallest)
+    while (
+        tile_count(round(width * scale), round(height * scale), size, overlap)
+        > max_tiles
+    ):
+        if scale * 0.95 <= smallest:
+            return smallest
+        scale *= 0.95
+    return scale
+
+
+def decode_tiles(
+    image_data: bytes,
+    size: Tuple[int, int],
+    overlap: float = TILE_OVERLAP,
+    max_tiles: int = TILE_MAX_COUNT,
+    full_frame: bool = True,
+    stage=None,
+) -> Tiles:
+    """
+    Decode `image_data` once and cut it into overlapping (H, W) = `size`
+    tiles, at most `max_tiles` of them (see fit_scale). Runs on a worker
+    thread.
+
+    Args:
+        full_frame: Also add the whole frame, resized to `size`, as the
+            last tile.
+        stage: Optional INFERENCE_STAGE_DURATION.labels partial; the decode
+            and tiling are timed as its "decode" and "preprocess" stages.
+
+    Raises:
+        ValueError: the bytes are not a decodable image.
+    """
+    tile_h, tile_w = size
+    grid_budget = max(1, max_tiles - 1 if full_frame else max_tiles)
+
+    def timed(name: str):
+        return stage(stage=name).time() if stage else nullcontext()
+
+    try:
+        with timed("decode"):
+            img = Image.open(io.BytesIO(image_data))
+            width, height = img.size
+            scale = fit_scale(width, height, size, overlap, grid_budget)
+            target = (
+                max(tile_w, round(width * scale)),
+                max(tile_h, round(height * scale)),
+            )
+            if scale < 1:
+                img.draft("RGB", target)
+            img = img.convert("RGB")
+            if img.size != target:
+                img = img.resize(target)
+    except Exception as e:
+        raise ValueError(f"Could not decode image bytes: {e}")
+
+    with timed("preprocess"):
+        pixels = np.asarray(img, dtype=np.uint8)
+        xs = tile_positions(target[0], tile_w, overlap)
+        ys = tile_positions(target[1], tile_h, overlap)
+        arrays = [pixels[y : y + tile_h, x : x + tile_w] for y in ys for x in xs]
+        # Per-axis ratios rather than 1/scale, so edge tiles end on the frame edge
+        rx, ry = width / target[0], height / target[1]
+        boxes = [
+            (
+                round(x * rx),
+                round(y * ry),
+                min(width, round((x + tile_w) * rx)),
+                min(height, round((y + tile_h) * ry)),
+            )
+            for y in ys
+            for x in xs
+        ]
+        if full_frame and len(arrays) > 1:
+            arrays.append(np.asarray(img.resize((tile_w, tile_h)), dtype=np.uint8))
+            boxes.append((0, 0, width, height))
+        return Tiles(np.stack(arrays), boxes, (width, height), scale)
+
+
+def aggregate(tile_predictions: Iterable[List[dict]], top: int = 5) -> List[dict]:
+    """
+    Frame-level predictions from per-tile top-k lists: each class's highest
+    confidence over the tiles and the number of tiles that ranked it.
+
+    Returns:
+        list: [{"class_id", "class_name", "confidence", "tiles"}, ...], the
+        `top` most confident classes first.
+    """
+    best = {}
+    for predictions in tile_predictions:
+        for p in predictions:
+            entry = best.get(p["class_name"])
+            if entry is None:
+                best[p["class_name"]] = entry = dict(p, confidence=0.0, tiles=0)
+            entry["confidence"] = max(entry["confidence"], p["confidence"])
+            entry["tiles"] += 1
+    ranked = sorted(best.values(), key=lambda e: (-e["confidence"], -e["tiles"]))
+    return ranked[:top]
+
+
+def tiled_result(model_name: str, tiles: Tiles, predictions: List[List[dict]]) -> dict:
+    """
+    The tiled classification response: {"model_used", "image_size",
+    "scale", "predictions": aggregate(...), "tiles": [{"box", "predictions"},
+    ...]}, tiles in row-major order (the whole frame last, when added).
+    """
+    return {
+        "model_used": model_name,
+        "image_size": list(tiles.image_size),
+        "scale": round(tiles.scale, 4),
+        "predictions": aggregate(predictions),
+        "tiles": [
+            {"box": list(box), "predictions": tile}
+            for box, tile in zip(tiles.boxes, predictions)
+        ],
+    }
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tritonclient.http import InferenceServerException, InferInput
+
+from app.config.logger import get_class_logger
+from app.metrics import TRITON_MODEL_EVENTS, TRITON_MODEL_LOADED
+
+logger = get_class_logger("TritonModelController")
+
+# "explicit": the API loads/unloads models (Triton started with
+# --model-control-mode=explicit); anything else leaves it to Triton (poll mode)
+TRITON_MODEL_CONTROL = os.getenv("TRITON_MODEL_CONTROL", "poll").lower()
+# Unload a model after this long without inferences (from any API worker)
+TRITON_MODEL_IDLE_SECONDS = float(os.getenv("TRITON_MODEL_IDLE_SECONDS", "600"))
+# Most models loaded at once (0 = no limit); least recently used go first
+TRITON_MAX_LOADED_MODELS = int(os.getenv("TRITON_MAX_LOADED_MODELS", "0"))
+# Never evict a model Triton served within this many seconds (to any worker)
+TRITON_EVICT_BUSY_SECONDS = float(os.getenv("TRITON_EVICT_BUSY_SECONDS", "10"))
+# Load the neighbouring model once CPU load is this close to its threshold
+TRITON_PRELOAD_MARGIN = float(os.getenv("TRITON_PRELOAD_MARGIN", "0.1"))
+TRITON_PREWARM = os.getenv("TRITON_PREWARM", "true").lower() == "true"
+TRITON_CONTROL_INTERVAL_SECONDS = float(
+    os.getenv("TRITON_CONTROL_INTERVAL_SECONDS", "30")
+)
+
+
+class TritonModelController:
+    """
+    Keeps the Triton models the CPU selector uses loaded, and nothing else.
+
+    - select(cpu) picks the model for the current CPU load like
+      TritonMultiModel._choose_model_by_cpu, and starts loading the models on
+      either side of the nearest threshold once the load is within
+      TRITON_PRELOAD_MARGIN of it, so they are ready when traffic moves.
+    - Traffic only moves to a model once it is loaded and pre-warmed (one
+      dummy inference, so the first real request doesn't pay for ORT session
+      setup); until then select() answers with the closest ready model,
+      preferring cheaper ones.
+    - A background sweep unloads models without inferences for
+      TRITON_MODEL_IDLE_SECONDS. Idleness comes from Triton's own statistics,
+      so a model another API worker still uses is kept. For the same reason
+      TRITON_MAX_LOADED_MODELS never evicts a model Triton served within
+      TRITON_EVICT_BUSY_SECONDS, or one this worker loaded or used within
+      TRITON_MODEL_IDLE_SECONDS; the cap is exceeded instead.
+    - `pinned` models (the overload fallback) are loaded at start and never
+      unloaded.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_info: Dict[str, dict],
+        cpu_to_model: Sequence[Tuple[float, str]],
+        idle_seconds: float = TRITON_MODEL_IDLE_SECONDS,
+        max_loaded: int = TRITON_MAX_LOADED_MODELS,
+        busy_seconds: float = TRITON_EVICT_BUSY_SECONDS,
+        margin: float = TRITON_PRELOAD_MARGIN,
+        prewarm: bool = TRITON_PREWARM,
+        interval: float = TRITON_CONTROL_INTERVAL_SECONDS,
+        pinned: Optional[Sequence[str]] = None,
+    ):
+        self.client = client
+        self.model_info = model_info
+        self.cpu_to_model = list(cpu_to_model)
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max_loaded
+        self.busy_seconds = busy_seconds
+        self.margin = margin
+        self.prewarm = prewarm
+        self.interval = interval
+        self.pinned = set(pinned if pinned is not None else [cpu_to_model[-1][1]])
+        # model name -> wall-clock time of its last use by this worker
+        self.ready: Dict[str, float] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    # ─── lifecycle ─────────────────────────────────────────────────────────
+
+    async def start(self) -> None:
+        """Adopt models Triton already has loaded, load the pinned ones and start sweeping."""
+        try:
+            index = await asyncio.to_thread(self.client.get_model_repository_index)
+            for entry in index:
+                if entry.get("state") == "READY":
+                    self._mark_ready(entry["name"])
+        except Exception as e:
+            logger.warning("Could not read Triton model repository", error=str(e))
+        for name in self.pinned - set(self.ready):
+            self._load_in_background(name)
+        self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        tasks = list(self._loading.values())
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ─── selection ─────────────────────────────────────────────────────────
+
+    def _band(self, cpu: float) -> int:
+        for i, (threshold, _) in enumerate(self.cpu_to_model):
+            if cpu <= threshold:
+                return i
+        return len(self.cpu_to_model) - 1
+
+    def upcoming(self, cpu: float) -> List[str]:
+        """Models the selector may switch to soon at this CPU load."""
+        band = self._band(cpu)
+        names = []
+        if band > 0 and cpu - self.cpu_to_model[band - 1][0] <= self.margin:
+            names.append(self.cpu_to_model[band - 1][1])
+        if (
+            band < len(self.cpu_to_model) - 1
+            and self.cpu_to_model[band][0] - cpu <= self.margin
+        ):
+            names.append(self.cpu_to_model[band + 1][1])
+        return names
+
+    async def select(self, cpu: float) -> str:
+        """Model to serve a request at CPU load `cpu` (0.0–1.0)."""
+        band = self._band(cpu)
+        wanted = self.cpu_to_model[band][1]
+        for name in [wanted] + self.upcoming(cpu):
+            if name not in self.ready:
+                self._load_in_background(name)
+        if wanted in self.ready:
+            return self._use(wanted)
+
+        # Closest ready model, cheaper ones (later in CPU_TO_MODEL) first
+        order = [n for _, n in self.cpu_to_model[band + 1 :]]
+        order += [n for _, n in reversed(self.cpu_to_model[:band])]
+        for name in order:
+            if name in self.ready:
+                TRITON_MODEL_EVENTS.labels(model_name=wanted, event="fallback").inc()
+                return self._use(name)
+        await self.ensure_ready(wanted)
+        return self._use(wanted)
+
+    async def ensure_ready(self, name: str) -> None:
+        """Load (and pre-warm) `name` unless it is ready; waits for the load."""
+        if name in self.ready:
+            return
+        await asyncio.shield(self._load_in_background(name))
+
+    def forget(self, name: str) -> None:
+        """Mark `name` as not loaded, e.g. after Triton reported it missing."""
+        if self.ready.pop(name, None) is not None:
+            TRITON_MODEL_LOADED.labels(model_name=name).set(0)
+
+    def _use(self, name: str) -> str:
+        self.ready[name] = time.time()
+        return name
+
+    def _mark_ready(self, name: str) -> None:
+        self.ready[name] = time.time()
+        TRITON_MODEL_LOADED.labels(model_name=name).set(1)
+
+    # ─── loading / unloading ───────────────────────────────────────────────
+
+    def _load_in_background(self, name: str) -> asyncio.Task:
+        task = self._loading.get(name)
+        if task is None:
+            task = asyncio.create_task(self._load(name))
+            self._loading[name] = task
+            task.add_done_callback(lambda _: self._loading.pop(name, None))
+            task.add_done_callback(_log_failure)
+        return task
+
+    async def _load(self, name: str) -> None:
+        if name not in self.model_info:
+            raise ValueError(f"Unknown Triton model '{name}'")
+        if self.max_loaded and len(self.ready) >= self.max_loaded:
+            await self._evict_for(name)
+        start = time.perf_counter()
+        await asyncio.to_thread(self.client.load_model, name)
+        TRITON_MODEL_EVENTS.labels(model_name=name, event="load").inc()
+        if self.prewarm:
+            await asyncio.to_thread(self._warm_up, name)
+            TRITON_MODEL_EVENTS.labels(model_name=name, event="prewarm").inc()
+        self._mark_ready(name)
+        logger.info(
+            "Triton model loaded",
+            model_name=name,
+            seconds=round(time.perf_counter() - start, 2),
+            loaded=sorted(self.ready),
+        )
+
+    def _warm_up(self, name: str) -> None:
+        height, width = self.model_info[name]["input_size"]
+        inputs = InferInput("input", [1, height, width, 3], "UINT8")
+        inputs.set_data_from_numpy(np.zeros((1, height, width, 3), dtype=np.uint8))
+        self.client.infer(model_name=name, inputs=[inputs])
+
+    async def unload(self, name: str, reason: str = "idle") -> None:
+        self.forget(name)
+        await asyncio.to_thread(self.client.unload_model, name)
+        TRITON_MODEL_EVENTS.labels(model_name=name, event="unload").inc()
+        logger.info("Triton model unloaded", model_name=name, reason=reason)
+
+    async def _last_inference(self) -> Dict[str, float]:
+        """
+        Last inference per ready model by Triton's statistics, so across all
+        API workers (wall clock; 0 when unknown).
+        """
+        last = {}
+        for name in list(self.ready):
+            last[name] = 0.0
+            try:
+                stats = await asyncio.to_thread(
+                    self.client.get_inference_statistics, name
+                )
+                for model in stats.get("model_stats", []):
+                    last[name] = max(last[name], model.get("last_inference", 0) / 1000)
+            except InferenceServerException:
+                pass
+        return last
+
+    async def _last_used(self) -> Dict[str, float]:
+        """Last use per ready model, by this worker or any other (wall clock)."""
+        served = await self._last_inference()
+        return {n: max(used, served.get(n, 0.0)) for n, used in self.ready.items()}
+
+    async def _evict_for(self, name: str) -> None:
+        served = await self._last_inference()
+        now = time.time()
+        candidates = sorted(
+            (max(local, used), n)
+            for n, used in served.items()
+            # Loaded or used by this worker within the sweep's idle window
+            # (possibly for a request whose inference Triton hasn't recorded
+            # yet), or served by Triton to any worker just now: keep it
+            if (local := self.ready.get(n)) is not None
+            and n not in self.pinned
+            and n != name
+            and now - local > self.idle_seconds
+            and now - used >= self.busy_seconds
+        )
+        if candidates:
+            await self.unload(candidates[0][1], reason="capacity")
+        else:
+            logger.warning(
+                "No idle Triton model to evict, loading over the limit",
+                model_name=name,
+                max_loaded=self.max_loaded,
+            )
+
+    async def sweep(self) -> None:
+        """
+        Forget models Triton no longer has loaded (e.g. after a restart) and
+        unload unpinned models that have been idle for idle_seconds.
+        """
+        index = await asyncio.to_thread(self.client.get_model_repository_index)
+        loaded = {e["name"] for e in index if e.get("state") == "READY"}
+        for name in list(self.ready):
+            if name not in loaded and name not in self._loading:
+                self.forget(name)
+        for name in self.pinned - set(self.ready):
+            self._load_in_background(name)
+
+        now = time.time()
+        for name, used in (await self._last_used()).items():
+            if name not in self.pinned and now - used > self.idle_seconds:
+                await self.unload(name)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning("Triton model sweep failed", error=str(e))
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Triton model load failed", error=str(task.exception()))
@@ -0,0 +1,315 @@
+"""
+Profile exported ONNX backbones and write a Triton config.pbtxt per model.
+
+Each `<repo>/<model>/<version>/model.onnx` is run with onnxruntime for every
+(intra-op threads, batch size) pair, with as many concurrent sessions as the
+CPU budget fits at that thread count, i.e. the way Triton would run that many
+model instances. From the measurements a config is picked that meets the
+target latency:
+
+- instance_group count and the ORT `intra_op_thread_count` come from the
+  thread count with the highest throughput among those that meet the target;
+- max_batch_size is the largest batch whose p95 meets the target, and the
+  preferred batch sizes are those within PREFERRED_BATCH_EFFICIENCY of the
+  best throughput;
+- max_queue_delay_microseconds spends part of the remaining latency budget
+  on forming batches, but never more than a batch-1 inference takes.
+
+The measurements and the chosen settings are saved as `profile.json` next to
+the model version, so configs can be reviewed or regenerated without
+profiling again.
+
+Usage (from the repo root):
+    python -m app.models.triton_tuning --repo services/triton/models --target-ms 200
+    python -m app.models.triton_tuning --repo services/triton/models --from-profiles
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import structlog
+
+from app.config.autotune import measure_cell
+from app.config.server import available_cpus
+from app.models.onnx_export import model_config
+
+logger = structlog.get_logger()
+
+PROFILE_FILENAME = "profile.json"
+PROFILE_VERSION = 1
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16]
+# Batch sizes reaching this share of the best throughput are "preferred"
+PREFERRED_BATCH_EFFICIENCY = 0.9
+# Share of the latency left after the largest batch spent waiting for batches
+QUEUE_DELAY_FRACTION = 0.5
+
+
+def thread_counts(cpus: int) -> List[int]:
+    """ORT intra-op thread counts worth trying on a `cpus`-core Triton."""
+    return sorted({n for n in (1, 2, cpus // 2, cpus) if 1 <= n <= cpus})
+
+
+def profile_model(
+    path: str,
+    cpus: int,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+    seconds: float = 1.0,
+) -> dict:
+    """
+    Measure `path` for each (threads, batch) pair, running cpus // threads
+    sessions concurrently.
+
+    Returns:
+        {"input_size": [height, width], "measurements": cells}, with one cell
+        per pair: threads, instances, batch, images_per_second, p50_ms and
+        p95_ms.
+    """
+    import onnxruntime as ort
+
+    rng = np.random.default_rng(0)
+    cells = []
+    input_size = None
+    for threads in thread_counts(cpus):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        spec = session.get_inputs()[0]
+        height, width = spec.shape[1], spec.shape[2]
+        input_size = [height, width]
+        instances = max(1, cpus // threads)
+
+        def predict(batch, session=session, input_name=spec.name):
+            session.run(None, {input_name: batch})
+
+        for batch_size in batch_sizes:
+            shape = (batch_size, height, width, 3)
+            if spec.type == "tensor(uint8)":
+                batch = rng.integers(0, 256, shape, np.uint8)
+            else:
+                batch = rng.random(shape, dtype=np.float32)
+            predict(batch)
+            cell = measure_cell(predict, batch, instances, seconds)
+            del cell["executors"]
+            cells.append({"threads": threads, "instances": instances, **cell})
+            logger.info("Profiled", model=path, **cells[-1])
+    return {"input_size": input_size, "measurements": cells}
+
+
+def plan_config(cells: List[dict], target_ms: float) -> dict:
+    """
+    Triton settings for a model from its `profile_model` cells.
+
+    Returns:
+        dict with threads, instances, max_batch_size, preferred_batch_sizes,
+        max_queue_delay_us, expected p95_ms / images_per_second and
+        meets_target.
+    """
+    by_threads: Dict[int, List[dict]] = {}
+    for cell in cells:
+        by_threads.setdefault(cell["threads"], []).append(cell)
+
+    best = None
+    for threads, group in by_threads.items():
+        feasible = [c for c in group if c["p95_ms"] <= target_ms]
+        if not feasible:
+            continue
+        top = max(feasible, key=lambda c: c["images_per_second"])
+        if best is None or top["images_per_second"] > best[1]["images_per_second"]:
+            best = (threads, top, feasible)
+
+    if best is None:
+        # Nothing meets the target: serve single images as fast as possible
+        fastest = min(
+            (c for c in cells if c["batch"] == 1),
+            key=lambda c: c["p95_ms"],
+        )
+        return {
+            "threads": fastest["threads"],
+            "instances": fastest["instances"],
+            "max_batch_size": 1,
+            "preferred_batch_sizes": [],
+            "max_queue_delay_us": 0,
+            "p95_ms": fastest["p95_ms"],
+            "images_per_second": fastest["images_per_second"],
+            "meets_target": False,
+        }
+
+    threads, top, feasible = best
+    max_batch = max(c["batch"] for c in feasible)
+    largest = next(c for c in feasible if c["batch"] == max_batch)
+    preferred = sorted(
+        c["batch"]
+        for c in feasible
+        if c["batch"] > 1
+        and c["images_per_second"]
+        >= PREFERRED_BATCH_EFFICIENCY * top["images_per_second"]
+    )
+    single = [c for c in by_threads[threads] if c["batch"] == 1]
+    delay_ms = (target_ms - largest["p95_ms"]) * QUEUE_DELAY_FRACTION
+    if single:
+        delay_ms = min(delay_ms, single[0]["p50_ms"])
+    return {
+        "threads": threads,
+        "instances": top["instances"],
+        "max_batch_size": max_batch,
+        "preferred_batch_sizes": preferred,
+        "max_queue_delay_us": int(max(0.0, delay_ms) * 1000),
+        "p95_ms": largest["p95_ms"],
+        "images_per_second": top["images_per_second"],
+        "meets_target": True,
+    }
+
+
+def tuning_block(plan: dict) -> str:
+    """dynamic_batching / instance_group / parameters for `model_config`."""
+    lines = []
+    if plan["max_batch_size"] > 1:
+        lines.append("dynamic_batching {")
+        if plan["preferred_batch_sizes"]:
+            sizes = ", ".join(str(b) for b in plan["preferred_batch_sizes"])
+            lines.append(f"  preferred_batch_size: [{sizes}]")
+        lines.append(f"  max_queue_delay_microseconds: {plan['max_queue_delay_us']}")
+        lines.append("}")
+    lines += [
+        "instance_group [",
+        "  {",
+        f"    count: {plan['instances']}",
+        "    kind: KIND_CPU",
+        "  }",
+        "]",
+    ]
+    for key, value in (
+        ("intra_op_thread_count", plan["threads"]),
+        ("inter_op_thread_count", 1),
+    ):
+        lines += [
+            "parameters {",
+            f'  key: "{key}"',
+            f'  value: {{ string_value: "{value}" }}',
+            "}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def write_config(repo: str, model_name: str, profile: dict) -> str:
+    """Write `<repo>/<model>/config.pbtxt` from a saved profile. Returns its path."""
+    plan = profile["plan"]
+    height, width = profile["input_size"]
+    path = os.path.join(repo, model_name, "config.pbtxt")
+    with open(path, "w") as f:
+        f.write(
+            model_config(
+                model_name,
+                height,
+                width,
+                max_batch_size=plan["max_batch_size"],
+                tuning=tuning_block(plan),
+            )
+        )
+    return path
+
+
+def tune_model(
+    repo: str,
+    model_name: str,
+    target_ms: float,
+    cpus: int,
+    version: str = "1",
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+    seconds: float = 1.0,
+) -> dict:
+    """Profile one model, save profile.json next to its version and write its config."""
+    version_dir = os.path.join(repo, model_name, version)
+    model_path = os.path.join(version_dir, "model.onnx")
+    started = time.perf_counter()
+    measured = profile_model(model_path, cpus, batch_sizes, seconds)
+    plan = plan_config(measured["measurements"], target_ms)
+    if not plan["meets_target"]:
+        logger.warning(
+            "No configuration meets the target latency",
+            model_name=model_name,
+            target_ms=target_ms,
+            best_p95_ms=round(plan["p95_ms"], 1),
+        )
+    profile = {
+        "version": PROFILE_VERSION,
+        "created_at": time.time(),
+        "duration_seconds": round(time.perf_counter() - started, 1),
+        "cpus": cpus,
+        "target_ms": target_ms,
+        **measured,
+        "plan": plan,
+    }
+    with open(os.path.join(version_dir, PROFILE_FILENAME), "w") as f:
+        json.dump(profile, f, indent=2)
+    write_config(repo, model_name, profile)
+    logger.info("Triton config written", model_name=model_name, **plan)
+    return profile
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Profile ONNX models and write per-model Triton configs."
+    )
+    parser.add_argument("--repo", default="services/triton/models")
+    parser.add_argument(
+        "--models", default="", help="comma separated (default: all in --repo)"
+    )
+    parser.add_argument("--version", default="1")
+    parser.add_argument("--target-ms", type=float, default=200.0)
+    parser.add_argument(
+        "--cpus", type=int, default=0, help="cores Triton gets (default: this host's)"
+    )
+    parser.add_argument(
+        "--batch-sizes", default=",".join(str(b) for b in DEFAULT_BATCH_SIZES)
+    )
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument(
+        "--from-profiles",
+        action="store_true",
+        help="rewrite configs from saved profile.json files (re-planned for "
+        "--target-ms) without profiling",
+    )
+    args = parser.parse_args(argv)
+
+    models = [m for m in args.models.split(",") if m] or sorted(
+        name
+        for name in os.listdir(args.repo)
+        if os.path.exists(os.path.join(args.repo, name, args.version, "model.onnx"))
+    )
+    plans = {}
+    for model_name in models:
+        if args.from_profiles:
+            path = os.path.join(args.repo, model_name, args.version, PROFILE_FILENAME)
+            with open(path) as f:
+                profile = json.load(f)
+            profile["target_ms"] = args.target_ms
+            profile["plan"] = plan_config(profile["measurements"], args.target_ms)
+            with open(path, "w") as f:
+                json.dump(profile, f, indent=2)
+            write_config(args.repo, model_name, profile)
+        else:
+            profile = tune_model(
+                args.repo,
+                model_name,
+                args.target_ms,
+                args.cpus or available_cpus(),
+                args.version,
+                [int(b) for b in args.batch_sizes.split(",")],
+                args.seconds,
+            )
+        plans[model_name] = profile["plan"]
+    print(json.dumps(plans, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
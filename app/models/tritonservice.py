@@ -1,7 +1,11 @@
 import io
 import json
 import os
+import re
 import threading
+import time
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import psutil
@@ -16,6 +20,15 @@ from tritonclient.http import (
 )
 
 from app.config.logger import get_class_logger
+from app.metrics import INFERENCE_STAGE_DURATION, time_executor_call
+from app.models.onnx_export import INPUT_SIZES
+from app.models.prediction_cache import (
+    PREDICTION_CACHE_VERSION_TTL_SECONDS,
+    prediction_cache,
+)
+from app.models.scheduler import DeadlineScheduler
+from app.models.tiling import TILE_MAX_COUNT, TILE_OVERLAP, decode_tiles, tiled_result
+from app.models.triton_control import TRITON_MODEL_CONTROL, TritonModelController
 
 tracer = trace.get_tracer(__name__)
 
@@ -52,30 +65,188 @@ else:
         (1.00, "ResNet50"),
     ]
 
+# Largest batch per infer call; lowered per model to its config's max_batch_size
+TRITON_MAX_BATCH_SIZE = int(os.getenv("TRITON_MAX_BATCH_SIZE", "8"))
+# Concurrent infer calls per worker; more wait in deadline order
+TRITON_MAX_INFLIGHT = int(os.getenv("TRITON_MAX_INFLIGHT", "8"))
+triton_scheduler = DeadlineScheduler("triton", slots=TRITON_MAX_INFLIGHT)
+
 # Load ImageNet class mapping
 with open("./app/models/imagenet_class_index.json", "r") as f:
     imagenet_class_index = json.load(f)
 
 
+class TritonModelUnavailable(RuntimeError):
+    """Triton does not have the model loaded (another worker unloaded it, or a restart)."""
+
+
+def _inference_error(e: InferenceServerException) -> RuntimeError:
+    message = f"Triton inference error: {e}"
+    if re.search(
+        r"unknown model|is not found|not ready|no available version", str(e), re.I
+    ):
+        return TritonModelUnavailable(message)
+    return RuntimeError(message)
+
+
+class ThreadLocalClient:
+    """
+    A Triton HTTP client per thread. tritonclient.http runs on gevent, whose
+    connections belong to the thread that created them; calls made from the
+    executor's other threads fail with "Cannot switch to a different thread".
+    Methods are looked up on the calling thread's client when called, so
+    `asyncio.to_thread(client.infer, ...)` runs on the worker's own client.
+    """
+
+    def __init__(self, url: str, **kwargs):
+        self.url = url
+        self._kwargs = kwargs
+        self._local = threading.local()
+
+    def _client(self) -> InferenceServerClient:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = InferenceServerClient(url=self.url, **self._kwargs)
+            self._local.client = client
+        return client
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            return getattr(self._client(), name)(*args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+
+def config_batch_limit(
+    client, model_name: str, default: Optional[int] = TRITON_MAX_BATCH_SIZE
+) -> Optional[int]:
+    """
+    Batch size to send `model_name`: TRITON_MAX_BATCH_SIZE, capped by the
+    `max_batch_size` of its Triton config (generated per model by
+    app/models/triton_tuning.py); `default` while the config cannot be read.
+    """
+    try:
+        config = client.get_model_config(model_name)
+    except InferenceServerException as e:
+        logger.warning("Could not read Triton model config", error=str(e))
+        return default
+    return max(1, min(TRITON_MAX_BATCH_SIZE, config.get("max_batch_size") or 1))
+
+
 class TritonMultiModel:
     CPU_TO_MODEL = CPU_TO_MODEL
 
-    MODEL_INFO = {
-        "Xception": {"preprocess": lambda x: x / 255.0, "input_size": (299, 299)},
-        "ResNet152V2": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "ResNet101V2": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "ResNet50V2": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "ResNet152": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "ResNet101": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "ResNet50": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "VGG19": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-        "VGG16": {"preprocess": lambda x: x / 255.0, "input_size": (224, 224)},
-    }
+    # Models take uint8 NHWC pixels; each one's preprocessing is part of its
+    # ONNX graph (see app/models/onnx_export.py)
+    MODEL_INFO = {name: {"input_size": size} for name, size in INPUT_SIZES.items()}
 
     _lock = threading.Lock()
 
-    def __init__(self, triton_url: str = "localhost:8000"):
-        self.client = InferenceServerClient(url=triton_url)
+    def __init__(
+        self,
+        triton_url: str = "localhost:8000",
+        model_control: str = TRITON_MODEL_CONTROL,
+    ):
+        self.client = ThreadLocalClient(triton_url)
+        # In explicit mode the API decides which models Triton keeps loaded
+        self.controller = (
+            TritonModelController(self.client, self.MODEL_INFO, self.CPU_TO_MODEL)
+            if model_control == "explicit"
+            else None
+        )
+        self._batch_limits: Dict[str, int] = {}
+        # model name -> (latest version Triton serves, when it was read)
+        self._versions: Dict[str, Tuple[Optional[str], float]] = {}
+
+    async def start(self) -> None:
+        if self.controller is not None:
+            await self.controller.start()
+
+    async def stop(self) -> None:
+        if self.controller is not None:
+            await self.controller.stop()
+
+    async def _select_model(self, model_name: Optional[str] = None) -> str:
+        """
+        `model_name`, or the model for the current CPU load. With model
+        control, waits until a requested model is loaded; selection may fall
+        back to a ready model while the preferred one loads.
+        """
+        if self.controller is None:
+            return model_name or self._choose_model_by_cpu()
+        if model_name:
+            await self.controller.ensure_ready(model_name)
+            return model_name
+        cpu_pct = psutil.cpu_percent(interval=None) / 100.0
+        logger.info("CPU usage measured", cpu_pct=cpu_pct)
+        return await self.controller.select(cpu_pct)
+
+    async def select_model(self, model_name: Optional[str] = None) -> str:
+        """Public _select_model, like ModelManager.select_model."""
+        return await self._select_model(model_name)
+
+    async def _reselect(
+        self,
+        model_name: str,
+        error: TritonModelUnavailable,
+        requested: Optional[str] = None,
+    ) -> str:
+        """
+        After Triton reported `model_name` unavailable: forget it and select
+        again (`requested` is reloaded, or the selector picks a ready model),
+        for the one retry of the request.
+
+        Raises:
+            TritonModelUnavailable: `error`, without model control (nothing
+            to forget or reload).
+        """
+        if self.controller is None:
+            raise error
+        logger.warning(
+            "Triton model unavailable, retrying",
+            model_name=model_name,
+            error=str(error),
+        )
+        self.controller.forget(model_name)
+        return await self._select_model(requested)
+
+    async def _batch_limit(self, model_name: str) -> int:
+        """
+        config_batch_limit of `model_name`, cached once read. While the config
+        cannot be read TRITON_MAX_BATCH_SIZE is used but not cached, so the
+        next call reads it again.
+        """
+        if model_name not in self._batch_limits:
+            limit = await run_in_threadpool(
+                config_batch_limit, self.client, model_name, None
+            )
+            if limit is None:
+                return TRITON_MAX_BATCH_SIZE
+            self._batch_limits[model_name] = limit
+        return self._batch_limits[model_name]
+
+    async def _model_version(self, model_name: str) -> Optional[str]:
+        """
+        Latest version of `model_name` on Triton, for the prediction cache;
+        None (nothing cached) while it cannot be read.
+        """
+        if not prediction_cache.enabled:
+            return None
+        version, read_at = self._versions.get(model_name, (None, 0.0))
+        if time.monotonic() - read_at < PREDICTION_CACHE_VERSION_TTL_SECONDS:
+            return version
+        try:
+            metadata = await run_in_threadpool(
+                self.client.get_model_metadata, model_name
+            )
+            versions = metadata.get("versions") or []
+            version = str(max(versions, key=int)) if versions else None
+        except (InferenceServerException, ValueError) as e:
+            logger.warning("Could not read Triton model version", error=str(e))
+            version = None
+        self._versions[model_name] = (version, time.monotonic())
+        return version
 
     @classmethod
     def _choose_model_by_cpu(cls) -> str:
@@ -93,29 +264,51 @@ class TritonMultiModel:
 
             # Model selection (nested span)
             with tracer.start_as_current_span("model_selection") as selection_span:
-                model_name = self._choose_model_by_cpu()
+                model_name = await self._select_model()
                 selection_span.set_attribute("model.name", model_name)
                 # Also attach to parent span for higher-level context
                 span.set_attribute("model.name", model_name)
 
-            info = self.MODEL_INFO[model_name]
-            input_h, input_w = info["input_size"]
-            preprocess_fn = info["preprocess"]
+            try:
+                return await self._classify_image(image_data, model_name, span)
+            except TritonModelUnavailable as e:
+                model_name = await self._reselect(model_name, e)
+                span.set_attribute("model.name", model_name)
+                return await self._classify_image(image_data, model_name, span)
 
-            # Preprocessing
-            with tracer.start_as_current_span("preprocessing"):
+    async def _classify_image(self, image_data: bytes, model_name: str, span) -> dict:
+        # Already classified by this model version (here or by another worker)
+        cache_key, cached = await prediction_cache.get(
+            image_data, "triton", model_name, await self._model_version(model_name)
+        )
+        span.set_attribute("prediction_cache.hit", cached is not None)
+        if cached is not None:
+            return cached
+
+        info = self.MODEL_INFO[model_name]
+        input_h, input_w = info["input_size"]
+
+        stage = partial(
+            INFERENCE_STAGE_DURATION.labels,
+            backend="triton",
+            model_name=model_name,
+        )
+
+        # Preprocessing
+        with tracer.start_as_current_span("preprocessing"):
+            with stage(stage="decode").time():
                 try:
                     img = Image.open(io.BytesIO(image_data)).convert("RGB")
                 except Exception as e:
                     logger.error("Image decode error", error=str(e))
                     raise ValueError(f"Could not decode image bytes: {e}")
 
+            with stage(stage="preprocess").time():
                 img = img.resize((input_w, input_h))
-                x = np.asarray(img, dtype=np.float32)
-                x = np.expand_dims(x, axis=0)
-                x = preprocess_fn(x)
+                x = np.expand_dims(np.asarray(img, dtype=np.uint8), axis=0)
 
-            # Health check
+        # Health check (the controller already tracks readiness)
+        if self.controller is None:
             with tracer.start_as_current_span("health_check"):
                 try:
                     is_ready = await run_in_threadpool(
@@ -127,45 +320,239 @@ class TritonMultiModel:
                     logger.error("Triton health-check error", error=str(e))
                     raise RuntimeError(f"Triton health-check failed: {e}")
 
-            # Inference
-            with tracer.start_as_current_span("inference_call"):
-                inputs = InferInput("input", x.shape, "FP32")
-                inputs.set_data_from_numpy(x)
-                outputs = InferRequestedOutput("predictions")
-                try:
+        # Inference
+        with tracer.start_as_current_span("inference_call"):
+            inputs = InferInput("input", x.shape, "UINT8")
+            inputs.set_data_from_numpy(x)
+            outputs = InferRequestedOutput("predictions")
+            submitted_at = time.perf_counter()
+            try:
+                async with triton_scheduler.slot():
                     response = await run_in_threadpool(
+                        time_executor_call,
                         self.client.infer,
                         model_name=model_name,
                         inputs=[inputs],
                         outputs=[outputs],
+                        queue_wait=stage(stage="queue_wait"),
+                        run_time=stage(stage="inference"),
+                        submitted_at=submitted_at,
                     )
+            except InferenceServerException as e:
+                logger.error("Triton inference error", error=str(e))
+                raise _inference_error(e)
+
+        # Postprocessing
+        with (
+            tracer.start_as_current_span("postprocessing"),
+            stage(stage="postprocess").time(),
+        ):
+            output_data = response.as_numpy("predictions")
+            preds = output_data[0]
+            top5_idx = np.argsort(preds)[::-1][:5]
+            top5_conf = preds[top5_idx]
+            results = []
+            for idx, conf in zip(top5_idx, top5_conf):
+                results.append(
+                    {
+                        "class_id": int(idx),
+                        "class_name": imagenet_class_index[str(idx)][1],
+                        "confidence": float(conf),
+                    }
+                )
+
+        # Log profiling data
+        logger.info(
+            "Profiling results",
+            model_used=model_name,
+        )
+
+        result = {
+            "model_used": model_name,
+            "predictions": results,
+        }
+        await prediction_cache.put(cache_key, result)
+        return result
+
+    def _prepare_batch(
+        self, images: List[bytes], info: dict, stage
+    ) -> Tuple[Optional[np.ndarray], Dict[int, str]]:
+        """
+        Decode and resize `images` into one (N, H, W, 3) uint8 batch; images
+        that fail to decode are reported in the {input_index: error} dict.
+        """
+        input_h, input_w = info["input_size"]
+        arrays = []
+        errors = {}
+        for i, image_data in enumerate(images):
+            try:
+                with stage(stage="decode").time():
+                    img = Image.open(io.BytesIO(image_data)).convert("RGB")
+            except Exception as e:
+                errors[i] = f"Could not decode image bytes: {e}"
+                continue
+            with stage(stage="preprocess").time():
+                arrays.append(
+                    np.asarray(img.resize((input_w, input_h)), dtype=np.uint8)
+                )
+        if not arrays:
+            return None, errors
+        return np.stack(arrays), errors
+
+    def _top5(self, preds: np.ndarray) -> List[dict]:
+        top5_idx = np.argsort(preds)[::-1][:5]
+        return [
+            {
+                "class_id": int(idx),
+                "class_name": imagenet_class_index[str(idx)][1],
+                "confidence": float(preds[idx]),
+            }
+            for idx in top5_idx
+        ]
+
+    async def classify_batch(
+        self, images: List[bytes], model_name: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Classify several images on Triton. The model is chosen once for the
+        batch and requests are split into chunks of at most the model's
+        `max_batch_size` (and TRITON_MAX_BATCH_SIZE). Images already in the
+        prediction cache for that model version are not sent.
+
+        Returns:
+            list: one entry per input, in order: {"model_used", "predictions"}
+            or {"error": str} for images that could not be decoded.
+        """
+        selected = await self._select_model(model_name)
+        try:
+            return await self._classify_cached(images, selected)
+        except TritonModelUnavailable as e:
+            selected = await self._reselect(selected, e, model_name)
+            return await self._classify_cached(images, selected)
+
+    async def _classify_cached(
+        self, images: List[bytes], model_name: str
+    ) -> List[dict]:
+        return await prediction_cache.classify_batch(
+            images,
+            "triton",
+            model_name,
+            await self._model_version(model_name),
+            partial(self._classify_batch, model_name=model_name),
+        )
+
+    async def _classify_batch(self, images: List[bytes], model_name: str) -> List[dict]:
+        with tracer.start_as_current_span("triton_classify_batch") as span:
+            span.set_attribute("model.name", model_name)
+            span.set_attribute("batch.size", len(images))
+            info = self.MODEL_INFO[model_name]
+            stage = partial(
+                INFERENCE_STAGE_DURATION.labels,
+                backend="triton",
+                model_name=model_name,
+            )
+
+            with tracer.start_as_current_span("preprocessing"):
+                batch, errors = await run_in_threadpool(
+                    self._prepare_batch, images, info, stage
+                )
+
+            rows = []
+            if batch is not None:
+                rows = await self._infer(batch, model_name, stage)
+
+            with stage(stage="postprocess").time():
+                results = []
+                predictions = iter(rows)
+                for i in range(len(images)):
+                    if i in errors:
+                        results.append({"error": errors[i]})
+                    else:
+                        results.append(
+                            {
+                                "model_used": model_name,
+                                "predictions": self._top5(next(predictions)),
+                            }
+                        )
+            return results
+
+    async def _infer(self, batch: np.ndarray, model_name: str, stage) -> list:
+        """
+        Run a uint8 batch on Triton in chunks of at most the model's batch
+        limit; returns the prediction rows in order.
+        """
+        rows = []
+        limit = await self._batch_limit(model_name)
+        with tracer.start_as_current_span("inference_call"):
+            for start in range(0, len(batch), limit):
+                chunk = batch[start : start + limit]
+                inputs = InferInput("input", chunk.shape, "UINT8")
+                inputs.set_data_from_numpy(chunk)
+                submitted_at = time.perf_counter()
+                try:
+                    async with triton_scheduler.slot():
+                        response = await run_in_threadpool(
+                            time_executor_call,
+                            self.client.infer,
+                            model_name=model_name,
+                            inputs=[inputs],
+                            outputs=[InferRequestedOutput("predictions")],
+                            queue_wait=stage(stage="queue_wait"),
+                            run_time=stage(stage="inference"),
+                            submitted_at=submitted_at,
+                        )
                 except InferenceServerException as e:
                     logger.error("Triton inference error", error=str(e))
-                    raise RuntimeError(f"Triton inference error: {e}")
-
-            # Postprocessing
-            with tracer.start_as_current_span("postprocessing"):
-                output_data = response.as_numpy("predictions")
-                preds = output_data[0]
-                top5_idx = np.argsort(preds)[::-1][:5]
-                top5_conf = preds[top5_idx]
-                results = []
-                for idx, conf in zip(top5_idx, top5_conf):
-                    results.append(
-                        {
-                            "class_id": int(idx),
-                            "class_name": imagenet_class_index[str(idx)][1],
-                            "confidence": float(conf),
-                        }
-                    )
+                    raise _inference_error(e)
+                rows.extend(response.as_numpy("predictions"))
+        return rows
+
+    async def classify_tiled(
+        self,
+        image_data: bytes,
+        overlap: float = TILE_OVERLAP,
+        max_tiles: int = TILE_MAX_COUNT,
+        model_name: Optional[str] = None,
+    ) -> dict:
+        """
+        Classify a high-resolution image tile by tile on Triton (see
+        app.models.tiling and ModelManager.classify_tiled). The tiles are
+        sent in chunks of at most the model's batch limit.
+
+        Raises:
+            ValueError: the image could not be decoded.
+        """
+        selected = await self._select_model(model_name)
+        try:
+            return await self._classify_tiled(image_data, overlap, max_tiles, selected)
+        except TritonModelUnavailable as e:
+            selected = await self._reselect(selected, e, model_name)
+            return await self._classify_tiled(image_data, overlap, max_tiles, selected)
 
-            # Log profiling data
-            logger.info(
-                "Profiling results",
-                model_used=model_name,
+    async def _classify_tiled(
+        self, image_data: bytes, overlap: float, max_tiles: int, model_name: str
+    ) -> dict:
+        with tracer.start_as_current_span("triton_classify_tiled") as span:
+            span.set_attribute("model.name", model_name)
+            info = self.MODEL_INFO[model_name]
+            stage = partial(
+                INFERENCE_STAGE_DURATION.labels,
+                backend="triton",
+                model_name=model_name,
             )
 
-            return {
-                "model_used": model_name,
-                "predictions": results,
-            }
+            with tracer.start_as_current_span("preprocessing"):
+                tiles = await run_in_threadpool(
+                    decode_tiles,
+                    image_data,
+                    info["input_size"],
+                    overlap,
+                    max_tiles,
+                    stage=stage,
+                )
+            span.set_attribute("tiles.count", len(tiles.arrays))
+
+            rows = await self._infer(tiles.arrays, model_name, stage)
+            with stage(stage="postprocess").time():
+                predictions = [self._top5(row) for row in rows]
+            return tiled_result(model_name, tiles, predictions)
@@ -0,0 +1,525 @@
+"""
+On-disk nearest-neighbour index of image embeddings, searched through mmap.
+
+An index is a directory holding:
+
+- meta.json: dimension, row count, the backbone and model version the
+  embeddings came from, and the number of IVF lists (0 = none),
+- vectors.f32: the rows, float32 and L2-normalized, so the inner product of
+  two rows is their cosine similarity,
+- keys.bin/keys.idx and labels.bin/labels.idx: per row, the archive path and
+  its label (e.g. the species; empty when unknown), as UTF-8 bytes back to
+  back plus int64 end offsets,
+- ivf_centroids.npy / ivf_offsets.npy: with IVF, rows are stored grouped by
+  their nearest centroid, list i being rows offsets[i]:offsets[i + 1].
+
+Nothing per row is read into memory: vectors, keys and labels are
+memory-mapped, so the OS pages them in on demand and every worker on the
+node shares one copy in the page cache. Search is either exact, a blocked
+matrix product over all rows, or IVF, which only scans the `nprobe` lists
+whose centroids are closest to the query.
+
+Files that workers have mapped are never rewritten: every build goes to a
+new sibling directory `<dir>.v<ns>`, and `<dir>` is a symlink swapped to it
+atomically once the build is complete (the previous build is kept for
+workers still reading it, older ones are removed). get_vector_index notices
+the swap and reopens the index.
+
+Indexes are built from image archives with `python -m app.pipeline.embed_index`.
+"""
+
+import json
+import os
+import shutil
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+# Index served by /api/v1/similar (empty = off)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "")
+# IVF lists scanned per query; more is slower and closer to exact search
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys"
+LABELS_FILE = "labels"
+CENTROIDS_FILE = "ivf_centroids.npy"
+OFFSETS_FILE = "ivf_offsets.npy"
+
+# Rows per matrix product; bounds the scores held per query block
+BLOCK_ROWS = 32768
+
+
+class VectorIndexError(Exception):
+    """No usable index. `status_code` is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows of `vectors` scaled to unit length (all-zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def default_nlist(count: int) -> int:
+    """
+    IVF lists for `count` rows: none for small indexes, where exact search
+    takes a few milliseconds, sqrt(count) otherwise, which keeps k-means
+    training and list assignment within minutes on one CPU node.
+    """
+    return 0 if count < 50_000 else int(np.sqrt(count))
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid of every row, computed block by block."""
+    assigned = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + BLOCK_ROWS])
+        assigned[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assigned
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    nlist: int,
+    sample: int = 0,
+    iterations: int = 10,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Spherical k-means on a random sample of the rows.
+
+    Args:
+        vectors: (N, D) unit rows, possibly a memmap.
+        sample: Rows to train on; 0 uses 32 per list (at least 10000).
+
+    Returns:
+        np.ndarray: (nlist, D) unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample = min(len(vectors), sample or max(32 * nlist, 10_000))
+    rows = np.sort(rng.choice(len(vectors), sample, replace=False))
+    x = np.asarray(vectors[rows], dtype=np.float32)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assigned = _assign(x, centroids)
+        order = np.argsort(assigned, kind="stable")
+        counts = np.bincount(assigned, minlength=nlist)
+        used = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[used])[:-1]])
+        centroids[used] = l2_normalize(np.add.reduceat(x[order], starts, axis=0))
+        # Lists left empty restart from random sample rows
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def _build_number(path: str) -> Optional[int]:
+    """The <ns> of a `<dir>.v<ns>` build directory, or None."""
+    suffix = path.rsplit(".v", 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+class _StringsWriter:
+    """Appends strings to `<prefix>.bin`, with int64 end offsets (after a leading 0) in `<prefix>.idx`."""
+
+    def __init__(self, prefix: str):
+        self._blob = open(prefix + ".bin", "wb")
+        self._offsets = open(prefix + ".idx", "wb")
+        self._offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+        self._end = 0
+
+    def write(self, strings: Iterable[str]) -> None:
+        encoded = [text.encode("utf-8") for text in strings]
+        ends = self._end + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+        self._blob.write(b"".join(encoded))
+        self._offsets.write(ends.tobytes())
+        if len(ends):
+            self._end = int(ends[-1])
+
+    def close(self) -> None:
+        self._blob.close()
+        self._offsets.close()
+
+
+class StringColumn:
+    """Strings written by _StringsWriter, memory-mapped; indexed like a list."""
+
+    def __init__(self, prefix: str, count: int):
+        self.offsets = np.memmap(
+            prefix + ".idx", dtype=np.int64, mode="r", shape=(count + 1,)
+        )
+        size = int(self.offsets[-1])
+        if size:
+            self.blob = np.memmap(
+                prefix + ".bin", dtype=np.uint8, mode="r", shape=(size,)
+            )
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def index(self, value: str) -> int:
+        """Row of the first `value` (a linear scan). Raises ValueError if absent."""
+        for row, text in enumerate(self):
+            if text == value:
+                return row
+        raise ValueError(f"{value!r} is not in the column")
+
+
+class VectorIndexWriter:
+    """
+    Streams embeddings into a new build of the index at `directory`, then
+    (optionally) groups them into IVF lists and publishes the build by
+    pointing the `directory` symlink at it. Memory stays bounded by one block
+    of rows, however many rows are added; the index being served is never
+    touched until the swap.
+    """
+
+    def __init__(self, directory: str, dim: int, model: str, version: str = ""):
+        self.directory = os.path.abspath(directory).rstrip(os.sep)
+        self.dim = dim
+        self.model = model
+        self.version = version
+        self.count = 0
+        self.build_dir = f"{self.directory}.v{time.time_ns()}"
+        os.makedirs(self.build_dir)
+        self._vectors = open(os.path.join(self.build_dir, VECTORS_FILE), "wb")
+        self._keys = _StringsWriter(os.path.join(self.build_dir, KEYS_FILE))
+        self._labels = _StringsWriter(os.path.join(self.build_dir, LABELS_FILE))
+
+    def add(
+        self,
+        vectors: np.ndarray,
+        keys: List[str],
+        labels: Optional[List[str]] = None,
+    ) -> None:
+        """Append rows (normalized here) with their keys and optional labels."""
+        vectors = l2_normalize(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected ({len(keys)}, {self.dim}) vectors, got {vectors.shape}"
+            )
+        if len(vectors) != len(keys):
+            raise ValueError("One key per vector is required.")
+        labels = labels if labels is not None else [""] * len(keys)
+        self._vectors.write(vectors.tobytes())
+        self._keys.write(keys)
+        self._labels.write(labels)
+        self.count += len(vectors)
+
+    def close(
+        self, nlist: int = 0, sample: int = 0, iterations: int = 10
+    ) -> "VectorIndex":
+        """
+        Finish the index: train `nlist` IVF lists (0 = exact search only),
+        write meta.json and swap the build in.
+
+        Returns:
+            VectorIndex: the new index, opened.
+        """
+        for f in (self._vectors, self._keys, self._labels):
+            f.close()
+        nlist = min(nlist, self.count)
+        if nlist > 0:
+            self._build_ivf(nlist, sample, iterations)
+        meta = {
+            "dim": self.dim,
+            "count": self.count,
+            "model": self.model,
+            "version": self.version,
+            "nlist": nlist,
+        }
+        with open(os.path.join(self.build_dir, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        self._publish()
+        logger.info(
+            "Vector index written",
+            directory=self.directory,
+            build=self.build_dir,
+            **meta,
+        )
+        return VectorIndex(self.directory)
+
+    def abort(self) -> None:
+        """Drop an unfinished build; the served index is unchanged."""
+        for f in (self._vectors, self._keys, self._labels):
+            f.close()
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+
+    def _publish(self) -> None:
+        """Atomically point `directory` at this build and prune older builds."""
+        link = self.directory
+        if os.path.isdir(link) and not os.path.islink(link):
+            if os.listdir(link):
+                # An index from before versioned builds: keep it as the
+                # previous build, for workers that still have it open
+                os.rename(link, f"{link}.v{_build_number(self.build_dir) - 1}")
+            else:
+                os.rmdir(link)
+        tmp = f"{link}.tmp-{os.getpid()}"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(os.path.basename(self.build_dir), tmp)
+        os.replace(tmp, link)
+
+        # Keep this build and the one before it (workers may still be
+        # reading it); newer directories are builds still in progress
+        parent, base = os.path.split(link)
+        current = _build_number(self.build_dir)
+        older = sorted(
+            number
+            for number in (
+                _build_number(os.path.join(parent, name))
+                for name in os.listdir(parent)
+                if name.startswith(base + ".v")
+            )
+            if number is not None and number < current
+        )
+        for number in older[:-1]:
+            shutil.rmtree(f"{link}.v{number}", ignore_errors=True)
+
+    def _build_ivf(self, nlist: int, sample: int, iterations: int) -> None:
+        path = os.path.join(self.build_dir, VECTORS_FILE)
+        vectors = np.memmap(
+            path, dtype=np.float32, mode="r", shape=(self.count, self.dim)
+        )
+        centroids = train_centroids(vectors, nlist, sample, iterations)
+        assigned = _assign(vectors, centroids)
+        order = np.argsort(assigned, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assigned, minlength=nlist))]
+        )
+
+        # Rewrite the rows (and their keys and labels) grouped by list; the
+        # build is not published yet, so nothing has these files mapped
+        with open(path + ".tmp", "wb") as out:
+            for start in range(0, self.count, BLOCK_ROWS):
+                out.write(
+                    np.asarray(vectors[order[start : start + BLOCK_ROWS]]).tobytes()
+                )
+        del vectors
+        os.replace(path + ".tmp", path)
+        for name in (KEYS_FILE, LABELS_FILE):
+            prefix = os.path.join(self.build_dir, name)
+            column = StringColumn(prefix, self.count)
+            out = _StringsWriter(prefix + ".tmp")
+            for start in range(0, self.count, BLOCK_ROWS):
+                out.write(column[row] for row in order[start : start + BLOCK_ROWS])
+            out.close()
+            del column
+            for suffix in (".bin", ".idx"):
+                os.replace(prefix + ".tmp" + suffix, prefix + suffix)
+        np.save(os.path.join(self.build_dir, CENTROIDS_FILE), centroids)
+        np.save(os.path.join(self.build_dir, OFFSETS_FILE), offsets.astype(np.int64))
+
+
+def _top_k(
+    scores: np.ndarray, rows: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The `k` highest (m, n) `scores` per row, best first, with their `rows`."""
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(
+        rows, order, axis=1
+    )
+
+
+class VectorIndex:
+    """A built index, memory-mapped read-only. Safe to search from several threads."""
+
+    def __init__(self, directory: str):
+        # Resolve the symlink once, so every file comes from the same build
+        directory = os.path.realpath(directory)
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            raise VectorIndexError(f"No vector index in {directory}")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.dim: int = meta["dim"]
+        self.count: int = meta["count"]
+        self.model: str = meta["model"]
+        self.version: str = meta.get("version", "")
+        self.nlist: int = meta.get("nlist", 0)
+        if self.count:
+            self.vectors = np.memmap(
+                os.path.join(directory, VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(self.count, self.dim),
+            )
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.keys = StringColumn(os.path.join(directory, KEYS_FILE), self.count)
+        self.labels = StringColumn(os.path.join(directory, LABELS_FILE), self.count)
+        if self.nlist:
+            self.centroids = np.load(os.path.join(directory, CENTROIDS_FILE))
+            self.offsets = np.load(os.path.join(directory, OFFSETS_FILE))
+
+    def search(
+        self, queries: np.ndarray, k: int = 10, nprobe: int = VECTOR_INDEX_NPROBE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The `k` most similar rows to each query.
+
+        Args:
+            queries: (D,) or (M, D) embeddings; normalized here.
+            nprobe: IVF lists to scan per query; 0, or an index without IVF,
+                searches every row exactly.
+
+        Returns:
+            (scores, rows): (M, k) cosine similarities, best first, and row
+            numbers. Rows are -1 (score -inf) when the index has fewer than
+            k rows.
+        """
+        queries = l2_normalize(np.atleast_2d(queries))
+        if queries.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected {self.dim}-dimensional queries, got {queries.shape[1]}"
+            )
+        if self.nlist and 0 < nprobe < self.nlist:
+            return self._search_ivf(queries, k, nprobe)
+        return self._search_exact(queries, k)
+
+    def _search_exact(
+        self, queries: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, self.count, BLOCK_ROWS):
+            block = self.vectors[start : start + BLOCK_ROWS]
+            scores = queries @ block.T
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_rows = _top_k(
+                np.concatenate([best_scores, scores], axis=1),
+                np.concatenate([best_rows, rows], axis=1),
+                k,
+            )
+        return best_scores, best_rows
+
+    def _search_ivf(
+        self, queries: np.ndarray, k: int, nprobe: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            scores, rows = [], []
+            for lst in probes[i, :nprobe]:
+                start, end = self.offsets[lst], self.offsets[lst + 1]
+                if end > start:
+                    scores.append(self.vectors[start:end] @ query)
+                    rows.append(np.arange(start, end))
+            if not scores:
+                continue
+            top_scores, top_rows = _top_k(
+                np.concatenate(scores)[None, :], np.concatenate(rows)[None, :], k
+            )
+            out_scores[i, : top_scores.shape[1]] = top_scores[0]
+            out_rows[i, : top_rows.shape[1]] = top_rows[0]
+        return out_scores, out_rows
+
+    def neighbours(
+        self, query: np.ndarray, k: int = 10, nprobe: int = VECTOR_INDEX_NPROBE
+    ) -> List[dict]:
+        """[{"key", "label", "score"}, ...] of the `k` rows most similar to `query`."""
+        scores, rows = self.search(query, k, nprobe)
+        return [
+            {"key": self.keys[row], "label": self.labels[row], "score": float(score)}
+            for score, row in zip(scores[0], rows[0])
+            if row >= 0
+        ]
+
+    @staticmethod
+    def vote(neighbours: Iterable[dict]) -> List[dict]:
+        """
+        kNN classification: labels of `neighbours` weighted by similarity.
+
+        Returns:
+            list: [{"label", "score", "votes"}, ...], best first; `score` is
+            the label's share of the total similarity. Unlabelled rows are
+            left out.
+        """
+        totals, votes = {}, {}
+        for n in neighbours:
+            if n["label"]:
+                weight = max(n["score"], 0.0)
+                totals[n["label"]] = totals.get(n["label"], 0.0) + weight
+                votes[n["label"]] = votes.get(n["label"], 0) + 1
+        total = sum(totals.values()) or 1.0
+        ranked = sorted(totals, key=lambda label: (-totals[label], -votes[label]))
+        return [
+            {"label": label, "score": totals[label] / total, "votes": votes[label]}
+            for label in ranked
+        ]
+
+
+_index: Optional[VectorIndex] = None
+# (build directory, meta.json mtime) of _index, to notice a new build
+_index_stamp: Optional[Tuple[str, int]] = None
+
+
+def _stamp(directory: str) -> Tuple[str, Optional[int]]:
+    real = os.path.realpath(directory)
+    try:
+        return real, os.stat(os.path.join(real, META_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return real, None
+
+
+def get_vector_index() -> VectorIndex:
+    """
+    The index in VECTOR_INDEX_DIR, opened on first use and reopened when a
+    new build is swapped in (or meta.json changes). If the new build can't
+    be opened, the one already open keeps serving.
+
+    Raises:
+        VectorIndexError: no index is configured or it has not been built.
+    """
+    global _index, _index_stamp
+    if not VECTOR_INDEX_DIR:
+        raise VectorIndexError("No vector index configured (VECTOR_INDEX_DIR).")
+    stamp = _stamp(VECTOR_INDEX_DIR)
+    if _index is not None and stamp == _index_stamp:
+        return _index
+    try:
+        index = VectorIndex(stamp[0])
+    except (VectorIndexError, OSError, ValueError, KeyError) as e:
+        if _index is not None:
+            logger.warning("Could not reopen vector index", error=str(e))
+            return _index
+        if isinstance(e, VectorIndexError):
+            raise
+        raise VectorIndexError(f"Could not open vector index: {e}")
+    logger.info(
+        "Vector index opened" if _index is None else "Vector index reloaded",
+        directory=VECTOR_INDEX_DIR,
+        build=stamp[0],
+        count=index.count,
+        model=index.model,
+        nlist=index.nlist,
+    )
+    _index, _index_stamp = index, stamp
+    return _index
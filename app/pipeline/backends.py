@@ -0,0 +1,159 @@
+"""
+Synchronous batch inference backends for offline (non-HTTP) processing.
+
+Every backend takes a uint8 batch of shape (N, H, W, 3), already resized to
+its `input_size`, and returns ImageNet class probabilities of shape (N, 1000).
+KerasBackend can also `embed` a batch (see app.pipeline.embed_index); the
+ONNX and Triton exports only have the classification output.
+Heavy imports (TensorFlow, onnxruntime, tritonclient) happen in the
+constructors, so importing this module stays cheap for decode workers.
+"""
+
+import json
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+ONNX_MODEL_REPO = os.getenv("ONNX_MODEL_REPO", "services/triton/models")
+TRITON_SERVER_NAME = os.getenv("TRITON_SERVER_NAME", "triton_cpu")
+TRITON_SERVER_PORT = os.getenv("TRITON_SERVER_PORT", "8000")
+
+with open("./app/models/imagenet_class_index.json", "r") as f:
+    imagenet_class_index = json.load(f)
+
+
+class KerasBackend:
+    """Runs a `ModelManager` backbone in-process."""
+
+    name = "keras"
+
+    def __init__(self, model_name: str):
+        from app.models.multimodel import ModelManager
+
+        info = ModelManager.MODEL_INFO[model_name]
+        self.model_name = model_name
+        self.input_size: Tuple[int, int] = info["input_size"]
+        self._preprocess = info["preprocess"]
+        self._model = ModelManager.get_model(model_name)
+        self._features = None
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        inputs = self._preprocess(batch.astype(np.float32))
+        return np.asarray(self._model.predict(inputs, batch_size=len(batch), verbose=0))
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        """Pooled features (N, D) of the backbone's "embedding_layer"."""
+        if self._features is None:
+            from app.models.multimodel import ModelManager
+
+            self._features = ModelManager.feature_model(self.model_name, self._model)
+        inputs = self._preprocess(batch.astype(np.float32))
+        return np.asarray(
+            self._features.predict(inputs, batch_size=len(batch), verbose=0)
+        )
+
+
+class OnnxBackend:
+    """
+    Runs the ONNX export of a backbone (as produced by
+    scripts/prepare_triton_models.sh) with onnxruntime, without TensorFlow
+    in the inference path. Exports with preprocessing compiled in take the
+    uint8 batch as is; older float32 exports get the Keras preprocessing.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, model_path: str = "", threads: int = 0):
+        import onnxruntime as ort
+
+        from app.models.multimodel import ModelManager
+
+        info = ModelManager.MODEL_INFO[model_name]
+        self.model_name = model_name
+        self.input_size: Tuple[int, int] = info["input_size"]
+        self._preprocess = info["preprocess"]
+        path = model_path or os.path.join(
+            ONNX_MODEL_REPO, model_name, "1", "model.onnx"
+        )
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        spec = self._session.get_inputs()[0]
+        self._input = spec.name
+        self._uint8 = spec.type == "tensor(uint8)"
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self._uint8:
+            inputs = batch.astype(np.uint8, copy=False)
+        else:
+            inputs = self._preprocess(batch.astype(np.float32)).astype(np.float32)
+        return self._session.run(None, {self._input: inputs})[0]
+
+
+class TritonBackend:
+    """
+    Sends uint8 batches to the Triton server (the models preprocess
+    in-graph), split into chunks of the model's `max_batch_size`.
+    """
+
+    name = "triton"
+
+    def __init__(self, model_name: str, url: str = ""):
+        from app.models.tritonservice import (
+            ThreadLocalClient,
+            TritonMultiModel,
+            config_batch_limit,
+        )
+
+        info = TritonMultiModel.MODEL_INFO[model_name]
+        self.model_name = model_name
+        self.input_size: Tuple[int, int] = info["input_size"]
+        self._client = ThreadLocalClient(
+            url or f"{TRITON_SERVER_NAME}:{TRITON_SERVER_PORT}"
+        )
+        self._max_batch = config_batch_limit(self._client, model_name)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        from tritonclient.http import InferInput, InferRequestedOutput
+
+        inputs = batch.astype(np.uint8, copy=False)
+        outputs = []
+        for start in range(0, len(inputs), self._max_batch):
+            chunk = inputs[start : start + self._max_batch]
+            infer_input = InferInput("input", chunk.shape, "UINT8")
+            infer_input.set_data_from_numpy(chunk)
+            response = self._client.infer(
+                model_name=self.model_name,
+                inputs=[infer_input],
+                outputs=[InferRequestedOutput("predictions")],
+            )
+            outputs.append(response.as_numpy("predictions"))
+        return np.concatenate(outputs)
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "onnx": OnnxBackend,
+    "triton": TritonBackend,
+}
+
+
+def top_k(probabilities: np.ndarray, k: int = 5) -> List[List[dict]]:
+    """Top-k {"class_index", "class_id", "class_name", "confidence"} per row."""
+    indices = np.argsort(probabilities, axis=1)[:, ::-1][:, :k]
+    return [
+        [
+            {
+                "class_index": int(idx),
+                "class_id": imagenet_class_index[str(idx)][0],
+                "class_name": imagenet_class_index[str(idx)][1],
+                "confidence": float(row[idx]),
+            }
+            for idx in row_indices
+        ]
+        for row, row_indices in zip(probabilities, indices)
+    ]
@@ -0,0 +1,199 @@
+"""
+Build a nearest-neighbour index (app.models.vector_index) of a labelled image
+archive, for /api/v1/similar.
+
+    python -m app.pipeline.embed_index /data/archive /data/index \\
+        --model ResNet50 --labels-from-dir --batch-size 64 --processes 7
+
+Images are walked and decoded exactly as by app.pipeline.offline (a directory
+tree, or tar shards with `--shards`; decoding runs in a process pool while
+the current batch is embedded) and their embeddings, keys and labels are
+streamed to disk, so memory stays bounded by the prefetched batches.
+Labels come from a `key,label` CSV (`--labels`) or the name of each image's
+directory (`--labels-from-dir`, for archives sorted into one folder per
+species). Once all rows are written they are grouped into `--nlist` IVF
+lists (by default sqrt(rows) from 50k rows up; smaller indexes are
+searched exactly). Each build goes to a new directory that replaces the
+index only when complete, so rebuilding the index a server is using is safe
+(it picks the new one up) and a failed build leaves it as it was. Builds are
+not resumable: a killed build starts over.
+"""
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+import structlog
+
+from app.config.server import available_cpus
+from app.models.vector_index import VectorIndex, VectorIndexWriter, default_nlist
+from app.pipeline.backends import KerasBackend
+from app.pipeline.offline import ThroughputMeter, _decode_batch, iter_images
+from app.pipeline.shards import ShardReader, list_shards
+
+logger = structlog.get_logger()
+
+
+def read_labels(path: str) -> Dict[str, str]:
+    """{key: label} from a CSV with `key` and `label` columns."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["key"]: row["label"] for row in csv.DictReader(f)}
+
+
+def directory_label(key: str) -> str:
+    return os.path.basename(os.path.dirname(key))
+
+
+def build(
+    root: str,
+    index_dir: str,
+    backend,
+    version: str = "",
+    labels: Optional[Dict[str, str]] = None,
+    labels_from_dir: bool = False,
+    batch_size: int = 64,
+    processes: int = 0,
+    prefetch: int = 4,
+    nlist: Optional[int] = None,
+    shards: bool = False,
+    meter: Optional[ThroughputMeter] = None,
+) -> VectorIndex:
+    """
+    Embed every image under `root` with `backend` into a new index in
+    `index_dir`. Images that fail to decode are skipped (and counted).
+
+    Args:
+        backend: Object with `model_name`, `input_size` and
+            `embed(uint8 batch) -> (N, D) features` (KerasBackend).
+        labels: {key: label}; keys not in it get no label.
+        nlist: IVF lists; None picks default_nlist(rows), 0 builds none.
+
+    Returns:
+        VectorIndex: the new index.
+    """
+    meter = meter or ThroughputMeter()
+    labels = labels or {}
+    label_of = directory_label if labels_from_dir else lambda key: labels.get(key, "")
+    size = backend.input_size
+    reader = None
+    if shards:
+        reader = ShardReader(list_shards(root))
+        samples = iter(reader)
+    else:
+        samples = ((p, os.path.join(root, p)) for p in iter_images(root))
+    batches = iter(lambda: list(itertools.islice(samples, batch_size)), [])
+
+    pool = multiprocessing.get_context("spawn").Pool(processes) if processes else None
+    pending: deque = deque()
+
+    def submit_next() -> bool:
+        batch = next(batches, None)
+        if batch is None:
+            return False
+        keys = [key for key, _ in batch]
+        args = ([source for _, source in batch], size)
+        result = pool.apply_async(_decode_batch, (args,)) if pool else None
+        pending.append((keys, result, args))
+        return True
+
+    writer = None
+    finished = False
+    try:
+        while len(pending) < prefetch and submit_next():
+            pass
+        while pending:
+            keys, result, args = pending.popleft()
+            decoded = result.get() if result is not None else _decode_batch(args)
+            submit_next()
+            ok = [i for i, (array, _) in enumerate(decoded) if array is not None]
+            if ok:
+                vectors = backend.embed(np.stack([decoded[i][0] for i in ok]))
+                if writer is None:
+                    writer = VectorIndexWriter(
+                        index_dir, vectors.shape[1], backend.model_name, version
+                    )
+                kept = [keys[i] for i in ok]
+                writer.add(vectors, kept, [label_of(key) for key in kept])
+            meter.update(len(keys), len(keys) - len(ok))
+        finished = True
+    finally:
+        if writer is not None and not finished:
+            writer.abort()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if reader is not None:
+            reader.close()
+        meter.update(0, force=True)
+        print(file=meter.stream)
+
+    if writer is None:
+        raise ValueError(f"No decodable images under {root}")
+    return writer.close(default_nlist(writer.count) if nlist is None else nlist)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Build a nearest-neighbour index of an image archive."
+    )
+    parser.add_argument("input_dir")
+    parser.add_argument("index_dir")
+    parser.add_argument("--model", default="ResNet50")
+    parser.add_argument("--labels", default="", help="CSV with key,label columns")
+    parser.add_argument(
+        "--labels-from-dir",
+        action="store_true",
+        help="Label each image with the name of its directory",
+    )
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=max(1, available_cpus() - 1),
+        help="Decode processes (0 decodes in the main process)",
+    )
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument(
+        "--nlist",
+        type=int,
+        default=None,
+        help="IVF lists (0 = exact search only; default depends on the row count)",
+    )
+    parser.add_argument(
+        "--shards",
+        action="store_true",
+        help="input_dir holds tar shards (app.pipeline.shards) instead of images",
+    )
+    args = parser.parse_args(argv)
+
+    from app.models.multimodel import ModelManager
+
+    try:
+        index = build(
+            args.input_dir,
+            args.index_dir,
+            KerasBackend(args.model),
+            version=ModelManager.model_version(args.model),
+            labels=read_labels(args.labels) if args.labels else None,
+            labels_from_dir=args.labels_from_dir,
+            batch_size=args.batch_size,
+            processes=args.processes,
+            prefetch=args.prefetch,
+            nlist=args.nlist,
+            shards=args.shards,
+        )
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(f"{index.count} vectors ({index.dim} dims, {index.nlist} IVF lists)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
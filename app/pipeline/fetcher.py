@@ -0,0 +1,205 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import structlog
+from opentelemetry import trace
+
+from app.models.scheduler import SchedulerError
+
+tracer = trace.get_tracer(__name__)
+logger = structlog.get_logger()
+
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "10"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "64"))
+FETCH_PER_HOST_CONCURRENCY = int(os.getenv("FETCH_PER_HOST_CONCURRENCY", "8"))
+# Redirect hops followed per download; every hop is re-validated
+FETCH_MAX_REDIRECTS = int(os.getenv("FETCH_MAX_REDIRECTS", "3"))
+# Comma separated host allow-list; empty means any host, so set it in
+# deployments (otherwise any internal address the pod can reach is fetchable).
+FETCH_ALLOWED_HOSTS = frozenset(
+    h.strip().lower() for h in os.getenv("FETCH_ALLOWED_HOSTS", "").split(",") if h
+)
+# How many URLs of one request are fetched/classified at the same time.
+FETCH_PIPELINE_CONCURRENCY = int(os.getenv("FETCH_PIPELINE_CONCURRENCY", "8"))
+
+
+class FetchError(Exception):
+    """An image URL could not be fetched. `status_code` is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ImageFetcher:
+    """
+    Downloads images over a single shared, connection-pooled httpx.AsyncClient.
+
+    - keep-alive connections are reused across requests (and across endpoints),
+    - at most `per_host_concurrency` downloads run against one host at a time,
+    - every download has a timeout and is aborted as soon as it exceeds `max_bytes`,
+    - only http/https URLs (and, if configured, allow-listed hosts) are fetched,
+      and redirects are followed by hand (at most `max_redirects` hops) so
+      every hop's URL is validated and counted against its own host's limit.
+    """
+
+    def __init__(
+        self,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        max_bytes: int = FETCH_MAX_BYTES,
+        max_connections: int = FETCH_MAX_CONNECTIONS,
+        per_host_concurrency: int = FETCH_PER_HOST_CONCURRENCY,
+        allowed_hosts: frozenset = FETCH_ALLOWED_HOSTS,
+        max_redirects: int = FETCH_MAX_REDIRECTS,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.allowed_hosts = allowed_hosts
+        self.max_redirects = max_redirects
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=False,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    def _validate(self, url: str) -> httpx.URL:
+        try:
+            parsed = httpx.URL(url)
+        except Exception:
+            raise FetchError(f"Invalid URL: {url}", status_code=400)
+        if parsed.scheme not in ("http", "https") or not parsed.host:
+            raise FetchError(f"Unsupported URL: {url}", status_code=400)
+        if self.allowed_hosts and parsed.host.lower() not in self.allowed_hosts:
+            raise FetchError(f"Host not allowed: {parsed.host}", status_code=403)
+        return parsed
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Download `url` and return its body, following up to `max_redirects`
+        redirects; each target is validated like `url` itself.
+
+        Raises:
+            FetchError: invalid/disallowed URL or redirect target (400/403),
+            upstream error or too many redirects (502), body larger than
+            `max_bytes` (413) or timeout (504).
+        """
+        target = self._validate(url)
+        with tracer.start_as_current_span("fetch_image") as span:
+            for _ in range(self.max_redirects + 1):
+                span.set_attribute("http.host", target.host)
+                body, location = await self._get(target, url)
+                if body is not None:
+                    break
+                target = self._validate(str(target.join(location)))
+            else:
+                raise FetchError(f"Too many redirects fetching {url}")
+            span.set_attribute("http.response_content_length", len(body))
+        if not body:
+            raise FetchError(f"Image at {url} is empty", status_code=400)
+        return body
+
+    async def _get(
+        self, target: httpx.URL, url: str
+    ) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        One GET of `target` under its host's limit: (body, None), or (None,
+        Location) for a redirect. `url` is the originally requested URL, for
+        error messages.
+        """
+        async with self._host_limit(target.host):
+            try:
+                async with self.client.stream("GET", target) as response:
+                    if response.is_redirect:
+                        location = response.headers.get("location")
+                        if not location:
+                            raise FetchError(
+                                f"Fetching {url} returned a redirect without Location"
+                            )
+                        return None, location
+                    if response.status_code != 200:
+                        raise FetchError(
+                            f"Fetching {url} returned HTTP {response.status_code}"
+                        )
+                    length = response.headers.get("content-length")
+                    if length and int(length) > self.max_bytes:
+                        raise FetchError(
+                            f"Image at {url} exceeds {self.max_bytes} bytes",
+                            status_code=413,
+                        )
+                    chunks = []
+                    size = 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise FetchError(
+                                f"Image at {url} exceeds {self.max_bytes} bytes",
+                                status_code=413,
+                            )
+                        chunks.append(chunk)
+            except httpx.TimeoutException:
+                raise FetchError(f"Timed out fetching {url}", status_code=504)
+            except httpx.HTTPError as e:
+                raise FetchError(f"Could not fetch {url}: {e}")
+        return b"".join(chunks), None
+
+
+async def fetch_and_classify_many(
+    urls: List[str],
+    fetch: Callable[[str], Awaitable[bytes]],
+    classify: Callable[[bytes], Awaitable[dict]],
+    concurrency: int = FETCH_PIPELINE_CONCURRENCY,
+) -> List[dict]:
+    """
+    Fetch and classify `urls` as a pipeline: up to `concurrency` URLs are in
+    flight at once, so downloads of later images overlap with decode and
+    inference of earlier ones. Results keep the input order; a failing URL
+    yields {"url", "error", "status_code"} instead of failing the batch.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(url: str) -> dict:
+        async with limit:
+            try:
+                image_data = await fetch(url)
+                return {"url": url, **(await classify(image_data))}
+            except FetchError as e:
+                logger.warning("Image fetch failed", url=url, error=str(e))
+                return {"url": url, "error": str(e), "status_code": e.status_code}
+            except ValueError as e:
+                return {"url": url, "error": str(e), "status_code": 400}
+            except SchedulerError as e:
+                return {"url": url, "error": str(e), "status_code": e.status_code}
+            except Exception as e:
+                logger.exception("Unexpected error classifying URL", url=url)
+                return {"url": url, "error": str(e), "status_code": 500}
+
+    return list(await asyncio.gather(*(one(url) for url in urls)))
+
+
+# Shared by every endpoint in this process
+image_fetcher = ImageFetcher()
@@ -0,0 +1,246 @@
+"""
+Frame-sequence classification with temporal deduplication.
+
+Adjacent frames of ROV video are nearly identical, so classifying each one
+wastes most of the inference. Every frame gets a 64-bit difference hash
+(dHash: a 9x8 grayscale thumbnail, one bit per horizontally adjacent pixel
+pair), which JPEG draft mode decodes at 1/8 scale for a fraction of a full
+decode. A frame whose hash is within FRAME_DEDUP_MAX_DISTANCE bits of the
+last frame that ran through the model reuses that frame's prediction; the
+rest are classified in batches. Comparing against the last *classified*
+frame rather than the previous one keeps a slow pan from drifting
+arbitrarily far on a single prediction.
+
+Sequences arrive either as multipart uploads or as one MJPEG body (raw
+concatenated JPEGs or multipart/x-mixed-replace), which JpegStreamSplitter
+cuts into frames as the body streams in.
+"""
+
+import asyncio
+import io
+import os
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+from opentelemetry import trace
+from PIL import Image
+
+from app.metrics import FRAME_SEQUENCE_FRAMES
+
+tracer = trace.get_tracer(__name__)
+
+# Hamming distance (of 64 bits) up to which a frame counts as unchanged
+FRAME_DEDUP_MAX_DISTANCE = int(os.getenv("FRAME_DEDUP_MAX_DISTANCE", "4"))
+FRAME_SEQUENCE_MAX_FRAMES = int(os.getenv("FRAME_SEQUENCE_MAX_FRAMES", "600"))
+# Frames per classify_batch call
+FRAME_BATCH_SIZE = int(os.getenv("FRAME_BATCH_SIZE", "32"))
+# Largest single frame, and largest request body, in bytes
+FRAME_MAX_BYTES = int(os.getenv("FRAME_MAX_BYTES", str(20 * 1024 * 1024)))
+FRAME_SEQUENCE_MAX_BYTES = int(
+    os.getenv("FRAME_SEQUENCE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+
+SOI = b"\xff\xd8\xff"
+EOI = b"\xff\xd9"
+
+
+def _jpeg_end(buffer: bytearray, start: int) -> Optional[int]:
+    """
+    End offset (exclusive) of the JPEG starting at `start`, or None if the
+    buffer does not hold all of it yet. Header segments are skipped by their
+    length, so EOI markers inside them (EXIF thumbnails) are not mistaken
+    for the end; in entropy-coded data 0xFF is always stuffed or a restart
+    marker, so the first EOI after the scan header ends the image.
+    """
+    pos = start + 2
+    while True:
+        if pos + 4 > len(buffer):
+            return None
+        if buffer[pos] != 0xFF:
+            break  # damaged header: fall back to scanning for EOI
+        marker = buffer[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+        elif marker == 0xD9:
+            return pos + 2
+        elif 0xD0 <= marker <= 0xD7 or marker == 0x01:  # no payload
+            pos += 2
+        else:
+            pos += 2 + int.from_bytes(buffer[pos + 2 : pos + 4], "big")
+            if marker == 0xDA:  # start of scan
+                break
+    end = buffer.find(EOI, pos)
+    return None if end < 0 else end + 2
+
+
+class FrameSequenceError(Exception):
+    """A frame sequence is over a limit. `status_code` is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 413):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JpegStreamSplitter:
+    """
+    Cuts JPEG frames out of a byte stream fed in arbitrary chunks: raw
+    concatenated JPEGs or multipart/x-mixed-replace parts (anything between
+    frames, such as part boundaries and headers, is skipped).
+
+    At most `max_frame_bytes` are buffered for one frame and `max_bytes`
+    accepted in total, so a stream that opens a frame and never ends it
+    can't grow the buffer without bound.
+    """
+
+    def __init__(
+        self,
+        max_frame_bytes: int = FRAME_MAX_BYTES,
+        max_bytes: int = FRAME_SEQUENCE_MAX_BYTES,
+    ):
+        self.max_frame_bytes = max_frame_bytes
+        self.max_bytes = max_bytes
+        self._received = 0
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Add `data` and return the frames it completed, in order.
+
+        Raises:
+            FrameSequenceError: the stream exceeds `max_bytes`, or a frame
+            `max_frame_bytes` (413).
+        """
+        self._received += len(data)
+        if self._received > self.max_bytes:
+            raise FrameSequenceError(f"Frame stream exceeds {self.max_bytes} bytes")
+        self._buffer += data
+        frames = []
+        while True:
+            start = self._buffer.find(SOI)
+            if start < 0:
+                # Keep a possible partial marker at the end
+                del self._buffer[: max(0, len(self._buffer) - len(SOI) + 1)]
+                return frames
+            end = _jpeg_end(self._buffer, start)
+            if end is None:
+                del self._buffer[:start]
+                if len(self._buffer) > self.max_frame_bytes:
+                    raise FrameSequenceError(
+                        f"Frame exceeds {self.max_frame_bytes} bytes"
+                    )
+                return frames
+            if end - start > self.max_frame_bytes:
+                raise FrameSequenceError(f"Frame exceeds {self.max_frame_bytes} bytes")
+            frames.append(bytes(self._buffer[start:end]))
+            del self._buffer[:end]
+
+
+def dhash(image_data: bytes, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image: `hash_size`**2 bits, one per horizontally
+    adjacent pixel pair of a grayscale thumbnail, set where brightness
+    increases.
+
+    Raises:
+        ValueError: the bytes are not a decodable image.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        thumb = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    except Exception as e:
+        raise ValueError(f"Could not decode image bytes: {e}")
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_frames(frames: List[bytes]) -> List[Optional[int]]:
+    """dhash of every frame; None for frames that can't be decoded. Runs on a worker thread."""
+    hashes = []
+    for frame in frames:
+        try:
+            hashes.append(dhash(frame))
+        except ValueError:
+            hashes.append(None)
+    return hashes
+
+
+def dedup_sources(hashes: List[Optional[int]], max_distance: int) -> List[int]:
+    """
+    For every frame, the index of the frame whose prediction it uses: its
+    own when it runs through the model, otherwise the last frame that did.
+    Frames without a hash always run (and report their decode error).
+    """
+    sources = []
+    anchor = None
+    for i, frame_hash in enumerate(hashes):
+        if (
+            frame_hash is not None
+            and anchor is not None
+            and (frame_hash ^ hashes[anchor]).bit_count() <= max_distance
+        ):
+            sources.append(anchor)
+            continue
+        sources.append(i)
+        if frame_hash is not None:
+            anchor = i
+    return sources
+
+
+async def classify_frames(
+    frames: List[bytes],
+    classify_batch: Callable[..., Awaitable[List[dict]]],
+    model_name: str,
+    max_distance: int = FRAME_DEDUP_MAX_DISTANCE,
+    batch_size: int = FRAME_BATCH_SIZE,
+) -> dict:
+    """
+    Classify a frame sequence, running only the frames that changed (see
+    dedup_sources) through `classify_batch`, `batch_size` at a time.
+
+    Args:
+        classify_batch: ModelManager.classify_batch or
+            TritonMultiModel.classify_batch.
+        model_name: Backbone for every batch (see select_model), so reused
+            frames and the frames they copy come from the same model.
+
+    Returns:
+        dict: {"model_used", "frame_count", "inferred", "inferred_share",
+        "frames": [{"frame", "source", "predictions"} | {"frame", "source",
+        "error"}, ...]}, where "source" is the frame whose prediction was
+        used (the frame itself when it ran).
+    """
+    with tracer.start_as_current_span("classify_frames") as span:
+        span.set_attribute("frames.count", len(frames))
+        hashes = await asyncio.to_thread(hash_frames, frames)
+        sources = dedup_sources(hashes, max_distance)
+        inferred = [i for i, source in enumerate(sources) if source == i]
+        span.set_attribute("frames.inferred", len(inferred))
+
+        results = {}
+        for start in range(0, len(inferred), batch_size):
+            chunk = inferred[start : start + batch_size]
+            outputs = await classify_batch(
+                [frames[i] for i in chunk], model_name=model_name
+            )
+            results.update(zip(chunk, outputs))
+
+    FRAME_SEQUENCE_FRAMES.labels(outcome="inferred").inc(len(inferred))
+    FRAME_SEQUENCE_FRAMES.labels(outcome="reused").inc(len(frames) - len(inferred))
+    per_frame = []
+    for i, source in enumerate(sources):
+        result = results[source]
+        entry = {"frame": i, "source": source}
+        if "error" in result:
+            entry["error"] = result["error"]
+        else:
+            entry["predictions"] = result["predictions"]
+        per_frame.append(entry)
+    return {
+        "model_used": model_name,
+        "frame_count": len(frames),
+        "inferred": len(inferred),
+        "inferred_share": round(len(inferred) / len(frames), 4) if frames else 0.0,
+        "frames": per_frame,
+    }
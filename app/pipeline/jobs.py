@@ -0,0 +1,468 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import structlog
+from opentelemetry import trace
+
+from app.pipeline.fetcher import ImageFetcher
+from app.pipeline.shards import ShardReader, list_shards
+
+tracer = trace.get_tracer(__name__)
+logger = structlog.get_logger()
+
+# Images per forward pass
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", "16"))
+# Jobs processed at the same time; the rest wait in the queue
+JOBS_MAX_CONCURRENT = int(os.getenv("JOBS_MAX_CONCURRENT", "1"))
+# Batches from *all* bulk jobs allowed in the inference pool at once, so bulk
+# work always leaves executor threads free for interactive requests.
+JOBS_MAX_INFLIGHT_BATCHES = int(os.getenv("JOBS_MAX_INFLIGHT_BATCHES", "1"))
+# Batches loaded ahead of inference (fetch/read overlaps with the forward pass)
+JOBS_PREFETCH_BATCHES = int(os.getenv("JOBS_PREFETCH_BATCHES", "2"))
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", "32"))
+JOBS_MAX_ITEMS = int(os.getenv("JOBS_MAX_ITEMS", "100000"))
+JOBS_RETENTION_SECONDS = float(os.getenv("JOBS_RETENTION_SECONDS", "3600"))
+# Uploaded images are spooled here instead of being held in memory, and job
+# results are written under its results/ directory
+JOBS_SPOOL_DIR = os.getenv("JOBS_SPOOL_DIR", "/tmp/marine_jobs")
+# Root directory for {"path": ...} items; empty disables server-local paths
+JOBS_LOCAL_ROOT = os.getenv("JOBS_LOCAL_ROOT", "")
+
+# Results between byte-offset checkpoints of a results file; a stream
+# resumed at `start` scans at most this many lines to reach it
+RESULTS_CHECKPOINT_EVERY = 1024
+
+BatchClassifier = Callable[[List[bytes]], Awaitable[List[dict]]]
+
+
+class JobError(Exception):
+    """A job request was rejected. `status_code` is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Job:
+    """
+    One bulk classification job. Results are appended in completion order
+    (batch by batch) to an NDJSON file rather than kept in memory, so a job
+    over millions of shard samples costs the worker no more heap than a
+    small one; every waiting stream is woken on each append.
+    """
+
+    def __init__(
+        self,
+        items: List[dict],
+        backend: str,
+        job_id: Optional[str] = None,
+        results_path: Optional[str] = None,
+    ):
+        self.id = job_id or uuid.uuid4().hex
+        self.items = items
+        self.backend = backend
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.results_path = results_path or os.path.join(
+            JOBS_SPOOL_DIR, "results", f"{self.id}.ndjson"
+        )
+        self.processed = 0
+        self.failed = 0
+        # Byte offset of result i * RESULTS_CHECKPOINT_EVERY
+        self._checkpoints: List[int] = [0]
+        self._size = 0
+        self._results_file = None
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    @property
+    def total(self) -> Optional[int]:
+        """Number of images, unknown (None) until the shards of a job are read."""
+        if any("shard" in item for item in self.items):
+            return self.processed if self.done else None
+        return len(self.items)
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "backend": self.backend,
+            "total": self.total,
+            "processed": self.processed,
+            "failed": self.failed,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def _append(self, results: List[dict]) -> None:
+        if self._results_file is None:
+            os.makedirs(os.path.dirname(self.results_path), exist_ok=True)
+            self._results_file = open(self.results_path, "ab")
+        for i, result in enumerate(results, start=self.processed):
+            if i and i % RESULTS_CHECKPOINT_EVERY == 0:
+                self._checkpoints.append(self._size)
+            line = (json.dumps({"type": "result", **result}) + "\n").encode()
+            self._results_file.write(line)
+            self._size += len(line)
+        self._results_file.flush()
+
+    def read_results(self, start: int, stop: int) -> List[bytes]:
+        """NDJSON lines of results `start` to `stop` (already published). Blocking."""
+        if stop <= start:
+            return []
+        first = start // RESULTS_CHECKPOINT_EVERY
+        with open(self.results_path, "rb") as f:
+            f.seek(self._checkpoints[first])
+            for _ in range(start - first * RESULTS_CHECKPOINT_EVERY):
+                f.readline()
+            return [f.readline() for _ in range(stop - start)]
+
+    def remove_results(self) -> None:
+        if self._results_file is not None:
+            self._results_file.close()
+            self._results_file = None
+        try:
+            os.remove(self.results_path)
+        except FileNotFoundError:
+            pass
+
+    async def _publish(self, results: List[dict]) -> None:
+        async with self.changed:
+            await asyncio.to_thread(self._append, results)
+            self.processed += len(results)
+            self.failed += sum(1 for r in results if "error" in r)
+            self.changed.notify_all()
+
+    async def _finish(self, status: str, error: Optional[str] = None) -> None:
+        async with self.changed:
+            if self._results_file is not None:
+                self._results_file.close()
+                self._results_file = None
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+
+class JobManager:
+    """
+    Queue and background pipeline for bulk classification jobs.
+
+    Each job is read in batches of JOBS_BATCH_SIZE: a loader task fetches URLs,
+    reads server-local files and spooled uploads for the next
+    JOBS_PREFETCH_BATCHES batches while the current batch is being classified
+    with one forward pass through the job's backend. At most
+    JOBS_MAX_CONCURRENT jobs run at once and at most JOBS_MAX_INFLIGHT_BATCHES
+    bulk batches occupy the inference pool, which bounds how much capacity
+    bulk work can take from interactive `/predict` traffic.
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, BatchClassifier],
+        fetcher: ImageFetcher,
+        batch_size: int = JOBS_BATCH_SIZE,
+        max_concurrent: int = JOBS_MAX_CONCURRENT,
+        max_inflight_batches: int = JOBS_MAX_INFLIGHT_BATCHES,
+        max_queued: int = JOBS_MAX_QUEUED,
+        spool_dir: str = JOBS_SPOOL_DIR,
+        local_root: str = JOBS_LOCAL_ROOT,
+    ):
+        self.backends = backends
+        self.fetcher = fetcher
+        self.batch_size = batch_size
+        self.max_concurrent = max_concurrent
+        self.max_inflight_batches = max_inflight_batches
+        self.max_queued = max_queued
+        self.spool_dir = spool_dir
+        self.local_root = os.path.realpath(local_root) if local_root else ""
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._inference_slots: Optional[asyncio.Semaphore] = None
+        self._workers: List[asyncio.Task] = []
+
+    # -----------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._inference_slots = asyncio.Semaphore(self.max_inflight_batches)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self.max_concurrent)
+        ]
+        logger.info(
+            "Job manager started",
+            workers=self.max_concurrent,
+            batch_size=self.batch_size,
+        )
+
+    async def stop(self) -> None:
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # -----------------------------------------------------------
+    # Submission
+    # -----------------------------------------------------------
+    def validate_items(self, items: List[dict]) -> List[dict]:
+        """
+        Check a manifest. Each item is {"url": ...}, {"path": ...} or
+        {"shard": ...} (a tar shard or a directory of shards, relative to
+        JOBS_LOCAL_ROOT) or an already spooled {"upload": ...}.
+        """
+        if not items:
+            raise JobError("A job needs at least one item.")
+        if len(items) > JOBS_MAX_ITEMS:
+            raise JobError(f"A job can contain at most {JOBS_MAX_ITEMS} items.")
+        for item in items:
+            if "path" in item:
+                item["resolved_path"] = self._resolve_local(item["path"])
+            elif "shard" in item:
+                item["resolved_path"] = self._resolve_local(item["shard"])
+                if not os.path.exists(item["resolved_path"]):
+                    raise JobError(f"Shard not found: {item['shard']}")
+            elif "url" not in item and "upload" not in item:
+                raise JobError("Each item needs a 'url', 'path', 'shard' or upload.")
+        return items
+
+    def _resolve_local(self, relative: str) -> str:
+        if not self.local_root:
+            raise JobError("Server-local paths are disabled.", 403)
+        full = os.path.realpath(os.path.join(self.local_root, relative))
+        if os.path.commonpath([full, self.local_root]) != self.local_root:
+            raise JobError(f"Path outside JOBS_LOCAL_ROOT: {relative}", 403)
+        return full
+
+    def spool_path(self, job_id: str, index: int) -> str:
+        return os.path.join(self.spool_dir, job_id, f"{index:08d}")
+
+    def submit(
+        self, items: List[dict], backend: str, job_id: Optional[str] = None
+    ) -> Job:
+        """
+        Queue a job. Uploads are spooled by the caller under
+        `spool_path(job_id, i)` first, so they must pass that same `job_id`.
+
+        Raises:
+            JobError: unknown backend or invalid manifest (400/403), manager
+            not started (503) or queue full (429).
+        """
+        if backend not in self.backends:
+            raise JobError(f"Unknown backend: {backend}")
+        if self._queue is None:
+            raise JobError("Job manager is not running.", 503)
+        job_id = job_id or self.new_job_id()
+        job = Job(
+            self.validate_items(items),
+            backend,
+            job_id,
+            os.path.join(self.spool_dir, "results", f"{job_id}.ndjson"),
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobError("Too many queued jobs, retry later.", 429)
+        self.jobs[job.id] = job
+        self._expire_old_jobs()
+        logger.info("Job submitted", job_id=job.id, total=len(items), backend=backend)
+        return job
+
+    @staticmethod
+    def new_job_id() -> str:
+        return uuid.uuid4().hex
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobError(f"Unknown job: {job_id}", 404)
+        return job
+
+    async def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        elif not job.done:
+            await job._finish("cancelled")
+        return job
+
+    def _expire_old_jobs(self) -> None:
+        cutoff = time.time() - JOBS_RETENTION_SECONDS
+        for job_id in [
+            j.id for j in self.jobs.values() if j.done and j.finished_at < cutoff
+        ]:
+            self.jobs.pop(job_id).remove_results()
+
+    # -----------------------------------------------------------
+    # Processing
+    # -----------------------------------------------------------
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.done:  # cancelled while queued
+                    continue
+                job.task = asyncio.create_task(self._run(job))
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    if not job.task.cancelled():
+                        raise
+                    await job._finish("cancelled")
+            finally:
+                shutil.rmtree(os.path.join(self.spool_dir, job.id), ignore_errors=True)
+                self._queue.task_done()
+
+    async def _load(self, item: dict) -> bytes:
+        if "url" in item:
+            return await self.fetcher.fetch(item["url"])
+        path = item.get("resolved_path") or item["upload"]
+        return await asyncio.to_thread(_read_file, path)
+
+    async def _load_batch(self, items: List[dict], queue: asyncio.Queue) -> None:
+        """Load one batch; a failing item yields its exception instead of bytes."""
+        loaded = await asyncio.gather(
+            *(self._load(item) for item in items), return_exceptions=True
+        )
+        await queue.put(([_source(item) for item in items], loaded))
+
+    async def _load_shard(self, item: dict, queue: asyncio.Queue) -> None:
+        """Stream the samples of a shard item in batches, keyed by sample key."""
+        reader = ShardReader(list_shards(item["resolved_path"]))
+        try:
+            while batch := await asyncio.to_thread(reader.next_batch, self.batch_size):
+                await queue.put(([key for key, _ in batch], [d for _, d in batch]))
+        finally:
+            reader.close()
+
+    async def _loader(self, job: Job, queue: asyncio.Queue) -> None:
+        """
+        Put (sources, loaded) batches on `queue`, then None. Shard items are
+        streamed on their own; other items are grouped into batches and
+        loaded concurrently. A loader failure is passed on to fail the job.
+        """
+        try:
+            pending: List[dict] = []
+            for item in job.items:
+                if "shard" in item:
+                    if pending:
+                        await self._load_batch(pending, queue)
+                        pending = []
+                    await self._load_shard(item, queue)
+                    continue
+                pending.append(item)
+                if len(pending) == self.batch_size:
+                    await self._load_batch(pending, queue)
+                    pending = []
+            if pending:
+                await self._load_batch(pending, queue)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    async def _run(self, job: Job) -> None:
+        job.status = "running"
+        classify = self.backends[job.backend]
+        queue: asyncio.Queue = asyncio.Queue(maxsize=JOBS_PREFETCH_BATCHES)
+        loader = asyncio.create_task(self._loader(job, queue))
+        with tracer.start_as_current_span("bulk_job") as span:
+            span.set_attribute("job.id", job.id)
+            span.set_attribute("job.items", len(job.items))
+            try:
+                while (entry := await queue.get()) is not None:
+                    if isinstance(entry, Exception):
+                        raise entry
+                    sources, loaded = entry
+                    start = job.processed
+                    images = [d for d in loaded if isinstance(d, bytes)]
+                    outputs = []
+                    if images:
+                        async with self._inference_slots:
+                            outputs = await classify(images)
+                    outputs = iter(outputs)
+                    results = []
+                    for offset, (source, data) in enumerate(zip(sources, loaded)):
+                        if isinstance(data, bytes):
+                            out = next(outputs)
+                        else:
+                            logger.warning(
+                                "Bulk job item failed", job_id=job.id, error=str(data)
+                            )
+                            out = {"error": str(data)}
+                        results.append(
+                            {"index": start + offset, "source": source, **out}
+                        )
+                    await job._publish(results)
+                await loader
+                await job._finish("completed")
+            except asyncio.CancelledError:
+                loader.cancel()
+                raise
+            except Exception as e:
+                loader.cancel()
+                logger.exception("Bulk job failed", job_id=job.id, error=str(e))
+                await job._finish("failed", error=str(e))
+        logger.info("Bulk job finished", **job.summary())
+
+    # -----------------------------------------------------------
+    # Streaming
+    # -----------------------------------------------------------
+    async def stream(self, job: Job, start: int = 0) -> AsyncIterator[bytes]:
+        """
+        Yield NDJSON lines for `job`: every result from index `start` on as
+        soon as its batch completes (read back from the job's results file),
+        a progress line after each batch, and a final summary line when the
+        job ends.
+        """
+        sent = start
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.processed > sent or job.done)
+                available = job.processed
+                finished = job.done
+            new = await asyncio.to_thread(job.read_results, sent, available)
+            for line in new:
+                yield line
+            sent += len(new)
+            if new and not finished:
+                progress = {
+                    "type": "progress",
+                    "processed": job.processed,
+                    "total": job.total,
+                }
+                yield (json.dumps(progress) + "\n").encode()
+            if finished and sent >= job.processed:
+                yield (json.dumps({"type": "summary", **job.summary()}) + "\n").encode()
+                return
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _source(item: dict) -> str:
+    if "url" in item:
+        return item["url"]
+    if "path" in item:
+        return item["path"]
+    return item.get("filename") or os.path.basename(item["upload"])
@@ -0,0 +1,425 @@
+"""
+Offline batch classification of large image directories, without the HTTP
+layer.
+
+    python -m app.pipeline.offline /data/survey-2019 /data/out \\
+        --backend onnx --model ResNet50V2 --batch-size 64 --processes 7
+
+The directory tree is walked lazily in a deterministic (sorted) order; with
+`--shards` the input is instead a directory of tar shards (see
+app.pipeline.shards), read sequentially with read-ahead. A pool
+of decode processes turns files into resized uint8 arrays for the next
+`--prefetch` batches while the current batch runs through the backend, and
+results are written as numbered CSV (or Parquet) part files of about
+`--chunk-rows` rows. After each part file is written, `checkpoint.json`
+records how many images are done, so a killed run continues from the last
+part file when started again with the same arguments. Memory stays bounded by
+`prefetch * batch_size` decoded images plus one chunk of result rows,
+whatever the size of the tree.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import structlog
+from PIL import Image
+
+from app.config.server import available_cpus
+from app.pipeline.backends import BACKENDS, top_k
+from app.pipeline.shards import ShardReader, list_shards
+
+logger = structlog.get_logger()
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+CHECKPOINT_FILE = "checkpoint.json"
+COLUMNS = [
+    "key",
+    "model",
+    "class_index",
+    "class_id",
+    "class_name",
+    "confidence",
+    "top5",
+    "error",
+]
+
+
+def iter_images(root: str, extensions=IMAGE_EXTENSIONS) -> Iterator[str]:
+    """
+    Yield image paths under `root` (relative to it) in a stable order. Only
+    one directory listing is held in memory at a time, and the order is the
+    same on every run, which is what makes resuming by count possible.
+    """
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(root, relative)) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            path = os.path.join(relative, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(path)
+            elif entry.name.lower().endswith(extensions):
+                yield path
+        stack.extend(reversed(subdirs))
+
+
+def decode_image(
+    source: Union[str, bytes], size: Tuple[int, int]
+) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Decode and resize one image (a file path or the encoded bytes of a shard
+    sample) to a (H, W, 3) uint8 array. JPEGs are decoded
+    at a reduced scale when much larger than `size`, which is most of the
+    decode cost for camera-sized images. Runs in the decode processes.
+    """
+    height, width = size
+    try:
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        with Image.open(source) as img:
+            img.draft("RGB", (width, height))
+            img = img.convert("RGB").resize((width, height))
+            return np.asarray(img, dtype=np.uint8), None
+    except Exception as e:
+        return None, f"Could not decode image: {e}"
+
+
+def _decode_batch(args) -> List[Tuple[Optional[np.ndarray], Optional[str]]]:
+    sources, size = args
+    return [decode_image(source, size) for source in sources]
+
+
+class Checkpoint:
+    """Progress of one output directory, rewritten atomically after every part file."""
+
+    def __init__(self, out_dir: str, settings: dict):
+        self.path = os.path.join(out_dir, CHECKPOINT_FILE)
+        self.settings = settings
+        self.processed = 0
+        self.parts = 0
+        self.completed = False
+
+    def load(self) -> bool:
+        """
+        Load an existing checkpoint. Returns False if there is none.
+
+        Raises:
+            ValueError: the checkpoint was written with different settings.
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state["settings"] != self.settings:
+            raise ValueError(
+                f"{self.path} was written by a run with different settings "
+                f"({state['settings']}); use --restart to start over."
+            )
+        self.processed = state["processed"]
+        self.parts = state["parts"]
+        self.completed = state["completed"]
+        return True
+
+    def save(self) -> None:
+        state = {
+            "settings": self.settings,
+            "processed": self.processed,
+            "parts": self.parts,
+            "completed": self.completed,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+class PartWriter:
+    """Writes result rows as numbered CSV or Parquet part files."""
+
+    def __init__(self, out_dir: str, fmt: str = "csv"):
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ValueError("Parquet output needs pyarrow: pip install pyarrow")
+        elif fmt != "csv":
+            raise ValueError(f"Unknown output format: {fmt}")
+        self.out_dir = out_dir
+        self.fmt = fmt
+
+    def part_path(self, index: int) -> str:
+        return os.path.join(self.out_dir, f"part-{index:05d}.{self.fmt}")
+
+    def write(self, index: int, rows: List[dict]) -> str:
+        path = self.part_path(index)
+        tmp = path + ".tmp"
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pq.write_table(pa.Table.from_pylist(rows), tmp, compression="zstd")
+        else:
+            with open(tmp, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+        os.replace(tmp, path)
+        return path
+
+    def remove_parts(self) -> None:
+        for name in os.listdir(self.out_dir):
+            if name.startswith("part-") or name == CHECKPOINT_FILE:
+                os.remove(os.path.join(self.out_dir, name))
+
+
+class ThroughputMeter:
+    """Prints processed count and images/sec (recent window and overall) to a stream."""
+
+    def __init__(self, interval: float = 2.0, stream=sys.stderr, start: int = 0):
+        self.interval = interval
+        self.stream = stream
+        self.started = self.last_time = time.perf_counter()
+        self.start_count = self.last_count = self.count = start
+        self.errors = 0
+
+    def update(self, images: int, errors: int = 0, force: bool = False) -> None:
+        self.count += images
+        self.errors += errors
+        now = time.perf_counter()
+        if not force and now - self.last_time < self.interval:
+            return
+        recent = (self.count - self.last_count) / max(now - self.last_time, 1e-9)
+        print(
+            f"\r{self.count} images | {recent:,.1f} img/s now | "
+            f"{self.rate():,.1f} img/s avg | {self.errors} errors",
+            end="",
+            file=self.stream,
+            flush=True,
+        )
+        self.last_time, self.last_count = now, self.count
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return (self.count - self.start_count) / max(elapsed, 1e-9)
+
+
+def _rows(keys, decoded, backend, k: int) -> Tuple[List[dict], int]:
+    """Run one decoded batch through `backend` and build its result rows."""
+    ok = [i for i, (array, _) in enumerate(decoded) if array is not None]
+    top = {}
+    if ok:
+        probabilities = backend.predict(np.stack([decoded[i][0] for i in ok]))
+        top = dict(zip(ok, top_k(probabilities, k)))
+    rows = []
+    for i, (key, (_, error)) in enumerate(zip(keys, decoded)):
+        row = dict.fromkeys(COLUMNS, "")
+        row.update(key=key, model=backend.model_name)
+        if i in top:
+            best = top[i][0]
+            row.update(
+                class_index=best["class_index"],
+                class_id=best["class_id"],
+                class_name=best["class_name"],
+                confidence=best["confidence"],
+                top5=json.dumps(top[i]),
+            )
+        else:
+            row["error"] = error
+        rows.append(row)
+    return rows, len(keys) - len(ok)
+
+
+def run(
+    root: str,
+    out_dir: str,
+    backend,
+    batch_size: int = 64,
+    processes: int = 0,
+    prefetch: int = 4,
+    chunk_rows: int = 50_000,
+    fmt: str = "csv",
+    restart: bool = False,
+    top: int = 5,
+    meter: Optional[ThroughputMeter] = None,
+    shards: bool = False,
+) -> Checkpoint:
+    """
+    Classify every image under `root` with `backend` and write part files to
+    `out_dir`, resuming from its checkpoint if one exists. Rows are keyed by
+    the path relative to `root`, or by the sample key when `shards` is set.
+
+    Args:
+        backend: Object with `model_name`, `input_size` and
+            `predict(uint8 batch) -> probabilities` (see app.pipeline.backends).
+        processes: Decode processes; 0 decodes in this process.
+        prefetch: Decoded batches kept ready ahead of inference.
+        shards: `root` is a tar shard (or a directory of shards), not an
+            image tree. Resuming re-reads, but does not decode, the samples
+            already done.
+
+    Returns:
+        Checkpoint: the final progress (`completed` is True).
+
+    Raises:
+        ValueError: the existing checkpoint belongs to different settings.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    writer = PartWriter(out_dir, fmt)
+    settings = {
+        "root": os.path.abspath(root),
+        "input": "shards" if shards else "files",
+        "backend": backend.name,
+        "model": backend.model_name,
+        "format": fmt,
+    }
+    checkpoint = Checkpoint(out_dir, settings)
+    if restart:
+        writer.remove_parts()
+    elif checkpoint.load():
+        if checkpoint.completed:
+            logger.info("Offline run already completed", **settings)
+            return checkpoint
+        logger.info("Resuming offline run", processed=checkpoint.processed)
+
+    meter = meter or ThroughputMeter(start=checkpoint.processed)
+    size = backend.input_size
+    reader = None
+    if shards:
+        reader = ShardReader(list_shards(root))
+        samples = iter(reader)
+    else:
+        samples = ((p, os.path.join(root, p)) for p in iter_images(root))
+    samples = itertools.islice(samples, checkpoint.processed, None)
+    batches = iter(lambda: list(itertools.islice(samples, batch_size)), [])
+
+    pool = multiprocessing.get_context("spawn").Pool(processes) if processes else None
+    pending: deque = deque()
+
+    def submit_next() -> bool:
+        batch = next(batches, None)
+        if batch is None:
+            return False
+        keys = [key for key, _ in batch]
+        args = ([source for _, source in batch], size)
+        result = pool.apply_async(_decode_batch, (args,)) if pool else None
+        pending.append((keys, result, args))
+        return True
+
+    buffered: List[dict] = []
+    try:
+        while len(pending) < prefetch and submit_next():
+            pass
+        while pending:
+            keys, result, args = pending.popleft()
+            decoded = result.get() if result is not None else _decode_batch(args)
+            submit_next()
+            rows, errors = _rows(keys, decoded, backend, top)
+            buffered.extend(rows)
+            meter.update(len(rows), errors)
+            if len(buffered) >= chunk_rows:
+                _flush(writer, checkpoint, buffered)
+                buffered = []
+        if buffered:
+            _flush(writer, checkpoint, buffered)
+        checkpoint.completed = True
+        checkpoint.save()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if reader is not None:
+            reader.close()
+        meter.update(0, force=True)
+        print(file=meter.stream)
+
+    logger.info(
+        "Offline run completed",
+        processed=checkpoint.processed,
+        parts=checkpoint.parts,
+        images_per_second=round(meter.rate(), 1),
+        **settings,
+    )
+    return checkpoint
+
+
+def _flush(writer: PartWriter, checkpoint: Checkpoint, rows: List[dict]) -> None:
+    writer.write(checkpoint.parts, rows)
+    checkpoint.parts += 1
+    checkpoint.processed += len(rows)
+    checkpoint.save()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Classify a directory tree of images offline (resumable)."
+    )
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--backend", choices=["onnx", "keras", "triton"], default="onnx"
+    )
+    parser.add_argument("--model", default="ResNet50V2")
+    parser.add_argument("--onnx-model", default="", help="Path to a model.onnx file")
+    parser.add_argument("--triton-url", default="")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=max(1, available_cpus() - 1),
+        help="Decode processes (0 decodes in the main process)",
+    )
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument(
+        "--shards",
+        action="store_true",
+        help="input_dir holds tar shards (app.pipeline.shards) instead of images",
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore and remove previous output"
+    )
+    args = parser.parse_args(argv)
+
+    if args.backend == "onnx":
+        backend = BACKENDS["onnx"](args.model, model_path=args.onnx_model)
+    elif args.backend == "triton":
+        backend = BACKENDS["triton"](args.model, url=args.triton_url)
+    else:
+        backend = BACKENDS["keras"](args.model)
+
+    try:
+        run(
+            args.input_dir,
+            args.output_dir,
+            backend,
+            batch_size=args.batch_size,
+            processes=args.processes,
+            prefetch=args.prefetch,
+            chunk_rows=args.chunk_rows,
+            fmt=args.format,
+            restart=args.restart,
+            top=args.top,
+            shards=args.shards,
+        )
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+WebDataset-style tar shards for bulk inference.
+
+A shard is a plain (uncompressed) tar file whose members are named
+`<key>.<ext>`; all members sharing a key form one sample, e.g.
+`survey/2019/img_000123.jpg`. Reading a shard is one sequential stream, so
+millions of small images cost a few large reads instead of one open/stat/seek
+per file on network storage.
+
+    python -m app.pipeline.shards pack /data/survey-2019 /data/shards --shard-size-mb 512
+"""
+
+import argparse
+import os
+import queue
+import sys
+import tarfile
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SHARD_EXTENSION = ".tar"
+# Samples read ahead of the consumer by ShardReader
+SHARD_PREFETCH_SAMPLES = int(os.getenv("SHARD_PREFETCH_SAMPLES", "256"))
+SHARD_READ_BUFFER = 1024 * 1024
+# Samples handed from the reader thread to the consumer at a time
+_HANDOFF_SAMPLES = 32
+_BLOCK = 512
+
+
+def split_key(name: str) -> Tuple[str, str]:
+    """
+    Split a member name into (key, extension) the WebDataset way: the
+    extension starts at the first dot of the file name, so
+    "a/b/img.001.jpg" has key "a/b/img" and extension "001.jpg".
+    """
+    directory, slash, base = name.rpartition("/")
+    stem, _, ext = base.partition(".")
+    return directory + slash + stem, ext.lower()
+
+
+def list_shards(path: str) -> List[str]:
+    """`path` itself if it is a shard, else the shards directly inside it, sorted."""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if name.endswith(SHARD_EXTENSION)
+    )
+
+
+def _header_number(field: bytes) -> int:
+    if field[0] & 0x80:  # GNU base-256 for sizes of 8 GiB and more
+        return int.from_bytes(field[1:], "big")
+    return int(field.strip(b"\0 ") or b"0", 8)
+
+
+def _pax_path(data: bytes) -> Optional[str]:
+    for record in data.split(b"\n"):
+        _, _, keyword_value = record.partition(b" ")
+        if keyword_value.startswith(b"path="):
+            return keyword_value[5:].decode()
+    return None
+
+
+def iter_shard(path: str) -> Iterator[Tuple[str, bytes]]:
+    """
+    Stream (key, image bytes) from one shard in member order, reading the
+    file strictly sequentially through a large buffer. Members that are not
+    images are skipped without being read.
+
+    The ustar/GNU/PAX headers are parsed directly instead of through
+    `tarfile`, whose per-member header processing costs more than reading a
+    small JPEG. Only what shards need is supported: regular files, GNU long
+    names and PAX `path` records.
+
+    Raises:
+        tarfile.ReadError: `path` is not a tar file.
+    """
+    with open(path, "rb", buffering=SHARD_READ_BUFFER) as f:
+        long_name = None
+        while True:
+            header = f.read(_BLOCK)
+            if len(header) < _BLOCK or not header.strip(b"\0"):
+                return
+            if header[257:262] != b"ustar":
+                raise tarfile.ReadError(f"{path} is not a tar shard")
+            size = _header_number(header[124:136])
+            padded = size + (-size % _BLOCK)
+            typeflag = header[156:157]
+            if typeflag in (b"L", b"x"):
+                data = f.read(padded)[:size]
+                long_name = (
+                    data.rstrip(b"\0").decode() if typeflag == b"L" else _pax_path(data)
+                )
+                continue
+            name = long_name
+            long_name = None
+            if name is None:
+                name = header[0:100].rstrip(b"\0").decode()
+                prefix = header[345:500].rstrip(b"\0").decode()
+                if prefix:
+                    name = f"{prefix}/{name}"
+            key, ext = split_key(name)
+            if typeflag not in (b"0", b"\0") or not ("." + ext).endswith(
+                IMAGE_EXTENSIONS
+            ):
+                f.seek(padded, os.SEEK_CUR)
+                continue
+            yield key, f.read(padded)[:size]
+
+
+def iter_samples(shards: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+    for shard in shards:
+        yield from iter_shard(shard)
+
+
+class ShardReader:
+    """
+    Iterates (key, image bytes) over several shards while a background thread
+    reads ahead up to `prefetch` samples, so storage reads overlap with
+    decoding and inference in the consumer. Samples are handed over in small
+    groups to keep the per-sample queue overhead low.
+    """
+
+    _DONE = object()
+
+    def __init__(self, shards: List[str], prefetch: int = SHARD_PREFETCH_SAMPLES):
+        self.shards = shards
+        self._queue: queue.Queue = queue.Queue(
+            maxsize=max(1, prefetch // _HANDOFF_SAMPLES)
+        )
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._iter: Optional[Iterator[Tuple[str, bytes]]] = None
+
+    def _produce(self) -> None:
+        try:
+            group = []
+            for sample in iter_samples(self.shards):
+                group.append(sample)
+                if len(group) == _HANDOFF_SAMPLES:
+                    if not self._put(group):
+                        return
+                    group = []
+            if group and not self._put(group):
+                return
+            self._put(self._DONE)
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self) -> Iterator[Tuple[str, bytes]]:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._produce, name="shard-reader", daemon=True
+            )
+            self._thread.start()
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield from item
+
+    def next_batch(self, size: int) -> List[Tuple[str, bytes]]:
+        """Up to `size` samples; an empty list once every shard is read."""
+        if self._iter is None:
+            self._iter = iter(self)
+        batch = []
+        for sample in self._iter:
+            batch.append(sample)
+            if len(batch) == size:
+                break
+        return batch
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+
+def pack_directory(
+    root: str,
+    out_dir: str,
+    shard_size_bytes: int = 512 * 1024 * 1024,
+    max_samples: int = 0,
+    prefix: str = "shard",
+    paths: Optional[Iterable[str]] = None,
+) -> List[str]:
+    """
+    Pack the images under `root` into `out_dir/<prefix>-000000.tar`, ...,
+    starting a new shard when the current one reaches `shard_size_bytes` (or
+    `max_samples` samples, if set). Keys are the paths relative to `root`
+    without extension, so results can be joined back to the original files.
+
+    Returns:
+        list: the shard paths written, in order.
+    """
+    from app.pipeline.offline import iter_images
+
+    os.makedirs(out_dir, exist_ok=True)
+    written: List[str] = []
+    tar = None
+    size = count = 0
+
+    def open_next():
+        nonlocal tar, size, count
+        if tar is not None:
+            tar.close()
+        path = os.path.join(out_dir, f"{prefix}-{len(written):06d}{SHARD_EXTENSION}")
+        # GNU format: no per-member PAX header for readers to parse
+        tar = tarfile.open(path, mode="w", format=tarfile.GNU_FORMAT)
+        written.append(path)
+        size = count = 0
+
+    try:
+        for relative in paths if paths is not None else iter_images(root):
+            full = os.path.join(root, relative)
+            file_size = os.path.getsize(full)
+            if (
+                tar is None
+                or (size and size + file_size > shard_size_bytes)
+                or (max_samples and count >= max_samples)
+            ):
+                open_next()
+            key = os.path.splitext(relative)[0].replace(os.sep, "/")
+            ext = os.path.splitext(relative)[1].lower()
+            # Dots in the key would move the WebDataset extension boundary
+            key = key.replace(".", "_")
+            tar.add(full, arcname=key + ext, recursive=False)
+            size += file_size + 512
+            count += 1
+    finally:
+        if tar is not None:
+            tar.close()
+    logger.info("Packed shards", root=root, shards=len(written))
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tar shard utilities.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Pack a directory of images into shards")
+    pack.add_argument("input_dir")
+    pack.add_argument("output_dir")
+    pack.add_argument("--shard-size-mb", type=int, default=512)
+    pack.add_argument("--max-samples", type=int, default=0)
+    pack.add_argument("--prefix", default="shard")
+    args = parser.parse_args(argv)
+
+    shards = pack_directory(
+        args.input_dir,
+        args.output_dir,
+        shard_size_bytes=args.shard_size_mb * 1024 * 1024,
+        max_samples=args.max_samples,
+        prefix=args.prefix,
+    )
+    print(f"Wrote {len(shards)} shards to {args.output_dir}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+#!/usr/bin/env bash
+
+set -euo pipefail
+
+echo "🚀 Starting open-loop load test using poetry..."
+
+cd /workspaces/OI.AI.MLEng.TakeHome/tests
+
+# The harness file
+HARNESS_FILE="open_loop_load.py"
+
+# Check if the file exists
+if [[ ! -f "$HARNESS_FILE" ]]; then
+  echo "❌ Load harness not found: $HARNESS_FILE"
+  exit 1
+fi
+
+# Stepped arrival rates (requests/s) and seconds per step, overridable from env
+STEPS="${LOAD_TEST_STEPS:-5,10,20,40}"
+STEP_DURATION="${LOAD_TEST_STEP_DURATION:-30}"
+OUT_FILE="${LOAD_TEST_OUT:-locust_reports/open_loop_$(date +%Y%m%d_%H%M%S).json}"
+
+poetry run python "$HARNESS_FILE" run \
+  --steps "$STEPS" \
+  --step-duration "$STEP_DURATION" \
+  --out "$OUT_FILE"
+
+echo "✅ Run saved to tests/$OUT_FILE"
+echo "   Compare two runs with: poetry run python $HARNESS_FILE diff <baseline.json> <candidate.json>"
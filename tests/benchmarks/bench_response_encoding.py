@@ -0,0 +1,116 @@
+"""
+Serialization cost and size of batch classification responses per encoding.
+
+Builds a /predict_urls-style payload of `--sizes` results (a few of them
+errors) and times turning it into response bytes:
+  - "fastapi": what a route returning a dict costs, i.e. FastAPI's
+    `jsonable_encoder` (which rebuilds every nested dict) plus
+    JSONResponse.render,
+  - "json" / "rapidjson": encoding the payload directly,
+  - "msgpack": MessagePack, floats as float32,
+  - "*-columnar": the same with `layout=columnar` (one array per field),
+as done by app.api.v1.encoding.encode_response.
+
+Usage (from the repo root):
+    PYTHONPATH=. python tests/benchmarks/bench_response_encoding.py --sizes 1,64,1000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.api.v1 import encoding
+from app.api.v1.encoding import columnar, dumps_json, dumps_msgpack
+
+
+def make_payload(size: int) -> dict:
+    rng = np.random.default_rng(0)
+    results = []
+    for i in range(size):
+        url = f"https://store.example.com/survey/frame_{i:07d}.jpg"
+        if i % 50 == 49:
+            results.append(
+                {"url": url, "error": "Image not found.", "status_code": 404}
+            )
+            continue
+        results.append(
+            {
+                "url": url,
+                "result": {
+                    "class_id": f"n{rng.integers(1_000_000, 9_999_999):08d}",
+                    "class_name": "tiger_shark",
+                    "confidence": float(np.float32(rng.random())),
+                    "model_used": "ResNet50",
+                },
+            }
+        )
+    return {"results": results}
+
+
+def as_columns(payload: dict) -> dict:
+    results = payload["results"]
+    return {"count": len(results), "columns": columnar(results)}
+
+
+def fastapi_default(payload: dict) -> bytes:
+    return JSONResponse(content=None).render(jsonable_encoder(payload))
+
+
+def stdlib_json(payload: dict) -> bytes:
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+ENCODERS = {
+    "fastapi": fastapi_default,
+    "json": stdlib_json,
+    "rapidjson": dumps_json,
+    "msgpack": dumps_msgpack,
+    "json-columnar": lambda p: dumps_json(as_columns(p)),
+    "msgpack-columnar": lambda p: dumps_msgpack(as_columns(p)),
+}
+
+
+def timed(fn, payload: dict, seconds: float) -> tuple:
+    body = fn(payload)
+    runs = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(payload)
+        runs += 1
+    return (time.perf_counter() - start) / runs, len(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1,64,1000")
+    parser.add_argument("--seconds", type=float, default=1.0, help="per encoder")
+    args = parser.parse_args()
+
+    encoders = dict(ENCODERS)
+    if encoding.rapidjson is None:
+        print("python-rapidjson not installed: 'rapidjson' uses stdlib json")
+    if encoding.msgpack is None:
+        print("msgpack not installed: skipping MessagePack")
+        encoders = {k: v for k, v in encoders.items() if "msgpack" not in k}
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        payload = make_payload(size)
+        print(f"\n{size} results")
+        baseline = None
+        for label, fn in encoders.items():
+            elapsed, length = timed(fn, payload, args.seconds)
+            baseline = baseline or elapsed
+            print(
+                f"  {label:<18} {elapsed * 1e6:>10.1f} us {length:>10} bytes "
+                f"{baseline / elapsed:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
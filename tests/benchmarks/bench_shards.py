@@ -0,0 +1,103 @@
+"""
+Per-file reads vs. sequential tar-shard reads of many small JPEGs.
+
+Generates `--images` small JPEGs (or uses `--input-dir`), packs them into
+shards with app.pipeline.shards, then times:
+  - "files": walk the tree and open/read every file (what the offline CLI
+    and `{"path": ...}` job items do),
+  - "shards": stream the same bytes out of the shards with ShardReader,
+and optionally the same two sources through decode + resize (`--decode`).
+
+On local SSD with a warm page cache the two are close; the gap appears on
+network storage or a cold cache, where every open/stat/seek is a round trip.
+Drop caches between runs (`sync; echo 3 > /proc/sys/vm/drop_caches`) or point
+`--input-dir`/`--work-dir` at the network mount to see it.
+
+Usage (from the repo root):
+    PYTHONPATH=. python tests/benchmarks/bench_shards.py --images 5000 --decode
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.pipeline.offline import decode_image, iter_images
+from app.pipeline.shards import ShardReader, list_shards, pack_directory
+
+
+def make_images(root: str, count: int, size: int = 256) -> None:
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        directory = os.path.join(root, f"{i // 1000:04d}")
+        os.makedirs(directory, exist_ok=True)
+        pixels = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(directory, f"img_{i:07d}.jpg"))
+
+
+def read_files(root: str, decode: bool) -> int:
+    count = 0
+    for relative in iter_images(root):
+        with open(os.path.join(root, relative), "rb") as f:
+            data = f.read()
+        if decode:
+            decode_image(data, (224, 224))
+        count += 1
+    return count
+
+
+def read_shards(shard_dir: str, decode: bool) -> int:
+    count = 0
+    reader = ShardReader(list_shards(shard_dir))
+    for _, data in reader:
+        if decode:
+            decode_image(data, (224, 224))
+        count += 1
+    reader.close()
+    return count
+
+
+def timed(label: str, fn, *args) -> None:
+    start = time.perf_counter()
+    count = fn(*args)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<16} {count:>8} images {elapsed:>8.2f} s {count / elapsed:>10.0f} img/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=5000)
+    parser.add_argument("--input-dir", default="")
+    parser.add_argument("--work-dir", default="")
+    parser.add_argument("--shard-size-mb", type=int, default=64)
+    parser.add_argument("--decode", action="store_true")
+    args = parser.parse_args()
+
+    work = args.work_dir or tempfile.mkdtemp(prefix="bench_shards_")
+    root = args.input_dir or os.path.join(work, "images")
+    shard_dir = os.path.join(work, "shards")
+    try:
+        if not args.input_dir:
+            make_images(root, args.images)
+        pack_directory(
+            root, shard_dir, shard_size_bytes=args.shard_size_mb * 1024 * 1024
+        )
+
+        timed("files (read)", read_files, root, False)
+        timed("shards (read)", read_shards, shard_dir, False)
+        if args.decode:
+            timed("files (decode)", read_files, root, True)
+            timed("shards (decode)", read_shards, shard_dir, True)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Per-request overhead of the HTTP telemetry stack.
+
+Compares a bare FastAPI app against:
+  - "before": FastAPIInstrumentor + OpenTelemetryMiddleware + a BaseHTTPMiddleware
+    Prometheus hook (what app/main.py used to do),
+  - "after": the single pure-ASGI TelemetryMiddleware, at several sampling ratios.
+
+Requests are driven straight through the ASGI callable (no sockets, no HTTP
+client), so the numbers are the framework + telemetry cost only. Spans go
+through a BatchSpanProcessor into an exporter that drops them.
+
+Usage (from the repo root):
+    PYTHONPATH=. python tests/benchmarks/bench_telemetry_middleware.py --requests 5000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import FastAPI, Request
+from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+from app.config.middleware import TelemetryMiddleware, build_sampler
+from app.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS
+
+
+class DropExporter(SpanExporter):
+    def export(self, spans):
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def make_provider(ratio: float) -> TracerProvider:
+    provider = TracerProvider(sampler=build_sampler(ratio))
+    provider.add_span_processor(BatchSpanProcessor(DropExporter()))
+    return provider
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/v1/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def bare_app():
+    return make_app()
+
+
+def before_app():
+    provider = make_provider(1.0)
+    app = make_app()
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=provider)
+    app.add_middleware(OpenTelemetryMiddleware, tracer_provider=provider)
+
+    @app.middleware("http")
+    async def metrics_middleware(request: Request, call_next):
+        with HTTP_REQUEST_DURATION.labels(endpoint=request.url.path).time():
+            response = await call_next(request)
+        HTTP_REQUESTS.labels(
+            method=request.method,
+            endpoint=request.url.path,
+            http_status=response.status_code,
+        ).inc()
+        return response
+
+    return app
+
+
+def after_app(ratio: float):
+    def factory():
+        app = make_app()
+        app.add_middleware(TelemetryMiddleware, tracer_provider=make_provider(ratio))
+        return app
+
+    return factory
+
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/api/v1/ping",
+    "raw_path": b"/api/v1/ping",
+    "root_path": "",
+    "query_string": b"",
+    "headers": [(b"host", b"bench"), (b"user-agent", b"bench")],
+    "client": ("127.0.0.1", 1234),
+    "server": ("bench", 80),
+}
+
+
+async def drive(app, n: int) -> list:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    timings = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await app(dict(SCOPE), receive, send)
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+async def main(n: int, warmup: int) -> None:
+    scenarios = [
+        ("bare (no telemetry)", bare_app),
+        ("before: instrumentor+asgi+BaseHTTP", before_app),
+        ("after: TelemetryMiddleware ratio=1.0", after_app(1.0)),
+        ("after: TelemetryMiddleware ratio=0.1", after_app(0.1)),
+        ("after: TelemetryMiddleware ratio=0.0", after_app(0.0)),
+    ]
+    results = {}
+    for name, factory in scenarios:
+        app = factory()
+        await drive(app, warmup)
+        timings = await drive(app, n)
+        results[name] = (
+            statistics.mean(timings) * 1e6,
+            statistics.quantiles(timings, n=100)[98] * 1e6,
+        )
+
+    bare_mean = results["bare (no telemetry)"][0]
+    print(f"{'scenario':<40} {'mean µs':>9} {'p99 µs':>9} {'overhead µs':>12}")
+    for name, (mean, p99) in results.items():
+        print(f"{name:<40} {mean:9.1f} {p99:9.1f} {mean - bare_mean:12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telemetry middleware overhead")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.warmup))
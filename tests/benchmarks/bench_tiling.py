@@ -0,0 +1,90 @@
+"""
+Decode cost and tiles per second of tiled inference on high-resolution frames.
+
+Encodes a synthetic `--width`x`--height` JPEG (20 MP by default, a typical
+survey camera), then times:
+  - "decode": decode_tiles at each `--max-tiles` cap (the draft-mode decode,
+    resize and tile cutting /predict_tiled does once per request),
+  - "infer": the tiles of the default cap through `--backend` (see
+    app.pipeline.backends) in batches of each `--batch-sizes`, reporting
+    tiles per second.
+
+The Keras backend needs the ImageNet weights and the ONNX backend the export
+from scripts/prepare_triton_models.sh; `--backend none` runs only the decode
+part.
+
+Usage (from the repo root):
+    PYTHONPATH=. python tests/benchmarks/bench_tiling.py --backend onnx --batch-sizes 1,8,32,64
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.models.tiling import TILE_MAX_COUNT, TILE_OVERLAP, decode_tiles
+from app.pipeline.backends import BACKENDS
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    """Smooth gradients plus noise, so the JPEG is roughly photo-sized."""
+    rng = np.random.default_rng(0)
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([xs + 0 * ys, ys + 0 * xs, (xs + ys) / 2], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape).astype(np.float32)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(
+        buffer, format="JPEG", quality=90
+    )
+    return buffer.getvalue()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=5472)
+    parser.add_argument("--height", type=int, default=3648)
+    parser.add_argument("--size", type=int, default=224, help="tile edge")
+    parser.add_argument("--overlap", type=float, default=TILE_OVERLAP)
+    parser.add_argument("--max-tiles", default=f"16,{TILE_MAX_COUNT},256")
+    parser.add_argument("--backend", choices=[*BACKENDS, "none"], default="none")
+    parser.add_argument("--model", default="ResNet50")
+    parser.add_argument("--batch-sizes", default="1,8,32,64")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    image_data = make_jpeg(args.width, args.height)
+    size = (args.size, args.size)
+    print(f"{args.width}x{args.height} JPEG, {len(image_data) / 1e6:.1f} MB")
+
+    for max_tiles in (int(n) for n in args.max_tiles.split(",")):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            tiles = decode_tiles(image_data, size, args.overlap, max_tiles)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        print(
+            f"decode max_tiles={max_tiles:<4} {len(tiles.arrays):4d} tiles  "
+            f"scale {tiles.scale:.3f}  {elapsed * 1000:8.1f} ms"
+        )
+
+    if args.backend == "none":
+        return
+    backend = BACKENDS[args.backend](args.model)
+    tiles = decode_tiles(image_data, backend.input_size, args.overlap, TILE_MAX_COUNT)
+    backend.predict(tiles.arrays[:1])  # warm-up
+    for batch_size in (int(n) for n in args.batch_sizes.split(",")):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for start in range(0, len(tiles.arrays), batch_size):
+                backend.predict(tiles.arrays[start : start + batch_size])
+        elapsed = (time.perf_counter() - started) / args.repeat
+        print(
+            f"infer batch={batch_size:<4} {len(tiles.arrays) / elapsed:8.1f} tiles/s  "
+            f"{elapsed * 1000:8.1f} ms/frame"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Build time, query latency and recall of the memory-mapped vector index.
+
+Streams `--count` synthetic clustered embeddings of `--dim` dimensions (2048
+is the ResNet/Xception embedding size, 4096 VGG's) through VectorIndexWriter,
+then times single-image queries, as /api/v1/similar runs them:
+  - "exact": a blocked matrix product over every row,
+  - "ivf nprobe=N": only the N lists closest to the query,
+reporting p50/p99 latency and recall@k against the exact results.
+
+The first queries after a build read the rows from the page cache; with an
+index larger than RAM, or after dropping caches, IVF's advantage grows since
+it only touches nprobe/nlist of the file.
+
+Usage (from the repo root):
+    PYTHONPATH=. python tests/benchmarks/bench_vector_index.py --count 1000000 --dim 2048
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.models.vector_index import VectorIndexWriter, default_nlist
+
+CHUNK_ROWS = 50_000
+
+
+def write_index(directory: str, count: int, dim: int, nlist: int, seed: int = 0):
+    """Clustered rows (species-like groups), generated chunk by chunk."""
+    rng = np.random.default_rng(seed)
+    means = rng.normal(size=(max(16, count // 500), dim)).astype(np.float32)
+    writer = VectorIndexWriter(directory, dim, "synthetic")
+    started = time.perf_counter()
+    for start in range(0, count, CHUNK_ROWS):
+        rows = min(CHUNK_ROWS, count - start)
+        groups = rng.integers(0, len(means), size=rows)
+        chunk = means[groups] + 0.5 * rng.standard_normal((rows, dim), np.float32)
+        writer.add(chunk, [str(i) for i in range(start, start + rows)])
+    written = time.perf_counter() - started
+    index = writer.close(nlist=nlist)
+    print(
+        f"built {count} x {dim}: write {written:.1f}s, "
+        f"IVF ({index.nlist} lists) {time.perf_counter() - started - written:.1f}s"
+    )
+    return index, means
+
+
+def timed_queries(index, queries, k: int, nprobe: int):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, rows = index.search(query, k, nprobe)
+        latencies.append(time.perf_counter() - started)
+        results.append(set(rows[0]))
+    return np.array(latencies) * 1000, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--nlist", type=int, default=-1, help="-1 = default_nlist")
+    parser.add_argument("--nprobe", default="4,16,64")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--work-dir", default="")
+    args = parser.parse_args()
+
+    work = args.work_dir or tempfile.mkdtemp(prefix="bench_vector_index_")
+    nlist = default_nlist(args.count) if args.nlist < 0 else args.nlist
+    try:
+        index, means = write_index(
+            os.path.join(work, "index"), args.count, args.dim, nlist
+        )
+        rng = np.random.default_rng(1)
+        groups = rng.integers(0, len(means), size=args.queries)
+        queries = means[groups] + 0.5 * rng.standard_normal(
+            (args.queries, args.dim), np.float32
+        )
+
+        latencies, exact = timed_queries(index, queries, args.k, 0)
+        print(
+            f"{'exact':<16} p50 {np.percentile(latencies, 50):8.2f} ms  "
+            f"p99 {np.percentile(latencies, 99):8.2f} ms  recall@{args.k} 1.000"
+        )
+        for nprobe in (int(n) for n in args.nprobe.split(",")):
+            if not index.nlist or nprobe >= index.nlist:
+                continue
+            latencies, found = timed_queries(index, queries, args.k, nprobe)
+            recall = np.mean([len(f & e) / args.k for f, e in zip(found, exact)])
+            print(
+                f"{f'ivf nprobe={nprobe}':<16} p50 {np.percentile(latencies, 50):8.2f} ms  "
+                f"p99 {np.percentile(latencies, 99):8.2f} ms  recall@{args.k} {recall:.3f}"
+            )
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,793 @@
+"""
+Local stand-in for Triton: a KServe v2 inference server backed by ONNX Runtime.
+
+Speaks the parts of the KServe v2 protocol the API's Triton clients use, over
+HTTP (JSON and the binary tensor extension) and gRPC: health, server/model
+metadata, model config, infer, model statistics and the repository
+index/load/unload extension (explicit model control). The Triton client path
+(TritonMultiModel, TritonModelController, the pipeline's TritonBackend) can be
+load-tested, benchmarked and fault-tested without the triton_cpu container.
+
+Models come from an exported repository (`<repo>/<model>/<version>/model.onnx`,
+as written by scripts/prepare_triton_models.sh) and run with onnxruntime, or,
+with `--fake`, every backbone in app/models/onnx_export.py answers with
+deterministic fake predictions derived from the input pixels.
+
+Latency and errors can be injected per model, at startup or at runtime with
+`POST /faults` (not part of KServe):
+
+    {"latency_ms": 20, "jitter_ms": 5, "error_rate": 0.01,
+     "models": {"ResNet152V2": {"latency_ms": 80}}}
+
+Usage (from the repo root):
+    python tests/kserve_server.py --fake --port 8000 --grpc-port 8001
+    python tests/kserve_server.py --repo services/triton/models --model-control-mode explicit
+    python tests/kserve_server.py --fake --latency-ms 30 --jitter-ms 10 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.onnx_export import INPUT_SIZES  # noqa: E402
+
+SERVER_NAME = "kserve-stand-in"
+SERVER_VERSION = "0.1.0"
+HEADER_LENGTH = "Inference-Header-Content-Length"
+NUM_CLASSES = 1000
+
+DATATYPES = {
+    "BOOL": np.bool_,
+    "UINT8": np.uint8,
+    "INT8": np.int8,
+    "INT32": np.int32,
+    "INT64": np.int64,
+    "FP16": np.float16,
+    "FP32": np.float32,
+    "FP64": np.float64,
+}
+ORT_DATATYPES = {
+    "tensor(uint8)": "UINT8",
+    "tensor(float)": "FP32",
+    "tensor(int64)": "INT64",
+}
+
+
+class KServeError(Exception):
+    """A request failed; `status_code` is the HTTP status (gRPC maps it)."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def datatype_of(array: np.ndarray) -> str:
+    for name, dtype in DATATYPES.items():
+        if array.dtype == dtype:
+            return name
+    raise KServeError(f"Unsupported output dtype {array.dtype}")
+
+
+# -----------------------------------------------------------
+# Fault injection
+# -----------------------------------------------------------
+class Faults:
+    """
+    Injected latency (fixed + uniform jitter, in ms) and error rate, globally
+    and per model. A seeded RNG makes a run reproducible.
+    """
+
+    FIELDS = ("latency_ms", "jitter_ms", "error_rate")
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        models: Optional[Dict[str, dict]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.defaults = {
+            "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms,
+            "error_rate": error_rate,
+        }
+        self.models: Dict[str, dict] = models or {}
+        self.rng = random.Random(seed)
+
+    def update(self, settings: dict) -> None:
+        for field in self.FIELDS:
+            if field in settings:
+                self.defaults[field] = float(settings[field])
+        for name, overrides in (settings.get("models") or {}).items():
+            self.models[name] = {
+                f: float(v) for f, v in overrides.items() if f in self.FIELDS
+            }
+
+    def to_dict(self) -> dict:
+        return {**self.defaults, "models": self.models}
+
+    def _get(self, model_name: str, field: str) -> float:
+        return self.models.get(model_name, {}).get(field, self.defaults[field])
+
+    def delay(self, model_name: str) -> float:
+        """Seconds to add to one inference of `model_name`."""
+        latency = self._get(model_name, "latency_ms")
+        jitter = self._get(model_name, "jitter_ms")
+        return max(0.0, latency + self.rng.uniform(-jitter, jitter)) / 1000
+
+    def fails(self, model_name: str) -> bool:
+        return self.rng.random() < self._get(model_name, "error_rate")
+
+
+# -----------------------------------------------------------
+# Models
+# -----------------------------------------------------------
+def fake_predictions(batch: np.ndarray) -> np.ndarray:
+    """
+    Deterministic softmax-like scores per image: the top class is the pixel
+    sum modulo NUM_CLASSES, so identical images get identical predictions.
+    """
+    flat = batch.reshape(len(batch), -1).astype(np.int64)
+    top = flat.sum(axis=1) % NUM_CLASSES
+    scores = np.full((len(batch), NUM_CLASSES), 0.5 / (NUM_CLASSES - 1), np.float32)
+    scores[np.arange(len(batch)), top] = 0.5
+    return scores
+
+
+class Model:
+    """One served model: its signature, how it runs, and its statistics."""
+
+    def __init__(
+        self,
+        name: str,
+        input_size: Tuple[int, int],
+        path: str = "",
+        version: str = "1",
+        max_batch_size: int = 8,
+        input_datatype: str = "UINT8",
+    ):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.height, self.width = input_size
+        self.max_batch_size = max_batch_size
+        self.input_name = "input"
+        self.input_datatype = input_datatype
+        self.output_name = "predictions"
+        self.session = None
+        self.ready = False
+        self.success_count = 0
+        self.fail_count = 0
+        self.success_ns = 0
+        self.compute_ns = 0
+        self.execution_count = 0
+        self.last_inference_ms = 0
+
+    def load(self, threads: int = 0) -> None:
+        if self.path:
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.session = ort.InferenceSession(
+                self.path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            spec = self.session.get_inputs()[0]
+            self.input_name = spec.name
+            self.input_datatype = ORT_DATATYPES.get(spec.type, "FP32")
+            self.output_name = self.session.get_outputs()[0].name
+        self.ready = True
+
+    def unload(self) -> None:
+        self.session = None
+        self.ready = False
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        if self.session is None:
+            return fake_predictions(batch)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    # KServe documents ----------------------------------------------------
+    def metadata(self) -> dict:
+        return {
+            "name": self.name,
+            "versions": [self.version],
+            "platform": "onnxruntime_onnx",
+            "inputs": [
+                {
+                    "name": self.input_name,
+                    "datatype": self.input_datatype,
+                    "shape": [-1, self.height, self.width, 3],
+                }
+            ],
+            "outputs": [
+                {
+                    "name": self.output_name,
+                    "datatype": "FP32",
+                    "shape": [-1, NUM_CLASSES],
+                }
+            ],
+        }
+
+    def config(self) -> dict:
+        return {
+            "name": self.name,
+            "platform": "onnxruntime_onnx",
+            "backend": "onnxruntime",
+            "max_batch_size": self.max_batch_size,
+            "input": [
+                {
+                    "name": self.input_name,
+                    "data_type": f"TYPE_{self.input_datatype}",
+                    "dims": [self.height, self.width, 3],
+                }
+            ],
+            "output": [
+                {
+                    "name": self.output_name,
+                    "data_type": "TYPE_FP32",
+                    "dims": [NUM_CLASSES],
+                }
+            ],
+        }
+
+    def statistics(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "last_inference": self.last_inference_ms,
+            "inference_count": self.success_count,
+            "execution_count": self.execution_count,
+            "inference_stats": {
+                "success": {"count": self.success_count, "ns": self.success_ns},
+                "fail": {"count": self.fail_count, "ns": 0},
+                "queue": {"count": self.success_count, "ns": 0},
+                "compute_infer": {"count": self.execution_count, "ns": self.compute_ns},
+            },
+        }
+
+
+def _config_max_batch(model_dir: str, default: int) -> int:
+    try:
+        with open(os.path.join(model_dir, "config.pbtxt")) as f:
+            match = re.search(r"max_batch_size:\s*(\d+)", f.read())
+    except OSError:
+        return default
+    return int(match.group(1)) if match else default
+
+
+class ModelStore:
+    """
+    The models this server knows, whether they are loaded, and inference with
+    fault injection. Shared by the HTTP and gRPC front ends.
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, Model],
+        faults: Optional[Faults] = None,
+        explicit: bool = False,
+        load_delay: float = 0.0,
+        threads: int = 0,
+    ):
+        self.models = models
+        self.faults = faults or Faults()
+        self.explicit = explicit
+        self.load_delay = load_delay
+        self.threads = threads
+
+    @classmethod
+    def from_repository(cls, repo: str, max_batch_size: int = 8, **kwargs):
+        models = {}
+        for name in sorted(os.listdir(repo)):
+            model_dir = os.path.join(repo, name)
+            versions = (
+                sorted((v for v in os.listdir(model_dir) if v.isdigit()), key=int)
+                if os.path.isdir(model_dir)
+                else []
+            )
+            for version in reversed(versions):
+                path = os.path.join(model_dir, version, "model.onnx")
+                if os.path.exists(path):
+                    models[name] = Model(
+                        name,
+                        INPUT_SIZES.get(name, (224, 224)),
+                        path=path,
+                        version=version,
+                        max_batch_size=_config_max_batch(model_dir, max_batch_size),
+                    )
+                    break
+        return cls(models, **kwargs)
+
+    @classmethod
+    def fake(cls, max_batch_size: int = 8, **kwargs):
+        models = {
+            name: Model(name, size, max_batch_size=max_batch_size)
+            for name, size in INPUT_SIZES.items()
+        }
+        return cls(models, **kwargs)
+
+    def start(self, preload: Optional[List[str]] = None) -> None:
+        """Load every model (poll mode) or only `preload` (explicit mode)."""
+        names = self.models if not self.explicit else (preload or [])
+        for name in names:
+            self.get(name).load(self.threads)
+
+    def get(self, name: str) -> Model:
+        model = self.models.get(name)
+        if model is None:
+            raise KServeError(f"Request for unknown model: '{name}' is not found", 404)
+        return model
+
+    def ready_model(self, name: str) -> Model:
+        model = self.get(name)
+        if not model.ready:
+            raise KServeError(
+                f"Request for unknown model: '{name}' has no available versions", 400
+            )
+        return model
+
+    def index(self) -> List[dict]:
+        return [
+            {
+                "name": m.name,
+                "version": m.version,
+                "state": "READY" if m.ready else "UNAVAILABLE",
+                "reason": "" if m.ready else "unloaded",
+            }
+            for m in self.models.values()
+        ]
+
+    async def load(self, name: str) -> None:
+        if not self.explicit:
+            raise KServeError("explicit model load / unload is not allowed", 400)
+        model = self.get(name)
+        await asyncio.sleep(self.load_delay)
+        await asyncio.to_thread(model.load, self.threads)
+
+    async def unload(self, name: str) -> None:
+        if not self.explicit:
+            raise KServeError("explicit model load / unload is not allowed", 400)
+        self.get(name).unload()
+
+    async def infer(self, name: str, batch: np.ndarray) -> np.ndarray:
+        model = self.ready_model(name)
+        if batch.ndim != 4 or batch.shape[1:] != (model.height, model.width, 3):
+            raise KServeError(
+                f"unexpected shape for input '{model.input_name}' for model "
+                f"'{name}'. Expected [-1,{model.height},{model.width},3], got "
+                f"{list(batch.shape)}"
+            )
+        if model.max_batch_size and len(batch) > model.max_batch_size:
+            raise KServeError(
+                f"inference request batch-size must be <= {model.max_batch_size} "
+                f"for '{name}'"
+            )
+        expected = DATATYPES[model.input_datatype]
+        if batch.dtype != expected:
+            raise KServeError(
+                f"unexpected datatype {datatype_of(batch)} for input "
+                f"'{model.input_name}', expecting {model.input_datatype}"
+            )
+
+        started = time.perf_counter_ns()
+        delay = self.faults.delay(name)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.faults.fails(name):
+            model.fail_count += 1
+            raise KServeError(f"injected failure for model '{name}'", 500)
+        compute_start = time.perf_counter_ns()
+        output = await asyncio.to_thread(model.run, batch)
+        finished = time.perf_counter_ns()
+        model.execution_count += 1
+        model.success_count += len(batch)
+        model.success_ns += finished - started
+        model.compute_ns += finished - compute_start
+        model.last_inference_ms = int(time.time() * 1000)
+        return output
+
+
+# -----------------------------------------------------------
+# HTTP front end
+# -----------------------------------------------------------
+def _decode_inputs(header: dict, binary: bytes) -> List[Tuple[str, np.ndarray]]:
+    """Tensors of an infer request, from JSON `data` or the binary extension."""
+    tensors = []
+    offset = 0
+    for spec in header.get("inputs", []):
+        datatype = spec["datatype"]
+        if datatype not in DATATYPES:
+            raise KServeError(f"unsupported datatype {datatype}")
+        dtype = DATATYPES[datatype]
+        size = (spec.get("parameters") or {}).get("binary_data_size")
+        if size is not None:
+            raw = binary[offset : offset + size]
+            offset += size
+            array = np.frombuffer(raw, dtype=dtype)
+        else:
+            array = np.asarray(spec.get("data", []), dtype=dtype)
+        try:
+            tensors.append((spec["name"], array.reshape(spec["shape"])))
+        except ValueError:
+            raise KServeError(
+                f"input '{spec['name']}' has {array.size} elements, "
+                f"shape {spec['shape']} expected"
+            )
+    return tensors
+
+
+def _encode_response(
+    model: Model, request: dict, output: np.ndarray
+) -> Tuple[bytes, Optional[int]]:
+    """Infer response body and, when binary, the JSON header length."""
+    requested = request.get("outputs") or [{"name": model.output_name}]
+    binary_default = (request.get("parameters") or {}).get("binary_data_output", False)
+    outputs = []
+    chunks = []
+    for spec in requested:
+        if spec["name"] != model.output_name:
+            raise KServeError(f"unexpected inference output '{spec['name']}'")
+        entry = {
+            "name": model.output_name,
+            "datatype": datatype_of(output),
+            "shape": list(output.shape),
+        }
+        if (spec.get("parameters") or {}).get("binary_data", binary_default):
+            raw = np.ascontiguousarray(output).tobytes()
+            entry["parameters"] = {"binary_data_size": len(raw)}
+            chunks.append(raw)
+        else:
+            entry["data"] = output.flatten().tolist()
+        outputs.append(entry)
+    document = {
+        "model_name": model.name,
+        "model_version": model.version,
+        "outputs": outputs,
+    }
+    if "id" in request:
+        document["id"] = request["id"]
+    header = json.dumps(document).encode()
+    if not chunks:
+        return header, None
+    return header + b"".join(chunks), len(header)
+
+
+def create_app(store: ModelStore) -> FastAPI:
+    app = FastAPI(title=SERVER_NAME, docs_url=None, redoc_url=None)
+
+    @app.exception_handler(KServeError)
+    async def kserve_error(request: Request, exc: KServeError):
+        return JSONResponse({"error": str(exc)}, status_code=exc.status_code)
+
+    @app.get("/v2")
+    async def server_metadata():
+        return {
+            "name": SERVER_NAME,
+            "version": SERVER_VERSION,
+            "extensions": ["binary_tensor_data", "statistics", "model_repository"],
+        }
+
+    @app.get("/v2/health/live")
+    async def live():
+        return Response(status_code=200)
+
+    @app.get("/v2/health/ready")
+    async def ready():
+        return Response(status_code=200)
+
+    # Before the /v2/models/{name} routes, which would otherwise take
+    # /v2/models/stats as the metadata of a model named "stats"
+    @app.get("/v2/models/stats")
+    @app.get("/v2/models/{name}/stats")
+    @app.get("/v2/models/{name}/versions/{version}/stats")
+    async def model_stats(name: str = "", version: str = ""):
+        models = [store.get(name)] if name else list(store.models.values())
+        return {"model_stats": [m.statistics() for m in models]}
+
+    @app.get("/v2/models/{name}/ready")
+    @app.get("/v2/models/{name}/versions/{version}/ready")
+    async def model_ready(name: str, version: str = ""):
+        model = store.models.get(name)
+        return Response(status_code=200 if model is not None and model.ready else 400)
+
+    @app.get("/v2/models/{name}")
+    @app.get("/v2/models/{name}/versions/{version}")
+    async def model_metadata(name: str, version: str = ""):
+        return store.ready_model(name).metadata()
+
+    @app.get("/v2/models/{name}/config")
+    @app.get("/v2/models/{name}/versions/{version}/config")
+    async def model_config(name: str, version: str = ""):
+        return store.ready_model(name).config()
+
+    @app.post("/v2/repository/index")
+    async def repository_index():
+        return store.index()
+
+    @app.post("/v2/repository/models/{name}/load")
+    async def repository_load(name: str):
+        await store.load(name)
+        return Response(status_code=200)
+
+    @app.post("/v2/repository/models/{name}/unload")
+    async def repository_unload(name: str):
+        await store.unload(name)
+        return Response(status_code=200)
+
+    @app.post("/v2/models/{name}/infer")
+    @app.post("/v2/models/{name}/versions/{version}/infer")
+    async def infer(name: str, request: Request, version: str = ""):
+        body = await request.body()
+        header_length = request.headers.get(HEADER_LENGTH)
+        if header_length is not None:
+            length = int(header_length)
+            header, binary = json.loads(body[:length]), body[length:]
+        else:
+            header, binary = json.loads(body or b"{}"), b""
+        tensors = _decode_inputs(header, binary)
+        if len(tensors) != 1:
+            raise KServeError(
+                f"expected 1 input for model '{name}', got {len(tensors)}"
+            )
+        output = await store.infer(name, tensors[0][1])
+        content, length = _encode_response(store.get(name), header, output)
+        if length is None:
+            return Response(content, media_type="application/json")
+        return Response(
+            content,
+            media_type="application/octet-stream",
+            headers={HEADER_LENGTH: str(length)},
+        )
+
+    @app.get("/faults")
+    async def get_faults():
+        return store.faults.to_dict()
+
+    @app.post("/faults")
+    async def set_faults(request: Request):
+        store.faults.update(await request.json())
+        return store.faults.to_dict()
+
+    return app
+
+
+# -----------------------------------------------------------
+# gRPC front end (needs grpcio and tritonclient's gRPC stubs)
+# -----------------------------------------------------------
+def create_grpc_server(store: ModelStore, port: int):
+    """A grpc.aio server for `store` on `port` (not started)."""
+    import grpc
+    from tritonclient.grpc import service_pb2, service_pb2_grpc
+
+    codes = {
+        400: grpc.StatusCode.INVALID_ARGUMENT,
+        404: grpc.StatusCode.NOT_FOUND,
+        500: grpc.StatusCode.INTERNAL,
+    }
+
+    async def fail(context, exc: KServeError):
+        await context.abort(
+            codes.get(exc.status_code, grpc.StatusCode.UNKNOWN), str(exc)
+        )
+
+    class Servicer(service_pb2_grpc.GRPCInferenceServiceServicer):
+        async def ServerLive(self, request, context):
+            return service_pb2.ServerLiveResponse(live=True)
+
+        async def ServerReady(self, request, context):
+            return service_pb2.ServerReadyResponse(ready=True)
+
+        async def ModelReady(self, request, context):
+            model = store.models.get(request.name)
+            return service_pb2.ModelReadyResponse(
+                ready=model is not None and model.ready
+            )
+
+        async def ServerMetadata(self, request, context):
+            return service_pb2.ServerMetadataResponse(
+                name=SERVER_NAME,
+                version=SERVER_VERSION,
+                extensions=["binary_tensor_data", "statistics", "model_repository"],
+            )
+
+        async def ModelMetadata(self, request, context):
+            try:
+                meta = store.ready_model(request.name).metadata()
+            except KServeError as e:
+                await fail(context, e)
+            tensor = service_pb2.ModelMetadataResponse.TensorMetadata
+            return service_pb2.ModelMetadataResponse(
+                name=meta["name"],
+                versions=meta["versions"],
+                platform=meta["platform"],
+                inputs=[tensor(**t) for t in meta["inputs"]],
+                outputs=[tensor(**t) for t in meta["outputs"]],
+            )
+
+        async def RepositoryIndex(self, request, context):
+            entry = service_pb2.RepositoryIndexResponse.ModelIndex
+            return service_pb2.RepositoryIndexResponse(
+                models=[entry(**m) for m in store.index()]
+            )
+
+        async def RepositoryModelLoad(self, request, context):
+            try:
+                await store.load(request.model_name)
+            except KServeError as e:
+                await fail(context, e)
+            return service_pb2.RepositoryModelLoadResponse()
+
+        async def RepositoryModelUnload(self, request, context):
+            try:
+                await store.unload(request.model_name)
+            except KServeError as e:
+                await fail(context, e)
+            return service_pb2.RepositoryModelUnloadResponse()
+
+        async def ModelInfer(self, request, context):
+            try:
+                if len(request.inputs) != 1:
+                    raise KServeError(
+                        f"expected 1 input for model '{request.model_name}'"
+                    )
+                spec = request.inputs[0]
+                if spec.datatype not in DATATYPES:
+                    raise KServeError(f"unsupported datatype {spec.datatype}")
+                raw = request.raw_input_contents[0]
+                batch = np.frombuffer(raw, dtype=DATATYPES[spec.datatype]).reshape(
+                    list(spec.shape)
+                )
+                output = await store.infer(request.model_name, batch)
+                model = store.get(request.model_name)
+            except KServeError as e:
+                await fail(context, e)
+            except ValueError as e:
+                await fail(context, KServeError(str(e)))
+            tensor = service_pb2.ModelInferResponse.InferOutputTensor(
+                name=model.output_name,
+                datatype=datatype_of(output),
+                shape=list(output.shape),
+            )
+            return service_pb2.ModelInferResponse(
+                model_name=model.name,
+                model_version=model.version,
+                id=request.id,
+                outputs=[tensor],
+                raw_output_contents=[np.ascontiguousarray(output).tobytes()],
+            )
+
+    server = grpc.aio.server()
+    service_pb2_grpc.add_GRPCInferenceServiceServicer_to_server(Servicer(), server)
+    server.add_insecure_port(f"0.0.0.0:{port}")
+    return server
+
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+async def serve(store: ModelStore, host: str, port: int, grpc_port: int) -> None:
+    servers = []
+    if grpc_port:
+        try:
+            grpc_server = create_grpc_server(store, grpc_port)
+        except ImportError as e:
+            print(f"gRPC disabled: {e}", file=sys.stderr)
+        else:
+            await grpc_server.start()
+            servers.append(grpc_server.wait_for_termination())
+    http = uvicorn.Server(uvicorn.Config(create_app(store), host=host, port=port))
+    servers.append(http.serve())
+    await asyncio.gather(*servers)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RunningServer:
+    """
+    The stand-in's HTTP and gRPC front ends on free ports, served from a
+    background event loop for the duration of a `with` block (for tests).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.port, self.grpc_port = free_port(), free_port()
+        self.url = f"127.0.0.1:{self.port}"
+        self.loop = asyncio.new_event_loop()
+        self.http = uvicorn.Server(
+            uvicorn.Config(create_app(store), port=self.port, log_level="error")
+        )
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.grpc = asyncio.run_coroutine_threadsafe(self._start_grpc(), self.loop)
+        self.grpc = self.grpc.result(timeout=5)
+        asyncio.run_coroutine_threadsafe(self.http.serve(), self.loop)
+        deadline = time.monotonic() + 5
+        while not self.http.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self
+
+    async def _start_grpc(self):
+        server = create_grpc_server(self.store, self.grpc_port)
+        await server.start()
+        return server
+
+    def __exit__(self, *exc):
+        self.http.should_exit = True
+        asyncio.run_coroutine_threadsafe(self.grpc.stop(0), self.loop).result(5)
+        time.sleep(0.2)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--repo", help="exported model repository")
+    source.add_argument(
+        "--fake", action="store_true", help="serve fake predictions for every backbone"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--grpc-port", type=int, default=8001, help="0 disables gRPC")
+    parser.add_argument(
+        "--model-control-mode", choices=["poll", "explicit"], default="poll"
+    )
+    parser.add_argument(
+        "--load-model", action="append", default=[], help="loaded at start (explicit)"
+    )
+    parser.add_argument("--load-delay", type=float, default=0.0, help="seconds")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="ORT intra-op threads")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    options = dict(
+        faults=Faults(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed),
+        explicit=args.model_control_mode == "explicit",
+        load_delay=args.load_delay,
+        threads=args.threads,
+    )
+    if args.fake:
+        store = ModelStore.fake(args.max_batch_size, **options)
+    else:
+        store = ModelStore.from_repository(args.repo, args.max_batch_size, **options)
+    store.start(args.load_model)
+    print(
+        f"Serving {len(store.models)} models "
+        f"({sum(m.ready for m in store.models.values())} loaded) "
+        f"on :{args.port} (HTTP) and :{args.grpc_port} (gRPC)",
+        file=sys.stderr,
+    )
+    asyncio.run(serve(store, args.host, args.port, args.grpc_port))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""
+Open-loop load harness for the Marine Classifier API.
+
+Unlike the Locust user in `async_locust_scale_test.py` (closed loop: each user
+waits for its response, then sleeps 1-3s), this harness schedules requests at a
+fixed arrival rate regardless of how fast the server answers. Latency is
+measured from the *intended* send time, so a stalled server shows up as tail
+latency instead of silently lowering the request rate (coordinated omission).
+
+Usage:
+    python open_loop_load.py run --rate 20 --duration 60 --out run_a.json
+    python open_loop_load.py run --steps 5,10,20,40 --step-duration 30 --out run_b.json
+    python open_loop_load.py report run_a.json
+    python open_loop_load.py diff run_a.json run_b.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+# List of endpoints to test
+API_ENDPOINTS = [
+    "/api/v1/predict",
+    "/api/v1/smart_predict",
+    "/api/v1/triton_predict",
+]
+
+HOST = os.getenv("LOAD_TEST_HOST", "http://marine_classifier:29000")
+IMAGE_DIR = os.getenv("LOAD_TEST_IMAGE_DIR", "images")
+
+PERCENTILES = (50.0, 95.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram with bounded relative error.
+
+    Values are recorded in integer microseconds. Each value is rounded down to
+    a bucket that keeps `precision_bits` significant bits, so the relative
+    error is below 2 ** -(precision_bits - 1) (~0.1% for the default) while the
+    number of buckets grows only logarithmically with the value range.
+    """
+
+    def __init__(self, precision_bits: int = 11):
+        self.precision_bits = precision_bits
+        self.counts: Counter = Counter()
+        self.total = 0
+        self.max_us = 0
+
+    def _bucket(self, value_us: int) -> int:
+        shift = max(0, value_us.bit_length() - self.precision_bits)
+        return (value_us >> shift) << shift
+
+    def record(self, seconds: float) -> None:
+        value_us = max(0, int(seconds * 1_000_000))
+        self.counts[self._bucket(value_us)] += 1
+        self.total += 1
+        self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, pct: float) -> float:
+        """Return the latency (ms) at or below which `pct` percent of samples fall."""
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * self.total))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket / 1000.0
+        return self.max_us / 1000.0
+
+    def to_dict(self) -> dict:
+        return {
+            "precision_bits": self.precision_bits,
+            "max_us": self.max_us,
+            "counts": {str(k): v for k, v in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        hist = cls(precision_bits=data.get("precision_bits", 11))
+        hist.counts = Counter({int(k): v for k, v in data["counts"].items()})
+        hist.total = sum(hist.counts.values())
+        hist.max_us = data.get("max_us", 0)
+        return hist
+
+
+def load_payloads(image_dir: str) -> List[Tuple[str, bytes]]:
+    """
+    Read every test image into memory once, so the harness measures the
+    server rather than the client's disk.
+    """
+    payloads = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(image_dir, name), "rb") as f:
+                payloads.append((name, f.read()))
+    if not payloads:
+        raise SystemExit(f"No images found in {image_dir}")
+    return payloads
+
+
+class StepResult:
+    """Latency histogram and outcome counters for one endpoint at one rate."""
+
+    def __init__(self, endpoint: str, target_rate: float):
+        self.endpoint = endpoint
+        self.target_rate = target_rate
+        self.histogram = LatencyHistogram()
+        self.successes = 0
+        self.errors: Counter = Counter()
+        self.elapsed = 0.0
+
+    def summary(self) -> dict:
+        total = self.successes + sum(self.errors.values())
+        return {
+            "endpoint": self.endpoint,
+            "target_rate": self.target_rate,
+            "requests": total,
+            "successes": self.successes,
+            "errors": dict(self.errors),
+            "error_rate": (total - self.successes) / total if total else 0.0,
+            "throughput": self.successes / self.elapsed if self.elapsed else 0.0,
+            "latency_ms": {
+                f"p{pct:g}": self.histogram.percentile(pct) for pct in PERCENTILES
+            },
+            "max_ms": self.histogram.max_us / 1000.0,
+            "histogram": self.histogram.to_dict(),
+        }
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    payload: Tuple[str, bytes],
+    intended_start: float,
+    result: StepResult,
+) -> None:
+    name, data = payload
+    try:
+        response = await client.post(
+            endpoint, files={"file": (name, data, "image/jpeg")}
+        )
+        if response.status_code == 200:
+            result.successes += 1
+        else:
+            result.errors[f"http_{response.status_code}"] += 1
+    except httpx.TimeoutException:
+        result.errors["timeout"] += 1
+    except httpx.HTTPError as e:
+        result.errors[type(e).__name__] += 1
+    finally:
+        # Measured from the scheduled time, not the actual send time.
+        result.histogram.record(time.perf_counter() - intended_start)
+
+
+async def run_step(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    rate: float,
+    duration: float,
+    payloads: List[Tuple[str, bytes]],
+    max_in_flight: int,
+) -> StepResult:
+    """
+    Fire requests at `rate` per second for `duration` seconds. The schedule is
+    fixed up front; a slow server does not delay later sends. If more than
+    `max_in_flight` requests are outstanding the request is counted as a
+    client-side overload error instead of being sent, so the harness itself
+    cannot run out of sockets.
+    """
+    result = StepResult(endpoint, rate)
+    interval = 1.0 / rate
+    total = int(rate * duration)
+    tasks = set()
+    start = time.perf_counter()
+
+    for i in range(total):
+        intended = start + i * interval
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_in_flight:
+            result.errors["client_overload"] += 1
+            result.histogram.record(time.perf_counter() - intended)
+            continue
+        task = asyncio.create_task(
+            _send(client, endpoint, random.choice(payloads), intended, result)
+        )
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def run_load(args: argparse.Namespace) -> dict:
+    payloads = load_payloads(args.images)
+    rates = [float(r) for r in args.steps.split(",")] if args.steps else [args.rate]
+    duration = args.step_duration if args.steps else args.duration
+    limits = httpx.Limits(
+        max_connections=args.max_in_flight,
+        max_keepalive_connections=args.max_in_flight,
+    )
+    run = {
+        "host": args.host,
+        "started_at": time.time(),
+        "rates": rates,
+        "step_duration": duration,
+        "steps": [],
+    }
+    async with httpx.AsyncClient(
+        base_url=args.host, timeout=args.timeout, limits=limits
+    ) as client:
+        for endpoint in args.endpoints:
+            for rate in rates:
+                step = await run_step(
+                    client, endpoint, rate, duration, payloads, args.max_in_flight
+                )
+                summary = step.summary()
+                run["steps"].append(summary)
+                print(_format_step(summary))
+    run["endpoints"] = summarize_endpoints(run["steps"], args.slo_ms, args.max_errors)
+    return run
+
+
+def summarize_endpoints(steps: List[dict], slo_ms: float, max_errors: float) -> dict:
+    """
+    Merge per-step histograms into one distribution per endpoint and find the
+    saturation throughput: the best achieved throughput among steps whose p99
+    stayed under `slo_ms` and whose error rate stayed under `max_errors`.
+    """
+    endpoints: Dict[str, dict] = {}
+    for step in steps:
+        entry = endpoints.setdefault(
+            step["endpoint"],
+            {"histogram": LatencyHistogram(), "requests": 0, "successes": 0},
+        )
+        entry["histogram"].merge(LatencyHistogram.from_dict(step["histogram"]))
+        entry["requests"] += step["requests"]
+        entry["successes"] += step["successes"]
+
+    summary = {}
+    for endpoint, entry in endpoints.items():
+        ok_steps = [
+            s
+            for s in steps
+            if s["endpoint"] == endpoint
+            and s["latency_ms"]["p99"] <= slo_ms
+            and s["error_rate"] <= max_errors
+        ]
+        hist = entry["histogram"]
+        summary[endpoint] = {
+            "requests": entry["requests"],
+            "error_rate": (
+                1 - entry["successes"] / entry["requests"] if entry["requests"] else 0.0
+            ),
+            "latency_ms": {f"p{pct:g}": hist.percentile(pct) for pct in PERCENTILES},
+            "saturation_throughput": max(
+                (s["throughput"] for s in ok_steps), default=0.0
+            ),
+        }
+    return summary
+
+
+def diff_runs(baseline: dict, candidate: dict) -> Dict[str, dict]:
+    """
+    Compare per-endpoint summaries of two runs. Positive deltas mean the
+    candidate is slower / has more errors / more throughput.
+    """
+    diff = {}
+    for endpoint, new in candidate["endpoints"].items():
+        old = baseline["endpoints"].get(endpoint)
+        if old is None:
+            continue
+        entry = {}
+        for key, new_ms in new["latency_ms"].items():
+            old_ms = old["latency_ms"].get(key, 0.0)
+            entry[key] = {
+                "baseline_ms": old_ms,
+                "candidate_ms": new_ms,
+                "delta_pct": (new_ms - old_ms) / old_ms * 100 if old_ms else None,
+            }
+        entry["error_rate"] = {
+            "baseline": old["error_rate"],
+            "candidate": new["error_rate"],
+        }
+        entry["saturation_throughput"] = {
+            "baseline": old["saturation_throughput"],
+            "candidate": new["saturation_throughput"],
+        }
+        diff[endpoint] = entry
+    return diff
+
+
+def _format_step(step: dict) -> str:
+    lat = "  ".join(f"{k}={v:8.1f}ms" for k, v in step["latency_ms"].items())
+    return (
+        f"{step['endpoint']:<24} rate={step['target_rate']:6.1f}/s  "
+        f"thr={step['throughput']:6.1f}/s  err={step['error_rate'] * 100:5.1f}%  {lat}"
+    )
+
+
+def print_report(run: dict) -> None:
+    print("\nPer-endpoint summary:")
+    for endpoint, entry in run["endpoints"].items():
+        lat = "  ".join(f"{k}={v:8.1f}ms" for k, v in entry["latency_ms"].items())
+        print(
+            f"  {endpoint:<24} requests={entry['requests']:6d}  "
+            f"err={entry['error_rate'] * 100:5.1f}%  "
+            f"saturation={entry['saturation_throughput']:6.1f}/s  {lat}"
+        )
+
+
+def print_diff(diff: Dict[str, dict]) -> None:
+    print("\nBaseline → candidate:")
+    for endpoint, entry in diff.items():
+        print(f"  {endpoint}")
+        for key in (f"p{pct:g}" for pct in PERCENTILES):
+            d = entry[key]
+            pct = f"{d['delta_pct']:+6.1f}%" if d["delta_pct"] is not None else "   n/a"
+            print(
+                f"    {key:<6} {d['baseline_ms']:9.1f}ms → {d['candidate_ms']:9.1f}ms  {pct}"
+            )
+        e = entry["error_rate"]
+        s = entry["saturation_throughput"]
+        print(
+            f"    errors {e['baseline'] * 100:5.1f}% → {e['candidate'] * 100:5.1f}%   "
+            f"saturation {s['baseline']:.1f}/s → {s['candidate']:.1f}/s"
+        )
+
+
+def _load_run(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Drive a constant or stepped request rate")
+    run.add_argument("--host", default=HOST)
+    run.add_argument("--images", default=IMAGE_DIR)
+    run.add_argument("--endpoints", nargs="+", default=API_ENDPOINTS)
+    run.add_argument("--rate", type=float, default=10.0, help="Requests per second")
+    run.add_argument("--duration", type=float, default=60.0, help="Seconds")
+    run.add_argument(
+        "--steps", help="Comma separated rates for a stepped run, e.g. 5,10,20"
+    )
+    run.add_argument("--step-duration", type=float, default=30.0)
+    run.add_argument("--timeout", type=float, default=30.0)
+    run.add_argument("--max-in-flight", type=int, default=512)
+    run.add_argument("--slo-ms", type=float, default=1000.0, help="p99 target")
+    run.add_argument("--max-errors", type=float, default=0.01)
+    run.add_argument("--out", default="open_loop_run.json")
+
+    report = sub.add_parser("report", help="Print the summary of a saved run")
+    report.add_argument("run")
+
+    diff = sub.add_parser("diff", help="Compare two saved runs")
+    diff.add_argument("baseline")
+    diff.add_argument("candidate")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        result = asyncio.run(run_load(args))
+        with open(args.out, "w") as f:
+            json.dump(result, f)
+        print_report(result)
+        print(f"\nSaved run to {args.out}")
+    elif args.command == "report":
+        print_report(_load_run(args.run))
+    else:
+        print_diff(diff_runs(_load_run(args.baseline), _load_run(args.candidate)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI, status
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1.routes import admin
+from app.diagnostics.profiler import SamplingProfiler
+
+app = FastAPI()
+app.include_router(admin.router, prefix="/api/v1/admin")
+
+
+def _busy_worker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profiler_samples_other_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_worker, args=(stop,), name="busy-worker")
+    worker.start()
+    profiler = SamplingProfiler(hz=200)
+    profiler.start()
+    time.sleep(0.2)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert profiler.samples > 0
+    assert any(stack[0] == "busy-worker" for stack in profiler.stacks)
+    assert "_busy_worker" in profiler.to_collapsed()
+    assert not SamplingProfiler.is_running()
+
+
+def test_profiler_speedscope_export_is_consistent():
+    profiler = SamplingProfiler(hz=100)
+    profiler.stacks[("MainThread", "main (a.py:1)", "work (a.py:2)")] = 3
+    profiler.stacks[("MainThread", "main (a.py:1)")] = 1
+    doc = profiler.to_speedscope()
+
+    frames = doc["shared"]["frames"]
+    prof = doc["profiles"][0]
+    assert len(frames) == 3
+    assert len(prof["samples"]) == len(prof["weights"]) == 2
+    assert prof["endValue"] == pytest.approx(0.04)
+
+
+def test_only_one_session_at_a_time():
+    first = SamplingProfiler(hz=50)
+    first.start()
+    try:
+        with pytest.raises(RuntimeError):
+            SamplingProfiler(hz=50).start()
+    finally:
+        first.stop()
+
+
+@pytest.mark.asyncio
+async def test_admin_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/v1/admin/profile", params={"seconds": 0.05})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_admin_rejects_wrong_token(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/admin/profile",
+            params={"seconds": 0.05},
+            headers={"X-Admin-Token": "nope"},
+        )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint_returns_speedscope(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/admin/profile",
+            params={"seconds": 0.1, "hz": 100, "format": "speedscope"},
+            headers={"X-Admin-Token": "secret"},
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["profiles"][0]["type"] == "sampled"
+    assert int(response.headers["X-Profile-Samples"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint_caps_duration(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/admin/profile",
+            params={"seconds": 10_000},
+            headers={"X-Admin-Token": "secret"},
+        )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_loop_endpoint_lists_blocking_episodes(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(admin.loop_monitor, "episodes", [{"lag_seconds": 0.3}])
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get(
+            "/api/v1/admin/loop", headers={"X-Admin-Token": "secret"}
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["episodes"] == [{"lag_seconds": 0.3}]
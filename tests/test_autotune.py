@@ -0,0 +1,150 @@
+import json
+import os
+
+import numpy as np
+
+from app.config import autotune, server
+from app.models.multimodel import ModelManager
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_cgroup_v2_quota(tmp_path):
+    _write(str(tmp_path / "cpu.max"), "150000 100000\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) == 1.5
+
+    _write(str(tmp_path / "cpu.max"), "max 100000\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) is None
+
+
+def test_cgroup_v1_quota(tmp_path):
+    _write(str(tmp_path / "cpu" / "cpu.cfs_quota_us"), "200000\n")
+    _write(str(tmp_path / "cpu" / "cpu.cfs_period_us"), "100000\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) == 2.0
+
+    _write(str(tmp_path / "cpu" / "cpu.cfs_quota_us"), "-1\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) is None
+
+
+def test_available_cpus_respects_quota(monkeypatch):
+    monkeypatch.setattr(server.os, "sched_getaffinity", lambda _: set(range(16)))
+    monkeypatch.setattr(server, "cgroup_cpu_limit", lambda: 2.5)
+    assert server.available_cpus() == 3
+
+
+def test_candidates_stay_within_budget():
+    assert autotune.thread_candidates(1) == [(1, 1)]
+    pairs = autotune.thread_candidates(8)
+    assert {intra for intra, _ in pairs} == {1, 2, 4, 8}
+    assert autotune.executor_candidates(8, 4) == [1, 2, 8]
+
+
+def _cell(model, intra, inter, executors, batch, ips, p95):
+    return {
+        "model": model,
+        "intra": intra,
+        "inter": inter,
+        "executors": executors,
+        "batch": batch,
+        "images_per_second": ips,
+        "p50_ms": p95 / 2,
+        "p95_ms": p95,
+    }
+
+
+def test_select_best_prefers_throughput_within_slo():
+    measurements = [
+        # 4 threads x 1 executor: fast enough, moderate throughput
+        _cell("A", 4, 1, 1, 1, 40, 30),
+        _cell("B", 4, 1, 1, 1, 20, 60),
+        # 1 thread x 4 executors: more throughput, but B misses the SLO
+        _cell("A", 1, 1, 4, 1, 60, 80),
+        _cell("B", 1, 1, 4, 1, 30, 300),
+        # bulk batches with the 4-thread configuration
+        _cell("A", 4, 1, 1, 8, 90, 200),
+        _cell("B", 4, 1, 1, 8, 45, 400),
+        _cell("A", 4, 1, 1, 16, 80, 400),
+        _cell("B", 4, 1, 1, 16, 40, 800),
+    ]
+
+    settings = autotune.select_best(measurements, slo_ms=100)
+
+    assert settings["TF_NUM_INTRAOP_THREADS"] == 4
+    assert settings["THREADPOOL_SIZE"] == 1
+    assert settings["JOBS_BATCH_SIZE"] == 8
+    # Without an SLO the faster configuration wins
+    assert autotune.select_best(measurements, slo_ms=1000)["THREADPOOL_SIZE"] == 4
+
+
+def test_recommend_triton_majority_vote():
+    onnx = {"A": {1: 10, 2: 18, 4: 15}, "B": {1: 5, 2: 9, 4: 8}, "C": {4: 3, 2: 1}}
+    assert autotune.recommend_triton(onnx)["session_thread_pool_size"] == 2
+    assert autotune.recommend_triton({}) is None
+
+
+def test_measure_tensorflow_runs_grid(monkeypatch):
+    class FakeModel:
+        def predict(self, batch, batch_size, verbose):
+            return np.zeros((len(batch), 1000))
+
+    monkeypatch.setattr(
+        ModelManager, "get_model", classmethod(lambda cls, n: FakeModel())
+    )
+    results = autotune.measure_tensorflow(
+        2, 1, executors=[1, 2], batches=[1, 4], seconds=0.05, models=["ResNet50"]
+    )
+
+    assert [(r["executors"], r["batch"]) for r in results] == [(1, 1), (2, 1), (1, 4)]
+    assert all(r["images_per_second"] > 0 for r in results)
+    assert all(r["intra"] == 2 and r["inter"] == 1 for r in results)
+
+
+def test_prepare_searches_once_then_loads(tmp_path, monkeypatch):
+    path = str(tmp_path / "profile.json")
+    searches = []
+
+    def fake_search(workers):
+        searches.append(workers)
+        return {
+            "fingerprint": autotune.fingerprint(workers),
+            "settings": {"THREADPOOL_SIZE": 3, "TF_NUM_INTRAOP_THREADS": 2},
+            "triton": None,
+        }
+
+    monkeypatch.setattr(autotune, "search", fake_search)
+    for var in ("THREADPOOL_SIZE", "TF_NUM_INTRAOP_THREADS"):
+        # setenv first so the variables are restored after the test
+        monkeypatch.setenv(var, "")
+        monkeypatch.delenv(var)
+
+    assert autotune.prepare("off", path, workers=2) is None
+    assert autotune.prepare("load", path, workers=2) is None
+    autotune.prepare("auto", path, workers=2)
+    autotune.prepare("auto", path, workers=2)
+
+    assert searches == [2]
+    assert os.environ["THREADPOOL_SIZE"] == "3"
+    with open(path) as f:
+        assert json.load(f)["settings"]["TF_NUM_INTRAOP_THREADS"] == 2
+
+    # A different CPU budget (here: worker count) invalidates the profile
+    autotune.prepare("auto", path, workers=4)
+    assert searches == [2, 4]
+
+
+def test_prepare_search_mode_always_searches(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_search(workers):
+        calls.append(workers)
+        return {"fingerprint": {}, "settings": {}, "triton": None}
+
+    monkeypatch.setattr(autotune, "search", fake_search)
+    path = str(tmp_path / "p.json")
+    autotune.prepare("search", path, workers=1)
+    autotune.prepare("search", path, workers=1)
+    assert calls == [1, 1]
@@ -0,0 +1,137 @@
+import json
+import time
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+from app.diagnostics import critical_path
+from app.diagnostics.critical_path import (
+    ROOT_STAGE,
+    analyze,
+    group_traces,
+    read_spans,
+    span_files,
+    summarize_trace,
+)
+from app.diagnostics.span_export import FileSpanExporter
+
+MS = 1_000_000
+
+
+def _trace(trace_id, inference_ms, model="ResNet50", route="/api/v1/smart_predict"):
+    """Root 0..total: preprocessing 1..4 then inference 4..4+n, a 2 ms
+    health check running beside them, then 1 ms of response encoding."""
+    total = 5 + inference_ms
+
+    def span(span_id, parent, name, start, end, **attributes):
+        return {
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": parent,
+            "name": name,
+            "start_ns": start * MS,
+            "end_ns": end * MS,
+            "attributes": attributes,
+        }
+
+    return [
+        span(
+            "r",
+            None,
+            f"POST {route}",
+            0,
+            total,
+            **{"http.method": "POST", "http.route": route},
+        ),
+        span(
+            "m", "r", "triton_inference", 1, 4 + inference_ms, **{"model.name": model}
+        ),
+        span("p", "m", "preprocessing", 1, 4),
+        span("h", "m", "health_check", 1, 3),
+        span("i", "m", "inference_call", 4, 4 + inference_ms),
+    ]
+
+
+def test_critical_path_splits_duration_over_stages():
+    summary = summarize_trace(_trace("t", 10))
+    assert summary["endpoint"] == "POST /api/v1/smart_predict"
+    assert summary["model"] == "ResNet50"
+    assert summary["duration_ns"] == 15 * MS
+    # The health check overlaps preprocessing, so it is never on the path
+    assert summary["critical"] == {
+        ROOT_STAGE: 2 * MS,
+        "preprocessing": 3 * MS,
+        "inference_call": 10 * MS,
+    }
+    assert summary["stages"]["health_check"] == 2 * MS
+    assert sum(summary["critical"].values()) == summary["duration_ns"]
+
+
+def test_analyze_attributes_the_tail_to_the_slow_stage():
+    summaries = [summarize_trace(_trace(f"a{i}", 10)) for i in range(99)]
+    summaries.append(summarize_trace(_trace("slow", 110)))
+    summaries += [summarize_trace(_trace(f"v{i}", 5, model="VGG16")) for i in range(5)]
+
+    report = analyze(summaries, sort="tail")
+    assert [(g["model"], g["traces"]) for g in report] == [
+        ("ResNet50", 100),
+        ("VGG16", 5),
+    ]
+    stages = {s["stage"]: s for s in report[0]["stages"]}
+    assert report[0]["stages"][0]["stage"] == "inference_call"
+    assert stages["inference_call"]["tail_share"] == 1.0
+    assert stages["inference_call"]["correlation"] > 0.99
+    assert stages["preprocessing"]["tail_share"] == 0.0
+    assert stages["health_check"]["critical_share"] == 0.0
+    assert stages["health_check"]["count"] == 100
+    assert sum(s["critical_share"] for s in report[0]["stages"]) == pytest.approx(1.0)
+
+    by_endpoint = analyze(summaries, by=["endpoint"], min_traces=200)
+    assert by_endpoint == []
+
+
+def test_exported_spans_round_trip_through_the_analyzer(tmp_path, capsys):
+    provider = TracerProvider()
+    exporter = FileSpanExporter(str(tmp_path), max_bytes=2**20, max_files=5)
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+    for _ in range(3):
+        with tracer.start_as_current_span("POST /api/v1/predict") as root:
+            root.set_attribute("http.method", "POST")
+            root.set_attribute("http.route", "/api/v1/predict")
+            with tracer.start_as_current_span("inference_call") as span:
+                span.set_attribute("model.name", "VGG19")
+                time.sleep(0.002)
+    provider.shutdown()
+
+    files = span_files([str(tmp_path)])
+    assert len(files) == 1
+    traces = group_traces(read_spans(files))
+    assert len(traces) == 3
+    summary = summarize_trace(next(iter(traces.values())))
+    assert summary["model"] == "VGG19"
+    assert summary["critical"]["inference_call"] >= 2 * MS
+
+    assert critical_path.main([str(tmp_path), "--json", "--min-traces", "1"]) == 0
+    (group,) = json.loads(capsys.readouterr().out)
+    assert (group["endpoint"], group["model"], group["traces"]) == (
+        "POST /api/v1/predict",
+        "VGG19",
+        3,
+    )
+
+
+def test_exporter_rotates_and_prunes_files(tmp_path):
+    provider = TracerProvider()
+    exporter = FileSpanExporter(str(tmp_path), max_bytes=1, max_files=2)
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+    for i in range(5):
+        with tracer.start_as_current_span(f"span-{i}"):
+            pass
+    provider.shutdown()
+
+    files = span_files([str(tmp_path)])
+    assert len(files) <= 2
+    assert "span-4" in {span["name"] for span in read_spans(files)}
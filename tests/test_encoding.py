@@ -0,0 +1,127 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import msgpack
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1 import encoding
+from app.api.v1.encoding import columnar, dumps_json, negotiate
+from app.api.v1.routes import img_class
+from app.pipeline.fetcher import FetchError
+
+app = FastAPI()
+app.include_router(img_class.router, prefix="/api/v1")
+
+FAKE_OUT = {
+    "model_used": "ResNet50",
+    "predictions": [
+        {"class_id": "n01491361", "class_name": "tiger_shark", "confidence": 0.75},
+        {"class_id": "n02066245", "class_name": "grey_whale", "confidence": 0.125},
+    ],
+}
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, ("json", False)),
+        ("*/*", ("json", False)),
+        ("application/msgpack", ("msgpack", False)),
+        ("application/x-msgpack", ("msgpack", False)),
+        ("application/json; layout=columnar", ("json", True)),
+        ("application/msgpack;layout=columnar", ("msgpack", True)),
+        ("application/json;q=0.5, application/msgpack", ("msgpack", False)),
+        ("application/msgpack;q=0, application/json", ("json", False)),
+        ("application/json, application/msgpack", ("json", False)),
+        ("text/html", ("json", False)),
+    ],
+)
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_negotiate_without_msgpack(monkeypatch):
+    monkeypatch.setattr(encoding, "msgpack", None)
+    assert negotiate("application/msgpack, application/json;q=0.1") == (
+        "json",
+        False,
+    )
+
+
+def test_columnar_flattens_results_and_fills_gaps():
+    rows = [
+        {"url": "a", "result": {"class_name": "shark", "confidence": 0.5}},
+        {"url": "b", "error": "timeout", "status_code": 504},
+        {"url": "c", "result": {"class_name": "whale", "confidence": 0.25}},
+    ]
+    assert columnar(rows) == {
+        "url": ["a", "b", "c"],
+        "class_name": ["shark", None, "whale"],
+        "confidence": [0.5, None, 0.25],
+        "error": [None, "timeout", None],
+        "status_code": [None, 504, None],
+    }
+
+
+def test_dumps_json_handles_numpy_scalars():
+    assert dumps_json({"confidence": np.float32(0.5), "id": np.int64(3)}) == (
+        b'{"confidence":0.5,"id":3}'
+    )
+
+
+@pytest.mark.asyncio
+async def test_smart_predict_negotiates_msgpack():
+    files = {"file": ("shark.jpg", b"fake image data", "image/jpeg")}
+    with patch.object(
+        img_class.ModelManager, "classify_image", AsyncMock(return_value=FAKE_OUT)
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            default = await ac.post("/api/v1/smart_predict", files=files)
+            packed = await ac.post(
+                "/api/v1/smart_predict",
+                files=files,
+                headers={"Accept": "application/msgpack"},
+            )
+
+    assert default.headers["content-type"] == "application/json"
+    assert default.json()["result"]["class_name"] == "tiger_shark"
+    assert packed.status_code == 200
+    assert packed.headers["content-type"] == "application/msgpack"
+    assert packed.headers["vary"] == "Accept"
+    assert msgpack.unpackb(packed.content) == default.json()
+
+
+@pytest.mark.asyncio
+async def test_predict_urls_columnar_layout():
+    urls = ["http://store/a.jpg", "http://store/missing.jpg", "http://store/b.jpg"]
+
+    async def fetch(url):
+        if "missing" in url:
+            raise FetchError("Image not found.", 502)
+        return b"image"
+
+    fetcher = MagicMock(fetch=AsyncMock(side_effect=fetch))
+    with (
+        patch.object(img_class, "image_fetcher", fetcher),
+        patch.object(
+            img_class.ModelManager, "classify_image", AsyncMock(return_value=FAKE_OUT)
+        ),
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            rows = await ac.post("/api/v1/predict_urls", json={"urls": urls})
+            columns = await ac.post(
+                "/api/v1/predict_urls",
+                json={"urls": urls},
+                headers={"Accept": "application/msgpack; layout=columnar"},
+            )
+
+    assert columns.headers["content-type"] == "application/msgpack; layout=columnar"
+    body = msgpack.unpackb(columns.content)
+    assert body["count"] == 3
+    assert body["columns"] == columnar(rows.json()["results"])
+    assert body["columns"]["class_name"] == ["tiger_shark", None, "tiger_shark"]
+    assert body["columns"]["status_code"] == [None, 502, None]
@@ -0,0 +1,172 @@
+import functools
+import http.server
+import os
+import threading
+from unittest.mock import AsyncMock, patch
+from urllib.parse import quote, unquote
+
+import pytest
+from fastapi import FastAPI, status
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1.routes import img_class
+from app.pipeline.fetcher import FetchError, ImageFetcher, fetch_and_classify_many
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves IMAGE_DIR; /redirect/<target> answers 302 to the unquoted target."""
+
+    def do_GET(self):
+        if self.path.startswith("/redirect/"):
+            self.send_response(302)
+            self.send_header("Location", unquote(self.path[len("/redirect/") :]))
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def image_store():
+    """Local HTTP server standing in for the object store."""
+    handler = functools.partial(_QuietHandler, directory=IMAGE_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_fetch_returns_image_bytes(image_store):
+    fetcher = ImageFetcher()
+    data = await fetcher.fetch(f"{image_store}/shark.jpg")
+    await fetcher.aclose()
+
+    with open(os.path.join(IMAGE_DIR, "shark.jpg"), "rb") as f:
+        assert data == f.read()
+
+
+@pytest.mark.asyncio
+async def test_fetch_enforces_size_cap(image_store):
+    fetcher = ImageFetcher(max_bytes=1024)
+    with pytest.raises(FetchError) as exc:
+        await fetcher.fetch(f"{image_store}/shark.jpg")
+    await fetcher.aclose()
+    assert exc.value.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_fetch_maps_upstream_errors(image_store):
+    fetcher = ImageFetcher()
+    with pytest.raises(FetchError) as exc:
+        await fetcher.fetch(f"{image_store}/missing.jpg")
+    await fetcher.aclose()
+    assert exc.value.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_fetch_rejects_bad_scheme_and_disallowed_host():
+    fetcher = ImageFetcher(allowed_hosts=frozenset({"store.internal"}))
+    with pytest.raises(FetchError) as bad_scheme:
+        await fetcher.fetch("file:///etc/passwd")
+    with pytest.raises(FetchError) as bad_host:
+        await fetcher.fetch("http://169.254.169.254/latest")
+    assert bad_scheme.value.status_code == 400
+    assert bad_host.value.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_fetch_revalidates_every_redirect_hop(image_store):
+    fetcher = ImageFetcher(allowed_hosts=frozenset({"127.0.0.1"}), max_redirects=2)
+    # Relative and absolute redirects within the allow-list are followed
+    data = await fetcher.fetch(f"{image_store}/redirect/{quote('/shark.jpg')}")
+    with open(os.path.join(IMAGE_DIR, "shark.jpg"), "rb") as f:
+        assert data == f.read()
+
+    metadata = quote("http://169.254.169.254/latest/meta-data/", safe="")
+    with pytest.raises(FetchError) as off_list:
+        await fetcher.fetch(f"{image_store}/redirect/{metadata}")
+    assert off_list.value.status_code == 403
+
+    loop = quote(f"{image_store}/redirect/{quote('/shark.jpg', safe='')}", safe="")
+    hops = f"{image_store}/redirect/" + quote(f"/redirect/{loop}", safe="")
+    with pytest.raises(FetchError) as too_many:
+        await fetcher.fetch(hops)
+    assert too_many.value.status_code == 502
+    await fetcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_order_and_isolates_failures(image_store):
+    fetcher = ImageFetcher()
+    urls = [f"{image_store}/dolphin.jpg", f"{image_store}/nope.jpg"]
+
+    async def classify(data):
+        return {"result": {"size": len(data)}}
+
+    results = await fetch_and_classify_many(urls, fetcher.fetch, classify)
+    await fetcher.aclose()
+
+    assert [r["url"] for r in results] == urls
+    assert results[0]["result"]["size"] > 0
+    assert results[1]["status_code"] == 502
+
+
+app = FastAPI()
+app.include_router(img_class.router, prefix="/api/v1")
+
+FAKE_OUT = {
+    "model_used": "ResNet50",
+    "predictions": [
+        {"class_id": "n1", "class_name": "shark", "confidence": 0.8},
+        {"class_id": "n2", "class_name": "whale", "confidence": 0.1},
+    ],
+}
+
+
+@pytest.mark.asyncio
+async def test_predict_url_endpoint(image_store):
+    with (
+        patch.object(img_class, "image_fetcher", ImageFetcher()),
+        patch.object(
+            img_class.ModelManager, "classify_image", AsyncMock(return_value=FAKE_OUT)
+        ),
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            ok = await ac.post(
+                "/api/v1/predict_url", json={"url": f"{image_store}/shark.jpg"}
+            )
+            missing = await ac.post(
+                "/api/v1/predict_url", json={"url": f"{image_store}/missing.jpg"}
+            )
+
+    assert ok.status_code == status.HTTP_200_OK
+    assert ok.json()["result"]["class_name"] == "shark"
+    assert ok.json()["result"]["model_used"] == "ResNet50"
+    assert missing.status_code == status.HTTP_502_BAD_GATEWAY
+
+
+@pytest.mark.asyncio
+async def test_predict_urls_endpoint(image_store):
+    urls = [f"{image_store}/{name}" for name in ("shark.jpg", "whale.jpg", "x.jpg")]
+    with (
+        patch.object(img_class, "image_fetcher", ImageFetcher()),
+        patch.object(
+            img_class.ModelManager, "classify_image", AsyncMock(return_value=FAKE_OUT)
+        ),
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.post("/api/v1/predict_urls", json={"urls": urls})
+
+    results = response.json()["results"]
+    assert response.status_code == status.HTTP_200_OK
+    assert [r["url"] for r in results] == urls
+    assert "result" in results[0] and "result" in results[1]
+    assert results[2]["status_code"] == 502
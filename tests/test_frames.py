@@ -0,0 +1,174 @@
+import io
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+
+from app.api.v1.routes import frames as frames_route
+from app.models.multimodel import ModelManager
+from app.pipeline.frames import (
+    FrameSequenceError,
+    JpegStreamSplitter,
+    classify_frames,
+    dedup_sources,
+    dhash,
+)
+
+
+def _frame(shift=0, size=(160, 120)):
+    """A horizontal gradient with a dark block, shifted right by `shift` pixels."""
+    width, height = size
+    pixels = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    pixels[40:80, 20 + shift : 60 + shift] = 0
+    buffer = io.BytesIO()
+    Image.fromarray(np.stack([pixels] * 3, axis=-1)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _with_exif_thumbnail(jpeg: bytes) -> bytes:
+    """Insert an APP1 segment holding a complete JPEG, EOI marker included."""
+    thumbnail = _frame(size=(16, 12))
+    payload = b"Exif\x00\x00" + thumbnail
+    segment = b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+    return jpeg[:2] + segment + jpeg[2:]
+
+
+def test_splitter_cuts_frames_from_arbitrary_chunks():
+    frames = [_with_exif_thumbnail(_frame(0)), _frame(30), _frame(60)]
+    stream = b"".join(
+        b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + f + b"\r\n" for f in frames
+    )
+    splitter = JpegStreamSplitter()
+    out = []
+    for start in range(0, len(stream), 777):
+        out.extend(splitter.feed(stream[start : start + 777]))
+    assert out == frames
+
+    # Raw concatenation, fed in one piece
+    assert JpegStreamSplitter().feed(b"".join(frames)) == frames
+
+
+def test_splitter_caps_unterminated_frames_and_total_bytes():
+    frame = _frame(0)
+    splitter = JpegStreamSplitter(max_frame_bytes=len(frame) + 100)
+    # A frame that opens and never reaches EOI
+    assert splitter.feed(frame[:-2]) == []
+    with pytest.raises(FrameSequenceError) as exc:
+        splitter.feed(b"\x00" * 200)
+    assert exc.value.status_code == 413
+
+    splitter = JpegStreamSplitter(max_bytes=2 * len(frame))
+    assert len(splitter.feed(frame + frame)) == 2
+    with pytest.raises(FrameSequenceError):
+        splitter.feed(b"\x00")
+
+
+def test_dedup_reuses_the_last_inferred_frame():
+    same, moved = dhash(_frame(0)), dhash(_frame(60))
+    assert (same ^ dhash(_frame(1))).bit_count() <= 4
+    assert (same ^ moved).bit_count() > 4
+    with pytest.raises(ValueError):
+        dhash(b"not an image")
+
+    sources = dedup_sources([same, same, moved, moved, same], max_distance=4)
+    assert sources == [0, 0, 2, 2, 4]
+    # Undecodable frames always run and are never reused
+    assert dedup_sources([same, None, same], max_distance=4) == [0, 1, 0]
+    # Compared with the last inferred frame, not the previous one, so small
+    # steps can't drift arbitrarily far
+    steps = [0b0, 0b1, 0b11, 0b111]
+    assert dedup_sources(steps, max_distance=2) == [0, 0, 0, 3]
+
+
+@pytest.mark.asyncio
+async def test_classify_frames_runs_only_changed_frames():
+    batches = []
+
+    async def classify_batch(images, model_name=None):
+        batches.append((len(images), model_name))
+        return [
+            (
+                {"error": "Could not decode image bytes"}
+                if image == b"broken"
+                else {"model_used": model_name, "predictions": [{"class_name": "ray"}]}
+            )
+            for image in images
+        ]
+
+    sequence = [_frame(0)] * 5 + [_frame(60)] * 4 + [b"broken"]
+    result = await classify_frames(sequence, classify_batch, "ResNet50", batch_size=2)
+
+    # Every batch runs on the model chosen for the sequence
+    assert batches == [(2, "ResNet50"), (1, "ResNet50")]
+    assert result["model_used"] == "ResNet50"
+    assert (result["frame_count"], result["inferred"]) == (10, 3)
+    assert result["inferred_share"] == 0.3
+    assert [f["source"] for f in result["frames"]] == [0] * 5 + [5] * 4 + [9]
+    assert result["frames"][3]["predictions"] == result["frames"][0]["predictions"]
+    assert result["frames"][9] == {
+        "frame": 9,
+        "source": 9,
+        "error": "Could not decode image bytes",
+    }
+
+
+@pytest.mark.asyncio
+async def test_predict_frames_endpoint(monkeypatch):
+    models = iter(["ResNet50", "ResNet152V2"])
+    used = []
+
+    async def classify_batch(images, model_name=None):
+        used.append(model_name)
+        return [{"model_used": model_name, "predictions": []} for _ in images]
+
+    monkeypatch.setattr(ModelManager, "classify_batch", classify_batch)
+    monkeypatch.setattr(
+        ModelManager, "_choose_model_by_cpu", classmethod(lambda cls: next(models))
+    )
+    monkeypatch.setattr(frames_route, "FRAME_MAX_BYTES", 50_000)
+    monkeypatch.setattr(frames_route, "FRAME_SEQUENCE_MAX_FRAMES", 4)
+    app = FastAPI()
+    app.include_router(frames_route.router, prefix="/api/v1")
+    sequence = [_frame(0), _frame(0), _frame(60)]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        multipart = await ac.post(
+            "/api/v1/predict_frames",
+            files=[
+                ("files", (f"{i}.jpg", f, "image/jpeg")) for i, f in enumerate(sequence)
+            ],
+        )
+        mjpeg = await ac.post(
+            "/api/v1/predict_frames?max_distance=0",
+            content=b"".join(sequence),
+            headers={"Content-Type": "video/x-motion-jpeg"},
+        )
+        too_many = await ac.post(
+            "/api/v1/predict_frames",
+            content=b"".join(sequence * 2),
+            headers={"Content-Type": "video/x-motion-jpeg"},
+        )
+        unterminated = await ac.post(
+            "/api/v1/predict_frames",
+            content=sequence[0][:-2] + b"\x00" * 60_000,
+            headers={"Content-Type": "video/x-motion-jpeg"},
+        )
+        empty = await ac.post(
+            "/api/v1/predict_frames",
+            content=b"no frames here",
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
+    assert multipart.status_code == 200
+    assert multipart.json()["inferred"] == 2
+    assert multipart.json()["model_used"] == "ResNet50" and used[0] == "ResNet50"
+    assert [f["source"] for f in multipart.json()["frames"]] == [0, 0, 2]
+    assert mjpeg.status_code == 200 and mjpeg.json()["frame_count"] == 3
+    # The model is chosen once per request, not per batch
+    assert mjpeg.json()["model_used"] == "ResNet152V2"
+    assert too_many.status_code == 413
+    assert unterminated.status_code == 413
+    assert empty.status_code == 400
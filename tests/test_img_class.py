@@ -1,3 +1,4 @@
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -5,6 +6,8 @@ from fastapi import FastAPI, status
 from httpx import ASGITransport, AsyncClient
 
 from app.api.v1.routes.img_class import return_the_highest_confidence, router
+from app.models.multimodel import RESNET_PREDICT_MODEL, model_registry
+from app.models.registry import ModelBudgetError
 
 # Setup FastAPI app for testing
 
@@ -99,3 +102,33 @@ async def test_predict_internal_error(mock_resnet):
         response = await ac.post("/api/v1/predict", files=files)
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
     assert "unexpected error" in response.json()["detail"].lower()
+
+
+@pytest.mark.asyncio
+@patch("app.api.v1.routes.img_class.resnet")
+async def test_predict_runs_off_the_event_loop(mock_resnet):
+    threads = []
+
+    def classify_image(data):
+        threads.append(threading.get_ident())
+        return {
+            "predictions": [{"class_id": "1", "class_name": "cat", "confidence": 1}]
+        }
+
+    mock_resnet.classify_image = MagicMock(side_effect=classify_image)
+    files = {"file": ("test.jpg", b"fake image data", "image/jpeg")}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        ok = await ac.post("/api/v1/predict", files=files)
+        mock_resnet.classify_image = MagicMock(
+            side_effect=ModelBudgetError("ResNet50 does not fit")
+        )
+        over_budget = await ac.post("/api/v1/predict", files=files)
+
+    assert ok.status_code == status.HTTP_200_OK
+    assert threads and threads[0] != threading.get_ident()
+    assert over_budget.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_predict_model_is_pinned():
+    assert RESNET_PREDICT_MODEL in model_registry.pinned
@@ -0,0 +1,240 @@
+import asyncio
+import io
+import json
+import os
+from contextlib import nullcontext
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, status
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+
+from app.api.v1.routes import jobs
+from app.models.multimodel import ModelManager
+from app.pipeline import jobs as jobs_pipeline
+from app.pipeline.fetcher import ImageFetcher
+from app.pipeline.jobs import JobError, JobManager
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+
+
+class _Stage:
+    def time(self):
+        return nullcontext()
+
+
+def _stage(**_):
+    return _Stage()
+
+
+def _fake_backend(calls):
+    async def classify_batch(images):
+        calls.append(len(images))
+        await asyncio.sleep(0)
+        return [
+            {"model_used": "fake", "predictions": [{"size": len(data)}]}
+            for data in images
+        ]
+
+    return classify_batch
+
+
+def _manager(tmp_path, calls, **kwargs):
+    return JobManager(
+        backends={"smart": _fake_backend(calls)},
+        fetcher=ImageFetcher(),
+        spool_dir=str(tmp_path / "spool"),
+        local_root=IMAGE_DIR,
+        **kwargs,
+    )
+
+
+async def _collect(manager, job):
+    return [json.loads(line) async for line in manager.stream(job)]
+
+
+@pytest.mark.asyncio
+async def test_job_classifies_in_batches_and_streams_ndjson(tmp_path):
+    calls = []
+    manager = _manager(tmp_path, calls, batch_size=2)
+    manager.start()
+    items = [{"path": name} for name in ("shark.jpg", "whale.jpg", "dolphin.jpg")]
+    job = manager.submit(items, "smart")
+    lines = await asyncio.wait_for(_collect(manager, job), timeout=10)
+    await manager.stop()
+
+    assert calls == [2, 1]
+    results = [line for line in lines if line["type"] == "result"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert [r["source"] for r in results] == ["shark.jpg", "whale.jpg", "dolphin.jpg"]
+    assert any(line["type"] == "progress" for line in lines)
+    assert lines[-1]["type"] == "summary"
+    assert lines[-1]["status"] == "completed"
+    assert lines[-1]["processed"] == 3
+
+
+@pytest.mark.asyncio
+async def test_results_are_spilled_to_disk_and_resumable(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_pipeline, "RESULTS_CHECKPOINT_EVERY", 2)
+    manager = _manager(tmp_path, [], batch_size=3)
+    manager.start()
+    job = manager.submit([{"path": "shark.jpg"}] * 7, "smart")
+    lines = await asyncio.wait_for(_collect(manager, job), timeout=10)
+
+    assert not hasattr(job, "results")
+    assert job.results_path.startswith(manager.spool_dir)
+    with open(job.results_path) as f:
+        on_disk = [json.loads(line) for line in f]
+    assert on_disk == [line for line in lines if line["type"] == "result"]
+    assert [r["index"] for r in on_disk] == list(range(7))
+
+    # Resuming seeks to the nearest checkpoint and skips to `start`
+    for start in (0, 3, 4, 6, 7):
+        resumed = [json.loads(line) async for line in manager.stream(job, start=start)]
+        assert [r["index"] for r in resumed if r["type"] == "result"] == list(
+            range(start, 7)
+        )
+        assert resumed[-1]["type"] == "summary"
+
+    # The results file goes with the job
+    monkeypatch.setattr(jobs_pipeline, "JOBS_RETENTION_SECONDS", -1)
+    manager._expire_old_jobs()
+    await manager.stop()
+    assert not os.path.exists(job.results_path)
+    assert job.id not in manager.jobs
+
+
+@pytest.mark.asyncio
+async def test_failed_items_are_reported_without_failing_the_job(tmp_path):
+    calls = []
+    manager = _manager(tmp_path, calls, batch_size=4)
+    manager.start()
+    job = manager.submit([{"path": "shark.jpg"}, {"path": "missing.jpg"}], "smart")
+    lines = await asyncio.wait_for(_collect(manager, job), timeout=10)
+    await manager.stop()
+
+    assert calls == [1]
+    assert "predictions" in lines[0]
+    assert "error" in lines[1]
+    assert lines[-1]["status"] == "completed"
+    assert lines[-1]["failed"] == 1
+
+
+def test_paths_outside_local_root_are_rejected(tmp_path):
+    manager = _manager(tmp_path, [])
+    with pytest.raises(JobError) as exc:
+        manager.validate_items([{"path": "../../etc/passwd"}])
+    assert exc.value.status_code == 403
+
+    disabled = JobManager({}, ImageFetcher(), local_root="")
+    with pytest.raises(JobError) as exc:
+        disabled.validate_items([{"path": "shark.jpg"}])
+    assert exc.value.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_queue_full_returns_429(tmp_path):
+    manager = _manager(tmp_path, [], max_concurrent=0, max_queued=1)
+    manager.start()
+    manager.submit([{"path": "shark.jpg"}], "smart")
+    with pytest.raises(JobError) as exc:
+        manager.submit([{"path": "shark.jpg"}], "smart")
+    await manager.stop()
+    assert exc.value.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_job(tmp_path):
+    started = asyncio.Event()
+
+    async def slow_backend(images):
+        started.set()
+        await asyncio.sleep(60)
+
+    manager = JobManager(
+        {"smart": slow_backend}, ImageFetcher(), local_root=IMAGE_DIR, batch_size=1
+    )
+    manager.start()
+    job = manager.submit([{"path": "shark.jpg"}] * 3, "smart")
+    await asyncio.wait_for(started.wait(), timeout=10)
+    await manager.cancel(job.id)
+    lines = await asyncio.wait_for(_collect(manager, job), timeout=10)
+    await manager.stop()
+
+    assert lines[-1]["status"] == "cancelled"
+
+
+def test_prepare_batch_reports_undecodable_images():
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(buffer, format="PNG")
+    info = {"input_size": (8, 8), "preprocess": lambda x: x / 255.0}
+
+    batch, errors = ModelManager._prepare_batch(
+        [buffer.getvalue(), b"not an image", buffer.getvalue()], info, _stage
+    )
+
+    assert batch.shape == (2, 8, 8, 3)
+    assert batch.dtype == np.float32
+    assert list(errors) == [1]
+
+
+app = FastAPI()
+app.include_router(jobs.router, prefix="/api/v1")
+
+
+@pytest.mark.asyncio
+async def test_upload_job_endpoints(tmp_path, monkeypatch):
+    calls = []
+    manager = _manager(tmp_path, calls)
+    monkeypatch.setattr(jobs, "job_manager", manager)
+    manager.start()
+
+    with open(os.path.join(IMAGE_DIR, "shark.jpg"), "rb") as f:
+        image = f.read()
+    files = [
+        ("files", ("a.jpg", image, "image/jpeg")),
+        ("files", ("b.jpg", image, "image/jpeg")),
+    ]
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        created = await ac.post("/api/v1/jobs/upload", files=files)
+        job_id = created.json()["job_id"]
+        streamed = await ac.get(f"/api/v1/jobs/{job_id}/results")
+        summary = await ac.get(f"/api/v1/jobs/{job_id}")
+        bad_type = await ac.post(
+            "/api/v1/jobs/upload", files=[("files", ("a.txt", b"x", "text/plain"))]
+        )
+        unknown = await ac.get("/api/v1/jobs/does-not-exist")
+    await manager.stop()
+
+    assert created.status_code == status.HTTP_202_ACCEPTED
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert [r["source"] for r in lines if r["type"] == "result"] == ["a.jpg", "b.jpg"]
+    assert summary.json()["status"] == "completed"
+    assert calls == [2]
+    # The spooled uploads are removed once the job is done
+    assert not os.path.exists(os.path.join(manager.spool_dir, job_id))
+    assert bad_type.status_code == status.HTTP_400_BAD_REQUEST
+    assert unknown.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_manifest_job_validation(tmp_path, monkeypatch):
+    manager = _manager(tmp_path, [])
+    monkeypatch.setattr(jobs, "job_manager", manager)
+    manager.start()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        ok = await ac.post("/api/v1/jobs", json={"items": [{"path": "shark.jpg"}]})
+        both = await ac.post(
+            "/api/v1/jobs", json={"items": [{"path": "a.jpg", "url": "http://x/a"}]}
+        )
+        escape = await ac.post("/api/v1/jobs", json={"items": [{"path": "../x.jpg"}]})
+    await manager.stop()
+
+    assert ok.status_code == status.HTTP_202_ACCEPTED
+    assert both.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert escape.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,152 @@
+import io
+import time
+
+import numpy as np
+import pytest
+import tritonclient.grpc as grpcclient
+from kserve_server import Faults, ModelStore, RunningServer
+from PIL import Image
+
+from app.models.triton_control import TritonModelController
+from app.models.tritonservice import (
+    ThreadLocalClient,
+    TritonModelUnavailable,
+    TritonMultiModel,
+)
+
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_triton_client_path_against_stand_in():
+    store = ModelStore.fake(max_batch_size=4)
+    store.start()
+    with RunningServer(store) as server:
+        triton = TritonMultiModel(triton_url=server.url, model_control="poll")
+        result = await triton.classify_image(_jpeg((10, 120, 200)))
+        assert result["model_used"] in TritonMultiModel.MODEL_INFO
+        assert len(result["predictions"]) == 5
+        assert result["predictions"][0]["confidence"] == pytest.approx(0.5)
+
+        model = store.models["ResNet50"]
+        before = (model.execution_count, model.success_count)
+        images = [_jpeg((i * 20, 0, 0)) for i in range(6)] + [b"not an image"]
+        results = await triton.classify_batch(images, model_name="ResNet50")
+        assert [r.get("model_used") for r in results[:6]] == ["ResNet50"] * 6
+        assert "error" in results[6]
+        # Split to fit the model's max_batch_size of 4
+        assert model.execution_count - before[0] == 2
+        assert model.success_count - before[1] == 6
+
+
+def test_statistics_of_all_models_and_of_one():
+    store = ModelStore.fake()
+    store.start()
+    with RunningServer(store) as server:
+        client = ThreadLocalClient(server.url)
+        every = client.get_inference_statistics()
+        one = client.get_inference_statistics("ResNet50")
+
+    assert {m["name"] for m in every["model_stats"]} == set(store.models)
+    assert [m["name"] for m in one["model_stats"]] == ["ResNet50"]
+
+
+@pytest.mark.asyncio
+async def test_injected_errors_and_latency_reach_the_client():
+    store = ModelStore.fake(faults=Faults(latency_ms=50, seed=0))
+    store.start()
+    with RunningServer(store) as server:
+        triton = TritonMultiModel(triton_url=server.url, model_control="poll")
+        started = time.perf_counter()
+        await triton.classify_batch([_jpeg((0, 0, 0))], model_name="VGG16")
+        assert time.perf_counter() - started >= 0.05
+
+        store.faults.update({"latency_ms": 0, "models": {"VGG16": {"error_rate": 1}}})
+        with pytest.raises(RuntimeError, match="injected failure"):
+            await triton.classify_batch([_jpeg((0, 0, 0))], model_name="VGG16")
+        await triton.classify_batch([_jpeg((0, 0, 0))], model_name="VGG19")
+        assert store.models["VGG16"].fail_count == 1
+
+
+@pytest.mark.asyncio
+async def test_explicit_model_control_through_the_controller():
+    store = ModelStore.fake(explicit=True)
+    store.start()
+    with RunningServer(store) as server:
+        client = ThreadLocalClient(server.url)
+        controller = TritonModelController(
+            client,
+            TritonMultiModel.MODEL_INFO,
+            [(0.5, "ResNet152V2"), (1.0, "ResNet50")],
+            interval=3600,
+        )
+        await controller.start()
+        await controller.ensure_ready("ResNet50")
+        await controller.ensure_ready("ResNet152V2")
+        await controller.unload("ResNet152V2")
+        await controller.stop()
+
+        loaded = {
+            m["name"]
+            for m in client.get_model_repository_index()
+            if m["state"] == "READY"
+        }
+        assert loaded == {"ResNet50"}
+        # Pre-warmed with one inference after loading
+        assert store.models["ResNet50"].success_count == 1
+
+
+@pytest.mark.asyncio
+async def test_model_unloaded_by_another_worker_is_reloaded_once():
+    store = ModelStore.fake(explicit=True)
+    store.start()
+    with RunningServer(store) as server:
+        triton = TritonMultiModel(triton_url=server.url, model_control="explicit")
+        await triton.start()
+        await triton.controller.ensure_ready("ResNet50")
+        # Another API worker evicts it behind this worker's back
+        store.models["ResNet50"].unload()
+
+        results = await triton.classify_batch([_jpeg((0, 0, 0))], model_name="ResNet50")
+        tiled = await triton.classify_tiled(_jpeg((0, 0, 0)), model_name="ResNet50")
+        await triton.stop()
+
+        assert results[0]["model_used"] == "ResNet50"
+        assert tiled["model_used"] == "ResNet50"
+        assert store.models["ResNet50"].ready
+
+    # Without model control there is nothing to reload
+    store = ModelStore.fake()
+    store.start()
+    with RunningServer(store) as server:
+        triton = TritonMultiModel(triton_url=server.url, model_control="poll")
+        store.models["VGG16"].unload()
+        with pytest.raises(TritonModelUnavailable):
+            await triton.classify_batch([_jpeg((0, 0, 0))], model_name="VGG16")
+
+
+def test_grpc_infer_matches_http():
+    store = ModelStore.fake()
+    store.start()
+    pixels = np.random.default_rng(0).integers(0, 256, (2, 224, 224, 3), np.uint8)
+    with RunningServer(store) as server:
+        client = grpcclient.InferenceServerClient(url=f"127.0.0.1:{server.grpc_port}")
+        assert client.is_server_ready() and client.is_model_ready("ResNet50")
+        inputs = grpcclient.InferInput("input", pixels.shape, "UINT8")
+        inputs.set_data_from_numpy(pixels)
+        response = client.infer("ResNet50", [inputs])
+        grpc_out = response.as_numpy("predictions")
+
+        with pytest.raises(Exception, match="batch-size"):
+            big = np.zeros((9, 224, 224, 3), np.uint8)
+            inputs = grpcclient.InferInput("input", big.shape, "UINT8")
+            inputs.set_data_from_numpy(big)
+            client.infer("ResNet50", [inputs])
+        client.close()
+
+    expected = np.argmax(grpc_out, axis=1)
+    assert list(expected) == list(pixels.reshape(2, -1).astype(np.int64).sum(1) % 1000)
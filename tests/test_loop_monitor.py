@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+
+from app.diagnostics.loop_monitor import EventLoopMonitor
+from app.metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+
+
+def _lag_samples():
+    for metric in EVENT_LOOP_LAG.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                return sample.value
+    return 0
+
+
+def _blocking_decode():
+    time.sleep(0.2)
+
+
+@pytest.mark.asyncio
+async def test_blocking_step_is_captured_with_its_stack():
+    monitor = EventLoopMonitor(interval=0.02, threshold=0.05)
+    blocked = EVENT_LOOP_BLOCKED._value.get()
+    monitor.start()
+    await asyncio.sleep(0.05)
+    _blocking_decode()
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    [episode] = monitor.recent()
+    assert episode["lag_seconds"] >= 0.1
+    assert any("_blocking_decode" in frame for frame in episode["stack"])
+    assert "test_blocking_step_is_captured_with_its_stack" in episode["task"]
+    assert EVENT_LOOP_BLOCKED._value.get() == blocked + 1
+    assert not monitor.running
+
+
+@pytest.mark.asyncio
+async def test_idle_loop_records_lag_without_episodes():
+    monitor = EventLoopMonitor(interval=0.01, threshold=0.1)
+    samples = _lag_samples()
+    monitor.start()
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+
+    assert _lag_samples() > samples
+    assert monitor.recent() == []
@@ -0,0 +1,129 @@
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI, status
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1.routes import admin
+from app.diagnostics import memory
+from app.metrics import MEMORY_RSS_BYTES, MEMORY_TRACED_BYTES, MEMORY_TRACED_GROWTH
+
+app = FastAPI()
+app.include_router(admin.router, prefix="/api/v1/admin")
+HEADERS = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def tracker():
+    tracker = memory.AllocationTracker(max_snapshots=2)
+    yield tracker
+    tracemalloc.stop()
+
+
+def _allocate():
+    return [bytearray(1024) for _ in range(2000)]
+
+
+def test_diff_points_at_the_growing_line(tracker):
+    tracker.start()
+    base = tracker.snapshot()
+    kept = _allocate()
+    [top] = tracker.diff(base, limit=1)
+    del kept
+
+    assert top["location"].endswith(
+        f"test_memory.py:{_allocate.__code__.co_firstlineno + 1}"
+    )
+    assert top["size_diff_bytes"] >= 2000 * 1024
+    assert top["count_diff"] >= 2000
+
+
+def test_only_recent_snapshots_are_kept(tracker):
+    tracker.start()
+    ids = [tracker.snapshot() for _ in range(3)]
+    assert [s["id"] for s in tracker.snapshots()] == ids[1:]
+    with pytest.raises(memory.SnapshotNotFound):
+        tracker.diff(ids[0])
+
+    tracker.stop()
+    assert tracker.snapshots() == []
+    with pytest.raises(memory.TracingNotStarted):
+        tracker.snapshot()
+
+
+def test_source_attribution():
+    assert memory.source_of(memory.__file__) == "app"
+    assert memory.source_of("/venv/lib/site-packages/PIL/Image.py") == "pil"
+    assert memory.source_of("/venv/lib/site-packages/numpy/core/numeric.py") == "numpy"
+    assert memory.source_of("/usr/lib/python3.11/json/decoder.py") == "other"
+
+
+def test_sampler_sets_rss_and_traced_growth(tracker, monkeypatch):
+    sampler = memory.MemorySampler(tracker)
+    sampler.sample()
+    assert MEMORY_RSS_BYTES._value.get() > 0
+
+    tracker.start()
+
+    def no_snapshots():
+        raise AssertionError("the sampler must not take snapshots")
+
+    monkeypatch.setattr(tracemalloc, "take_snapshot", no_snapshots)
+    sampler.sample()
+    kept = _allocate()
+    sampler.sample()
+    del kept
+    assert MEMORY_TRACED_BYTES.labels(source="total")._value.get() >= 2000 * 1024
+    assert MEMORY_TRACED_GROWTH.labels(source="total")._value.get() > 0
+
+
+def test_by_source_of_a_kept_snapshot(tracker):
+    tracker.start()
+    kept = _allocate()
+    snapshot_id = tracker.snapshot()
+    del kept
+    assert tracker.by_source(snapshot_id)["other"] >= 2000 * 1024
+
+
+@pytest.mark.asyncio
+async def test_memory_endpoint_reports_models_and_process(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/api/v1/admin/memory", headers=HEADERS)
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert report["process"]["rss_bytes"] > 0
+    assert {"budget_bytes", "used_bytes", "models"} <= set(report["models"])
+
+
+@pytest.mark.asyncio
+async def test_snapshot_endpoints(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    transport = ASGITransport(app=app)
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            url = "/api/v1/admin/memory"
+            response = await ac.post(f"{url}/snapshots", headers=HEADERS)
+            assert response.status_code == status.HTTP_409_CONFLICT
+
+            await ac.post(f"{url}/tracemalloc/start", headers=HEADERS)
+            response = await ac.post(f"{url}/snapshots", headers=HEADERS)
+            assert response.status_code == status.HTTP_200_OK
+            snapshot_id = response.json()["id"]
+            assert response.json()["by_source"]
+
+            response = await ac.get(
+                f"{url}/snapshots/{snapshot_id}/diff",
+                params={"limit": 5},
+                headers=HEADERS,
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.json()["stats"]) <= 5
+
+            response = await ac.get(f"{url}/snapshots/999/diff", headers=HEADERS)
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+            await ac.post(f"{url}/tracemalloc/stop", headers=HEADERS)
+    finally:
+        tracemalloc.stop()
+    assert not tracemalloc.is_tracing()
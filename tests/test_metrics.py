@@ -0,0 +1,59 @@
+import concurrent.futures
+import time
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from app.metrics import STAGE_DURATION_BUCKETS, time_executor_call
+
+
+def _histogram():
+    registry = CollectorRegistry()
+    hist = Histogram(
+        "stage_seconds",
+        "test",
+        ["stage"],
+        buckets=STAGE_DURATION_BUCKETS,
+        registry=registry,
+    )
+    return hist, registry
+
+
+def test_time_executor_call_records_queue_wait_and_run_time():
+    hist, registry = _histogram()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        # Occupy the only worker so the second call has to queue.
+        blocker = pool.submit(time.sleep, 0.05)
+        future = pool.submit(
+            time_executor_call,
+            lambda x: x * 2,
+            21,
+            queue_wait=hist.labels(stage="queue_wait"),
+            run_time=hist.labels(stage="inference"),
+            submitted_at=time.perf_counter(),
+        )
+        blocker.result()
+        assert future.result() == 42
+
+    queue_sum = registry.get_sample_value("stage_seconds_sum", {"stage": "queue_wait"})
+    run_count = registry.get_sample_value("stage_seconds_count", {"stage": "inference"})
+    assert queue_sum >= 0.03
+    assert run_count == 1
+
+
+def test_time_executor_call_records_run_time_on_failure():
+    hist, registry = _histogram()
+
+    def boom():
+        raise RuntimeError("fail")
+
+    try:
+        time_executor_call(
+            boom,
+            queue_wait=hist.labels(stage="queue_wait"),
+            run_time=hist.labels(stage="inference"),
+            submitted_at=time.perf_counter(),
+        )
+    except RuntimeError:
+        pass
+
+    assert registry.get_sample_value("stage_seconds_count", {"stage": "inference"}) == 1
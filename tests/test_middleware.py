@@ -0,0 +1,101 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from prometheus_client import REGISTRY
+
+from app.config.middleware import TelemetryMiddleware, build_sampler
+
+
+def make_app(ratio: float):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=build_sampler(ratio))
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"item_id": item_id}
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "healthy"}
+
+    app.add_middleware(TelemetryMiddleware, tracer_provider=provider)
+    return app, exporter
+
+
+def _count(endpoint, status="200"):
+    return (
+        REGISTRY.get_sample_value(
+            "http_requests_total",
+            {"method": "GET", "endpoint": endpoint, "http_status": status},
+        )
+        or 0.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_single_server_span_and_route_template_metrics():
+    app, exporter = make_app(ratio=1.0)
+    before = _count("/items/{item_id}")
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.get("/items/7")
+
+    assert response.status_code == 200
+    assert response.headers["x-request-id"]
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 1
+    assert spans[0].name == "GET /items/{item_id}"
+    assert spans[0].attributes["http.status_code"] == 200
+    assert _count("/items/{item_id}") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_ratio_zero_records_metrics_but_no_spans():
+    app, exporter = make_app(ratio=0.0)
+    before = _count("/items/{item_id}")
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        await ac.get("/items/1")
+
+    assert exporter.get_finished_spans() == ()
+    assert _count("/items/{item_id}") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_parent_sampling_decision_and_request_id_are_honoured():
+    app, exporter = make_app(ratio=0.0)
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    headers = {
+        "traceparent": f"00-{trace_id}-00f067aa0ba902b7-01",
+        "x-request-id": "abc123",
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.get("/items/2", headers=headers)
+
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 1
+    assert format(spans[0].context.trace_id, "032x") == trace_id
+    assert response.headers["x-request-id"] == "abc123"
+
+
+@pytest.mark.asyncio
+async def test_untraced_paths_are_not_traced():
+    app, exporter = make_app(ratio=1.0)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        await ac.get("/healthz")
+
+    assert exporter.get_finished_spans() == ()
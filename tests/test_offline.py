@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from app.pipeline import offline
+from app.pipeline.offline import (
+    Checkpoint,
+    ThroughputMeter,
+    decode_image,
+    iter_images,
+    main,
+    run,
+)
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+
+
+class FakeBackend:
+    """Predicts class = number of the batch row; can fail after N batches."""
+
+    name = "fake"
+    model_name = "Fake"
+    input_size = (32, 32)
+
+    def __init__(self, fail_after=None):
+        self.batches = []
+        self.fail_after = fail_after
+
+    def predict(self, batch):
+        if self.fail_after is not None and len(self.batches) >= self.fail_after:
+            raise RuntimeError("killed")
+        assert batch.dtype == np.uint8 and batch.shape[1:] == (32, 32, 3)
+        self.batches.append(len(batch))
+        probabilities = np.zeros((len(batch), 1000), dtype=np.float32)
+        probabilities[:, 2] = 0.9
+        return probabilities
+
+
+@pytest.fixture
+def image_tree(tmp_path):
+    """tests/images split over nested directories, plus one broken file."""
+    root = tmp_path / "tree"
+    names = sorted(os.listdir(IMAGE_DIR))
+    for i, name in enumerate(names):
+        target = root / ("a" if i % 2 else "b/c")
+        target.mkdir(parents=True, exist_ok=True)
+        shutil.copy(os.path.join(IMAGE_DIR, name), target / name)
+    (root / "a" / "broken.jpg").write_bytes(b"not an image")
+    (root / "a" / "notes.txt").write_text("skip me")
+    return str(root)
+
+
+def _read_rows(out_dir):
+    rows = []
+    for name in sorted(os.listdir(out_dir)):
+        if name.startswith("part-"):
+            with open(os.path.join(out_dir, name), newline="") as f:
+                rows.extend(csv.DictReader(f))
+    return rows
+
+
+def _quiet():
+    return ThroughputMeter(stream=io.StringIO())
+
+
+def test_iter_images_is_recursive_and_stable(image_tree):
+    paths = list(iter_images(image_tree))
+    assert len(paths) == 11
+    assert paths == list(iter_images(image_tree))
+    assert not any(p.endswith(".txt") for p in paths)
+    assert any(p.startswith(os.path.join("b", "c")) for p in paths)
+
+
+def test_decode_image_resizes_and_reports_errors(image_tree):
+    array, error = decode_image(os.path.join(IMAGE_DIR, "shark.jpg"), (20, 30))
+    assert error is None
+    assert array.shape == (20, 30, 3) and array.dtype == np.uint8
+
+    array, error = decode_image(os.path.join(image_tree, "a", "broken.jpg"), (8, 8))
+    assert array is None and "decode" in error
+
+
+def test_run_writes_parts_and_checkpoint(image_tree, tmp_path):
+    out = str(tmp_path / "out")
+    backend = FakeBackend()
+    checkpoint = run(
+        image_tree, out, backend, batch_size=4, chunk_rows=4, meter=_quiet()
+    )
+
+    rows = _read_rows(out)
+    # a/broken.jpg is in the first batch and never reaches the model
+    assert backend.batches == [3, 4, 3]
+    assert [r["key"] for r in rows] == list(iter_images(image_tree))
+    assert checkpoint.completed and checkpoint.processed == 11
+    assert checkpoint.parts == 3
+    broken = [r for r in rows if r["error"]]
+    assert [r["key"] for r in broken] == [os.path.join("a", "broken.jpg")]
+    good = rows[1]
+    assert good["class_name"] == "great_white_shark"
+    assert len(json.loads(good["top5"])) == 5
+
+
+def test_killed_run_resumes_from_last_part(image_tree, tmp_path):
+    out = str(tmp_path / "out")
+    with pytest.raises(RuntimeError):
+        run(
+            image_tree,
+            out,
+            FakeBackend(fail_after=2),
+            batch_size=3,
+            chunk_rows=3,
+            meter=_quiet(),
+        )
+    settings = json.load(open(os.path.join(out, "checkpoint.json")))
+    assert settings["processed"] == 6 and not settings["completed"]
+
+    resumed = FakeBackend()
+    checkpoint = run(
+        image_tree, out, resumed, batch_size=3, chunk_rows=3, meter=_quiet()
+    )
+
+    # Only the 5 images after the last written part are classified again
+    assert resumed.batches == [3, 2]
+    assert [r["key"] for r in _read_rows(out)] == list(iter_images(image_tree))
+    assert checkpoint.completed
+
+
+def test_resume_with_other_settings_is_refused(image_tree, tmp_path):
+    out = str(tmp_path / "out")
+    run(image_tree, out, FakeBackend(), meter=_quiet())
+
+    other = Checkpoint(out, {"root": "/elsewhere"})
+    with pytest.raises(ValueError):
+        other.load()
+
+
+def test_decode_processes(image_tree, tmp_path):
+    out = str(tmp_path / "out")
+    backend = FakeBackend()
+    run(image_tree, out, backend, batch_size=5, processes=2, meter=_quiet())
+    assert sum(backend.batches) == 10
+    assert len(_read_rows(out)) == 11
+
+
+def test_cli_rejects_parquet_without_pyarrow(image_tree, tmp_path, monkeypatch):
+    try:
+        import pyarrow  # noqa: F401
+
+        pytest.skip("pyarrow is installed")
+    except ImportError:
+        pass
+    monkeypatch.setitem(
+        offline.BACKENDS, "onnx", lambda model, model_path="": FakeBackend()
+    )
+    code = main([image_tree, str(tmp_path / "out"), "--format", "parquet"])
+    assert code == 2
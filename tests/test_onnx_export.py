@@ -0,0 +1,65 @@
+import numpy as np
+import onnxruntime as ort
+import pytest
+from onnx import TensorProto, helper
+
+from app.models.multimodel import ModelManager
+from app.models.onnx_export import (
+    PREPROCESS_MODES,
+    is_uint8_model,
+    model_config,
+    prepend_preprocessing,
+)
+
+
+def _float_identity_model(height=8, width=8):
+    """Stand-in for a tf2onnx export: float32 NHWC `input` -> `predictions`."""
+    graph = helper.make_graph(
+        [helper.make_node("Identity", ["input"], ["predictions"])],
+        "backbone",
+        [
+            helper.make_tensor_value_info(
+                "input", TensorProto.FLOAT, [None, height, width, 3]
+            )
+        ],
+        [
+            helper.make_tensor_value_info(
+                "predictions", TensorProto.FLOAT, [None, height, width, 3]
+            )
+        ],
+    )
+    return helper.make_model(
+        graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8
+    )
+
+
+@pytest.mark.parametrize("model_name", sorted(PREPROCESS_MODES))
+def test_in_graph_preprocessing_matches_keras(model_name):
+    model = prepend_preprocessing(_float_identity_model(), PREPROCESS_MODES[model_name])
+    assert is_uint8_model(model)
+
+    session = ort.InferenceSession(
+        model.SerializeToString(), providers=["CPUExecutionProvider"]
+    )
+    assert session.get_inputs()[0].name == "input"
+    assert session.get_inputs()[0].type == "tensor(uint8)"
+
+    pixels = np.random.default_rng(0).integers(0, 256, (2, 8, 8, 3), np.uint8)
+    expected = ModelManager.MODEL_INFO[model_name]["preprocess"](
+        pixels.astype(np.float32)
+    )
+    actual = session.run(None, {"input": pixels})[0]
+    np.testing.assert_allclose(actual, expected, atol=1e-4)
+
+
+def test_prepend_refuses_uint8_model():
+    model = prepend_preprocessing(_float_identity_model(), "tf")
+    with pytest.raises(ValueError):
+        prepend_preprocessing(model, "tf")
+
+
+def test_model_config_declares_uint8_input():
+    config = model_config("ResNet50", 224, 224)
+    assert "data_type: TYPE_UINT8" in config
+    assert "dims: [224, 224, 3]" in config
+    assert "dynamic_batching" in config
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, UploadFile
+from open_loop_load import LatencyHistogram, diff_runs, run_step, summarize_endpoints
+
+
+def test_histogram_percentiles_within_precision():
+    hist = LatencyHistogram()
+    for ms in range(1, 1001):
+        hist.record(ms / 1000.0)
+
+    assert hist.total == 1000
+    assert hist.percentile(50) == pytest.approx(500, rel=1e-3)
+    assert hist.percentile(99) == pytest.approx(990, rel=1e-3)
+    assert hist.percentile(99.9) == pytest.approx(999, rel=1e-3)
+    assert hist.max_us == 1_000_000
+
+
+def test_histogram_round_trip_and_merge():
+    a, b = LatencyHistogram(), LatencyHistogram()
+    a.record(0.010)
+    b.record(2.5)
+    merged = LatencyHistogram.from_dict(a.to_dict())
+    merged.merge(b)
+
+    assert merged.total == 2
+    assert merged.percentile(100) == pytest.approx(2500, rel=1e-3)
+
+
+def _step(endpoint, rate, p99, error_rate, throughput):
+    hist = LatencyHistogram()
+    hist.record(p99 / 1000.0)
+    return {
+        "endpoint": endpoint,
+        "target_rate": rate,
+        "requests": 100,
+        "successes": int(100 * (1 - error_rate)),
+        "error_rate": error_rate,
+        "throughput": throughput,
+        "latency_ms": {"p50": p99, "p95": p99, "p99": p99, "p99.9": p99},
+        "histogram": hist.to_dict(),
+    }
+
+
+def test_saturation_ignores_steps_over_slo():
+    steps = [
+        _step("/a", 10, p99=100, error_rate=0.0, throughput=10),
+        _step("/a", 20, p99=200, error_rate=0.0, throughput=19.5),
+        _step("/a", 40, p99=5000, error_rate=0.2, throughput=25),
+    ]
+    summary = summarize_endpoints(steps, slo_ms=1000, max_errors=0.01)
+
+    assert summary["/a"]["saturation_throughput"] == 19.5
+    assert summary["/a"]["requests"] == 300
+
+
+def test_diff_reports_relative_change():
+    baseline = {"endpoints": summarize_endpoints([_step("/a", 10, 100, 0, 10)], 1e3, 1)}
+    candidate = {"endpoints": summarize_endpoints([_step("/a", 10, 50, 0, 10)], 1e3, 1)}
+    diff = diff_runs(baseline, candidate)
+
+    assert diff["/a"]["p99"]["delta_pct"] == pytest.approx(-50, abs=0.5)
+
+
+@pytest.mark.asyncio
+async def test_run_step_keeps_schedule_against_slow_server():
+    app = FastAPI()
+
+    @app.post("/slow")
+    async def slow(file: UploadFile):
+        await asyncio.sleep(0.2)
+        return {"ok": True}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        result = await run_step(
+            c,
+            "/slow",
+            rate=50,
+            duration=0.2,
+            payloads=[("x.jpg", b"x")],
+            max_in_flight=64,
+        )
+
+    # Open loop: all 10 requests are sent on schedule even though each takes 200ms.
+    assert result.successes == 10
+    assert result.elapsed < 0.5
@@ -0,0 +1,167 @@
+import io
+
+import pytest
+from kserve_server import ModelStore, RunningServer
+from PIL import Image
+
+from app.models import tritonservice
+from app.models.prediction_cache import (
+    CacheBackend,
+    MemoryCacheBackend,
+    PredictionCache,
+    SqliteCacheBackend,
+)
+from app.models.tritonservice import TritonMultiModel
+
+
+def _result(name):
+    return {
+        "model_used": "ResNet50",
+        "predictions": [
+            {"class_id": "n01491361", "class_name": name, "confidence": 0.5}
+        ],
+    }
+
+
+class CountingClassifier:
+    def __init__(self):
+        self.seen = []
+
+    async def __call__(self, images):
+        self.seen.append(list(images))
+        return [
+            {"error": "bad"} if data == b"bad" else _result(data.decode())
+            for data in images
+        ]
+
+
+def test_memory_backend_evicts_least_recently_used_by_size():
+    backend = MemoryCacheBackend(max_bytes=10)
+    backend.put("a", b"aaaa", "m", "1")
+    backend.put("b", b"bbbb", "m", "1")
+    assert backend.get("a") == b"aaaa"
+    assert backend.put("c", b"cccc", "m", "1") == 1
+    assert backend.get("b") is None
+    assert backend.get("a") == b"aaaa"
+    assert backend.size_bytes() == 8
+
+    assert backend.set_model_version("m", "2") == 2
+    assert backend.size_bytes() == 0
+
+
+def test_backends_must_implement_every_tier_method():
+    class Partial(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_sqlite_backend_is_shared_and_survives_restarts(tmp_path):
+    path = str(tmp_path / "cache" / "predictions.sqlite3")
+    first = SqliteCacheBackend(path, max_bytes=2**20)
+    second = SqliteCacheBackend(path, max_bytes=2**20)
+    first.put("key", b"value", "tensorflow/ResNet50", "1")
+    assert second.get("key") == b"value"
+
+    first.put("key", b"longer value", "tensorflow/ResNet50", "1")
+    assert second.size_bytes() == len(b"longer value")
+    first.close()
+    second.close()
+
+    restarted = SqliteCacheBackend(path, max_bytes=2**20)
+    assert restarted.get("key") == b"longer value"
+    restarted.close()
+
+
+def test_sqlite_backend_size_eviction_and_version_invalidation(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "p.sqlite3"), max_bytes=1000)
+    for i in range(10):
+        backend.put(f"old{i}", b"x" * 100, "triton/VGG16", "1")
+    assert backend.size_bytes() == 1000
+    # Over budget: least recently used entries go, down to 90% of it
+    assert backend.put("new", b"x" * 100, "triton/VGG16", "2") > 0
+    assert backend.size_bytes() <= 900
+    assert backend.get("new") is not None
+    assert backend.get("old0") is None
+
+    kept = backend.size_bytes() // 100 - 1
+    backend.put("other", b"y" * 10, "triton/VGG19", "1")
+    assert backend.set_model_version("triton/VGG16", "2") == kept
+    assert backend.get("new") is not None
+    assert backend.get("other") is not None
+    backend.close()
+
+
+@pytest.mark.asyncio
+async def test_classify_batch_only_runs_misses(tmp_path):
+    shared = SqliteCacheBackend(str(tmp_path / "p.sqlite3"), max_bytes=2**20)
+    cache = PredictionCache(True, MemoryCacheBackend(2**20), shared)
+    classify = CountingClassifier()
+
+    first = await cache.classify_batch(
+        [b"shark", b"bad", b"whale"], "tensorflow", "ResNet50", "1", classify
+    )
+    assert [r.get("predictions", [{}])[0].get("class_name") for r in first] == [
+        "shark",
+        None,
+        "whale",
+    ]
+    again = await cache.classify_batch(
+        [b"whale", b"bad", b"ray", b"shark"], "tensorflow", "ResNet50", "1", classify
+    )
+    # Errors are not cached; the rest come back in input order
+    assert classify.seen[-1] == [b"bad", b"ray"]
+    assert again[0] == first[2] and again[3] == first[0]
+
+    # Another worker (own memory tier) finds them in the shared store
+    other = PredictionCache(True, MemoryCacheBackend(2**20), shared)
+    key, cached = await other.get(b"shark", "tensorflow", "ResNet50", "1")
+    assert cached == first[0]
+    assert other.local.get(key.key) is not None
+
+    # A new model version misses and drops the old entries
+    await cache.classify_batch([b"shark"], "tensorflow", "ResNet50", "2", classify)
+    assert classify.seen[-1] == [b"shark"]
+    assert shared.get(key.key) is None
+    shared.close()
+
+
+@pytest.mark.asyncio
+async def test_disabled_cache_passes_through():
+    cache = PredictionCache(enabled=False)
+    classify = CountingClassifier()
+    await cache.classify_batch([b"a"], "tensorflow", "ResNet50", "1", classify)
+    await cache.classify_batch([b"a"], "tensorflow", "ResNet50", "1", classify)
+    assert classify.seen == [[b"a"], [b"a"]]
+    assert await cache.get(b"a", "tensorflow", "ResNet50", "1") == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_triton_predictions_are_cached_by_model_version(tmp_path, monkeypatch):
+    shared = SqliteCacheBackend(str(tmp_path / "p.sqlite3"), max_bytes=2**20)
+    monkeypatch.setattr(
+        tritonservice,
+        "prediction_cache",
+        PredictionCache(True, MemoryCacheBackend(2**20), shared),
+    )
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (0, 90, 180)).save(buffer, format="JPEG")
+    image = buffer.getvalue()
+
+    store = ModelStore.fake()
+    store.start()
+    with RunningServer(store) as server:
+        triton = TritonMultiModel(triton_url=server.url, model_control="poll")
+        model = store.models["ResNet50"]
+        first = await triton.classify_batch([image], model_name="ResNet50")
+        runs = model.success_count
+        again = await triton.classify_batch([image, image], model_name="ResNet50")
+
+    assert again == first * 2
+    assert model.success_count == runs
+    assert shared.size_bytes() > 0
+    shared.close()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from app.metrics import MODEL_REGISTRY_EVENTS
+from app.models.registry import ModelBudgetError, ModelRegistry
+
+MB = 2**20
+SIZES = {
+    "small": 10 * MB,
+    "medium": 30 * MB,
+    "large": 60 * MB,
+    "large2": 60 * MB,
+    "huge": 200 * MB,
+}
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+
+def _registry(budget_mb=100, pinned=("small",), loads=None):
+    def loader(name):
+        if loads is not None:
+            loads.append(name)
+        return FakeModel(name)
+
+    return ModelRegistry(
+        loader,
+        budget_bytes=budget_mb * MB,
+        pinned=pinned,
+        footprint=lambda model: SIZES[model.name],
+    )
+
+
+def _events(name, event):
+    return MODEL_REGISTRY_EVENTS.labels(model_name=name, event=event)._value.get()
+
+
+def test_lru_eviction_keeps_pinned_models():
+    registry = _registry()
+    evictions = _events("medium", "evict")
+    registry.get("small")
+    registry.get("medium")
+    registry.get("small")  # touch: medium is now least recently used
+    registry.get("large")  # 10 + 30 + 60 = 100, fits
+    assert list(registry.resident()) == ["medium", "small", "large"]
+
+    # Needs 60 MB: medium goes first, then large; pinned small stays
+    registry.get("large2")
+    assert list(registry.resident()) == ["small", "large2"]
+    assert registry.used_bytes == 70 * MB
+    assert _events("medium", "evict") == evictions + 1
+
+
+def test_model_larger_than_budget_is_refused():
+    loads = []
+    registry = _registry(loads=loads)
+    registry.get("small")
+    with pytest.raises(ModelBudgetError) as exc:
+        registry.get("huge")
+    assert exc.value.status_code == 503
+    assert list(registry.resident()) == ["small"]
+    # Its size is known now, so a retry fails without loading again
+    with pytest.raises(ModelBudgetError):
+        registry.get("huge")
+    assert loads == ["small", "huge"]
+
+
+def test_concurrent_gets_load_once():
+    loads = []
+    started = threading.Event()
+
+    def slow_loader(name):
+        loads.append(name)
+        started.set()
+        time.sleep(0.05)
+        return FakeModel(name)
+
+    registry = ModelRegistry(slow_loader, footprint=lambda model: SIZES[model.name])
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("medium")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["medium"]
+    assert len({id(model) for model in results}) == 1
+
+
+def test_preload_stops_at_budget_without_evicting():
+    loads = []
+    registry = _registry(budget_mb=80, loads=loads)
+    registry.preload(["medium", "large", "small"])
+
+    # small is pinned and goes first; large does not fit next to medium
+    assert list(registry.resident()) == ["small", "medium"]
+    assert loads == ["small", "medium", "large"]
+    # On demand, large may evict medium
+    registry.get("large")
+    assert list(registry.resident()) == ["small", "large"]
+
+
+def test_unload_and_clear():
+    unloads = []
+    registry = _registry()
+    registry.on_unload = lambda: unloads.append(True)
+    registry.get("small")
+    registry.get("medium")
+    assert registry.unload("medium") is True
+    assert registry.unload("medium") is False
+    registry.clear()
+    assert registry.resident() == {}
+    assert len(unloads) == 2
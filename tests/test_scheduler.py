@@ -0,0 +1,260 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, Request
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1.routes.img_class import router
+from app.config.middleware import DeadlineMiddleware
+from app.metrics import SCHEDULER_DROPPED
+from app.models import scheduler as scheduler_module
+from app.models.multimodel import ModelManager
+from app.models.scheduler import (
+    DeadlineExceeded,
+    DeadlineScheduler,
+    RequestCancelled,
+    RequestContext,
+    current_request,
+    parse_deadline,
+    reset_request_context,
+    set_request_context,
+)
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+
+
+def _dropped(scheduler: str, reason: str) -> float:
+    return SCHEDULER_DROPPED.labels(scheduler=scheduler, reason=reason)._value.get()
+
+
+async def _in_request(ctx, coro_fn):
+    token = set_request_context(ctx)
+    try:
+        return await coro_fn()
+    finally:
+        reset_request_context(token)
+
+
+def test_parse_deadline():
+    now = time.monotonic()
+    assert parse_deadline(None, None, default=0) is None
+    assert parse_deadline("2", None) == pytest.approx(now + 2, abs=0.1)
+    # Absolute deadline earlier than the timeout wins
+    assert parse_deadline("10", str(time.time() + 1)) == pytest.approx(now + 1, abs=0.1)
+    assert parse_deadline(None, None, default=5) == pytest.approx(now + 5, abs=0.1)
+    assert parse_deadline("1000", None, maximum=3) == pytest.approx(now + 3, abs=0.1)
+    with pytest.raises(ValueError):
+        parse_deadline("soon", None)
+
+
+@pytest.mark.asyncio
+async def test_waiters_run_in_deadline_order():
+    scheduler = DeadlineScheduler("test-order", slots=1)
+    order = []
+
+    async def work(label):
+        async with scheduler.slot():
+            order.append(label)
+
+    await scheduler.acquire()
+    now = time.monotonic()
+    tasks = [
+        asyncio.create_task(
+            _in_request(RequestContext(now + d), lambda lb=lb: work(lb))
+        )
+        for lb, d in [("late", 30), ("early", 10), ("mid", 20)]
+    ]
+    tasks.append(asyncio.create_task(work("undated")))  # due after 10s slack
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ["early", "undated", "mid", "late"]
+
+
+@pytest.mark.asyncio
+async def test_expired_work_is_dropped_while_queued():
+    scheduler = DeadlineScheduler("test-expire", slots=1)
+    before = _dropped("test-expire", "expired")
+    ran = []
+
+    async def work():
+        async with scheduler.slot():
+            ran.append(True)
+
+    await scheduler.acquire()
+    ctx = RequestContext(time.monotonic() + 0.05)
+    task = asyncio.create_task(_in_request(ctx, work))
+    with pytest.raises(DeadlineExceeded):
+        await asyncio.wait_for(task, timeout=1)
+    scheduler.release()
+
+    assert ran == []
+    assert _dropped("test-expire", "expired") == before + 1
+    # An already expired request is rejected without queueing
+    with pytest.raises(DeadlineExceeded):
+        await _in_request(RequestContext(time.monotonic() - 1), work)
+    assert _dropped("test-expire", "expired") == before + 2
+    # The slot is free again for live work
+    await work()
+    assert ran == [True]
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_queued_work():
+    scheduler = DeadlineScheduler("test-cancel", slots=1)
+    before = _dropped("test-cancel", "cancelled")
+
+    async def work():
+        async with scheduler.slot():
+            pass
+
+    await scheduler.acquire()
+    ctx = RequestContext()
+    task = asyncio.create_task(_in_request(ctx, work))
+    await asyncio.sleep(0)
+    ctx.cancel()
+    with pytest.raises(RequestCancelled):
+        await task
+    scheduler.release()
+
+    assert ctx.cancelled.is_set()
+    assert _dropped("test-cancel", "cancelled") == before + 1
+
+
+def _app(handler):
+    app = FastAPI()
+    app.add_api_route("/work", handler, methods=["POST"])
+    app.add_middleware(DeadlineMiddleware)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_middleware_sets_request_deadline():
+    seen = {}
+
+    async def handler():
+        ctx = current_request()
+        seen["remaining"] = ctx.remaining()
+        seen["cancelled"] = ctx.cancelled.is_set()
+        return {}
+
+    transport = ASGITransport(app=_app(handler))
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        await ac.post("/work", headers={"X-Request-Timeout": "2.5"})
+        assert 0 < seen["remaining"] <= 2.5
+        assert seen["cancelled"] is False
+
+        await ac.post("/work", headers={"X-Request-Timeout": "not-a-number"})
+        assert seen["remaining"] is None
+
+
+@pytest.mark.asyncio
+async def test_middleware_cancels_on_client_disconnect():
+    cancelled = asyncio.Event()
+
+    async def handler(request: Request):
+        await request.body()  # disconnects are watched once the body is read
+        ctx = current_request()
+        await ctx.cancelled.wait()
+        cancelled.set()
+        return {}
+
+    messages = [
+        {"type": "http.request", "body": b"", "more_body": False},
+        {"type": "http.disconnect"},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/work",
+        "raw_path": b"/work",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(_app(handler)(scope, receive, send), timeout=5)
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_expired_request_skips_inference(monkeypatch):
+    calls = []
+
+    class FakeModel:
+        def predict(self, batch):
+            calls.append(len(batch))
+            return np.zeros((len(batch), 1000))
+
+    monkeypatch.setattr(
+        ModelManager, "get_model", classmethod(lambda cls, n: FakeModel())
+    )
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    app.add_middleware(DeadlineMiddleware)
+    with open(os.path.join(IMAGE_DIR, sorted(os.listdir(IMAGE_DIR))[0]), "rb") as f:
+        files = {"file": ("img.jpg", f.read(), "image/jpeg")}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/smart_predict", files=files, headers={"X-Request-Timeout": "0"}
+        )
+
+    assert response.status_code == 504
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_lane_limit_keeps_room_for_other_models():
+    scheduler = DeadlineScheduler("test-lanes", slots=3, lane_limits={"heavy": 2})
+    held = [await scheduler.acquire("heavy") for _ in range(2)]
+    queued = asyncio.create_task(scheduler.acquire("heavy"))
+    await asyncio.sleep(0)
+
+    # The heavy lane is at its cap, yet a light request gets the free thread
+    light = await asyncio.wait_for(scheduler.acquire("light"), timeout=1)
+    assert not queued.done()
+    assert scheduler.lanes["heavy"].busy == 2
+
+    scheduler.release("heavy", held[0])
+    await asyncio.wait_for(queued, timeout=1)
+    for lane, granted in [("heavy", held[1]), ("heavy", queued.result())]:
+        scheduler.release(lane, granted)
+    scheduler.release("light", light)
+    assert scheduler.lanes["heavy"].busy == scheduler.lanes["light"].busy == 0
+
+
+@pytest.mark.asyncio
+async def test_lanes_share_slots_by_weight(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "LANE_COST_SMOOTHING", 0.0)
+    scheduler = DeadlineScheduler("test-wfq", slots=1, lane_weights={"a": 3, "b": 1})
+    order = []
+
+    async def work(lane):
+        async with scheduler.slot(lane):
+            order.append(lane)
+
+    holder = await scheduler.acquire("a")
+    tasks = [asyncio.create_task(work(lane)) for lane in "ab" * 8]
+    await asyncio.sleep(0)
+    scheduler.release("a", holder)
+    await asyncio.gather(*tasks)
+
+    assert order[:8].count("a") == 6
+    assert sorted(order) == sorted("ab" * 8)
@@ -0,0 +1,96 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+import pytest
+
+from app.config import server
+from app.models import multimodel
+from app.models.multimodel import ModelManager
+
+
+def test_production_options_use_workers_and_no_reload(monkeypatch):
+    monkeypatch.setattr(server, "API_WORKERS", 3)
+    options = server.uvicorn_options("production")
+
+    assert options["workers"] == 3
+    assert options["reload"] is False
+    assert options["loop"] == "auto"
+    assert options["http"] == "auto"
+
+
+def test_zero_workers_means_one_per_core(monkeypatch):
+    monkeypatch.setattr(server, "available_cpus", lambda: 6)
+    assert server.resolve_workers(0) == 6
+    assert server.resolve_workers(2) == 2
+
+
+def test_development_options_keep_reload(monkeypatch):
+    monkeypatch.setattr(server, "API_AUTO_RELOAD", True)
+    options = server.uvicorn_options("development")
+
+    assert options["reload"] is True
+    assert "workers" not in options
+
+
+def test_threads_are_split_between_workers(monkeypatch):
+    monkeypatch.setattr(server, "available_cpus", lambda: 8)
+    for var in ("TF_NUM_INTRAOP_THREADS", "OMP_NUM_THREADS", "TF_NUM_INTEROP_THREADS"):
+        monkeypatch.delenv(var, raising=False)
+    server._split_threads_between_workers(4)
+
+    assert os.environ["TF_NUM_INTRAOP_THREADS"] == "2"
+    assert os.environ["OMP_NUM_THREADS"] == "2"
+
+
+def test_autotune_profile_is_skipped_when_served_in_process(monkeypatch):
+    import uvicorn
+
+    from app.config import autotune
+
+    prepared, warnings = [], []
+    monkeypatch.setattr(autotune, "AUTOTUNE_MODE", "auto")
+    monkeypatch.setattr(autotune, "prepare", lambda **kw: prepared.append(kw))
+    monkeypatch.setattr(uvicorn, "run", lambda *args, **kwargs: None)
+    monkeypatch.setattr(
+        server.logger, "warning", lambda event, **kw: warnings.append(event)
+    )
+
+    # app.models.multimodel is imported (by this test module): with one
+    # process and no reload nobody would read the profile's env vars
+    monkeypatch.setattr(
+        server, "uvicorn_options", lambda mode: {"reload": False, "workers": 1}
+    )
+    server.run_server("development")
+    assert prepared == []
+    assert warnings and "ignored" in warnings[0]
+
+    # Reloader / several workers import the app afresh and do read them
+    monkeypatch.setattr(server, "uvicorn_options", lambda mode: {"reload": True})
+    server.run_server("development")
+    assert prepared == [{"workers": 1}]
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_inflight_inference(monkeypatch):
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(multimodel, "threadpool_executor", pool)
+    release = threading.Event()
+    finished = []
+
+    def slow_inference():
+        release.wait(timeout=5)
+        finished.append(True)
+        return "done"
+
+    task = asyncio.create_task(ModelManager._run_in_executor(slow_inference))
+    await asyncio.sleep(0.01)
+    assert len(ModelManager._inflight) == 1
+
+    asyncio.get_running_loop().call_later(0.05, release.set)
+    await ModelManager.drain(timeout=5)
+
+    assert finished == [True]
+    assert await task == "done"
+    assert not ModelManager._inflight
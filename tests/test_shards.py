@@ -0,0 +1,143 @@
+import asyncio
+import io
+import json
+import os
+import tarfile
+
+import numpy as np
+import pytest
+
+from app.pipeline.fetcher import ImageFetcher
+from app.pipeline.jobs import JobManager
+from app.pipeline.offline import ThroughputMeter, run
+from app.pipeline.shards import (
+    ShardReader,
+    iter_samples,
+    list_shards,
+    pack_directory,
+    split_key,
+)
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+IMAGE_NAMES = sorted(os.listdir(IMAGE_DIR))
+
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    out = tmp_path / "shards"
+    pack_directory(IMAGE_DIR, str(out), max_samples=4)
+    return str(out)
+
+
+def test_split_key_follows_webdataset_rules():
+    assert split_key("a/b/img.jpg") == ("a/b/img", "jpg")
+    assert split_key("img.seg.PNG") == ("img", "seg.png")
+
+
+def test_pack_and_read_back(shard_dir):
+    shards = list_shards(shard_dir)
+    assert [os.path.basename(s) for s in shards] == [
+        "shard-000000.tar",
+        "shard-000001.tar",
+        "shard-000002.tar",
+    ]
+    samples = list(iter_samples(shards))
+    assert [key for key, _ in samples] == [os.path.splitext(n)[0] for n in IMAGE_NAMES]
+    with open(os.path.join(IMAGE_DIR, IMAGE_NAMES[0]), "rb") as f:
+        assert samples[0][1] == f.read()
+
+
+def test_reader_skips_non_images_and_prefetches(tmp_path):
+    path = tmp_path / "mixed.tar"
+    with tarfile.open(path, "w") as tar:
+        for name, data in [("x.json", b"{}"), ("x.jpg", b"img"), ("y.png", b"png")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    reader = ShardReader([str(path)], prefetch=1)
+    assert reader.next_batch(5) == [("x", b"img"), ("y", b"png")]
+    assert reader.next_batch(5) == []
+    reader.close()
+
+
+def test_reader_propagates_read_errors(tmp_path):
+    path = tmp_path / "broken.tar"
+    path.write_bytes(b"not a tar file" * 100)
+    reader = ShardReader([str(path)])
+    with pytest.raises(tarfile.TarError):
+        list(reader)
+    reader.close()
+
+
+class FakeBackend:
+    name = "fake"
+    model_name = "Fake"
+    input_size = (16, 16)
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, batch):
+        self.batches.append(len(batch))
+        return np.full((len(batch), 1000), 0.001, dtype=np.float32)
+
+
+def test_offline_run_reads_shards(shard_dir, tmp_path):
+    out = str(tmp_path / "out")
+    backend = FakeBackend()
+    checkpoint = run(
+        shard_dir,
+        out,
+        backend,
+        batch_size=3,
+        shards=True,
+        meter=ThroughputMeter(stream=io.StringIO()),
+    )
+
+    assert checkpoint.processed == len(IMAGE_NAMES)
+    assert backend.batches == [3, 3, 3, 1]
+    with open(os.path.join(out, "part-00000.csv")) as f:
+        keys = [line.split(",")[0] for line in f.read().splitlines()[1:]]
+    assert keys == [os.path.splitext(n)[0] for n in IMAGE_NAMES]
+
+
+@pytest.mark.asyncio
+async def test_job_with_shard_items(shard_dir, tmp_path):
+    batches = []
+
+    async def classify_batch(images):
+        batches.append(len(images))
+        return [{"model_used": "fake", "predictions": []} for _ in images]
+
+    manager = JobManager(
+        {"smart": classify_batch},
+        ImageFetcher(),
+        batch_size=4,
+        local_root=str(tmp_path),
+    )
+    manager.start()
+    job = manager.submit([{"shard": "shards"}, {"path": "shards/../x.jpg"}], "smart")
+    lines = [json.loads(line) async for line in manager.stream(job)]
+    await asyncio.wait_for(manager.stop(), timeout=10)
+
+    results = [line for line in lines if line["type"] == "result"]
+    assert [r["source"] for r in results[:-1]] == [
+        os.path.splitext(n)[0] for n in IMAGE_NAMES
+    ]
+    assert "error" in results[-1]  # x.jpg does not exist
+    assert batches == [4, 4, 2]
+    assert [r["index"] for r in results] == list(range(len(IMAGE_NAMES) + 1))
+    assert lines[-1]["total"] == len(IMAGE_NAMES) + 1
+
+
+@pytest.mark.parametrize("fmt", [tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+def test_long_member_names(tmp_path, fmt):
+    name = "/".join(["deep" * 10] * 5) + "/image.jpg"
+    path = tmp_path / "long.tar"
+    with tarfile.open(path, "w", format=fmt) as tar:
+        info = tarfile.TarInfo(name)
+        info.size = 3
+        tar.addfile(info, io.BytesIO(b"abc"))
+
+    assert list(iter_samples([str(path)])) == [(name[: -len(".jpg")], b"abc")]
@@ -0,0 +1,171 @@
+import io
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+
+from app.api.v1.routes import img_class
+from app.models.multimodel import ModelManager
+from app.models.tiling import (
+    aggregate,
+    decode_tiles,
+    fit_scale,
+    tile_count,
+    tile_positions,
+)
+
+
+def _jpeg(size, color=(90, 120, 60)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_tile_positions_cover_the_axis_with_overlap():
+    assert tile_positions(100, 224, 0.25) == [0]
+    assert tile_positions(1000, 224, 0.25) == [0, 168, 336, 504, 672, 776]
+    assert tile_positions(224 + 168, 224, 0.25) == [0, 168]
+
+
+def test_fit_scale_keeps_the_grid_under_the_cap():
+    size = (224, 224)
+    # Small enough: no scaling
+    assert fit_scale(1000, 800, size, 0.25, 64) == 1.0
+    # 20 MP: scaled down until the grid fits
+    scale = fit_scale(5472, 3648, size, 0.25, 63)
+    assert scale < 1
+    assert tile_count(round(5472 * scale), round(3648 * scale), size, 0.25) <= 63
+    # Never below one tile, and tiny images are scaled up to one
+    assert fit_scale(5000, 400, size, 0.25, 1) == pytest.approx(224 / 400)
+    assert fit_scale(100, 50, size, 0.25, 64) == pytest.approx(224 / 50)
+
+
+def test_decode_tiles_of_a_large_frame():
+    tiles = decode_tiles(_jpeg((4000, 3000)), (224, 224), overlap=0.25, max_tiles=16)
+    assert len(tiles.arrays) <= 16
+    assert tiles.arrays.shape[1:] == (224, 224, 3)
+    assert tiles.arrays.dtype == np.uint8
+    assert tiles.image_size == (4000, 3000) and tiles.scale < 1
+    # Boxes are in frame pixels; the whole frame comes last
+    assert tiles.boxes[0][:2] == (0, 0)
+    assert tiles.boxes[-1] == (0, 0, 4000, 3000)
+    assert max(box[2] for box in tiles.boxes[:-1]) == 4000
+    assert max(box[3] for box in tiles.boxes[:-1]) == 3000
+
+    # One tile: no separate whole-frame tile
+    small = decode_tiles(_jpeg((150, 150)), (224, 224))
+    assert len(small.arrays) == 1 and small.boxes == [(0, 0, 150, 150)]
+
+    with pytest.raises(ValueError):
+        decode_tiles(b"not an image", (224, 224))
+
+
+def test_aggregate_keeps_each_class_best_confidence():
+    def p(name, confidence):
+        return {"class_id": name, "class_name": name, "confidence": confidence}
+
+    result = aggregate(
+        [
+            [p("zebra", 0.2), p("tiger", 0.1)],
+            [p("zebra", 0.7), p("gazelle", 0.5)],
+            [p("gazelle", 0.6)],
+        ],
+        top=2,
+    )
+    assert result == [
+        {"class_id": "zebra", "class_name": "zebra", "confidence": 0.7, "tiles": 2},
+        {"class_id": "gazelle", "class_name": "gazelle", "confidence": 0.6, "tiles": 2},
+    ]
+
+
+@pytest.fixture
+def tiny_classifier(monkeypatch):
+    inputs = tf.keras.Input((8, 8, 3))
+    x = tf.keras.layers.GlobalAveragePooling2D()(inputs)
+    outputs = tf.keras.layers.Dense(4, activation="softmax")(x)
+    model = tf.keras.Model(inputs, outputs)
+
+    def decode(preds, top=5):
+        return [
+            [(str(i), f"class{i}", row[i]) for i in np.argsort(-row)[:top]]
+            for row in preds
+        ]
+
+    monkeypatch.setitem(
+        ModelManager.MODEL_INFO,
+        "Tiny",
+        {"preprocess": lambda x: x / 255.0, "input_size": (8, 8), "decode": decode},
+    )
+    monkeypatch.setattr(ModelManager, "get_model", classmethod(lambda cls, name: model))
+    return model
+
+
+@pytest.mark.asyncio
+async def test_classify_tiled_runs_every_tile_in_one_batch(tiny_classifier):
+    calls = []
+    predict = tiny_classifier.predict
+
+    def counting_predict(batch, **kwargs):
+        calls.append(len(batch))
+        return predict(batch, **kwargs)
+
+    tiny_classifier.predict = counting_predict
+    result = await ModelManager.classify_tiled(
+        _jpeg((40, 24)), overlap=0.5, max_tiles=64, model_name="Tiny"
+    )
+    # 40x24 at 8x8 with a stride of 4: 9 x 5 tiles plus the whole frame
+    assert calls == [46]
+    assert result["model_used"] == "Tiny"
+    assert result["image_size"] == [40, 24] and result["scale"] == 1.0
+    assert len(result["tiles"]) == 46
+    assert result["tiles"][-1]["box"] == [0, 0, 40, 24]
+    assert all(len(tile["predictions"]) == 4 for tile in result["tiles"])
+    assert {p["class_name"] for p in result["predictions"]} == {
+        f"class{i}" for i in range(4)
+    }
+    assert all(p["tiles"] == len(result["tiles"]) for p in result["predictions"])
+
+
+@pytest.mark.asyncio
+async def test_predict_tiled_endpoint(monkeypatch):
+    seen = {}
+
+    async def classify_tiled(image_data, overlap, max_tiles):
+        seen.update(overlap=overlap, max_tiles=max_tiles)
+        if image_data == b"broken":
+            raise ValueError("Could not decode image bytes")
+        return {
+            "model_used": "ResNet50",
+            "image_size": [4000, 3000],
+            "scale": 0.5,
+            "predictions": [],
+            "tiles": [],
+        }
+
+    monkeypatch.setattr(ModelManager, "classify_tiled", classify_tiled)
+    app = FastAPI()
+    app.include_router(img_class.router, prefix="/api/v1")
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        ok = await ac.post(
+            "/api/v1/predict_tiled?overlap=0.5&max_tiles=8",
+            files={"file": ("a.jpg", _jpeg((16, 16)), "image/jpeg")},
+        )
+        broken = await ac.post(
+            "/api/v1/predict_tiled",
+            files={"file": ("b.jpg", b"broken", "image/jpeg")},
+        )
+        too_many = await ac.post(
+            "/api/v1/predict_tiled?max_tiles=100000",
+            files={"file": ("a.jpg", _jpeg((16, 16)), "image/jpeg")},
+        )
+
+    assert ok.status_code == 200
+    assert ok.json()["model_used"] == "ResNet50"
+    assert broken.status_code == 400
+    assert too_many.status_code == 422
+    assert seen["max_tiles"] != 100000
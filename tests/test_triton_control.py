@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.models.triton_control import TritonModelController
+
+CPU_TO_MODEL = [(0.30, "Heavy"), (0.60, "Medium"), (1.00, "Light")]
+MODEL_INFO = {name: {"input_size": (8, 8)} for _, name in CPU_TO_MODEL}
+
+
+class FakeTritonClient:
+    def __init__(self, loaded=(), load_delay=0.0):
+        self.loaded = set(loaded)
+        self.load_delay = load_delay
+        self.calls = []
+        self.last_inference = {}
+        self._lock = threading.Lock()
+
+    def get_model_repository_index(self):
+        return [
+            {"name": name, "state": "READY" if name in self.loaded else "UNAVAILABLE"}
+            for name in MODEL_INFO
+        ]
+
+    def load_model(self, name):
+        time.sleep(self.load_delay)
+        with self._lock:
+            self.calls.append(("load", name))
+            self.loaded.add(name)
+
+    def unload_model(self, name):
+        with self._lock:
+            self.calls.append(("unload", name))
+            self.loaded.discard(name)
+
+    def infer(self, model_name, inputs):
+        with self._lock:
+            self.calls.append(("infer", model_name))
+
+    def get_inference_statistics(self, name):
+        return {
+            "model_stats": [
+                {"name": name, "last_inference": self.last_inference.get(name, 0)}
+            ]
+        }
+
+
+def _controller(client, **kwargs):
+    kwargs.setdefault("interval", 3600)
+    return TritonModelController(client, MODEL_INFO, CPU_TO_MODEL, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_start_adopts_loaded_models_and_loads_pinned():
+    client = FakeTritonClient(loaded={"Medium"})
+    controller = _controller(client)
+    await controller.start()
+    await controller.ensure_ready("Light")
+    await controller.stop()
+
+    assert set(controller.ready) == {"Medium", "Light"}
+    # Loaded, then pre-warmed before taking traffic
+    assert client.calls == [("load", "Light"), ("infer", "Light")]
+
+
+@pytest.mark.asyncio
+async def test_select_falls_back_while_preferred_model_loads():
+    client = FakeTritonClient(loaded={"Light"}, load_delay=0.05)
+    controller = _controller(client)
+    await controller.start()
+
+    # Low CPU wants Heavy; it is not loaded yet, so the cheapest ready model serves
+    assert await controller.select(0.10) == "Light"
+    await asyncio.sleep(0.2)
+    assert await controller.select(0.10) == "Heavy"
+    await controller.stop()
+
+
+def test_upcoming_models_near_thresholds():
+    controller = _controller(FakeTritonClient(), margin=0.05)
+    assert controller.upcoming(0.45) == []
+    assert controller.upcoming(0.57) == ["Light"]
+    assert controller.upcoming(0.33) == ["Heavy"]
+
+
+@pytest.mark.asyncio
+async def test_select_preloads_next_model_near_threshold():
+    client = FakeTritonClient(loaded={"Light", "Medium"})
+    controller = _controller(client, margin=0.05)
+    await controller.start()
+    assert await controller.select(0.32) == "Medium"
+    await asyncio.sleep(0.05)
+    await controller.stop()
+
+    assert "Heavy" in controller.ready
+    assert ("load", "Heavy") in client.calls
+
+
+@pytest.mark.asyncio
+async def test_sweep_unloads_idle_models_but_keeps_pinned_and_busy_ones():
+    client = FakeTritonClient(loaded={"Heavy", "Medium", "Light"})
+    controller = _controller(client, idle_seconds=60)
+    await controller.start()
+    past = time.time() - 120
+    controller.ready.update(Heavy=past, Medium=past, Light=past)
+    # Another worker used Medium a moment ago
+    client.last_inference["Medium"] = time.time() * 1000
+
+    await controller.sweep()
+    await controller.stop()
+
+    assert ("unload", "Heavy") in client.calls
+    assert set(controller.ready) == {"Medium", "Light"}
+
+
+@pytest.mark.asyncio
+async def test_max_loaded_evicts_least_recently_used():
+    client = FakeTritonClient(loaded={"Medium", "Light"})
+    controller = _controller(client, max_loaded=2, prewarm=False, idle_seconds=60)
+    await controller.start()
+    past = time.time() - 120
+    controller.ready.update(Medium=past, Light=past)
+    await controller.ensure_ready("Heavy")
+    await controller.stop()
+
+    assert client.calls == [("unload", "Medium"), ("load", "Heavy")]
+    assert set(controller.ready) == {"Light", "Heavy"}
+
+
+@pytest.mark.asyncio
+async def test_max_loaded_never_evicts_a_model_another_worker_is_serving():
+    client = FakeTritonClient(loaded={"Medium", "Light"})
+    controller = _controller(
+        client, max_loaded=2, prewarm=False, busy_seconds=10, idle_seconds=60
+    )
+    await controller.start()
+    controller.ready.update(Medium=time.time() - 120)
+    client.last_inference["Medium"] = time.time() * 1000
+    await controller.ensure_ready("Heavy")
+    await controller.stop()
+
+    # Light is pinned and Medium busy: loaded over the limit instead
+    assert client.calls == [("load", "Heavy")]
+    assert set(controller.ready) == {"Medium", "Light", "Heavy"}
+
+
+@pytest.mark.asyncio
+async def test_max_loaded_never_evicts_a_model_this_worker_just_loaded():
+    client = FakeTritonClient(loaded={"Medium", "Light"})
+    controller = _controller(client, max_loaded=2, prewarm=False, idle_seconds=60)
+    await controller.start()
+    # Medium was just loaded here for a request Triton has no inference of yet
+    controller.ready.update(Medium=time.time() - 1)
+    await controller.ensure_ready("Heavy")
+    await controller.stop()
+
+    assert client.calls == [("load", "Heavy")]
+    assert set(controller.ready) == {"Medium", "Light", "Heavy"}
@@ -0,0 +1,146 @@
+import json
+
+import onnx
+import pytest
+from onnx import TensorProto, helper
+from tritonclient.http import InferenceServerException
+
+from app.models import triton_tuning
+from app.models.tritonservice import (
+    TRITON_MAX_BATCH_SIZE,
+    TritonMultiModel,
+    config_batch_limit,
+)
+
+
+def _cell(threads, instances, batch, ips, p95):
+    return {
+        "threads": threads,
+        "instances": instances,
+        "batch": batch,
+        "images_per_second": ips,
+        "p50_ms": p95 / 2,
+        "p95_ms": p95,
+    }
+
+
+MEASUREMENTS = [
+    # 1 thread x 4 instances: best throughput, but batch 16 is too slow
+    _cell(1, 4, 1, 40, 30),
+    _cell(1, 4, 4, 90, 80),
+    _cell(1, 4, 8, 100, 150),
+    _cell(1, 4, 16, 105, 290),
+    # 4 threads x 1 instance: lower latency, lower throughput
+    _cell(4, 1, 1, 30, 10),
+    _cell(4, 1, 8, 70, 60),
+]
+
+
+def test_plan_meets_target_with_best_throughput():
+    plan = triton_tuning.plan_config(MEASUREMENTS, target_ms=200)
+    assert plan["meets_target"]
+    assert (plan["threads"], plan["instances"]) == (1, 4)
+    assert plan["max_batch_size"] == 8
+    assert plan["preferred_batch_sizes"] == [4, 8]
+    # Half of the (200 - 150) ms slack, capped at a batch-1 inference (p50 15 ms)
+    assert plan["max_queue_delay_us"] == 15000
+
+
+def test_plan_tight_target_prefers_low_latency_threads():
+    plan = triton_tuning.plan_config(MEASUREMENTS, target_ms=65)
+    assert (plan["threads"], plan["max_batch_size"]) == (4, 8)
+    assert plan["max_queue_delay_us"] == 2500
+
+
+def test_plan_unreachable_target_serves_single_images():
+    plan = triton_tuning.plan_config(MEASUREMENTS, target_ms=5)
+    assert not plan["meets_target"]
+    assert (plan["threads"], plan["max_batch_size"]) == (4, 1)
+    assert "dynamic_batching" not in triton_tuning.tuning_block(plan)
+
+
+def test_tuning_block_sets_instances_and_ort_threads():
+    block = triton_tuning.tuning_block(
+        triton_tuning.plan_config(MEASUREMENTS, target_ms=200)
+    )
+    assert "preferred_batch_size: [4, 8]" in block
+    assert "max_queue_delay_microseconds: 15000" in block
+    assert "count: 4" in block and "kind: KIND_CPU" in block
+    assert 'key: "intra_op_thread_count"' in block
+    assert 'value: { string_value: "1" }' in block
+
+
+def _write_model(repo, name):
+    graph = helper.make_graph(
+        [helper.make_node("Cast", ["input"], ["predictions"], to=TensorProto.FLOAT)],
+        name,
+        [helper.make_tensor_value_info("input", TensorProto.UINT8, [None, 8, 8, 3])],
+        [
+            helper.make_tensor_value_info(
+                "predictions", TensorProto.FLOAT, [None, 8, 8, 3]
+            )
+        ],
+    )
+    model = helper.make_model(
+        graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8
+    )
+    version_dir = repo / name / "1"
+    version_dir.mkdir(parents=True)
+    onnx.save(model, str(version_dir / "model.onnx"))
+
+
+def test_cli_profiles_and_writes_config_and_measurements(tmp_path):
+    _write_model(tmp_path, "Tiny")
+    args = ["--repo", str(tmp_path), "--cpus", "2", "--batch-sizes", "1,2"]
+    assert triton_tuning.main(args + ["--seconds", "0.02"]) == 0
+
+    profile = json.loads((tmp_path / "Tiny" / "1" / "profile.json").read_text())
+    assert profile["input_size"] == [8, 8]
+    assert {(c["threads"], c["batch"]) for c in profile["measurements"]} == {
+        (1, 1),
+        (1, 2),
+        (2, 1),
+        (2, 2),
+    }
+    config = (tmp_path / "Tiny" / "config.pbtxt").read_text()
+    assert 'name: "Tiny"' in config
+    assert "data_type: TYPE_UINT8" in config
+    assert f"max_batch_size: {profile['plan']['max_batch_size']}" in config
+
+    # Re-plan from the saved measurements, without profiling
+    assert triton_tuning.main(args + ["--from-profiles", "--target-ms", "0"]) == 0
+    config = (tmp_path / "Tiny" / "config.pbtxt").read_text()
+    assert "max_batch_size: 1" in config
+
+
+class FakeClient:
+    def __init__(self, max_batch_size):
+        self.max_batch_size = max_batch_size
+        self.reads = 0
+
+    def get_model_config(self, model_name):
+        self.reads += 1
+        if self.max_batch_size is None:
+            raise InferenceServerException("connection refused")
+        return {"name": model_name, "max_batch_size": self.max_batch_size}
+
+
+def test_batch_limit_follows_model_config():
+    assert config_batch_limit(FakeClient(4), "ResNet50") == min(
+        4, TRITON_MAX_BATCH_SIZE
+    )
+    assert config_batch_limit(FakeClient(64), "ResNet50") == TRITON_MAX_BATCH_SIZE
+
+
+@pytest.mark.asyncio
+async def test_batch_limit_fallback_is_not_cached():
+    triton = TritonMultiModel(model_control="poll")
+    triton.client = FakeClient(None)
+    assert await triton._batch_limit("ResNet50") == TRITON_MAX_BATCH_SIZE
+    assert config_batch_limit(triton.client, "ResNet50", None) is None
+
+    # Triton is back: the config is read, then cached
+    triton.client.max_batch_size = 1
+    assert await triton._batch_limit("ResNet50") == 1
+    assert await triton._batch_limit("ResNet50") == 1
+    assert triton.client.reads == 3
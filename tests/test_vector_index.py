@@ -0,0 +1,269 @@
+import io
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+
+from app.api.v1.routes import embeddings
+from app.models import vector_index
+from app.models.multimodel import ModelManager
+from app.models.vector_index import (
+    StringColumn,
+    VectorIndex,
+    VectorIndexWriter,
+    get_vector_index,
+    l2_normalize,
+)
+from app.pipeline import embed_index
+
+
+def _clusters(count=4000, dim=32, centers=20, seed=0):
+    rng = np.random.default_rng(seed)
+    means = rng.normal(size=(centers, dim))
+    labels = rng.integers(0, centers, size=count)
+    vectors = means[labels] + 0.3 * rng.normal(size=(count, dim))
+    return vectors.astype(np.float32), [f"species{label}" for label in labels]
+
+
+def _write(directory, vectors, labels, nlist=0):
+    writer = VectorIndexWriter(str(directory), vectors.shape[1], "ResNet50", "v1")
+    for start in range(0, len(vectors), 1000):
+        writer.add(
+            vectors[start : start + 1000],
+            [f"img/{i}.jpg" for i in range(start, min(start + 1000, len(vectors)))],
+            labels[start : start + 1000],
+        )
+    return writer.close(nlist=nlist)
+
+
+def _jpeg(color, size=(16, 16)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_exact_search_matches_brute_force(tmp_path):
+    vectors, labels = _clusters(count=2500)
+    index = _write(tmp_path, vectors, labels)
+    assert (index.count, index.dim, index.nlist) == (2500, 32, 0)
+
+    queries = vectors[:5] + 0.01
+    scores, rows = index.search(queries, k=10)
+    expected = np.argsort(-(l2_normalize(queries) @ l2_normalize(vectors).T), axis=1)
+    assert (rows == expected[:, :10]).all()
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+    # Fewer rows than k: padded with -1
+    small = _write(tmp_path / "small", vectors[:3], labels[:3])
+    _, rows = small.search(vectors[0], k=5)
+    assert sorted(rows[0][:3]) == [0, 1, 2] and list(rows[0][3:]) == [-1, -1]
+    assert len(small.neighbours(vectors[0], k=5)) == 3
+
+
+def test_ivf_search_finds_nearly_all_exact_neighbours(tmp_path):
+    vectors, labels = _clusters()
+    index = _write(tmp_path, vectors, labels, nlist=32)
+    assert index.nlist == 32 and index.offsets[-1] == len(vectors)
+
+    queries = vectors[::100] + 0.05
+    _, exact = index.search(queries, k=10, nprobe=0)
+    _, approximate = index.search(queries, k=10, nprobe=4)
+    recall = np.mean([len(set(a) & set(e)) / 10 for a, e in zip(approximate, exact)])
+    assert recall > 0.9
+
+    # Rows were regrouped by list; keys and labels moved with them
+    reopened = VectorIndex(str(tmp_path))
+    row = reopened.keys.index("img/7.jpg")
+    assert reopened.labels[row] == labels[7]
+    assert np.allclose(reopened.vectors[row], l2_normalize(vectors[7]))
+
+    (best,) = VectorIndex.vote(reopened.neighbours(vectors[7], k=5))[:1]
+    assert best["label"] == labels[7] and best["votes"] >= 3
+
+
+def test_rebuild_swaps_in_a_new_build_without_touching_the_served_one(
+    tmp_path, monkeypatch
+):
+    live = tmp_path / "index"
+    vectors, labels = _clusters(count=300)
+    monkeypatch.setattr(vector_index, "VECTOR_INDEX_DIR", str(live))
+    monkeypatch.setattr(vector_index, "_index", None)
+    _write(live, vectors, labels)
+    served = get_vector_index()
+    assert get_vector_index() is served
+    assert isinstance(served.keys, StringColumn) and served.keys[5] == "img/5.jpg"
+
+    # Rebuild into the served directory: the open index keeps its files
+    writer = VectorIndexWriter(str(live), 32, "ResNet50", "v2")
+    writer.add(vectors[:10] * -1, [f"new/{i}.jpg" for i in range(10)])
+    assert served.search(vectors[0], k=1)[1][0][0] == 0
+    writer.close()
+
+    assert served.search(vectors[0], k=1)[1][0][0] == 0
+    assert served.keys[0] == "img/0.jpg" and served.labels[0] == labels[0]
+    reloaded = get_vector_index()
+    assert reloaded is not served
+    assert (reloaded.count, reloaded.version, reloaded.keys[0]) == (
+        10,
+        "v2",
+        "new/0.jpg",
+    )
+
+    # Two more builds: only the current one and the one before it remain
+    for _ in range(2):
+        _write(live, vectors[:20], labels[:20])
+    builds = sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("index.v"))
+    assert len(builds) == 2 and (tmp_path / "index").is_symlink()
+    assert get_vector_index().count == 20
+
+    # A failed build leaves the served index in place
+    writer = VectorIndexWriter(str(live), 32, "ResNet50")
+    writer.abort()
+    assert get_vector_index().count == 20
+    assert len([p for p in tmp_path.iterdir() if p.name.startswith("index.v")]) == 2
+
+
+def test_vote_weights_labels_by_similarity():
+    votes = VectorIndex.vote(
+        [
+            {"key": "a", "label": "manta", "score": 0.9},
+            {"key": "b", "label": "reef_shark", "score": 0.5},
+            {"key": "c", "label": "reef_shark", "score": 0.5},
+            {"key": "d", "label": "", "score": 0.99},
+        ]
+    )
+    assert [(v["label"], v["votes"]) for v in votes] == [
+        ("reef_shark", 2),
+        ("manta", 1),
+    ]
+    assert sum(v["score"] for v in votes) == pytest.approx(1.0)
+
+
+@pytest.fixture
+def tiny_backbone(monkeypatch):
+    # Fixed non-negative kernels: any non-black image has positive pooled
+    # features, so no embedding is all zeros after the ReLU
+    inputs = tf.keras.Input((8, 8, 3))
+    x = tf.keras.layers.Conv2D(
+        6,
+        3,
+        activation="relu",
+        kernel_initializer=tf.keras.initializers.RandomUniform(0.0, 1.0, seed=0),
+    )(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D(name="avg_pool")(x)
+    outputs = tf.keras.layers.Dense(4, activation="softmax", name="predictions")(x)
+    model = tf.keras.Model(inputs, outputs)
+    monkeypatch.setitem(
+        ModelManager.MODEL_INFO,
+        "Tiny",
+        {
+            "preprocess": lambda x: x / 255.0,
+            "input_size": (8, 8),
+            "embedding_layer": "avg_pool",
+        },
+    )
+    monkeypatch.setattr(ModelManager, "get_model", classmethod(lambda cls, name: model))
+    monkeypatch.setattr(ModelManager, "_feature_models", {})
+    return model
+
+
+@pytest.mark.asyncio
+async def test_embed_batch_returns_normalized_pooled_features(
+    tiny_backbone, monkeypatch
+):
+    lookups = []
+    get_model = ModelManager.get_model
+    monkeypatch.setattr(
+        ModelManager,
+        "get_model",
+        classmethod(lambda cls, name: lookups.append(name) or get_model(name)),
+    )
+    results = await ModelManager.embed_batch(
+        [_jpeg((200, 30, 30)), b"not an image", _jpeg((30, 30, 200))],
+        model_name="Tiny",
+    )
+    assert "error" in results[1]
+    for result in (results[0], results[2]):
+        assert result["model_used"] == "Tiny"
+        assert len(result["embedding"]) == 6
+        assert np.linalg.norm(result["embedding"]) == pytest.approx(1.0, abs=1e-5)
+    # The backbone from _get_model_async is reused, not looked up again
+    assert lookups == ["Tiny"]
+    # The feature model is built once and shares the backbone's weights
+    features = ModelManager.feature_model("Tiny")
+    assert ModelManager.feature_model("Tiny") is features
+    pooled = features.predict(np.full((1, 8, 8, 3), 200 / 255.0), verbose=0)
+    assert (pooled > 0).all()
+    assert features.layers[1] is tiny_backbone.layers[1]
+
+
+class ColorBackend:
+    """Embeds an image as its mean color, so similar colors are neighbours."""
+
+    model_name = "ResNet50"
+    input_size = (8, 8)
+
+    def embed(self, batch):
+        return batch.reshape(len(batch), -1, 3).mean(axis=1) + 1.0
+
+
+def test_build_index_from_labelled_archive(tmp_path):
+    colors = {
+        "manta": (20, 20, 220),
+        "lionfish": (220, 40, 20),
+        "turtle": (30, 200, 40),
+    }
+    for species, color in colors.items():
+        (tmp_path / "archive" / species).mkdir(parents=True)
+        for i in range(4):
+            shade = tuple(min(255, c + 8 * i) for c in color)
+            (tmp_path / "archive" / species / f"{i}.jpg").write_bytes(_jpeg(shade))
+    (tmp_path / "archive" / "turtle" / "broken.jpg").write_bytes(b"not an image")
+
+    index = embed_index.build(
+        str(tmp_path / "archive"),
+        str(tmp_path / "index"),
+        ColorBackend(),
+        labels_from_dir=True,
+        batch_size=5,
+    )
+    assert index.count == 12 and index.nlist == 0
+    query = ColorBackend().embed(np.full((1, 8, 8, 3), (30, 30, 210), np.float32))
+    assert VectorIndex.vote(index.neighbours(query[0], k=4))[0]["label"] == "manta"
+
+
+@pytest.mark.asyncio
+async def test_similar_endpoint(tmp_path, monkeypatch):
+    vectors, labels = _clusters(count=500)
+    index = _write(tmp_path, vectors, labels)
+
+    async def embed_batch(images, model_name=None):
+        return [{"model_used": model_name, "embedding": vectors[42].tolist()}]
+
+    monkeypatch.setattr(embeddings, "get_vector_index", lambda: index)
+    monkeypatch.setattr(ModelManager, "embed_batch", embed_batch)
+    app = FastAPI()
+    app.include_router(embeddings.router, prefix="/api/v1")
+    files = {"file": ("query.jpg", _jpeg((0, 0, 0)), "image/jpeg")}
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post("/api/v1/similar?k=3", files=files)
+        unknown = await ac.post(
+            "/api/v1/embeddings?model=Nope",
+            files=[("files", ("a.jpg", _jpeg((0, 0, 0)), "image/jpeg"))],
+        )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["model_used"] == "ResNet50"
+    assert body["neighbours"][0] == {
+        "key": "img/42.jpg",
+        "label": labels[42],
+        "score": pytest.approx(1.0, abs=1e-5),
+    }
+    assert body["knn"][0]["label"] == labels[42]
+    assert unknown.status_code == 400